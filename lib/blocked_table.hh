@@ -0,0 +1,133 @@
+#ifndef BLOCKED_TABLE_HH
+#define BLOCKED_TABLE_HH
+
+#include <stdlib.h>
+#include <string.h>
+#include "khmer.hh"
+#include "kmer_hash.hh"
+
+// a block is one cache line.
+#define TABLE_BLOCK_BYTES 64
+
+// most probes (i.e. tables) a blocked table will split a block into.
+#define MAX_BLOCKED_TABLES 16
+
+namespace khmer {
+
+  //
+  // Bins for tables made with fast_hash.  khash is mixed once, by
+  // mix_table_hash(); table i then takes h + i * h2 (double hashing, with
+  // h2 the halves of h swapped) and scales it down to its size by a
+  // multiply and shift.  This avoids the 64-bit division per table of the
+  // classic khash % tablesize (which needs prime table sizes to give
+  // independent tables).
+  //
+
+  inline HashIntoType mix_table_hash(HashIntoType khash) {
+    return _kmer_hash_mix(khash);
+  }
+
+  inline HashIntoType mixed_table_bin(HashIntoType h, unsigned int i,
+				      HashIntoType tablesize) {
+    const HashIntoType h2 = ((h >> 32) | (h << 32)) | 1;
+    return (HashIntoType) (((unsigned __int128) (h + i * h2) * tablesize)
+			   >> 64);
+  }
+
+  //
+  // BlockedLayout: where a k-mer's bins go in a blocked table.  Instead
+  // of n_tables separate tables, there is one array of 64-byte blocks;
+  // a hash of the k-mer picks its block, and each of its n_tables probes
+  // lands in its own slice of that block, so an insert or lookup
+  // touches one cache line rather than n_tables of them.
+  //
+  // Slice i of every block, strung together, acts as table i, with
+  // n_blocks * slice_bins bins; that's the table size reported (and
+  // saved), so occupancy works out as before.  The tables aren't
+  // independent, though -- a block with more k-mers than most has more
+  // of every slice set -- so collision rates are higher than for
+  // separate tables; see calc_expected_collisions.
+  //
+
+  struct BlockedLayout {
+    HashIntoType n_blocks;
+    unsigned int block_bins;	// bins in a block
+    unsigned int slice_bins;	// bins in each probe's slice of a block
+    unsigned int n_slices;
+
+    BlockedLayout() : n_blocks(0), block_bins(0), slice_bins(0),
+		      n_slices(0) { }
+
+    // n_tables probes into blocks of bins_per_block bins, with at least
+    // min_bytes of blocks in all.
+    void init(HashIntoType min_bytes, unsigned int bins_per_block,
+	      unsigned int n_tables) {
+      block_bins = bins_per_block;
+      n_slices = n_tables;
+      slice_bins = block_bins / n_tables;
+
+      n_blocks = (min_bytes + TABLE_BLOCK_BYTES - 1) / TABLE_BLOCK_BYTES;
+    }
+
+    // the same, given the table size reported by tablesize().
+    void init_from_tablesize(HashIntoType tablesize,
+			     unsigned int bins_per_block,
+			     unsigned int n_tables) {
+      block_bins = bins_per_block;
+      n_slices = n_tables;
+      slice_bins = block_bins / n_tables;
+      n_blocks = tablesize / slice_bins;
+    }
+
+    HashIntoType tablesize() const { return n_blocks * slice_bins; }
+    HashIntoType n_bytes() const { return n_blocks * TABLE_BLOCK_BYTES; }
+
+    // the bin for khash in each table, as offsets into the whole array.
+    // Everything comes from a mix of khash: its high bits pick the block,
+    // and the high bits of it times successive powers of an odd constant
+    // the bin in each slice.  (Double hashing, h + i * h2, leaves the
+    // bins in a block's small slices too closely tied to each other, and
+    // the false positive rate well over that for independent slices.)
+    // Both are scaled down to size by a multiply and shift rather than a
+    // (slow) modulus.
+    void get_bins(HashIntoType khash, HashIntoType * bins) const {
+      const HashIntoType h = _kmer_hash_mix(khash);
+      const HashIntoType block_start = _block(h) * block_bins;
+
+      HashIntoType x = h;
+      HashIntoType slice_start = block_start;
+      for (unsigned int i = 0; i < n_slices; i++) {
+	x *= 0x9e3779b97f4a7c15ULL;
+	bins[i] = slice_start + (((x >> 32) * slice_bins) >> 32);
+	slice_start += slice_bins;
+      }
+    }
+
+    // where khash's block starts, in bytes from the start of the array.
+    HashIntoType block_offset(HashIntoType khash) const {
+      return _block(_kmer_hash_mix(khash)) * TABLE_BLOCK_BYTES;
+    }
+
+    // the block for a k-mer with the mixed hash h.
+    HashIntoType _block(HashIntoType h) const {
+      return (HashIntoType) (((unsigned __int128) h * n_blocks) >> 64);
+    }
+
+    // where bin j of table i is, as an offset into the whole array.
+    HashIntoType table_bin(unsigned int i, HashIntoType j) const {
+      return (j / slice_bins) * block_bins + i * slice_bins + j % slice_bins;
+    }
+
+    // a zeroed, block-aligned array to hold the table; free() it.
+    Byte * allocate() const {
+      void * p = NULL;
+      if (posix_memalign(&p, TABLE_BLOCK_BYTES, n_bytes()) != 0) {
+	return NULL;
+      }
+      memset(p, 0, n_bytes());
+      return (Byte *) p;
+    }
+  };
+};
+
+#endif // BLOCKED_TABLE_HH
@@ -0,0 +1,414 @@
+#include "chunked_gz.hh"
+#include "zlib-1.2.3/zlib.h"
+
+#include <assert.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/stat.h>
+#include <pthread.h>
+#include <algorithm>
+
+using namespace std;
+using namespace khmer;
+
+// a member is a 24-byte gzip header (with the 'KC' extra field), raw
+// deflated data, then the CRC-32 and size of the data.
+#define GZ_HEADER_SIZE 24
+#define GZ_TRAILER_SIZE 8
+
+static void _put_le32(unsigned char * p, unsigned int x)
+{
+  p[0] = x & 0xff;
+  p[1] = (x >> 8) & 0xff;
+  p[2] = (x >> 16) & 0xff;
+  p[3] = (x >> 24) & 0xff;
+}
+
+static unsigned int _get_le32(const unsigned char * p)
+{
+  return p[0] | (p[1] << 8) | (p[2] << 16) | ((unsigned int) p[3] << 24);
+}
+
+static void _put_header(unsigned char * p, unsigned int member_size,
+			unsigned int size)
+{
+  static const unsigned char header[] = {
+    0x1f, 0x8b,			// gzip magic
+    8,				// deflate
+    4,				// FEXTRA
+    0, 0, 0, 0,			// no mtime
+    0,
+    255,			// unknown OS
+    12, 0,			// XLEN
+    'K', 'C', 8, 0		// our subfield, and its length
+  };
+  memcpy(p, header, sizeof(header));
+  _put_le32(p + 16, member_size);
+  _put_le32(p + 20, size);
+}
+
+// is p the header of a chunk's member?  If so, get its sizes.
+static bool _get_header(const unsigned char * p, unsigned int &member_size,
+			unsigned int &size)
+{
+  if (p[0] != 0x1f || p[1] != 0x8b || p[2] != 8 || !(p[3] & 4) ||
+      p[10] != 12 || p[11] != 0 || p[12] != 'K' || p[13] != 'C' ||
+      p[14] != 8 || p[15] != 0) {
+    return false;
+  }
+  member_size = _get_le32(p + 16);
+  size = _get_le32(p + 20);
+  return true;
+}
+
+static void _pread_all(int fd, void * buf, size_t n, unsigned long long offset)
+{
+  char * p = (char *) buf;
+  while (n) {
+    ssize_t r = pread(fd, p, n, offset);
+    assert(r > 0);
+    p += r;
+    n -= r;
+    offset += r;
+  }
+}
+
+//
+// run fn(data) on n_threads threads, the calling thread being one.
+//
+
+static void _run_threads(unsigned int n_threads, void * (*fn)(void *),
+			 void * data)
+{
+  std::vector<pthread_t> threads(n_threads > 1 ? n_threads - 1 : 0);
+  for (size_t t = 0; t < threads.size(); t++) {
+    pthread_create(&threads[t], NULL, fn, data);
+  }
+  fn(data);
+  for (size_t t = 0; t < threads.size(); t++) {
+    pthread_join(threads[t], NULL);
+  }
+}
+
+//
+// ChunkedGzWriter
+//
+
+static void _deflate_chunk(const char * data, size_t n,
+			   std::vector<char> &member)
+{
+  z_stream z;
+  memset(&z, 0, sizeof(z));
+  int r = deflateInit2(&z, Z_DEFAULT_COMPRESSION, Z_DEFLATED, -15, 8,
+		       Z_DEFAULT_STRATEGY);
+  assert(r == Z_OK);
+
+  member.resize(GZ_HEADER_SIZE + deflateBound(&z, n) + GZ_TRAILER_SIZE);
+
+  z.next_in = (Bytef *) data;
+  z.avail_in = n;
+  z.next_out = (Bytef *) &member[GZ_HEADER_SIZE];
+  z.avail_out = member.size() - GZ_HEADER_SIZE - GZ_TRAILER_SIZE;
+  r = deflate(&z, Z_FINISH);
+  assert(r == Z_STREAM_END);
+
+  const size_t member_size = GZ_HEADER_SIZE + z.total_out + GZ_TRAILER_SIZE;
+  deflateEnd(&z);
+  member.resize(member_size);
+
+  unsigned char * p = (unsigned char *) &member[0];
+  _put_header(p, member_size, n);
+
+  uLong crc = crc32(0L, Z_NULL, 0);
+  crc = crc32(crc, (const Bytef *) data, n);
+  _put_le32(p + member_size - GZ_TRAILER_SIZE, crc);
+  _put_le32(p + member_size - 4, n);
+}
+
+struct _deflate_state {
+  const std::vector<std::pair<const char *, size_t> > * chunks;
+  std::vector<std::vector<char> > * members;
+  size_t next;
+};
+
+static void * _deflate_worker(void * data)
+{
+  _deflate_state * state = (_deflate_state *) data;
+
+  size_t i;
+  while ((i = __sync_fetch_and_add(&state->next, 1)) <
+	 state->chunks->size()) {
+    const std::pair<const char *, size_t> &chunk = (*state->chunks)[i];
+    _deflate_chunk(chunk.first, chunk.second, (*state->members)[i]);
+  }
+  return NULL;
+}
+
+ChunkedGzWriter::ChunkedGzWriter(const std::string &filename,
+				 unsigned int n_threads) :
+  _outfile(filename.c_str(), ios::binary), _n_threads(n_threads), _offset(0)
+{
+  assert(_outfile.is_open());
+  if (_n_threads < 1) {
+    _n_threads = 1;
+  }
+}
+
+void ChunkedGzWriter::_flush_chunks()
+{
+  if (!_chunks.size()) {
+    return;
+  }
+
+  std::vector<std::vector<char> > members(_chunks.size());
+  _deflate_state state = { &_chunks, &members, 0 };
+  _run_threads(std::min((size_t) _n_threads, _chunks.size()),
+	       _deflate_worker, &state);
+
+  for (size_t i = 0; i < members.size(); i++) {
+    _outfile.write(&members[i][0], members[i].size());
+  }
+  _chunks.clear();
+}
+
+void ChunkedGzWriter::write(const void * data, size_t n)
+{
+  const char * p = (const char *) data;
+  _offset += n;
+
+  // top up the pending chunk first...
+  if (_pending.size()) {
+    const size_t k = std::min(n, GZ_CHUNK_SIZE - _pending.size());
+    _pending.insert(_pending.end(), p, p + k);
+    p += k;
+    n -= k;
+
+    if (_pending.size() < GZ_CHUNK_SIZE) {
+      return;
+    }
+    _chunks.push_back(std::make_pair(&_pending[0], _pending.size()));
+    _flush_chunks();
+    _pending.clear();
+  }
+
+  // ...then compress whole chunks straight from the caller's data, a few
+  // per thread at a time...
+  const size_t batch = _n_threads * 4;
+  while (n >= GZ_CHUNK_SIZE) {
+    _chunks.push_back(std::make_pair(p, (size_t) GZ_CHUNK_SIZE));
+    p += GZ_CHUNK_SIZE;
+    n -= GZ_CHUNK_SIZE;
+    if (_chunks.size() == batch) {
+      _flush_chunks();
+    }
+  }
+  _flush_chunks();
+
+  // ...and keep the rest for later.
+  _pending.assign(p, p + n);
+}
+
+void ChunkedGzWriter::close()
+{
+  if (!_outfile.is_open()) {
+    return;
+  }
+
+  if (_pending.size()) {
+    _chunks.push_back(std::make_pair(&_pending[0], _pending.size()));
+    _flush_chunks();
+    _pending.clear();
+  }
+  _outfile.close();
+}
+
+//
+// ChunkedGzReader
+//
+
+static void _inflate_chunk(int fd, const GzChunk &chunk, char * out)
+{
+  std::vector<char> member(chunk.member_size);
+  _pread_all(fd, &member[0], member.size(), chunk.file_offset);
+
+  z_stream z;
+  memset(&z, 0, sizeof(z));
+  int r = inflateInit2(&z, -15);
+  assert(r == Z_OK);
+
+  z.next_in = (Bytef *) &member[GZ_HEADER_SIZE];
+  z.avail_in = chunk.member_size - GZ_HEADER_SIZE - GZ_TRAILER_SIZE;
+  z.next_out = (Bytef *) out;
+  z.avail_out = chunk.size;
+  r = inflate(&z, Z_FINISH);
+  assert(r == Z_STREAM_END && z.total_out == chunk.size);
+  inflateEnd(&z);
+
+  const unsigned char * trailer = (const unsigned char *)
+    &member[chunk.member_size - GZ_TRAILER_SIZE];
+  uLong crc = crc32(0L, Z_NULL, 0);
+  crc = crc32(crc, (const Bytef *) out, chunk.size);
+  assert(_get_le32(trailer) == (crc & 0xffffffff));
+  assert(_get_le32(trailer + 4) == chunk.size);
+}
+
+bool ChunkedGzReader::is_chunked(const std::string &filename)
+{
+  int fd = open(filename.c_str(), O_RDONLY);
+  if (fd < 0) {
+    return false;
+  }
+
+  unsigned char header[GZ_HEADER_SIZE];
+  unsigned int member_size, size;
+  bool chunked = (pread(fd, header, sizeof(header), 0) == sizeof(header) &&
+		  _get_header(header, member_size, size));
+  close(fd);
+
+  return chunked;
+}
+
+ChunkedGzReader::ChunkedGzReader(const std::string &filename,
+				 unsigned int n_threads) :
+  _n_threads(n_threads), _offset(0), _size(0), _cached(0)
+{
+  if (_n_threads < 1) {
+    _n_threads = 1;
+  }
+
+  _fd = open(filename.c_str(), O_RDONLY);
+  assert(_fd >= 0);
+
+  struct stat st;
+  fstat(_fd, &st);
+
+  // build the index from the members' headers.
+  unsigned long long file_offset = 0;
+  while (file_offset < (unsigned long long) st.st_size) {
+    unsigned char header[GZ_HEADER_SIZE];
+    _pread_all(_fd, header, sizeof(header), file_offset);
+
+    GzChunk chunk;
+    bool ok = _get_header(header, chunk.member_size, chunk.size);
+    assert(ok);
+    chunk.file_offset = file_offset;
+    chunk.offset = _size;
+    _index.push_back(chunk);
+
+    file_offset += chunk.member_size;
+    _size += chunk.size;
+  }
+  _cached = _index.size();
+}
+
+ChunkedGzReader::~ChunkedGzReader()
+{
+  close(_fd);
+}
+
+// the chunk holding the given offset.
+size_t ChunkedGzReader::_find_chunk(unsigned long long offset) const
+{
+  size_t lo = 0, hi = _index.size();
+  while (hi - lo > 1) {
+    const size_t mid = (lo + hi) / 2;
+    if (_index[mid].offset <= offset) {
+      lo = mid;
+    } else {
+      hi = mid;
+    }
+  }
+  return lo;
+}
+
+struct _inflate_state {
+  int fd;
+  const std::vector<GzChunk> * index;
+  size_t first, last;		// the chunks to inflate
+  unsigned long long offset;	// what to copy out of them, and where
+  size_t n;
+  char * buf;
+  size_t next;
+};
+
+static void * _inflate_worker(void * data)
+{
+  _inflate_state * state = (_inflate_state *) data;
+  std::vector<char> scratch;
+
+  size_t i;
+  while ((i = state->first + __sync_fetch_and_add(&state->next, 1)) <=
+	 state->last) {
+    const GzChunk &chunk = (*state->index)[i];
+    const unsigned long long start = std::max(chunk.offset, state->offset);
+    const unsigned long long stop = std::min(chunk.offset + chunk.size,
+					     state->offset + state->n);
+    char * out = state->buf + (start - state->offset);
+
+    if (start == chunk.offset && stop == chunk.offset + chunk.size) {
+      _inflate_chunk(state->fd, chunk, out);
+    } else {			// only part of it is wanted
+      scratch.resize(chunk.size);
+      _inflate_chunk(state->fd, chunk, &scratch[0]);
+      memcpy(out, &scratch[start - chunk.offset], stop - start);
+    }
+  }
+  return NULL;
+}
+
+void ChunkedGzReader::read_at(unsigned long long offset, void * buf,
+			      size_t n)
+{
+  if (!n) {
+    return;
+  }
+  assert(offset + n <= _size);
+
+  const size_t first = _find_chunk(offset);
+  const size_t last = _find_chunk(offset + n - 1);
+
+  // small reads (headers and such) come out of the cached chunk.
+  if (first == last) {
+    const GzChunk &chunk = _index[first];
+    if (_cached != first) {
+      _cache.resize(chunk.size);
+      _inflate_chunk(_fd, chunk, &_cache[0]);
+      _cached = first;
+    }
+    memcpy(buf, &_cache[offset - chunk.offset], n);
+    return;
+  }
+
+  _inflate_state state = { _fd, &_index, first, last, offset, n,
+			   (char *) buf, 0 };
+  _run_threads(std::min((size_t) _n_threads, last - first + 1),
+	       _inflate_worker, &state);
+}
+
+GzReader::GzReader(const std::string &filename)
+{
+  _infile = gzopen(filename.c_str(), "rb");
+  assert(_infile != NULL);
+}
+
+GzReader::~GzReader()
+{
+  gzclose((gzFile) _infile);
+}
+
+void GzReader::read(void * buf, size_t n)
+{
+  size_t loaded = 0;
+  while (loaded != n) {		// gzread takes at most 4 GB
+    int r = gzread((gzFile) _infile, (char *) buf + loaded,
+		   std::min(n - loaded, (size_t) 1 << 30));
+    assert(r > 0);
+    loaded += r;
+  }
+}
+
+unsigned long long GzReader::tell()
+{
+  return gztell((gzFile) _infile);
+}
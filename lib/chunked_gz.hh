@@ -0,0 +1,110 @@
+#ifndef CHUNKED_GZ_HH
+#define CHUNKED_GZ_HH
+
+#include <string>
+#include <vector>
+#include <fstream>
+
+// bytes of input per chunk.
+#define GZ_CHUNK_SIZE (4 * 1024 * 1024)
+
+namespace khmer {
+
+  //
+  // Chunked gzip files, for saving tables.  The data is split into
+  // GZ_CHUNK_SIZE chunks, and each is deflated separately, on a pool of
+  // threads, into a gzip member of its own.  The members are concatenated,
+  // so the file is still a plain .gz file to gunzip (or an older khmer).
+  //
+  // Each member's header carries an extra field ('K', 'C') holding the
+  // member's size and the size of the data in it, so a reader can find
+  // every chunk (the index) by hopping from header to header without
+  // inflating anything, then inflate just the chunks it needs -- a whole
+  // table, or a range of one -- in parallel.
+  //
+
+  class ChunkedGzWriter {
+  protected:
+    std::ofstream _outfile;
+    unsigned int _n_threads;
+    unsigned long long _offset;	// bytes of input so far
+
+    // chunks waiting to be compressed, and the end of the input that
+    // doesn't fill a chunk yet.
+    std::vector<std::pair<const char *, size_t> > _chunks;
+    std::vector<char> _pending;
+
+    void _flush_chunks();
+  public:
+    ChunkedGzWriter(const std::string &filename, unsigned int n_threads = 1);
+    ~ChunkedGzWriter() { close(); }
+
+    void write(const void * data, size_t n);
+
+    // bytes written so far, before compression.
+    unsigned long long tell() const { return _offset; }
+
+    void close();
+  };
+
+  struct GzChunk {
+    unsigned long long file_offset;	// where the member starts
+    unsigned long long offset;		// where its data starts, inflated
+    unsigned int member_size;
+    unsigned int size;
+  };
+
+  class ChunkedGzReader {
+  protected:
+    int _fd;
+    unsigned int _n_threads;
+    unsigned long long _offset;
+    unsigned long long _size;
+    std::vector<GzChunk> _index;
+
+    // the last chunk inflated, for small reads.
+    size_t _cached;
+    std::vector<char> _cache;
+
+    size_t _find_chunk(unsigned long long offset) const;
+  public:
+    ChunkedGzReader(const std::string &filename, unsigned int n_threads = 1);
+    ~ChunkedGzReader();
+
+    // is filename a chunked gzip file, rather than an ordinary one?
+    static bool is_chunked(const std::string &filename);
+
+    // total bytes in the file, inflated.
+    unsigned long long size() const { return _size; }
+
+    // read n bytes from the given offset in the inflated data, inflating
+    // only the chunks they're in.
+    void read_at(unsigned long long offset, void * buf, size_t n);
+
+    // read n bytes from the current position, and move past them.
+    void read(void * buf, size_t n) {
+      read_at(_offset, buf, n);
+      _offset += n;
+    }
+
+    unsigned long long tell() const { return _offset; }
+  };
+
+  //
+  // ordinary .gz files (from gzip, or an older khmer) are read straight
+  // through gzread(), in the shape of a ChunkedGzReader.
+  //
+
+  class GzReader {
+  protected:
+    void * _infile;		// a gzFile
+  public:
+    GzReader(const std::string &filename);
+    ~GzReader();
+
+    void read(void * buf, size_t n);
+    unsigned long long tell();
+  };
+};
+
+#endif // CHUNKED_GZ_HH
@@ -2,10 +2,17 @@
 #include "counting.hh"
 #include "hashbits.hh"
 #include "parsers.hh"
+#include "read_queue.hh"
 
 #include "zlib-1.2.3/zlib.h"
+#include "chunked_gz.hh"
 #include <math.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/stat.h>
+#include <sys/mman.h>
 #include <algorithm>
+#include <map>
 
 using namespace std;
 using namespace khmer;
@@ -471,6 +478,291 @@ HashIntoType * CountingHash::abundance_distribution(std::string filename,
   return dist;
 }
 
+//
+// abundance_distribution_threaded: the same, with the calling thread
+// parsing reads into batches and n_threads workers looking them up.  Each
+// k-mer is counted once, by whichever worker sets its bits in tracking
+// first (see Hashbits::test_and_set); workers keep their own histograms
+// and add them up at the end.
+//
+
+struct _abundance_worker_state {
+  const CountingHash * ht;
+  Hashbits * tracking;
+  ReadBatchQueue * queue;
+  HashIntoType * dist;		// shared; added to under lock
+  pthread_mutex_t * lock;
+};
+
+static void * _abundance_worker(void * data)
+{
+  _abundance_worker_state * state = (_abundance_worker_state *) data;
+  const CountingHash * ht = state->ht;
+  std::vector<HashIntoType> dist(MAX_BIGCOUNT + 1, 0);
+
+  HashIntoType batch[KMER_BATCH_SIZE];
+  BoundedCounterType counts[KMER_BATCH_SIZE];
+  ReadBatch * reads;
+
+  while ((reads = state->queue->pop()) != NULL) {
+    for (ReadBatch::const_iterator it = reads->begin(); it != reads->end();
+	 ++it) {
+      if (!ht->check_read(it->seq)) {
+	continue;
+      }
+
+      KMerIterator kmers(it->seq.c_str(), ht->ksize());
+      unsigned int n;
+      while ((n = kmers.next_batch(batch, KMER_BATCH_SIZE)) > 0) {
+	unsigned int n_new = 0;
+	for (unsigned int i = 0; i < n; i++) {
+	  if (state->tracking->test_and_set(batch[i])) {
+	    batch[n_new++] = batch[i];
+	  }
+	}
+
+	ht->get_count_batch(batch, counts, n_new);
+	for (unsigned int i = 0; i < n_new; i++) {
+	  dist[counts[i]]++;
+	}
+      }
+    }
+    delete reads;
+  }
+
+  pthread_mutex_lock(state->lock);
+  for (unsigned int i = 0; i <= MAX_BIGCOUNT; i++) {
+    state->dist[i] += dist[i];
+  }
+  pthread_mutex_unlock(state->lock);
+
+  return NULL;
+}
+
+HashIntoType * CountingHash::abundance_distribution_threaded(
+					std::string filename,
+					Hashbits * tracking,
+					unsigned int n_threads,
+					CallbackFn callback,
+					void * callback_data) const
+{
+  HashIntoType * dist = new HashIntoType[MAX_BIGCOUNT + 1];
+  for (unsigned int i = 0; i <= MAX_BIGCOUNT; i++) {
+    dist[i] = 0;
+  }
+
+  if (n_threads < 1) {
+    n_threads = 1;
+  }
+
+  IParser* parser = IParser::get_parser(filename.c_str());
+
+  ReadBatchQueue queue;
+  pthread_mutex_t lock;
+  pthread_mutex_init(&lock, NULL);
+  _abundance_worker_state state = { this, tracking, &queue, dist, &lock };
+
+  std::vector<pthread_t> workers(n_threads);
+  for (unsigned int i = 0; i < n_threads; i++) {
+    pthread_create(&workers[i], NULL, _abundance_worker, &state);
+  }
+
+  ReadBatch * batch = new ReadBatch;
+  batch->reserve(READ_BATCH_SIZE);
+  unsigned long long read_num = 0;
+
+  try {
+    while(!parser->is_complete()) {
+      batch->push_back(parser->get_next_read());
+
+      if (batch->size() == READ_BATCH_SIZE) {
+	queue.push(batch);
+	batch = new ReadBatch;
+	batch->reserve(READ_BATCH_SIZE);
+      }
+
+      read_num++;
+
+      // run callback, if specified
+      if (read_num % CALLBACK_PERIOD == 0 && callback) {
+	callback("abundance_distribution", callback_data, read_num, 0);
+      }
+    }
+  } catch (...) {
+    // drain the workers before letting the error through.
+    delete batch;
+    queue.close();
+    for (unsigned int i = 0; i < n_threads; i++) {
+      pthread_join(workers[i], NULL);
+    }
+    pthread_mutex_destroy(&lock);
+    delete parser;
+    delete[] dist;
+    throw;
+  }
+
+  queue.push(batch);
+  queue.close();
+
+  for (unsigned int i = 0; i < n_threads; i++) {
+    pthread_join(workers[i], NULL);
+  }
+  pthread_mutex_destroy(&lock);
+  delete parser;
+
+  return dist;
+}
+
+//
+// approx_abundance_distribution: estimate abundance_distribution from the
+// tables alone, without the reads or a tracking table.
+//
+// A bin holds the sum of the counts of the k-mers that land in it, and
+// the number of those is Poisson, with mean lambda = (distinct k-mers) /
+// (table size).  So the distribution g of bin values is the compound
+// Poisson distribution of the k-mer abundances f, and lambda f can be
+// had back from g by running the Panjer recursion,
+//
+//   x g(x) = sum_{j = 1..x} j lambda f(j) g(x - j),
+//
+// the other way, with lambda = -ln g(0).  That's done for each table,
+// from a histogram of its bins, and the estimates averaged.
+//
+// Bins at _max_count may hold any total, so k-mers with counts that high
+// are lumped together under _max_count -- except those with bigcounts,
+// which are known exactly.
+//
+// With conservative updates a bin is no longer the sum of its k-mers'
+// counts, and none of this holds, so conservative tables are refused.
+//
+
+struct _bin_histogram_state {
+  const CountingHash * ht;
+  unsigned int table;
+  HashIntoType start, stop;
+  std::vector<HashIntoType> hist;
+};
+
+static void * _bin_histogram_worker(void * data)
+{
+  _bin_histogram_state * state = (_bin_histogram_state *) data;
+  state->ht->_get_bin_histogram(state->table, state->start, state->stop,
+				state->hist);
+  return NULL;
+}
+
+void CountingHash::_get_bin_histogram(unsigned int table, HashIntoType start,
+				      HashIntoType stop,
+				      std::vector<HashIntoType> &hist) const
+{
+  hist.assign(_max_count + 1, 0);
+
+  if (_blocked) {
+    for (HashIntoType j = start; j < stop; j++) {
+      hist[_get_bin(_counts[0], _layout.table_bin(table, j))]++;
+    }
+  } else if (_counter_bits == 8) {
+    const Byte * p = _counts[table];
+    for (HashIntoType j = start; j < stop; j++) {
+      hist[p[j]]++;
+    }
+  } else {
+    for (HashIntoType j = start; j < stop; j++) {
+      hist[_get_bin(_counts[table], j)]++;
+    }
+  }
+}
+
+HashIntoType * CountingHash::approx_abundance_distribution(
+					unsigned int n_threads) const
+{
+  if (_conservative) {
+    throw khmer_exception("cannot estimate the abundance distribution of "
+			  "a conservative-update table from its bins");
+  }
+
+  if (n_threads < 1) {
+    n_threads = 1;
+  }
+
+  std::vector<double> estimate(_max_count + 1, 0.);
+  unsigned int n_estimates = 0;
+
+  for (unsigned int i = 0; i < _n_tables; i++) {
+    const HashIntoType m = _tablesizes[i];
+
+    // histogram the table's bins, in n_threads pieces.
+    std::vector<_bin_histogram_state> states(n_threads);
+    std::vector<pthread_t> threads(n_threads);
+    for (unsigned int t = 0; t < n_threads; t++) {
+      _bin_histogram_state &st = states[t];
+      st.ht = this;
+      st.table = i;
+      st.start = m * t / n_threads;
+      st.stop = m * (t + 1) / n_threads;
+      if (t) {
+	pthread_create(&threads[t], NULL, _bin_histogram_worker, &st);
+      }
+    }
+    _bin_histogram_worker(&states[0]);
+
+    std::vector<double> g(_max_count + 1, 0.);
+    for (unsigned int t = 0; t < n_threads; t++) {
+      if (t) {
+	pthread_join(threads[t], NULL);
+      }
+      for (unsigned int x = 0; x <= _max_count; x++) {
+	g[x] += (double) states[t].hist[x] / m;
+      }
+    }
+
+    if (g[0] == 0.) {		// full; nothing to go on.
+      continue;
+    }
+    const double lambda = -log(g[0]);
+
+    // a[x] = lambda f(x).
+    std::vector<double> a(_max_count, 0.);
+    double below_max = 0.;
+    for (unsigned int x = 1; x < _max_count; x++) {
+      double sum = x * g[x];
+      for (unsigned int j = 1; j < x; j++) {
+	sum -= j * a[j] * g[x - j];
+      }
+      a[x] = sum / (x * g[0]);
+
+      estimate[x] += m * a[x];
+      below_max += a[x];
+    }
+    estimate[_max_count] += m * (lambda - below_max);
+    n_estimates++;
+  }
+
+  HashIntoType * dist = new HashIntoType[MAX_BIGCOUNT + 1];
+  for (unsigned int x = 0; x <= MAX_BIGCOUNT; x++) {
+    dist[x] = 0;
+  }
+  for (unsigned int x = 1; n_estimates && x <= _max_count; x++) {
+    const double n = estimate[x] / n_estimates;
+    dist[x] = n > 0. ? (HashIntoType) (n + .5) : 0;
+  }
+
+  // move the k-mers with bigcounts out from under _max_count.
+  for (unsigned int i = 0; i < BIGCOUNT_SHARDS; i++) {
+    KmerCountMap::const_iterator it = _bigcounts[i].begin();
+    for (; it != _bigcounts[i].end(); ++it) {
+      if (it->second > _max_count) {
+	dist[it->second]++;
+	if (dist[_max_count]) {
+	  dist[_max_count]--;
+	}
+      }
+    }
+  }
+
+  return dist;
+}
+
 HashIntoType * CountingHash::fasta_count_kmers_by_position(const std::string &inputfile,
 					     const unsigned int max_read_len,
 					     ReadMaskTable * readmask,
@@ -582,14 +874,409 @@ void CountingHash::fasta_dump_kmers_by_abundance(const std::string &inputfile,
   }
 }
 
-void CountingHash::save(std::string outfilename)
+//
+// normalize_by_median: digital normalization, streamed.  One thread
+// parses records (all of them; unlike IParser, reads with N's are kept)
+// into batches, while the calling thread makes the keep/discard calls,
+// which depend on every earlier decision, and writes the keepers.
+//
+
+struct _stream_reader_state {
+  SequenceStream * stream;
+  ReadBatchQueue * queue;
+};
+
+static void * _stream_reader(void * data)
+{
+  _stream_reader_state * state = (_stream_reader_state *) data;
+  ReadBatch * batch = new ReadBatch;
+  batch->reserve(READ_BATCH_SIZE);
+  ReadView rv;
+
+  while (state->stream->next_record(rv)) {
+    batch->push_back(Read());
+    Read &read = batch->back();
+    read.name.assign(rv.name, rv.name_len);
+    read.seq.assign(rv.seq, rv.seq_len);
+    read.quality.assign(rv.quality, rv.quality_len);
+
+    if (batch->size() == READ_BATCH_SIZE) {
+      if (!state->queue->push(batch)) {
+	batch = NULL;		// consumer gave up
+	break;
+      }
+      batch = new ReadBatch;
+      batch->reserve(READ_BATCH_SIZE);
+    }
+  }
+
+  if (batch) {
+    state->queue->push(batch);
+  }
+  state->queue->close();
+
+  return NULL;
+}
+
+// read names stop at the first space, as in screed.
+static std::string _short_name(const std::string &name)
 {
-  CountingHashFile::save(outfilename, *this);
+  return name.substr(0, name.find(' '));
 }
 
-void CountingHash::load(std::string infilename)
+static bool _is_valid_pair(const std::string &name1, const std::string &name2)
 {
-  CountingHashFile::load(infilename, *this);
+  return name1.length() && name2.length() &&
+    name1[name1.length() - 1] == '1' && name2[name2.length() - 1] == '2' &&
+    name1.compare(0, name1.length() - 1, name2, 0, name2.length() - 1) == 0;
+}
+
+void CountingHash::normalize_by_median(const std::string &infilename,
+				       const std::string &outfilename,
+				       unsigned int cutoff,
+				       bool paired,
+				       unsigned long long &n_total,
+				       unsigned long long &n_kept,
+				       CallbackFn callback,
+				       void * callback_data)
+{
+  n_total = 0;
+  n_kept = 0;
+
+  SequenceStream stream(infilename);
+  const bool is_fastq = stream.is_fastq();
+  ofstream outfile(outfilename.c_str());
+  if (!outfile.is_open()) {
+    throw khmer_file_exception("cannot open " + outfilename + " for writing");
+  }
+
+  ReadBatchQueue queue;
+  _stream_reader_state reader_state = { &stream, &queue };
+  pthread_t reader;
+  pthread_create(&reader, NULL, _stream_reader, &reader_state);
+
+  const unsigned int group_size = paired ? 2 : 1;
+  Read * group[2];
+  Read first;
+  unsigned int n_in_group = 0;
+  unsigned long long n_groups = 0;
+
+  std::vector<BoundedCounterType> scratch;
+  std::string seq_noN;
+  ReadBatch * batch = NULL;
+
+  try {
+    while ((batch = queue.pop()) != NULL) {
+      for (ReadBatch::iterator it = batch->begin(); it != batch->end(); ++it) {
+	it->name = _short_name(it->name);
+
+	// hang on to the first read of a pair; it may be in the last batch.
+	if (paired && n_in_group == 0) {
+	  std::swap(first, *it);
+	  group[0] = &first;
+	  n_in_group = 1;
+	  continue;
+	}
+	group[n_in_group] = &(*it);
+	n_in_group = 0;
+
+	if (paired && !_is_valid_pair(group[0]->name, group[1]->name)) {
+	  throw khmer_exception("Improperly interleaved pairs " +
+				group[0]->name + " " + group[1]->name);
+	}
+
+	// emit the group if any read passes the filter and all reads
+	// are at least K long.
+	bool passed_filter = false;
+	bool passed_length = true;
+
+	for (unsigned int i = 0; i < group_size; i++) {
+	  const std::string &seq = group[i]->seq;
+	  if (seq.length() < _ksize) {
+	    passed_length = false;
+	    continue;
+	  }
+
+	  const char * sp = seq.c_str();
+	  if (seq.find('N') != std::string::npos) {
+	    seq_noN = seq;
+	    std::replace(seq_noN.begin(), seq_noN.end(), 'N', 'A');
+	    sp = seq_noN.c_str();
+	  }
+
+	  BoundedCounterType median;
+	  float average, stddev;
+	  _get_median_count(sp, scratch, median, average, stddev);
+
+	  if (median < cutoff) {
+	    KMerIterator kmers(sp, _ksize);
+	    while (!kmers.done()) {
+	      count(kmers.next());
+	    }
+	    passed_filter = true;
+	  }
+	}
+
+	n_total += group_size;
+	if (passed_length && passed_filter) {
+	  for (unsigned int i = 0; i < group_size; i++) {
+	    const Read &read = *group[i];
+	    if (is_fastq) {
+	      outfile << "@" << read.name << "\n" << read.seq << "\n+\n"
+		      << read.quality << "\n";
+	    } else {
+	      outfile << ">" << read.name << "\n" << read.seq << "\n";
+	    }
+	  }
+	  n_kept += group_size;
+	}
+
+	n_groups++;
+	if (n_groups % CALLBACK_PERIOD == 0 && callback) {
+	  callback("normalize_by_median", callback_data, n_total, n_kept);
+	}
+      }
+      delete batch;
+    }
+  } catch (...) {
+    delete batch;
+    queue.close();
+    pthread_join(reader, NULL);
+    throw;
+  }
+
+  pthread_join(reader, NULL);
+  outfile.close();
+  if (outfile.fail()) {
+    throw khmer_file_exception("error writing " + outfilename);
+  }
+}
+
+//
+// filter_abund: one thread parses records into batches, as for
+// normalize_by_median; n_threads workers each take a batch, trim its
+// reads and format the keepers; and the calling thread writes the
+// formatted batches out in the order they were read.  Batches are
+// numbered as they come off the queue, and workers wait rather than get
+// more than READ_QUEUE_DEPTH batches ahead of the writer.
+//
+
+struct _filtered_batch {
+  std::string out;
+  unsigned long long n_reads;
+  unsigned long long n_kept;
+};
+
+struct _filter_abund_state {
+  const CountingHash * ht;
+  BoundedCounterType cutoff;
+  bool below;
+  bool is_fastq;
+  ReadBatchQueue * queue;
+
+  pthread_mutex_t pop_lock;
+  unsigned long long next_in;		// the number of the next batch popped
+
+  pthread_mutex_t lock;			// guards the rest
+  pthread_cond_t changed;
+  unsigned long long next_out;		// the next batch to write
+  std::map<unsigned long long, _filtered_batch *> done;
+  unsigned int n_running;
+  bool aborted;
+};
+
+static void * _filter_abund_worker(void * data)
+{
+  _filter_abund_state * state = (_filter_abund_state *) data;
+  const WordLength ksize = state->ht->ksize();
+
+  while (true) {
+    pthread_mutex_lock(&state->pop_lock);
+    ReadBatch * batch = state->queue->pop();
+    const unsigned long long n = state->next_in++;
+    pthread_mutex_unlock(&state->pop_lock);
+
+    if (!batch) {
+      break;
+    }
+
+    _filtered_batch * result = new _filtered_batch;
+    result->n_reads = batch->size();
+    result->n_kept = 0;
+
+    for (ReadBatch::const_iterator it = batch->begin(); it != batch->end();
+	 ++it) {
+      const unsigned int trim_at = state->below ?
+	state->ht->trim_below_abundance(it->seq, state->cutoff) :
+	state->ht->trim_on_abundance(it->seq, state->cutoff);
+      if (trim_at < ksize) {
+	continue;
+      }
+
+      const std::string name = _short_name(it->name);
+      if (state->is_fastq) {
+	result->out += "@" + name + "\n";
+	result->out.append(it->seq, 0, trim_at);
+	result->out += "\n+\n";
+	result->out.append(it->quality, 0, trim_at);
+	result->out += "\n";
+      } else {
+	result->out += ">" + name + "\n";
+	result->out.append(it->seq, 0, trim_at);
+	result->out += "\n";
+      }
+      result->n_kept++;
+    }
+    delete batch;
+
+    pthread_mutex_lock(&state->lock);
+    while (n >= state->next_out + READ_QUEUE_DEPTH && !state->aborted) {
+      pthread_cond_wait(&state->changed, &state->lock);
+    }
+    if (state->aborted) {
+      pthread_mutex_unlock(&state->lock);
+      delete result;
+      break;
+    }
+    state->done[n] = result;
+    pthread_cond_broadcast(&state->changed);
+    pthread_mutex_unlock(&state->lock);
+  }
+
+  pthread_mutex_lock(&state->lock);
+  state->n_running--;
+  pthread_cond_broadcast(&state->changed);
+  pthread_mutex_unlock(&state->lock);
+
+  return NULL;
+}
+
+void CountingHash::filter_abund(const std::string &infilename,
+				const std::string &outfilename,
+				BoundedCounterType cutoff,
+				bool below,
+				unsigned int n_threads,
+				unsigned long long &n_total,
+				unsigned long long &n_kept,
+				CallbackFn callback,
+				void * callback_data) const
+{
+  n_total = 0;
+  n_kept = 0;
+
+  if (n_threads < 1) {
+    n_threads = 1;
+  }
+
+  SequenceStream stream(infilename);
+  ofstream outfile(outfilename.c_str());
+  if (!outfile.is_open()) {
+    throw khmer_file_exception("cannot open " + outfilename + " for writing");
+  }
+
+  ReadBatchQueue queue;
+  _stream_reader_state reader_state = { &stream, &queue };
+  pthread_t reader;
+  pthread_create(&reader, NULL, _stream_reader, &reader_state);
+
+  _filter_abund_state state;
+  state.ht = this;
+  state.cutoff = cutoff;
+  state.below = below;
+  state.is_fastq = stream.is_fastq();
+  state.queue = &queue;
+  pthread_mutex_init(&state.pop_lock, NULL);
+  state.next_in = 0;
+  pthread_mutex_init(&state.lock, NULL);
+  pthread_cond_init(&state.changed, NULL);
+  state.next_out = 0;
+  state.n_running = n_threads;
+  state.aborted = false;
+
+  std::vector<pthread_t> workers(n_threads);
+  for (unsigned int i = 0; i < n_threads; i++) {
+    pthread_create(&workers[i], NULL, _filter_abund_worker, &state);
+  }
+
+  try {
+    while (true) {
+      pthread_mutex_lock(&state.lock);
+      std::map<unsigned long long, _filtered_batch *>::iterator it;
+      while ((it = state.done.find(state.next_out)) == state.done.end() &&
+	     state.n_running) {
+	pthread_cond_wait(&state.changed, &state.lock);
+      }
+      if (it == state.done.end()) {	// the workers are all done
+	pthread_mutex_unlock(&state.lock);
+	break;
+      }
+      _filtered_batch * result = it->second;
+      state.done.erase(it);
+      state.next_out++;
+      pthread_cond_broadcast(&state.changed);
+      pthread_mutex_unlock(&state.lock);
+
+      outfile.write(result->out.data(), result->out.size());
+      const unsigned long long last_total = n_total;
+      n_total += result->n_reads;
+      n_kept += result->n_kept;
+      delete result;
+
+      if (callback &&
+	  n_total / CALLBACK_PERIOD != last_total / CALLBACK_PERIOD) {
+	callback("filter_abund", callback_data, n_total, n_kept);
+      }
+    }
+  } catch (...) {
+    pthread_mutex_lock(&state.lock);
+    state.aborted = true;
+    pthread_cond_broadcast(&state.changed);
+    pthread_mutex_unlock(&state.lock);
+    queue.close();
+
+    for (unsigned int i = 0; i < n_threads; i++) {
+      pthread_join(workers[i], NULL);
+    }
+    pthread_join(reader, NULL);
+
+    std::map<unsigned long long, _filtered_batch *>::iterator it;
+    for (it = state.done.begin(); it != state.done.end(); ++it) {
+      delete it->second;
+    }
+    pthread_cond_destroy(&state.changed);
+    pthread_mutex_destroy(&state.lock);
+    pthread_mutex_destroy(&state.pop_lock);
+    throw;
+  }
+
+  for (unsigned int i = 0; i < n_threads; i++) {
+    pthread_join(workers[i], NULL);
+  }
+  pthread_join(reader, NULL);
+
+  pthread_cond_destroy(&state.changed);
+  pthread_mutex_destroy(&state.lock);
+  pthread_mutex_destroy(&state.pop_lock);
+  outfile.close();
+  if (outfile.fail()) {
+    throw khmer_file_exception("error writing " + outfilename);
+  }
+}
+
+void CountingHash::save(std::string outfilename, unsigned int n_threads,
+			bool allow_sparse)
+{
+  CountingHashFile::save(outfilename, *this, n_threads, allow_sparse);
+}
+
+void CountingHash::load(std::string infilename, unsigned int n_threads)
+{
+  CountingHashFile::load(infilename, *this, n_threads);
+}
+
+bool CountingHash::load_mmap(std::string infilename)
+{
+  return CountingHashFile::load_mmap(infilename, *this);
 }
 
 // technically, get medioid count... our "median" is always a member of the
@@ -600,17 +1287,31 @@ void CountingHash::get_median_count(const std::string &s,
 				    float &average,
 				    float &stddev)
 {
-  BoundedCounterType count;
   std::vector<BoundedCounterType> counts;
-  KMerIterator kmers(s.c_str(), _ksize);
-
-  while(!kmers.done()) {
-    HashIntoType kmer = kmers.next();
-    count = this->get_count(kmer);
-    counts.push_back(count);
-  }
 
+  _get_median_count(s.c_str(), counts, median, average, stddev);
   assert(counts.size());
+}
+
+// the guts of get_median_count, with the caller providing the scratch
+// vector so that it can be reused across many reads.
+
+void CountingHash::_get_median_count(const char * s,
+				     std::vector<BoundedCounterType> &counts,
+				     BoundedCounterType &median,
+				     float &average,
+				     float &stddev) const
+{
+  KMerIterator kmers(s, _ksize);
+  HashIntoType batch[KMER_BATCH_SIZE];
+  unsigned int n;
+
+  counts.clear();
+  while ((n = kmers.next_batch(batch, KMER_BATCH_SIZE)) > 0) {
+    const size_t start = counts.size();
+    counts.resize(start + n);
+    get_count_batch(batch, &counts[start], n);
+  }
 
   if (!counts.size()) {
     median = 0;
@@ -635,8 +1336,77 @@ void CountingHash::get_median_count(const std::string &s,
   stddev /= float(counts.size());
   stddev = sqrt(stddev);
 
-  sort(counts.begin(), counts.end());
-  median = counts[counts.size() / 2]; // rounds down
+  // only the middle element needs to be in place.
+  std::vector<BoundedCounterType>::iterator mid;
+  mid = counts.begin() + counts.size() / 2; // rounds down
+  nth_element(counts.begin(), mid, counts.end());
+  median = *mid;
+}
+
+//
+// get_median_counts: get_median_count for a whole batch of sequences,
+// split into contiguous chunks across n_threads threads.
+//
+
+struct _median_worker_state {
+  const CountingHash * ht;
+  const std::vector<std::string> * seqs;
+  size_t start, stop;
+  BoundedCounterType * medians;
+  float * averages;
+  float * stddevs;
+};
+
+static void * _median_counts_worker(void * data)
+{
+  _median_worker_state * state = (_median_worker_state *) data;
+  std::vector<BoundedCounterType> scratch;
+
+  for (size_t i = state->start; i < state->stop; i++) {
+    state->ht->_get_median_count((*state->seqs)[i].c_str(), scratch,
+				 state->medians[i], state->averages[i],
+				 state->stddevs[i]);
+  }
+
+  return NULL;
+}
+
+void CountingHash::get_median_counts(const std::vector<std::string> &seqs,
+				     BoundedCounterType * medians,
+				     float * averages,
+				     float * stddevs,
+				     unsigned int n_threads) const
+{
+  if (n_threads < 1) {
+    n_threads = 1;
+  }
+  if (n_threads > seqs.size()) {
+    n_threads = seqs.size() ? seqs.size() : 1;
+  }
+
+  std::vector<_median_worker_state> states(n_threads);
+  std::vector<pthread_t> workers(n_threads);
+  size_t chunk = (seqs.size() + n_threads - 1) / n_threads;
+
+  for (unsigned int t = 0; t < n_threads; t++) {
+    _median_worker_state &state = states[t];
+    state.ht = this;
+    state.seqs = &seqs;
+    state.start = std::min(seqs.size(), t * chunk);
+    state.stop = std::min(seqs.size(), (t + 1) * chunk);
+    state.medians = medians;
+    state.averages = averages;
+    state.stddevs = stddevs;
+  }
+
+  // the calling thread takes the first chunk itself.
+  for (unsigned int t = 1; t < n_threads; t++) {
+    pthread_create(&workers[t], NULL, _median_counts_worker, &states[t]);
+  }
+  _median_counts_worker(&states[0]);
+  for (unsigned int t = 1; t < n_threads; t++) {
+    pthread_join(workers[t], NULL);
+  }
 }
 
 void CountingHash::get_kadian_count(const std::string &s,
@@ -802,7 +1572,7 @@ unsigned int CountingHash::max_hamming1_count(const std::string kmer_s)
   return max_count;
 }
 
-unsigned int CountingHash::trim_on_abundance(std::string seq,
+unsigned int CountingHash::trim_on_abundance(const std::string &seq,
 					     BoundedCounterType min_abund)
   const
 {
@@ -811,238 +1581,655 @@ unsigned int CountingHash::trim_on_abundance(std::string seq,
   }
 
   KMerIterator kmers(seq.c_str(), _ksize);
+  HashIntoType batch[KMER_BATCH_SIZE];
+  BoundedCounterType counts[KMER_BATCH_SIZE];
+  unsigned int n;
+
+  // i is the length of the prefix kept so far: through the end of the
+  // last k-mer that passed.
+  unsigned int i = 0;
+  while ((n = kmers.next_batch(batch, KMER_BATCH_SIZE)) > 0) {
+    get_count_batch(batch, counts, n);
+    for (unsigned int j = 0; j < n; j++) {
+      if (counts[j] < min_abund) {
+	return i;
+      }
+      i = i ? i + 1 : _ksize;
+    }
+  }
 
-  SeenSet path;
+  if (i <= _ksize) {		// no more than one k-mer; keep nothing.
+    return 0;
+  }
 
-  HashIntoType kmer;
+  return seq.length();
+}
 
-  if (kmers.done()) { return 0; }
-  kmer = kmers.next();
 
-  if (kmers.done() || get_count(kmer) < min_abund) {
+unsigned int CountingHash::trim_below_abundance(const std::string &seq,
+						BoundedCounterType max_abund)
+  const
+{
+  if (!check_read(seq)) {
     return 0;
   }
 
-  unsigned int i = _ksize;
-  while (!kmers.done()) {
-    kmer = kmers.next();
-
-    if (get_count(kmer) < min_abund) {
-      return i;
+  KMerIterator kmers(seq.c_str(), _ksize);
+  HashIntoType batch[KMER_BATCH_SIZE];
+  BoundedCounterType counts[KMER_BATCH_SIZE];
+  unsigned int n;
+
+  // i is the length of the prefix kept so far: through the end of the
+  // last k-mer that passed.
+  unsigned int i = 0;
+  while ((n = kmers.next_batch(batch, KMER_BATCH_SIZE)) > 0) {
+    get_count_batch(batch, counts, n);
+    for (unsigned int j = 0; j < n; j++) {
+      if (counts[j] > max_abund) {
+	return i;
+      }
+      i = i ? i + 1 : _ksize;
     }
-    i++;
+  }
+
+  if (i <= _ksize) {		// no more than one k-mer; keep nothing.
+    return 0;
   }
 
   return seq.length();
 }
 
 
-unsigned int CountingHash::trim_below_abundance(std::string seq,
-						BoundedCounterType max_abund)
-  const
+//
+// add: merge the tables word by word (see merge_table_bytes), then fix
+// up the bigcounts.  Their totals come from get_count() on both tables
+// before the merge, so a k-mer that was over the limit in either one
+// keeps an exact count (up to MAX_BIGCOUNT).  The k-mers that go over
+// the limit only through the addition can't be found without a list of
+// k-mers, though, so they stay at get_counter_max().
+//
+
+void CountingHash::add(const CountingHash& other, unsigned int n_threads)
 {
-  if (!check_read(seq)) {
-    return 0;
+  if (other._ksize != _ksize || other._tablesizes != _tablesizes ||
+      other._counter_bits != _counter_bits ||
+      other._blocked != _blocked || other._fast_hash != _fast_hash ||
+      other._conservative != _conservative) {
+    throw khmer_exception("cannot add counting tables of different shapes");
   }
 
-  KMerIterator kmers(seq.c_str(), _ksize);
+  const bool use_bigcount = _use_bigcount || other._use_bigcount;
+  std::vector<std::pair<HashIntoType, unsigned int> > totals;
+  if (use_bigcount) {
+    for (unsigned int pass = 0; pass < 2; pass++) {
+      const CountingHash& ht = pass ? other : *this;
+      for (unsigned int i = 0; i < BIGCOUNT_SHARDS; i++) {
+	KmerCountMap::const_iterator it = ht._bigcounts[i].begin();
+	for (; it != ht._bigcounts[i].end(); ++it) {
+	  totals.push_back(std::make_pair(it->first, 0U));
+	}
+      }
+    }
+    std::sort(totals.begin(), totals.end());
+    totals.erase(std::unique(totals.begin(), totals.end()), totals.end());
 
-  SeenSet path;
+    for (size_t n = 0; n < totals.size(); n++) {
+      totals[n].second = (unsigned int) get_count(totals[n].first) +
+	other.get_count(totals[n].first);
+    }
+  }
 
-  HashIntoType kmer;
+  if (_blocked) {
+    merge_table_bytes(_counts[0], other._counts[0], _layout.n_bytes(),
+		      TABLE_MERGE_ADD, _counter_bits, n_threads);
+  } else {
+    for (unsigned int i = 0; i < _n_tables; i++) {
+      merge_table_bytes(_counts[i], other._counts[i],
+			_table_bytes(_tablesizes[i]), TABLE_MERGE_ADD,
+			_counter_bits, n_threads);
+    }
+  }
 
-  if (kmers.done()) { return 0; }
-  kmer = kmers.next();
+  _use_bigcount = use_bigcount;
+  for (size_t n = 0; n < totals.size(); n++) {
+    if (totals[n].second > _max_count) {
+      _bigcounts[_bigcount_shard(totals[n].first)][totals[n].first] =
+	std::min(totals[n].second, (unsigned int) MAX_BIGCOUNT);
+    }
+  }
 
-  if (kmers.done() || get_count(kmer) > max_abund) {
-    return 0;
+  recount_occupancy();
+}
+
+//
+// recount_occupancy: count the nonzero counters of the first table a word
+// at a time (see count_table_nonzero).  In a blocked table the first
+// table is the first slice of each block.
+//
+
+void CountingHash::recount_occupancy()
+{
+  HashIntoType n = 0;
+  if (_blocked) {
+    const HashIntoType slice_bytes = _layout.slice_bins * _counter_bits / 8;
+    const unsigned int slice_rest = _layout.slice_bins -
+      slice_bytes * 8 / _counter_bits;
+
+    for (HashIntoType b = 0; b < _layout.n_blocks; b++) {
+      const Byte * block = _counts[0] + b * TABLE_BLOCK_BYTES;
+      n += count_table_nonzero(block, slice_bytes, _counter_bits);
+
+      const HashIntoType first = b * _layout.block_bins +
+	_layout.slice_bins - slice_rest;
+      for (unsigned int j = 0; j < slice_rest; j++) {
+	n += _get_bin(_counts[0], first + j) != 0;
+      }
+    }
+  } else {
+    n = count_table_nonzero(_counts[0], _table_bytes(_tablesizes[0]),
+			    _counter_bits);
   }
 
-  unsigned int i = _ksize;
-  while (!kmers.done()) {
-    kmer = kmers.next();
+  _occupied_bins = n;
+  _n_unique_kmers = estimate_n_kmers(_tablesizes[0], (double) n);
+}
 
-    if (get_count(kmer) > max_abund) {
-      return i;
+//
+// bigcounts are saved as a count, then that many packed (k-mer, count)
+// records sorted by k-mer, so that they can be read with one read, and
+// files with the same counts are the same.
+//
+
+void CountingHash::_pack_bigcounts(std::vector<char>& packed) const
+{
+  std::vector<std::pair<HashIntoType, BoundedCounterType> > entries;
+  entries.reserve(n_bigcounts());
+  for (unsigned int i = 0; i < BIGCOUNT_SHARDS; i++) {
+    KmerCountMap::const_iterator it = _bigcounts[i].begin();
+    for (; it != _bigcounts[i].end(); ++it) {
+      entries.push_back(*it);
     }
-    i++;
   }
+  std::sort(entries.begin(), entries.end());
+
+  packed.resize(entries.size() * BIGCOUNT_RECORD_SIZE);
+  char * p = packed.size() ? &packed[0] : NULL;
+  for (size_t n = 0; n < entries.size(); n++) {
+    memcpy(p, &entries[n].first, sizeof(HashIntoType));
+    p += sizeof(HashIntoType);
+    memcpy(p, &entries[n].second, sizeof(BoundedCounterType));
+    p += sizeof(BoundedCounterType);
+  }
+}
 
-  return seq.length();
+void CountingHash::_unpack_bigcounts(const char * packed,
+				     HashIntoType n_counts)
+{
+  // size each shard up front, so that none of them rehash.
+  std::vector<size_t> shard_sizes(BIGCOUNT_SHARDS, 0);
+  for (HashIntoType n = 0; n < n_counts; n++) {
+    HashIntoType kmer;
+    memcpy(&kmer, packed + n * BIGCOUNT_RECORD_SIZE, sizeof(kmer));
+    shard_sizes[_bigcount_shard(kmer)]++;
+  }
+  for (unsigned int i = 0; i < BIGCOUNT_SHARDS; i++) {
+    _bigcounts[i].clear();
+    _bigcounts[i].reserve(shard_sizes[i]);
+  }
+
+  for (HashIntoType n = 0; n < n_counts; n++) {
+    HashIntoType kmer;
+    BoundedCounterType count;
+
+    memcpy(&kmer, packed, sizeof(kmer));
+    packed += sizeof(kmer);
+    memcpy(&count, packed, sizeof(count));
+    packed += sizeof(count);
+
+    _bigcounts[_bigcount_shard(kmer)][kmer] = count;
+  }
 }
 
 
-void CountingHashFile::load(const std::string &infilename, CountingHash &ht)
+void CountingHashFile::load(const std::string &infilename, CountingHash &ht,
+			    unsigned int n_threads)
 {
    std::string filename(infilename);
    int found = filename.find_last_of(".");
    std::string type = filename.substr(found+1);
 
-   if (type == "gz") { CountingHashGzFileReader(filename, ht); }
+   if (type == "gz") { CountingHashGzFileReader(filename, ht, n_threads); }
    else { CountingHashFileReader(filename, ht); }
 }
 
 
-void CountingHashFile::save(const std::string &outfilename, const CountingHash &ht)
+void CountingHashFile::save(const std::string &outfilename,
+			    const CountingHash &ht, unsigned int n_threads,
+			    bool allow_sparse)
 {
    std::string filename(outfilename);
    int found = filename.find_last_of(".");
    std::string type = filename.substr(found+1);
 
-   if (type == "gz") { CountingHashGzFileWriter(filename, ht); }
-   else { CountingHashFileWriter(filename, ht); }
+   if (type == "gz") {
+     CountingHashGzFileWriter(filename, ht, n_threads, allow_sparse);
+   } else {
+     CountingHashFileWriter(filename, ht, allow_sparse);
+   }
 }
 
 
 CountingHashFileReader::CountingHashFileReader(const std::string &infilename, CountingHash &ht)
 {
-  if (ht._counts) {
-    for (unsigned int i = 0; i < ht._n_tables; i++) {
-      delete ht._counts[i]; ht._counts[i] = NULL;
-    }
-    delete ht._counts; ht._counts = NULL;
-  }
+  ht._release_counters();
   ht._tablesizes.clear();
   
   unsigned int save_ksize = 0;
   unsigned char save_n_tables = 0;
   unsigned long long save_tablesize = 0;
   unsigned char version, ht_type, use_bigcount;
+  unsigned char counter_bits = 8;
+  unsigned char flags = 0;
+  unsigned long long save_occupied = 0, save_n_unique = 0;
+  char pad[SAVED_TABLE_ALIGNMENT];
 
   ifstream infile(infilename.c_str(), ios::binary);
   assert(infile.is_open());
 
   infile.read((char *) &version, 1);
   infile.read((char *) &ht_type, 1);
-  assert(version == SAVED_FORMAT_VERSION);
+  assert(version >= SAVED_FORMAT_VERSION &&
+	 version <= SAVED_COUNTING_FORMAT_VERSION);
   assert(ht_type == SAVED_COUNTING_HT);
 
   infile.read((char *) &use_bigcount, 1);
   infile.read((char *) &save_ksize, sizeof(save_ksize));
   infile.read((char *) &save_n_tables, sizeof(save_n_tables));
+  if (version > SAVED_TABLE_FORMAT_VERSION) {
+    infile.read((char *) &counter_bits, sizeof(counter_bits));
+  }
+  if (version >= SAVED_COUNTING_FLAGS_VERSION) {
+    infile.read((char *) &flags, sizeof(flags));
+  }
+  if (version == SAVED_COUNTING_FORMAT_VERSION) {
+    infile.read((char *) &save_occupied, sizeof(save_occupied));
+    infile.read((char *) &save_n_unique, sizeof(save_n_unique));
+  }
 
   ht._ksize = (WordLength) save_ksize;
   ht._n_tables = (unsigned int) save_n_tables;
   ht._init_bitstuff();
+  ht._set_counter_bits(counter_bits);
+  ht._blocked = flags & SAVED_TABLE_BLOCKED;
+  ht._fast_hash = flags & SAVED_TABLE_FAST_HASH;
+  ht._conservative = flags & SAVED_TABLE_CONSERVATIVE;
+  const bool sparse = flags & SAVED_TABLE_SPARSE;
 
   ht._use_bigcount = use_bigcount;
 
-  ht._counts = new Byte*[ht._n_tables];
-  for (unsigned int i = 0; i < ht._n_tables; i++) {
-    HashIntoType tablesize;
+  // version 3 interleaves table sizes with tables; later versions put
+  // all the sizes up front, and page-align each table.
+  if (version != SAVED_FORMAT_VERSION) {
+    for (unsigned int i = 0; i < ht._n_tables; i++) {
+      infile.read((char *) &save_tablesize, sizeof(save_tablesize));
+      ht._tablesizes.push_back((HashIntoType) save_tablesize);
+    }
+    infile.read(pad, table_padding(infile.tellg()));
+  }
+
+  if (ht._blocked) {
+    ht._layout.init_from_tablesize(ht._tablesizes[0],
+				   TABLE_BLOCK_BYTES * 8 / ht._counter_bits,
+				   ht._n_tables);
+    ht._allocate_counters();
+    if (sparse) {
+      read_sparse_table(infile, ht._counts[0], ht._layout.n_bytes());
+    } else {
+      infile.read((char *) ht._counts[0], ht._layout.n_bytes());
+      infile.read(pad, table_padding(infile.tellg()));
+    }
+  } else {
+    ht._counts = new Byte*[ht._n_tables];
+  }
+
+  for (unsigned int i = 0; !ht._blocked && i < ht._n_tables; i++) {
+    HashIntoType tablebytes;
 
-    infile.read((char *) &save_tablesize, sizeof(save_tablesize));
+    if (version == SAVED_FORMAT_VERSION) {
+      infile.read((char *) &save_tablesize, sizeof(save_tablesize));
+      ht._tablesizes.push_back((HashIntoType) save_tablesize);
+    }
+    tablebytes = ht._table_bytes(ht._tablesizes[i]);
 
-    tablesize = (HashIntoType) save_tablesize;
-    ht._tablesizes.push_back(tablesize);
+    ht._counts[i] = new Byte[tablebytes];
 
-    ht._counts[i] = new Byte[tablesize];
+    if (sparse) {
+      read_sparse_table(infile, ht._counts[i], tablebytes);
+      continue;
+    }
 
     unsigned long long loaded = 0;
-    while (loaded != tablesize) {
-      infile.read((char *) ht._counts[i], tablesize - loaded);
+    while (loaded != tablebytes) {
+      infile.read((char *) ht._counts[i], tablebytes - loaded);
       loaded += infile.gcount();	// do I need to do this loop?
     }
+
+    if (version != SAVED_FORMAT_VERSION) {
+      infile.read(pad, table_padding(infile.tellg()));
+    }
   }
 
   HashIntoType n_counts = 0;
   infile.read((char *) &n_counts, sizeof(n_counts));
 
   if (n_counts) {
-    ht._bigcounts.clear();
-
-    HashIntoType kmer;
-    BoundedCounterType count;
-
-    for (HashIntoType n = 0; n < n_counts; n++) {
-      infile.read((char *) &kmer, sizeof(kmer));
-      infile.read((char *) &count, sizeof(count));
-      ht._bigcounts[kmer] = count;
-    }
+    std::vector<char> packed(n_counts * BIGCOUNT_RECORD_SIZE);
+    infile.read(&packed[0], packed.size());
+    ht._unpack_bigcounts(&packed[0], n_counts);
   }
 
   infile.close();
+
+  // older files don't have the occupancy; count it.
+  if (version == SAVED_COUNTING_FORMAT_VERSION) {
+    ht._occupied_bins = save_occupied;
+    ht._n_unique_kmers = save_n_unique;
+  } else {
+    ht.recount_occupancy();
+  }
 }
 
-CountingHashGzFileReader::CountingHashGzFileReader(const std::string &infilename, CountingHash &ht)
+CountingHashGzFileReader::CountingHashGzFileReader(const std::string &infilename, CountingHash &ht, unsigned int n_threads)
 {
-  if (ht._counts) {
-    for (unsigned int i = 0; i < ht._n_tables; i++) {
-      delete ht._counts[i]; ht._counts[i] = NULL;
-    }
-    delete ht._counts; ht._counts = NULL;
+  if (ChunkedGzReader::is_chunked(infilename)) {
+    ChunkedGzReader infile(infilename, n_threads);
+    _read(infile, ht);
+  } else {
+    GzReader infile(infilename);
+    _read(infile, ht);
   }
+}
+
+template <class In>
+void CountingHashGzFileReader::_read(In &infile, CountingHash &ht)
+{
+  ht._release_counters();
   ht._tablesizes.clear();
   
   unsigned int save_ksize = 0;
   unsigned char save_n_tables = 0;
   unsigned long long save_tablesize = 0;
   unsigned char version, ht_type, use_bigcount;
+  unsigned char counter_bits = 8;
+  unsigned char flags = 0;
+  unsigned long long save_occupied = 0, save_n_unique = 0;
+  char pad[SAVED_TABLE_ALIGNMENT];
 
-  gzFile infile = gzopen(infilename.c_str(), "rb");
-
-  gzread(infile, (char *) &version, 1);
-  gzread(infile, (char *) &ht_type, 1);
-  assert(version == SAVED_FORMAT_VERSION);
+  infile.read((char *) &version, 1);
+  infile.read((char *) &ht_type, 1);
+  assert(version >= SAVED_FORMAT_VERSION &&
+	 version <= SAVED_COUNTING_FORMAT_VERSION);
   assert(ht_type == SAVED_COUNTING_HT);
 
-  gzread(infile, (char *) &use_bigcount, 1);
-  gzread(infile, (char *) &save_ksize, sizeof(save_ksize));
-  gzread(infile, (char *) &save_n_tables, sizeof(save_n_tables));
+  infile.read((char *) &use_bigcount, 1);
+  infile.read((char *) &save_ksize, sizeof(save_ksize));
+  infile.read((char *) &save_n_tables, sizeof(save_n_tables));
+  if (version > SAVED_TABLE_FORMAT_VERSION) {
+    infile.read((char *) &counter_bits, sizeof(counter_bits));
+  }
+  if (version >= SAVED_COUNTING_FLAGS_VERSION) {
+    infile.read((char *) &flags, sizeof(flags));
+  }
+  if (version == SAVED_COUNTING_FORMAT_VERSION) {
+    infile.read((char *) &save_occupied, sizeof(save_occupied));
+    infile.read((char *) &save_n_unique, sizeof(save_n_unique));
+  }
 
   ht._ksize = (WordLength) save_ksize;
   ht._n_tables = (unsigned int) save_n_tables;
   ht._init_bitstuff();
+  ht._set_counter_bits(counter_bits);
+  ht._blocked = flags & SAVED_TABLE_BLOCKED;
+  ht._fast_hash = flags & SAVED_TABLE_FAST_HASH;
+  ht._conservative = flags & SAVED_TABLE_CONSERVATIVE;
+  const bool sparse = flags & SAVED_TABLE_SPARSE;
 
   ht._use_bigcount = use_bigcount;
 
-  ht._counts = new Byte*[ht._n_tables];
-  for (unsigned int i = 0; i < ht._n_tables; i++) {
-    HashIntoType tablesize;
+  if (version != SAVED_FORMAT_VERSION) {
+    for (unsigned int i = 0; i < ht._n_tables; i++) {
+      infile.read((char *) &save_tablesize, sizeof(save_tablesize));
+      ht._tablesizes.push_back((HashIntoType) save_tablesize);
+    }
+    infile.read(pad, table_padding(infile.tell()));
+  }
 
-    gzread(infile, (char *) &save_tablesize, sizeof(save_tablesize));
+  if (ht._blocked) {
+    ht._layout.init_from_tablesize(ht._tablesizes[0],
+				   TABLE_BLOCK_BYTES * 8 / ht._counter_bits,
+				   ht._n_tables);
+    ht._allocate_counters();
+    if (sparse) {
+      read_sparse_table(infile, ht._counts[0], ht._layout.n_bytes());
+    } else {
+      infile.read((char *) ht._counts[0], ht._layout.n_bytes());
+      infile.read(pad, table_padding(infile.tell()));
+    }
+  } else {
+    ht._counts = new Byte*[ht._n_tables];
+  }
 
-    tablesize = (HashIntoType) save_tablesize;
-    ht._tablesizes.push_back(tablesize);
+  for (unsigned int i = 0; !ht._blocked && i < ht._n_tables; i++) {
+    HashIntoType tablebytes;
 
-    ht._counts[i] = new Byte[tablesize];
+    if (version == SAVED_FORMAT_VERSION) {
+      infile.read((char *) &save_tablesize, sizeof(save_tablesize));
+      ht._tablesizes.push_back((HashIntoType) save_tablesize);
+    }
+    tablebytes = ht._table_bytes(ht._tablesizes[i]);
 
-    unsigned long long loaded = 0;
-    while (loaded != tablesize) {
-      loaded += gzread(infile, (char *) ht._counts[i], tablesize - loaded);
+    ht._counts[i] = new Byte[tablebytes];
+
+    if (sparse) {
+      read_sparse_table(infile, ht._counts[i], tablebytes);
+    } else {
+      infile.read((char *) ht._counts[i], tablebytes);
+      if (version != SAVED_FORMAT_VERSION) {
+	infile.read(pad, table_padding(infile.tell()));
+      }
     }
   }
 
   HashIntoType n_counts = 0;
-  gzread(infile, (char *) &n_counts, sizeof(n_counts));
+  infile.read((char *) &n_counts, sizeof(n_counts));
 
   if (n_counts) {
-    ht._bigcounts.clear();
+    std::vector<char> packed(n_counts * BIGCOUNT_RECORD_SIZE);
+    infile.read(&packed[0], packed.size());
+    ht._unpack_bigcounts(&packed[0], n_counts);
+  }
 
-    HashIntoType kmer;
-    BoundedCounterType count;
+  if (version == SAVED_COUNTING_FORMAT_VERSION) {
+    ht._occupied_bins = save_occupied;
+    ht._n_unique_kmers = save_n_unique;
+  } else {
+    ht.recount_occupancy();
+  }
+}
+
+//
+// load_mmap: map the tables of an (uncompressed, version 4+) counting
+// table file straight into memory rather than reading them.  The mapping
+// is private, so the page cache is shared between processes until
+// someone writes to the table.
+//
+
+bool CountingHashFile::load_mmap(const std::string &infilename,
+				 CountingHash &ht)
+{
+  int fd = open(infilename.c_str(), O_RDONLY);
+  if (fd < 0) {
+    return false;
+  }
+
+  struct stat st;
+  if (fstat(fd, &st) < 0 || st.st_size < 8) {
+    close(fd);
+    return false;
+  }
+
+  Byte * base = (Byte *) mmap(NULL, st.st_size, PROT_READ | PROT_WRITE,
+			      MAP_PRIVATE, fd, 0);
+  close(fd);
+  if (base == MAP_FAILED) {
+    return false;
+  }
+
+  // header: version, type, use_bigcount, ksize, n_tables, [counter_bits,
+  // [flags, [occupied bins, unique k-mers,]]] tablesizes...
+  if (base[0] < SAVED_TABLE_FORMAT_VERSION ||
+      base[0] > SAVED_COUNTING_FORMAT_VERSION ||
+      base[1] != SAVED_COUNTING_HT) {
+    munmap(base, st.st_size);
+    return false;
+  }
+
+  unsigned int save_ksize;
+  memcpy(&save_ksize, base + 3, sizeof(save_ksize));
+  unsigned int n_tables = base[7];
+
+  // the rest of the header, with the table sizes, has to be there.
+  HashIntoType header_end = 8 + n_tables * sizeof(HashIntoType);
+  if (base[0] > SAVED_TABLE_FORMAT_VERSION) {
+    header_end += 1;
+  }
+  if (base[0] >= SAVED_COUNTING_FLAGS_VERSION) {
+    header_end += 1;
+  }
+  if (base[0] == SAVED_COUNTING_FORMAT_VERSION) {
+    header_end += 2 * sizeof(unsigned long long);
+  }
+  if (header_end > (HashIntoType) st.st_size) {
+    munmap(base, st.st_size);
+    throw khmer_file_exception(infilename + " is truncated");
+  }
+
+  HashIntoType offset = 8;
+  unsigned int counter_bits = 8;
+  unsigned char flags = 0;
+  unsigned long long save_occupied = 0, save_n_unique = 0;
+  if (base[0] > SAVED_TABLE_FORMAT_VERSION) {
+    counter_bits = base[offset];
+    offset++;
+  }
+  if (base[0] >= SAVED_COUNTING_FLAGS_VERSION) {
+    flags = base[offset];
+    offset++;
+  }
+  if (base[0] == SAVED_COUNTING_FORMAT_VERSION) {
+    memcpy(&save_occupied, base + offset, sizeof(save_occupied));
+    offset += sizeof(save_occupied);
+    memcpy(&save_n_unique, base + offset, sizeof(save_n_unique));
+    offset += sizeof(save_n_unique);
+  }
+
+  // sparsely saved tables have to be unpacked; load() them instead.
+  if (flags & SAVED_TABLE_SPARSE) {
+    munmap(base, st.st_size);
+    return false;
+  }
+
+  std::vector<HashIntoType> tablesizes(n_tables);
+  for (unsigned int i = 0; i < n_tables; i++) {
+    memcpy(&tablesizes[i], base + offset, sizeof(HashIntoType));
+    offset += sizeof(HashIntoType);
+  }
+  offset += table_padding(offset);
+
+  // and so do the tables and the bigcount count after them.
+  const bool blocked = flags & SAVED_TABLE_BLOCKED;
+  BlockedLayout layout;
+  std::vector<HashIntoType> table_offsets(n_tables);
+  HashIntoType end = offset;
+  if (blocked && n_tables) {
+    layout.init_from_tablesize(tablesizes[0],
+			       TABLE_BLOCK_BYTES * 8 / counter_bits,
+			       n_tables);
+    end = offset + layout.n_bytes();
+    end += table_padding(end);
+  }
+  for (unsigned int i = 0; !blocked && i < n_tables; i++) {
+    table_offsets[i] = end;
+    end += (tablesizes[i] * counter_bits + 7) / 8;
+    end += table_padding(end);
+  }
+  if (end + sizeof(HashIntoType) > (HashIntoType) st.st_size) {
+    munmap(base, st.st_size);
+    throw khmer_file_exception(infilename + " is truncated");
+  }
+
+  // ...and so do the bigcount records.
+  HashIntoType n_counts = 0;
+  memcpy(&n_counts, base + end, sizeof(n_counts));
+  if (n_counts > (st.st_size - end - sizeof(n_counts)) /
+      BIGCOUNT_RECORD_SIZE) {
+    munmap(base, st.st_size);
+    throw khmer_file_exception(infilename + " is truncated");
+  }
 
-    for (HashIntoType n = 0; n < n_counts; n++) {
-      gzread(infile, (char *) &kmer, sizeof(kmer));
-      gzread(infile, (char *) &count, sizeof(count));
-      ht._bigcounts[kmer] = count;
+  ht._release_counters();
+  ht._mmap_base = base;
+  ht._mmap_size = st.st_size;
+
+  ht._use_bigcount = base[2];
+  ht._ksize = (WordLength) save_ksize;
+  ht._n_tables = n_tables;
+  ht._tablesizes = tablesizes;
+  ht._init_bitstuff();
+  ht._set_counter_bits(counter_bits);
+  ht._blocked = blocked;
+  ht._fast_hash = flags & SAVED_TABLE_FAST_HASH;
+  ht._conservative = flags & SAVED_TABLE_CONSERVATIVE;
+
+  ht._counts = new Byte*[n_tables];
+  if (ht._blocked) {
+    ht._layout = layout;
+    ht._counts[0] = base + offset;
+    for (unsigned int i = 1; i < n_tables; i++) {
+      ht._counts[i] = NULL;
     }
   }
 
-  gzclose(infile);
+  for (unsigned int i = 0; !ht._blocked && i < n_tables; i++) {
+    ht._counts[i] = base + table_offsets[i];
+  }
+  offset = end + sizeof(n_counts);
+
+  ht._unpack_bigcounts((const char *) base + offset, n_counts);
+
+  if (base[0] == SAVED_COUNTING_FORMAT_VERSION) {
+    ht._occupied_bins = save_occupied;
+    ht._n_unique_kmers = save_n_unique;
+  } else {
+    ht.recount_occupancy();
+  }
+
+  return true;
 }
 
-CountingHashFileWriter::CountingHashFileWriter(const std::string &outfilename, const CountingHash &ht)
+CountingHashFileWriter::CountingHashFileWriter(const std::string &outfilename, const CountingHash &ht, bool allow_sparse)
 {
   assert(ht._counts[0]);
 
   unsigned int save_ksize = ht._ksize;
   unsigned char save_n_tables = ht._n_tables;
   unsigned long long save_tablesize;
+  char pad[SAVED_TABLE_ALIGNMENT];
+  memset(pad, 0, sizeof(pad));
 
   ofstream outfile(outfilename.c_str(), ios::binary);
 
-  unsigned char version = SAVED_FORMAT_VERSION;
+  unsigned char version = SAVED_COUNTING_FORMAT_VERSION;
   outfile.write((const char *) &version, 1);
 
   unsigned char ht_type = SAVED_COUNTING_HT;
@@ -1057,73 +2244,149 @@ CountingHashFileWriter::CountingHashFileWriter(const std::string &outfilename, c
   outfile.write((const char *) &save_ksize, sizeof(save_ksize));
   outfile.write((const char *) &save_n_tables, sizeof(save_n_tables));
 
+  unsigned char counter_bits = ht._counter_bits;
+  outfile.write((const char *) &counter_bits, sizeof(counter_bits));
+
+  unsigned char flags = 0;
+  if (ht._blocked) {
+    flags |= SAVED_TABLE_BLOCKED;
+  }
+  if (ht._fast_hash) {
+    flags |= SAVED_TABLE_FAST_HASH;
+  }
+  if (ht._conservative) {
+    flags |= SAVED_TABLE_CONSERVATIVE;
+  }
+  const bool sparse = allow_sparse && ht._save_sparse();
+  if (sparse) {
+    flags |= SAVED_TABLE_SPARSE;
+  }
+  outfile.write((const char *) &flags, sizeof(flags));
+
+  unsigned long long save_occupied = ht._occupied_bins;
+  unsigned long long save_n_unique = ht._n_unique_kmers;
+  outfile.write((const char *) &save_occupied, sizeof(save_occupied));
+  outfile.write((const char *) &save_n_unique, sizeof(save_n_unique));
+
   for (unsigned int i = 0; i < save_n_tables; i++) {
     save_tablesize = ht._tablesizes[i];
-
     outfile.write((const char *) &save_tablesize, sizeof(save_tablesize));
-    outfile.write((const char *) ht._counts[i], save_tablesize);
   }
+  outfile.write(pad, table_padding(outfile.tellp()));
 
-  HashIntoType n_counts = ht._bigcounts.size();
-  outfile.write((const char *) &n_counts, sizeof(n_counts));
+  if (ht._blocked && sparse) {
+    write_sparse_table(outfile, ht._counts[0], ht._layout.n_bytes());
+  } else if (ht._blocked) {
+    outfile.write((const char *) ht._counts[0], ht._layout.n_bytes());
+    outfile.write(pad, table_padding(outfile.tellp()));
+  }
 
-  if (n_counts) {
-    KmerCountMap::const_iterator it = ht._bigcounts.begin();
-    
-    for (; it != ht._bigcounts.end(); it++) {
-      outfile.write((const char *) &it->first, sizeof(it->first));
-      outfile.write((const char *) &it->second, sizeof(it->second));
+  for (unsigned int i = 0; !ht._blocked && i < save_n_tables; i++) {
+    const HashIntoType tablebytes = ht._table_bytes(ht._tablesizes[i]);
+    if (sparse) {
+      write_sparse_table(outfile, ht._counts[i], tablebytes);
+    } else {
+      outfile.write((const char *) ht._counts[i], tablebytes);
+      outfile.write(pad, table_padding(outfile.tellp()));
     }
   }
 
+  std::vector<char> packed;
+  ht._pack_bigcounts(packed);
+
+  HashIntoType n_counts = packed.size() / BIGCOUNT_RECORD_SIZE;
+  outfile.write((const char *) &n_counts, sizeof(n_counts));
+  if (n_counts) {
+    outfile.write(&packed[0], packed.size());
+  }
+
   outfile.close();
 }
 
-CountingHashGzFileWriter::CountingHashGzFileWriter(const std::string &outfilename, const CountingHash &ht)
+CountingHashGzFileWriter::CountingHashGzFileWriter(const std::string &outfilename, const CountingHash &ht, unsigned int n_threads, bool allow_sparse)
 {
   assert(ht._counts[0]);
 
   unsigned int save_ksize = ht._ksize;
   unsigned char save_n_tables = ht._n_tables;
   unsigned long long save_tablesize;
+  char pad[SAVED_TABLE_ALIGNMENT];
+  memset(pad, 0, sizeof(pad));
 
-  gzFile outfile = gzopen(outfilename.c_str(), "wb");
+  ChunkedGzWriter outfile(outfilename, n_threads);
 
-  unsigned char version = SAVED_FORMAT_VERSION;
-  gzwrite(outfile, (const char *) &version, 1);
+  unsigned char version = SAVED_COUNTING_FORMAT_VERSION;
+  outfile.write((const char *) &version, 1);
 
   unsigned char ht_type = SAVED_COUNTING_HT;
-  gzwrite(outfile, (const char *) &ht_type, 1);
+  outfile.write((const char *) &ht_type, 1);
 
   unsigned char use_bigcount = 0;
   if (ht._use_bigcount) {
     use_bigcount = 1;
   }
-  gzwrite(outfile, (const char *) &use_bigcount, 1);
+  outfile.write((const char *) &use_bigcount, 1);
+
+  outfile.write((const char *) &save_ksize, sizeof(save_ksize));
+  outfile.write((const char *) &save_n_tables, sizeof(save_n_tables));
+
+  unsigned char counter_bits = ht._counter_bits;
+  outfile.write((const char *) &counter_bits, sizeof(counter_bits));
+
+  unsigned char flags = 0;
+  if (ht._blocked) {
+    flags |= SAVED_TABLE_BLOCKED;
+  }
+  if (ht._fast_hash) {
+    flags |= SAVED_TABLE_FAST_HASH;
+  }
+  if (ht._conservative) {
+    flags |= SAVED_TABLE_CONSERVATIVE;
+  }
+  const bool sparse = allow_sparse && ht._save_sparse();
+  if (sparse) {
+    flags |= SAVED_TABLE_SPARSE;
+  }
+  outfile.write((const char *) &flags, sizeof(flags));
 
-  gzwrite(outfile, (const char *) &save_ksize, sizeof(save_ksize));
-  gzwrite(outfile, (const char *) &save_n_tables, sizeof(save_n_tables));
+  unsigned long long save_occupied = ht._occupied_bins;
+  unsigned long long save_n_unique = ht._n_unique_kmers;
+  outfile.write((const char *) &save_occupied, sizeof(save_occupied));
+  outfile.write((const char *) &save_n_unique, sizeof(save_n_unique));
 
   for (unsigned int i = 0; i < save_n_tables; i++) {
     save_tablesize = ht._tablesizes[i];
+    outfile.write((const char *) &save_tablesize, sizeof(save_tablesize));
+  }
+  outfile.write(pad, table_padding(outfile.tell()));
 
-    gzwrite(outfile, (const char *) &save_tablesize, sizeof(save_tablesize));
-    gzwrite(outfile, (const char *) ht._counts[i], save_tablesize);
+  if (ht._blocked && sparse) {
+    write_sparse_table(outfile, ht._counts[0], ht._layout.n_bytes());
+  } else if (ht._blocked) {
+    outfile.write((const char *) ht._counts[0], ht._layout.n_bytes());
+    outfile.write(pad, table_padding(outfile.tell()));
   }
 
-  HashIntoType n_counts = ht._bigcounts.size();
-  gzwrite(outfile, (const char *) &n_counts, sizeof(n_counts));
+  for (unsigned int i = 0; !ht._blocked && i < save_n_tables; i++) {
+    const HashIntoType tablebytes = ht._table_bytes(ht._tablesizes[i]);
+    if (sparse) {
+      write_sparse_table(outfile, ht._counts[i], tablebytes);
+    } else {
+      outfile.write((const char *) ht._counts[i], tablebytes);
+      outfile.write(pad, table_padding(outfile.tell()));
+    }
+  }
+
+  std::vector<char> packed;
+  ht._pack_bigcounts(packed);
 
+  HashIntoType n_counts = packed.size() / BIGCOUNT_RECORD_SIZE;
+  outfile.write((const char *) &n_counts, sizeof(n_counts));
   if (n_counts) {
-    KmerCountMap::const_iterator it = ht._bigcounts.begin();
-    
-    for (; it != ht._bigcounts.end(); it++) {
-      gzwrite(outfile, (const char *) &it->first, sizeof(it->first));
-      gzwrite(outfile, (const char *) &it->second, sizeof(it->second));
-    }
+    outfile.write(&packed[0], packed.size());
   }
 
-  gzclose(outfile);
+  outfile.close();
 }
 
 void CountingHash::collect_high_abundance_kmers(const std::string &filename,
@@ -2,11 +2,26 @@
 #define COUNTING_HH
 
 #include <vector>
+#include <pthread.h>
+#include <sys/mman.h>
 #include "hashtable.hh"
+#include "blocked_table.hh"
+#include "sparse_table.hh"
 #include "hashbits.hh"
 
+// number of independently locked pieces the bigcount map is split into.
+#define BIGCOUNT_SHARDS 64
+
+// default width of the counters in the tables, in bits; 4 and 2 bits
+// are also allowed, saturating at 15 and 3.
+#define DEFAULT_COUNTER_BITS 8
+
+// bytes in a saved bigcount: a k-mer and its count, packed.
+#define BIGCOUNT_RECORD_SIZE (sizeof(khmer::HashIntoType) + \
+			      sizeof(khmer::BoundedCounterType))
+
 namespace khmer {
-  typedef std::map<HashIntoType, BoundedCounterType> KmerCountMap;
+  typedef KmerMap<BoundedCounterType> KmerCountMap;
 
   class CountingHashIntersect;
   class CountingHashFile;
@@ -24,49 +39,208 @@ namespace khmer {
     friend class CountingHashGzFileWriter;
 
   protected:
-    bool _use_bigcount;		// keep track of counts > MAX_COUNT?
+    bool _use_bigcount;		// keep track of counts > _max_count?
     std::vector<HashIntoType> _tablesizes;
     unsigned int _n_tables;
 
+    // counters are _counter_bits wide, packed 8 / _counter_bits to a byte
+    // starting from the low bits; bin b lives in byte b >> _bin_shift.
+    unsigned int _counter_bits;
+    unsigned int _bin_shift;
+    BoundedCounterType _max_count;
+
     Byte ** _counts;
 
+    // if _blocked, all the counters are in one table, _counts[0], laid
+    // out by _layout; _tablesizes are the sizes of its slices.
+    bool _blocked;
+    BlockedLayout _layout;
+
+    // if _fast_hash, bins are picked by mixed_table_bin() rather than
+    // khash % _tablesizes[i], and the table sizes needn't be prime.  The
+    // bins for khash come from _bin_hash(khash), computed once.
+    bool _fast_hash;
+
+    // if _conservative, count() raises only the bins holding a k-mer's
+    // current (minimum) count; see _count_conservative().
+    bool _conservative;
+
+    // the number of occupied bins in the first table (what n_occupied()
+    // reports), and of distinct k-mers counted -- those that found one
+    // of their bins empty.  Kept up to date as k-mers are counted, and
+    // saved with the tables.
+    HashIntoType _occupied_bins;
+    HashIntoType _n_unique_kmers;
+
+    HashIntoType _bin_hash(HashIntoType khash) const {
+      return _fast_hash ? mix_table_hash(khash) : khash;
+    }
+
+    HashIntoType _table_bin(HashIntoType h, unsigned int i) const {
+      return _fast_hash ? mixed_table_bin(h, i, _tablesizes[i]) :
+	h % _tablesizes[i];
+    }
+
+    // set if the tables live in a file mapping rather than on the heap.
+    Byte * _mmap_base;
+    size_t _mmap_size;
+
+    void _set_counter_bits(unsigned int counter_bits) {
+      assert(counter_bits == 8 || counter_bits == 4 || counter_bits == 2);
+      _counter_bits = counter_bits;
+      _bin_shift = counter_bits == 8 ? 0 : (counter_bits == 4 ? 1 : 2);
+      _max_count = (1 << counter_bits) - 1;
+    }
+
+    // bytes needed to hold a table with the given number of bins.
+    HashIntoType _table_bytes(HashIntoType tablesize) const {
+      return (tablesize * _counter_bits + 7) / 8;
+    }
+
+    // switch to a blocked table using (about) as much memory as the
+    // tables in _tablesizes would.
+    void _init_blocked_layout() {
+      assert(_tablesizes.size() <= MAX_BLOCKED_TABLES);
+
+      HashIntoType n_bytes = 0;
+      for (unsigned int i = 0; i < _tablesizes.size(); i++) {
+	n_bytes += _table_bytes(_tablesizes[i]);
+      }
+      _layout.init(n_bytes, TABLE_BLOCK_BYTES * 8 / _counter_bits,
+		   _tablesizes.size());
+      _tablesizes.assign(_tablesizes.size(), _layout.tablesize());
+    }
+
     virtual void _allocate_counters() {
       _n_tables = _tablesizes.size();
 
       _counts = new Byte*[_n_tables];
+      if (_blocked) {
+	_counts[0] = _layout.allocate();
+	for (unsigned int i = 1; i < _n_tables; i++) {
+	  _counts[i] = NULL;
+	}
+	return;
+      }
+
       for (unsigned int i = 0; i < _n_tables; i++) {
-	_counts[i] = new Byte[_tablesizes[i]];
-	memset(_counts[i], 0, _tablesizes[i]);
+	const HashIntoType tablebytes = _table_bytes(_tablesizes[i]);
+	_counts[i] = new Byte[tablebytes];
+	memset(_counts[i], 0, tablebytes);
       }
     }
+
+    BoundedCounterType _get_bin(const Byte * table, HashIntoType bin) const {
+      const unsigned int shift = (bin & ((1 << _bin_shift) - 1)) *
+	_counter_bits;
+      return (table[bin >> _bin_shift] >> shift) & _max_count;
+    }
+
+    void _release_counters() {
+      if (_counts) {
+	if (_blocked && !_mmap_base) {
+	  free(_counts[0]);
+	} else if (!_mmap_base) {
+	  for (unsigned int i = 0; i < _n_tables; i++) {
+	    delete[] _counts[i];
+	    _counts[i] = NULL;
+	  }
+	}
+	delete[] _counts;
+	_counts = NULL;
+      }
+
+      if (_mmap_base) {
+	munmap(_mmap_base, _mmap_size);
+	_mmap_base = NULL;
+	_mmap_size = 0;
+      }
+      _n_tables = 0;
+    }
+
+    // the bigcounts are sharded by k-mer hash, each shard with its own
+    // lock, so that concurrent count() calls rarely contend.
+    mutable pthread_mutex_t _bigcount_locks[BIGCOUNT_SHARDS];
+
+    // conservative updates of a k-mer are done under the lock for its
+    // shard, as for the bigcounts.
+    pthread_mutex_t _update_locks[BIGCOUNT_SHARDS];
+
+    void _init_locks() {
+      for (unsigned int i = 0; i < BIGCOUNT_SHARDS; i++) {
+	pthread_mutex_init(&_bigcount_locks[i], NULL);
+	pthread_mutex_init(&_update_locks[i], NULL);
+      }
+    }
+
+    void _destroy_locks() {
+      for (unsigned int i = 0; i < BIGCOUNT_SHARDS; i++) {
+	pthread_mutex_destroy(&_bigcount_locks[i]);
+	pthread_mutex_destroy(&_update_locks[i]);
+      }
+    }
+
+    static unsigned int _bigcount_shard(HashIntoType khash) {
+      return (unsigned int) ((khash ^ (khash >> 17)) % BIGCOUNT_SHARDS);
+    }
+
+    // would saving the tables in the sparse encoding (see
+    // sparse_table.hh) take less than half the space?
+    bool _save_sparse() const {
+      HashIntoType dense = 0, sparse = 0;
+      if (_blocked) {
+	dense = _layout.n_bytes();
+	sparse = sparse_table_bytes(_counts[0], dense);
+      }
+      for (unsigned int i = 0; !_blocked && i < _n_tables; i++) {
+	const HashIntoType tablebytes = _table_bytes(_tablesizes[i]);
+	dense += tablebytes;
+	sparse += sparse_table_bytes(_counts[i], tablebytes);
+      }
+      return 2 * sparse < dense;
+    }
+
+    // the bigcounts as saved: n_bigcounts() packed (k-mer, count)
+    // records, in k-mer order.
+    void _pack_bigcounts(std::vector<char>& packed) const;
+
+    // replace the bigcounts with n_counts packed records.
+    void _unpack_bigcounts(const char * packed, HashIntoType n_counts);
   public:
-    KmerCountMap _bigcounts;
+    KmerCountMap _bigcounts[BIGCOUNT_SHARDS];
 
-    CountingHash(WordLength ksize, HashIntoType single_tablesize) :
-      khmer::Hashtable(ksize), _use_bigcount(false) {
+    CountingHash(WordLength ksize, HashIntoType single_tablesize,
+		 unsigned int counter_bits = DEFAULT_COUNTER_BITS) :
+      khmer::Hashtable(ksize), _use_bigcount(false), _blocked(false),
+      _fast_hash(false), _conservative(false), _occupied_bins(0),
+      _n_unique_kmers(0), _mmap_base(NULL), _mmap_size(0) {
       _tablesizes.push_back(single_tablesize);
       
+      _set_counter_bits(counter_bits);
       _allocate_counters();
+      _init_locks();
     }
 
-    CountingHash(WordLength ksize, std::vector<HashIntoType>& tablesizes) :
-      khmer::Hashtable(ksize), _use_bigcount(false), _tablesizes(tablesizes) {
-
+    CountingHash(WordLength ksize, std::vector<HashIntoType>& tablesizes,
+		 unsigned int counter_bits = DEFAULT_COUNTER_BITS,
+		 bool blocked = false, bool fast_hash = false,
+		 bool conservative = false) :
+      khmer::Hashtable(ksize), _use_bigcount(false), _tablesizes(tablesizes),
+      _blocked(blocked), _fast_hash(fast_hash), _conservative(conservative),
+      _occupied_bins(0), _n_unique_kmers(0), _mmap_base(NULL),
+      _mmap_size(0) {
+
+      _set_counter_bits(counter_bits);
+      if (_blocked) {
+	_init_blocked_layout();
+      }
       _allocate_counters();
+      _init_locks();
     }
 
     virtual ~CountingHash() {
-      if (_counts) {
-	for (unsigned int i = 0; i < _n_tables; i++) {
-	  delete _counts[i];
-	  _counts[i] = NULL;
-	}
-
-	delete _counts;
-	_counts = NULL;
-
-	_n_tables = 0;
-      }
+      _destroy_locks();
+      _release_counters();
     }
 
     std::vector<HashIntoType> get_tablesizes() const {
@@ -76,50 +250,290 @@ namespace khmer {
     void set_use_bigcount(bool b) { _use_bigcount = b; }
     bool get_use_bigcount() { return _use_bigcount; }
 
-    virtual void save(std::string);
-    virtual void load(std::string);
+    unsigned int get_counter_bits() const { return _counter_bits; }
+    bool is_blocked() const { return _blocked; }
+    bool has_fast_hash() const { return _fast_hash; }
+    bool is_conservative() const { return _conservative; }
+
+    // bins in each table's slice of a block, if blocked; else 0.
+    unsigned int get_slice_bins() const {
+      return _blocked ? _layout.slice_bins : 0;
+    }
+
+    // the largest count the tables themselves can hold.
+    BoundedCounterType get_counter_max() const { return _max_count; }
+
+    // total number of k-mers with counts above get_counter_max().
+    HashIntoType n_bigcounts() const {
+      HashIntoType n = 0;
+      for (unsigned int i = 0; i < BIGCOUNT_SHARDS; i++) {
+	n += _bigcounts[i].size();
+      }
+      return n;
+    }
+
+    // add the counts in other, a table of the same shape and update rule
+    // (both conservative or neither), to these ones, on n_threads
+    // threads.  Counters saturate at get_counter_max(); k-mers with
+    // bigcounts in either table get the sum of their counts.
+    void add(const CountingHash& other, unsigned int n_threads = 1);
+
+    virtual void save(std::string, unsigned int n_threads = 1,
+		      bool allow_sparse = true);
+    virtual void load(std::string, unsigned int n_threads = 1);
+
+    // map the tables of a saved file instead of reading them in; returns
+    // false if the file can't be mapped (e.g. gzipped or old format).
+    bool load_mmap(std::string);
 
     // accessors to get table info
     const HashIntoType n_entries() const { return _tablesizes[0]; }
 
-    // count number of occupied bins
+    // count number of occupied bins in the first table; the whole table's
+    // is kept as k-mers are counted, and a range of it is counted now.
     virtual const HashIntoType n_occupied(HashIntoType start=0,
 					  HashIntoType stop=0) const {
+      if (start == 0 && stop == 0) {
+	return _occupied_bins;
+      }
+
       HashIntoType n = 0;
       if (stop == 0) { stop = _tablesizes[0]; }
       for (HashIntoType i = start; i < stop; i++) {
-	if (_counts[0][i % _tablesizes[0]]) {
+	const HashIntoType bin = i % _tablesizes[0];
+	if (_blocked ? _get_bin(_counts[0], _layout.table_bin(0, bin)) :
+	    _get_bin(_counts[0], bin)) {
 	  n++;
 	}
       }
       return n;
     }
 
+    // the number of distinct k-mers counted.  Like a Bloom filter, this
+    // misses k-mers whose bins were all taken already.
+    const HashIntoType n_unique_kmers() const { return _n_unique_kmers; }
+
+    // recount the occupancy from the tables, and estimate the number of
+    // distinct k-mers from it, e.g. for files saved before they were kept.
+    void recount_occupancy();
+
     virtual void count(const char * kmer) {
       HashIntoType hash = _hash(kmer, _ksize);
       count(hash);
     }
 
+    // count() is safe to call from several threads at once: the table
+    // bins are bumped with a compare-and-swap saturating increment of the
+    // byte holding them, and the bigcounts are updated under a per-shard
+    // lock.
+    //
+    // With bigcounts, the last step of a bin (to _max_count) is only ever
+    // taken with the k-mer's shard lock held; see _count_near_full.
     virtual void count(HashIntoType khash) {
-      unsigned int n_full = 0;
-      for (unsigned int i = 0; i < _n_tables; i++) {
-	const HashIntoType bin = khash % _tablesizes[i];
+      if (_conservative) {
+	_count_conservative(khash);
+	return;
+      }
+
+      HashIntoType bins[MAX_BLOCKED_TABLES];
+      if (_blocked) {
+	_layout.get_bins(khash, bins);
+      }
+      const HashIntoType h = _bin_hash(khash);
+      const BoundedCounterType limit = _use_bigcount ? _max_count - 1 :
+	_max_count;
+
+      bool is_new_kmer = false;
+      unsigned int i;
+      for (i = 0; i < _n_tables; i++) {
+	Byte * table = _blocked ? _counts[0] : _counts[i];
+	const HashIntoType bin = _blocked ? bins[i] : _table_bin(h, i);
+	const BoundedCounterType old = _bump_bin(table, bin, limit);
+
+	if (old >= limit && _use_bigcount) {
+	  break;			// the rest is done under the lock
+	}
 
-	if (_counts[i][bin] < MAX_COUNT) {
-	  _counts[i][bin] += 1;
-	} else {
-	  n_full++;
+	// old is what the bin held before, so exactly one count sees it
+	// empty.
+	if (!old) {
+	  is_new_kmer = true;
+	  if (i == 0) {
+	    __sync_fetch_and_add(&_occupied_bins, 1);
+	  }
 	}
       }
 
-      if (n_full == _n_tables && _use_bigcount) {
-	if (_bigcounts[khash] == 0) {
-	  _bigcounts[khash] = MAX_COUNT + 1;
-	} else {
-	  if (_bigcounts[khash] < MAX_BIGCOUNT) {
-	    _bigcounts[khash] += 1;
+      if (i < _n_tables) {
+	is_new_kmer = _count_near_full(khash, bins, h, i) || is_new_kmer;
+      }
+      if (is_new_kmer) {
+	__sync_fetch_and_add(&_n_unique_kmers, 1);
+      }
+    }
+
+    // add one to the counter for bin if it's below limit; returns what it
+    // held before.
+    BoundedCounterType _bump_bin(Byte * table, HashIntoType bin,
+				 BoundedCounterType limit) {
+      const unsigned int shift = (bin & ((1 << _bin_shift) - 1)) *
+	_counter_bits;
+      Byte * cell = &table[bin >> _bin_shift];
+      Byte current = *cell;
+
+      while (((current >> shift) & _max_count) < limit) {
+	Byte seen = __sync_val_compare_and_swap(cell, current,
+						current + (1 << shift));
+	if (seen == current) {
+	  break;
+	}
+	current = seen;		// lost the race; retry with new value
+      }
+      return (current >> shift) & _max_count;
+    }
+
+    // count a k-mer whose bins are all full.
+    void _count_big(HashIntoType khash) {
+      const unsigned int shard = _bigcount_shard(khash);
+
+      pthread_mutex_lock(&_bigcount_locks[shard]);
+      _add_bigcount(khash, 1);
+      pthread_mutex_unlock(&_bigcount_locks[shard]);
+    }
+
+    // add n to a k-mer's bigcount, with its shard's lock held.
+    void _add_bigcount(HashIntoType khash, unsigned int n) {
+      KmerCountMap& bigcounts = _bigcounts[_bigcount_shard(khash)];
+      const unsigned int count = bigcounts[khash] ? bigcounts[khash] :
+	_max_count;
+
+      bigcounts[khash] = count + n < MAX_BIGCOUNT ? count + n : MAX_BIGCOUNT;
+    }
+
+    // finish a count that has bumped khash's bins in tables [0, first)
+    // and found the one in table first at _max_count - 1 or more, under
+    // khash's shard lock.  Returns true if it found any bin empty.
+    //
+    // If every bin is full, the count goes into the bigcounts; otherwise
+    // the rest of the bins are bumped, up to _max_count.
+    //
+    // Counts outside the lock bump their bins in table order and never
+    // fill one, so the bin that fills last can't lag behind the counts
+    // that have got through every table: by the time all the bins are
+    // full, exactly _max_count counts have, and each count still in
+    // flight finds them full and comes here for its bigcount.  However
+    // wide the counters, no count is lost.
+    bool _count_near_full(HashIntoType khash, const HashIntoType * bins,
+			  HashIntoType h, unsigned int first) {
+      const unsigned int shard = _bigcount_shard(khash);
+      bool found_empty = false;
+
+      pthread_mutex_lock(&_bigcount_locks[shard]);
+      if (_get_table_count(khash) == _max_count) {
+	_add_bigcount(khash, 1);
+      } else {
+	for (unsigned int i = first; i < _n_tables; i++) {
+	  const BoundedCounterType old = _blocked ?
+	    _bump_bin(_counts[0], bins[i], _max_count) :
+	    _bump_bin(_counts[i], _table_bin(h, i), _max_count);
+	  found_empty = found_empty || !old;
+	}
+      }
+      pthread_mutex_unlock(&_bigcount_locks[shard]);
+
+      return found_empty;
+    }
+
+    // raise the counter for bin to at least target (<= _max_count), and
+    // return true if it was empty.
+    bool _raise_bin(Byte * table, HashIntoType bin,
+		    BoundedCounterType target) {
+      const unsigned int shift = (bin & ((1 << _bin_shift) - 1)) *
+	_counter_bits;
+      Byte * cell = &table[bin >> _bin_shift];
+      Byte current = *cell;
+
+      while (((current >> shift) & _max_count) < target) {
+	const Byte raised = (current & ~(_max_count << shift)) |
+	  (target << shift);
+	Byte seen = __sync_val_compare_and_swap(cell, current, raised);
+	if (seen == current) {
+	  break;
+	}
+	current = seen;		// lost the race; retry with new value
+      }
+      return !((current >> shift) & _max_count);
+    }
+
+    // conservative update: with c the k-mer's current count (the minimum
+    // over its bins), raise each of its bins to c + 1 if it's below that,
+    // and leave the rest alone.  Counts are still never underestimated,
+    // but k-mers sharing a bin inflate each other's counts much less.
+    //
+    // Two threads counting the same k-mer at once could both read c and
+    // lose a count, so the read and raise are done under the k-mer's
+    // shard lock.  Other k-mers only ever raise a shared bin, which is
+    // done with a compare-and-swap.
+    void _count_conservative(HashIntoType khash) {
+      const unsigned int shard = _bigcount_shard(khash);
+
+      pthread_mutex_lock(&_update_locks[shard]);
+      const BoundedCounterType min_count = _get_table_count(khash);
+      if (min_count < _max_count) {
+	HashIntoType bins[MAX_BLOCKED_TABLES];
+	if (_blocked) {
+	  _layout.get_bins(khash, bins);
+	}
+	const HashIntoType h = _bin_hash(khash);
+
+	for (unsigned int i = 0; i < _n_tables; i++) {
+	  const bool was_empty = _blocked ?
+	    _raise_bin(_counts[0], bins[i], min_count + 1) :
+	    _raise_bin(_counts[i], _table_bin(h, i), min_count + 1);
+	  if (was_empty && i == 0) {
+	    __sync_fetch_and_add(&_occupied_bins, 1);
 	  }
 	}
+	if (!min_count) {
+	  __sync_fetch_and_add(&_n_unique_kmers, 1);
+	}
+      }
+      pthread_mutex_unlock(&_update_locks[shard]);
+
+      if (min_count >= _max_count && _use_bigcount) {
+	_count_big(khash);
+      }
+    }
+
+    // the count for khash in the tables, ignoring the bigcounts.
+    BoundedCounterType _get_table_count(HashIntoType khash) const {
+      HashIntoType bins[MAX_BLOCKED_TABLES];
+      if (_blocked) {
+	_layout.get_bins(khash, bins);
+      }
+      const HashIntoType h = _bin_hash(khash);
+
+      BoundedCounterType min_count = _max_count;
+      for (unsigned int i = 0; i < _n_tables; i++) {
+	BoundedCounterType the_count = _blocked ?
+	  _get_bin(_counts[0], bins[i]) :
+	  _get_bin(_counts[i], _table_bin(h, i));
+	if (the_count < min_count) {
+	  min_count = the_count;
+	}
+      }
+      return min_count;
+    }
+
+    virtual void prefetch(HashIntoType khash, bool for_write = false) const {
+      if (_blocked) {
+	prefetch_address(_counts[0] + _layout.block_offset(khash), for_write);
+	return;
+      }
+
+      const HashIntoType h = _bin_hash(khash);
+      for (unsigned int i = 0; i < _n_tables; i++) {
+	prefetch_address(&_counts[i][_table_bin(h, i) >> _bin_shift], for_write);
       }
     }
 
@@ -131,18 +545,17 @@ namespace khmer {
 
     // get the count for the given k-mer hash.
     virtual const BoundedCounterType get_count(HashIntoType khash) const {
-      BoundedCounterType min_count = MAX_COUNT;
-      for (unsigned int i = 0; i < _n_tables; i++) {
-	BoundedCounterType the_count = _counts[i][khash % _tablesizes[i]];
-	if (the_count < min_count) {
-	  min_count = the_count;
-	}
-      }
-      if (min_count == MAX_COUNT && _use_bigcount) {
-	KmerCountMap::const_iterator it = _bigcounts.find(khash);
-	if (it != _bigcounts.end()) {
+      BoundedCounterType min_count = _get_table_count(khash);
+      if (min_count == _max_count && _use_bigcount) {
+	const unsigned int shard = _bigcount_shard(khash);
+	const KmerCountMap& bigcounts = _bigcounts[shard];
+
+	pthread_mutex_lock(&_bigcount_locks[shard]);
+	KmerCountMap::const_iterator it = bigcounts.find(khash);
+	if (it != bigcounts.end()) {
 	  min_count = it->second;
 	}
+	pthread_mutex_unlock(&_bigcount_locks[shard]);
       }
       return min_count;
     }
@@ -199,6 +612,33 @@ namespace khmer {
 			  float &average,
 			  float &stddev);
 
+    void _get_median_count(const char * s,
+			   std::vector<BoundedCounterType> &scratch,
+			   BoundedCounterType &median,
+			   float &average,
+			   float &stddev) const;
+
+    // get_median_count for each of seqs; the output arrays must have
+    // room for seqs.size() entries.
+    void get_median_counts(const std::vector<std::string> &seqs,
+			   BoundedCounterType * medians,
+			   float * averages,
+			   float * stddevs,
+			   unsigned int n_threads = 1) const;
+
+    // digital normalization: stream the reads in infilename, keeping (and
+    // counting) those with a median k-mer count below cutoff.  In paired
+    // mode, reads come in interleaved pairs that are kept or dropped
+    // together; improperly paired reads raise a khmer_exception.
+    void normalize_by_median(const std::string &infilename,
+			     const std::string &outfilename,
+			     unsigned int cutoff,
+			     bool paired,
+			     unsigned long long &n_total,
+			     unsigned long long &n_kept,
+			     CallbackFn callback = NULL,
+			     void * callback_data = NULL);
+
     void get_kadian_count(const std::string &s,
 			  BoundedCounterType &kadian,
 			  unsigned int nk = 1);
@@ -208,6 +648,24 @@ namespace khmer {
 					  CallbackFn callback = NULL,
 					  void * callback_data = NULL) const;
 
+    HashIntoType * abundance_distribution_threaded(std::string filename,
+						   Hashbits * tracking,
+						   unsigned int n_threads,
+						   CallbackFn callback = NULL,
+						   void * callback_data = NULL)
+      const;
+
+    // an estimate of abundance_distribution for all the k-mers counted,
+    // from the tables alone; see counting.cc.  Not for conservative
+    // tables (throws khmer_exception).
+    HashIntoType * approx_abundance_distribution(unsigned int n_threads = 1)
+      const;
+
+    // count the values of bins [start, stop) of the given table.
+    void _get_bin_histogram(unsigned int table, HashIntoType start,
+			    HashIntoType stop,
+			    std::vector<HashIntoType> &hist) const;
+
     HashIntoType * fasta_count_kmers_by_position(const std::string &inputfile,
 					 const unsigned int max_read_len,
 					 ReadMaskTable * old_readmask = NULL,
@@ -231,11 +689,26 @@ namespace khmer {
 
     unsigned int max_hamming1_count(const std::string kmer);
 
-    unsigned int trim_on_abundance(std::string seq,
+    unsigned int trim_on_abundance(const std::string &seq,
 				   BoundedCounterType min_abund) const;
-    unsigned int trim_below_abundance(std::string seq,
+    unsigned int trim_below_abundance(const std::string &seq,
 				      BoundedCounterType max_abund) const;
 
+    // trim every read in infilename at its first k-mer below cutoff (or,
+    // with below set, above it), as trim_on_abundance (trim_below_abundance)
+    // does, and write the reads with anything left, qualities trimmed to
+    // match, to outfilename in their original order.  The reads are
+    // trimmed on n_threads threads.
+    void filter_abund(const std::string &infilename,
+		      const std::string &outfilename,
+		      BoundedCounterType cutoff,
+		      bool below,
+		      unsigned int n_threads,
+		      unsigned long long &n_total,
+		      unsigned long long &n_kept,
+		      CallbackFn callback = NULL,
+		      void * callback_data = NULL) const;
+
     void collect_high_abundance_kmers(const std::string &infilename,
 				      unsigned int lower_count,
 				      unsigned int upper_count,
@@ -245,8 +718,11 @@ namespace khmer {
 
   class CountingHashFile {
   public:
-    static void load(const std::string &infilename, CountingHash &ht);
-    static void save(const std::string &outfilename, const CountingHash &ht);
+    static void load(const std::string &infilename, CountingHash &ht,
+		     unsigned int n_threads = 1);
+    static void save(const std::string &outfilename, const CountingHash &ht,
+		     unsigned int n_threads = 1, bool allow_sparse = true);
+    static bool load_mmap(const std::string &infilename, CountingHash &ht);
   };
 
   class CountingHashFileReader : public CountingHashFile {
@@ -254,20 +730,26 @@ namespace khmer {
     CountingHashFileReader(const std::string &infilename, CountingHash &ht);
   };
 
+  // reads both chunked (see ChunkedGzReader) and plain .gz files.
   class CountingHashGzFileReader : public CountingHashFile {
+    template <class In> void _read(In &infile, CountingHash &ht);
   public:
-    CountingHashGzFileReader(const std::string &infilename, CountingHash &ht);
+    CountingHashGzFileReader(const std::string &infilename, CountingHash &ht,
+			     unsigned int n_threads = 1);
   };
 
 
   class CountingHashFileWriter : public CountingHashFile {
   public:
-    CountingHashFileWriter(const std::string &outfilename, const CountingHash &ht);
+    CountingHashFileWriter(const std::string &outfilename, const CountingHash &ht,
+			   bool allow_sparse = true);
   };
 
   class CountingHashGzFileWriter : public CountingHashFile {
   public:
-    CountingHashGzFileWriter(const std::string &outfilename, const CountingHash &ht);
+    CountingHashGzFileWriter(const std::string &outfilename, const CountingHash &ht,
+			     unsigned int n_threads = 1,
+			     bool allow_sparse = true);
   };
 };
 
@@ -1,23 +1,81 @@
 #include "hashtable.hh"
 #include "hashbits.hh"
 #include "parsers.hh"
+#include "chunked_gz.hh"
 #include <iostream>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/stat.h>
+#include <stdio.h>
+#include <math.h>
+#include <algorithm>
 #define MAX_KEEPER_SIZE int(1e6)
 
 using namespace std;
 using namespace khmer;
 
-void Hashbits::save(std::string outfilename)
+//
+// .ht files are written and read through one of these, or, for .gz
+// files, a ChunkedGzWriter / ChunkedGzReader.
+//
+
+class _FileOut {
+  ofstream _outfile;
+public:
+  _FileOut(const std::string &filename) :
+    _outfile(filename.c_str(), ios::binary) { }
+
+  void write(const void * data, size_t n) {
+    _outfile.write((const char *) data, n);
+  }
+  unsigned long long tell() { return _outfile.tellp(); }
+  void close() { _outfile.close(); }
+};
+
+class _FileIn {
+  ifstream _infile;
+public:
+  _FileIn(const std::string &filename) :
+    _infile(filename.c_str(), ios::binary) {
+    assert(_infile.is_open());
+  }
+
+  void read(void * buf, size_t n) {
+    _infile.read((char *) buf, n);
+  }
+  unsigned long long tell() { return _infile.tellg(); }
+};
+
+static bool _is_gz(const std::string &filename)
+{
+  return filename.size() > 3 &&
+    filename.compare(filename.size() - 3, 3, ".gz") == 0;
+}
+
+void Hashbits::save(std::string outfilename, unsigned int n_threads,
+		    bool allow_sparse)
+{
+  if (_is_gz(outfilename)) {
+    ChunkedGzWriter outfile(outfilename, n_threads);
+    _save(outfile, allow_sparse);
+  } else {
+    _FileOut outfile(outfilename);
+    _save(outfile, allow_sparse);
+  }
+}
+
+template <class Out>
+void Hashbits::_save(Out &outfile, bool allow_sparse) const
 {
   assert(_counts[0]);
 
   unsigned int save_ksize = _ksize;
   unsigned char save_n_tables = _n_tables;
   unsigned long long save_tablesize;
+  char pad[SAVED_TABLE_ALIGNMENT];
+  memset(pad, 0, sizeof(pad));
 
-  ofstream outfile(outfilename.c_str(), ios::binary);
-
-  unsigned char version = SAVED_FORMAT_VERSION;
+  unsigned char version = SAVED_HASHBITS_FORMAT_VERSION;
   outfile.write((const char *) &version, 1);
 
   unsigned char ht_type = SAVED_HASHBITS;
@@ -26,154 +84,488 @@ void Hashbits::save(std::string outfilename)
   outfile.write((const char *) &save_ksize, sizeof(save_ksize));
   outfile.write((const char *) &save_n_tables, sizeof(save_n_tables));
 
+  unsigned char flags = 0;
+  if (_blocked) {
+    flags |= SAVED_TABLE_BLOCKED;
+  }
+  if (_fast_hash) {
+    flags |= SAVED_TABLE_FAST_HASH;
+  }
+  const bool sparse = allow_sparse && _save_sparse();
+  if (sparse) {
+    flags |= SAVED_TABLE_SPARSE;
+  }
+  outfile.write((const char *) &flags, sizeof(flags));
+
+  unsigned long long save_occupied = _occupied_bins;
+  unsigned long long save_n_unique = _n_unique_kmers;
+  outfile.write((const char *) &save_occupied, sizeof(save_occupied));
+  outfile.write((const char *) &save_n_unique, sizeof(save_n_unique));
+
   for (unsigned int i = 0; i < _n_tables; i++) {
     save_tablesize = _tablesizes[i];
-    unsigned long long tablebytes = save_tablesize / 8 + 1;
-
     outfile.write((const char *) &save_tablesize, sizeof(save_tablesize));
+  }
+  outfile.write(pad, table_padding(outfile.tell()));
 
-    outfile.write((const char *) _counts[i], tablebytes);
+  if (_blocked) {
+    if (sparse) {
+      write_sparse_table(outfile, _counts[0], _layout.n_bytes());
+    } else {
+      outfile.write((const char *) _counts[0], _layout.n_bytes());
+      outfile.write(pad, table_padding(outfile.tell()));
+    }
+    outfile.close();
+    return;
+  }
+
+  for (unsigned int i = 0; i < _n_tables; i++) {
+    unsigned long long tablebytes = _tablesizes[i] / 8 + 1;
+
+    if (sparse) {
+      write_sparse_table(outfile, _counts[i], tablebytes);
+    } else {
+      outfile.write((const char *) _counts[i], tablebytes);
+      outfile.write(pad, table_padding(outfile.tell()));
+    }
   }
   outfile.close();
 }
 
-void Hashbits::load(std::string infilename)
+void Hashbits::load(std::string infilename, unsigned int n_threads)
 {
-  if (_counts) {
-    for (unsigned int i = 0; i < _n_tables; i++) {
-      delete _counts[i]; _counts[i] = NULL;
-    }
-    delete _counts; _counts = NULL;
+  if (_is_gz(infilename) && ChunkedGzReader::is_chunked(infilename)) {
+    ChunkedGzReader infile(infilename, n_threads);
+    _load(infile);
+  } else if (_is_gz(infilename)) {
+    GzReader infile(infilename);
+    _load(infile);
+  } else {
+    _FileIn infile(infilename);
+    _load(infile);
   }
+}
+
+template <class In>
+void Hashbits::_load(In &infile)
+{
+  _release_counters();
   _tablesizes.clear();
   
   unsigned int save_ksize = 0;
   unsigned char save_n_tables = 0;
   unsigned long long save_tablesize = 0;
   unsigned char version, ht_type;
-
-  ifstream infile(infilename.c_str(), ios::binary);
-  assert(infile.is_open());
+  unsigned char flags = 0;
+  unsigned long long save_occupied = 0, save_n_unique = 0;
+  char pad[SAVED_TABLE_ALIGNMENT];
 
   infile.read((char *) &version, 1);
   infile.read((char *) &ht_type, 1);
-  assert(version == SAVED_FORMAT_VERSION);
+  assert(version == SAVED_FORMAT_VERSION ||
+	 (version >= SAVED_TABLE_FORMAT_VERSION &&
+	  version <= SAVED_HASHBITS_FORMAT_VERSION));
   assert(ht_type == SAVED_HASHBITS);
 
   infile.read((char *) &save_ksize, sizeof(save_ksize));
   infile.read((char *) &save_n_tables, sizeof(save_n_tables));
+  if (version >= SAVED_HASHBITS_FLAGS_VERSION) {
+    infile.read((char *) &flags, sizeof(flags));
+  }
+  if (version == SAVED_HASHBITS_FORMAT_VERSION) {
+    infile.read((char *) &save_occupied, sizeof(save_occupied));
+    infile.read((char *) &save_n_unique, sizeof(save_n_unique));
+  }
 
   _ksize = (WordLength) save_ksize;
   _n_tables = (unsigned int) save_n_tables;
   _init_bitstuff();
+  _blocked = flags & SAVED_TABLE_BLOCKED;
+  _fast_hash = flags & SAVED_TABLE_FAST_HASH;
+  const bool sparse = flags & SAVED_TABLE_SPARSE;
 
-  _counts = new Byte*[_n_tables];
-  for (unsigned int i = 0; i < _n_tables; i++) {
+  // version 3 interleaves table sizes with tables; later versions put
+  // all the sizes up front, and page-align each table.
+  if (version != SAVED_FORMAT_VERSION) {
+    for (unsigned int i = 0; i < _n_tables; i++) {
+      infile.read((char *) &save_tablesize, sizeof(save_tablesize));
+      _tablesizes.push_back((HashIntoType) save_tablesize);
+    }
+    infile.read(pad, table_padding(infile.tell()));
+  }
+
+  if (_blocked) {
+    _layout.init_from_tablesize(_tablesizes[0], TABLE_BLOCK_BYTES * 8,
+				_n_tables);
+    _allocate_counters();
+    if (sparse) {
+      read_sparse_table(infile, _counts[0], _layout.n_bytes());
+    } else {
+      infile.read((char *) _counts[0], _layout.n_bytes());
+    }
+  }
+
+  if (!_blocked) {
+    _counts = new Byte*[_n_tables];
+  }
+  for (unsigned int i = 0; !_blocked && i < _n_tables; i++) {
     HashIntoType tablesize;
     unsigned long long tablebytes;
 
-    infile.read((char *) &save_tablesize, sizeof(save_tablesize));
-
-    tablesize = (HashIntoType) save_tablesize;
-    _tablesizes.push_back(tablesize);
+    if (version == SAVED_FORMAT_VERSION) {
+      infile.read((char *) &save_tablesize, sizeof(save_tablesize));
+      _tablesizes.push_back((HashIntoType) save_tablesize);
+    }
+    tablesize = _tablesizes[i];
 
     tablebytes = tablesize / 8 + 1;
     _counts[i] = new Byte[tablebytes];
 
-    unsigned long long loaded = 0;
-    while (loaded != tablebytes) {
-      infile.read((char *) _counts[i], tablebytes - loaded);
-      loaded += infile.gcount();	// do I need to do this loop?
+    if (sparse) {
+      read_sparse_table(infile, _counts[i], tablebytes);
+    } else {
+      infile.read((char *) _counts[i], tablebytes);
+      if (version != SAVED_FORMAT_VERSION) {
+	infile.read(pad, table_padding(infile.tell()));
+      }
+    }
+  }
+
+  // older files don't have the occupancy; count it.
+  if (version == SAVED_HASHBITS_FORMAT_VERSION) {
+    _occupied_bins = save_occupied;
+    _n_unique_kmers = save_n_unique;
+  } else {
+    recount_occupancy();
+  }
+}
+
+//
+// load_mmap: map the tables of a version 4+ file straight into memory.
+// The mapping is private, so the page cache is shared between processes
+// until someone writes to the table.
+//
+
+bool Hashbits::load_mmap(std::string infilename)
+{
+  int fd = open(infilename.c_str(), O_RDONLY);
+  if (fd < 0) {
+    return false;
+  }
+
+  struct stat st;
+  if (fstat(fd, &st) < 0 || st.st_size < 7) {
+    close(fd);
+    return false;
+  }
+
+  Byte * base = (Byte *) mmap(NULL, st.st_size, PROT_READ | PROT_WRITE,
+			      MAP_PRIVATE, fd, 0);
+  close(fd);
+  if (base == MAP_FAILED) {
+    return false;
+  }
+
+  // header: version, type, ksize, n_tables, [flags, [occupied bins,
+  // unique k-mers,]] tablesizes...
+  if (base[0] < SAVED_TABLE_FORMAT_VERSION ||
+      base[0] > SAVED_HASHBITS_FORMAT_VERSION ||
+      base[1] != SAVED_HASHBITS) {
+    munmap(base, st.st_size);
+    return false;
+  }
+
+  unsigned int save_ksize;
+  memcpy(&save_ksize, base + 2, sizeof(save_ksize));
+  unsigned int n_tables = base[6];
+
+  // the rest of the header, with the table sizes, has to be there.
+  HashIntoType header_end = 7 + n_tables * sizeof(HashIntoType);
+  if (base[0] >= SAVED_HASHBITS_FLAGS_VERSION) {
+    header_end += 1;
+  }
+  if (base[0] == SAVED_HASHBITS_FORMAT_VERSION) {
+    header_end += 2 * sizeof(unsigned long long);
+  }
+  if (header_end > (HashIntoType) st.st_size) {
+    munmap(base, st.st_size);
+    throw khmer_file_exception(infilename + " is truncated");
+  }
+
+  HashIntoType offset = 7;
+  unsigned char flags = 0;
+  unsigned long long save_occupied = 0, save_n_unique = 0;
+  if (base[0] >= SAVED_HASHBITS_FLAGS_VERSION) {
+    flags = base[offset];
+    offset++;
+  }
+  if (base[0] == SAVED_HASHBITS_FORMAT_VERSION) {
+    memcpy(&save_occupied, base + offset, sizeof(save_occupied));
+    offset += sizeof(save_occupied);
+    memcpy(&save_n_unique, base + offset, sizeof(save_n_unique));
+    offset += sizeof(save_n_unique);
+  }
+
+  // sparsely saved tables have to be unpacked; load() them instead.
+  if (flags & SAVED_TABLE_SPARSE) {
+    munmap(base, st.st_size);
+    return false;
+  }
+
+  std::vector<HashIntoType> tablesizes(n_tables);
+  for (unsigned int i = 0; i < n_tables; i++) {
+    memcpy(&tablesizes[i], base + offset, sizeof(HashIntoType));
+    offset += sizeof(HashIntoType);
+  }
+  offset += table_padding(offset);
+
+  // and so do the tables.
+  const bool blocked = flags & SAVED_TABLE_BLOCKED;
+  BlockedLayout layout;
+  std::vector<HashIntoType> table_offsets(n_tables);
+  HashIntoType end = offset;
+  if (blocked && n_tables) {
+    layout.init_from_tablesize(tablesizes[0], TABLE_BLOCK_BYTES * 8,
+			       n_tables);
+    end = offset + layout.n_bytes();
+  }
+  for (unsigned int i = 0; !blocked && i < n_tables; i++) {
+    table_offsets[i] = offset;
+    end = offset + tablesizes[i] / 8 + 1;
+    offset = end + table_padding(end);
+  }
+  if (end > (HashIntoType) st.st_size) {
+    munmap(base, st.st_size);
+    throw khmer_file_exception(infilename + " is truncated");
+  }
+
+  _release_counters();
+  _mmap_base = base;
+  _mmap_size = st.st_size;
+
+  _ksize = (WordLength) save_ksize;
+  _n_tables = n_tables;
+  _tablesizes = tablesizes;
+  _init_bitstuff();
+  _blocked = blocked;
+  _fast_hash = flags & SAVED_TABLE_FAST_HASH;
+
+  _counts = new Byte*[n_tables];
+  if (_blocked) {
+    _layout = layout;
+    _counts[0] = base + offset;
+    for (unsigned int i = 1; i < n_tables; i++) {
+      _counts[i] = NULL;
     }
   }
-  infile.close();
+
+  for (unsigned int i = 0; !_blocked && i < n_tables; i++) {
+    _counts[i] = base + table_offsets[i];
+  }
+
+  if (base[0] == SAVED_HASHBITS_FORMAT_VERSION) {
+    _occupied_bins = save_occupied;
+    _n_unique_kmers = save_n_unique;
+  } else {
+    recount_occupancy();
+  }
+
+  return true;
+}
+//
+// update / intersection_update: OR or AND the tables word by word (see
+// merge_table_bytes).  Neither table keeps a list of its k-mers, so the
+// occupancy is recounted from the bits afterwards.
+//
+
+void Hashbits::update(const Hashbits& other, unsigned int n_threads)
+{
+  _merge(other, TABLE_MERGE_OR, n_threads);
+}
+
+void Hashbits::intersection_update(const Hashbits& other,
+				   unsigned int n_threads)
+{
+  _merge(other, TABLE_MERGE_AND, n_threads);
+}
+
+void Hashbits::_merge(const Hashbits& other, TableMergeOp op,
+		      unsigned int n_threads)
+{
+  if (other._ksize != _ksize || other._tablesizes != _tablesizes ||
+      other._blocked != _blocked || other._fast_hash != _fast_hash) {
+    throw khmer_exception("cannot merge presence tables of different shapes");
+  }
+
+  if (_blocked) {
+    merge_table_bytes(_counts[0], other._counts[0], _layout.n_bytes(), op,
+		      1, n_threads);
+  } else {
+    for (unsigned int i = 0; i < _n_tables; i++) {
+      merge_table_bytes(_counts[i], other._counts[i], _tablesizes[i] / 8 + 1,
+			op, 1, n_threads);
+    }
+  }
+  recount_occupancy();
+}
+
+//
+// recount_occupancy: count the set bits a word at a time, and estimate
+// the number of unique k-mers from the average occupancy of a table.
+//
+
+void Hashbits::recount_occupancy()
+{
+  HashIntoType n_set = 0;
+  if (_blocked) {
+    n_set = count_table_bits(_counts[0], _layout.n_bytes());
+  } else {
+    for (unsigned int i = 0; i < _n_tables; i++) {
+      n_set += count_table_bits(_counts[i], _tablesizes[i] / 8 + 1);
+    }
+  }
+  _occupied_bins = n_set;
+  _n_unique_kmers = estimate_n_kmers(_tablesizes[0],
+				     (double) n_set / _n_tables);
 }
 
 //////////////////////////////////////////////////////////////////////
 // graph stuff
 
+//
+// calc_connected_graph_size: a depth-first traversal, with an explicit
+// stack of k-mers to visit rather than recursion, so that big components
+// can't run off the end of the C stack.
+//
+
 void Hashbits::calc_connected_graph_size(const HashIntoType kmer_f,
 					 const HashIntoType kmer_r,
 					 unsigned long long& count,
 					 SeenSet& keeper,
 					 const unsigned long long threshold,
-					 bool break_on_circum)
+					 bool break_on_circum,
+					 std::vector<HashIntoType> * counted)
 const
 {
-  HashIntoType kmer = uniqify_rc(kmer_f, kmer_r);
-  const BoundedCounterType val = get_count(kmer);
+  const unsigned int rc_left_shift = _ksize*2 - 2;
+  static const char bases[] = "ACGT";
 
-  if (val == 0) {
-    return;
-  }
+  std::vector<std::pair<HashIntoType, HashIntoType> > stack;
+  stack.push_back(std::make_pair(kmer_f, kmer_r));
 
-  // have we already seen me? don't count; exit.
-  if (set_contains(keeper, kmer)) {
-    return;
-  }
+  while (!stack.empty()) {
+    const HashIntoType f = stack.back().first;
+    const HashIntoType r = stack.back().second;
+    stack.pop_back();
 
-  // is this in stop_tags?
-  if (set_contains(stop_tags, kmer)) {
-    return;
-  }
+    HashIntoType kmer = uniqify_rc(f, r);
 
-  // keep track of both seen kmers, and counts.
-  keeper.insert(kmer);
+    if (get_count(kmer) == 0) {
+      continue;
+    }
 
-  // is this a high-circumference k-mer? if so, don't count it; get outta here!
-  if (break_on_circum && \
-      kmer_degree(kmer_f, kmer_r) > 4) {
-    return;
-  }
+    // have we already seen me? don't count; move on.
+    if (set_contains(keeper, kmer)) {
+      continue;
+    }
 
-  count += 1;
+    // is this in stop_tags?
+    if (set_contains(stop_tags, kmer)) {
+      continue;
+    }
 
-  // are we past the threshold? truncate search.
-  if (threshold && count >= threshold) {
-    return;
-  }
+    keeper.insert(kmer);
 
-  // otherwise, explore in all directions.
+    // is this a high-circumference k-mer? if so, don't count it, or go
+    // any further this way.
+    if (break_on_circum && kmer_degree(f, r) > 4) {
+      continue;
+    }
 
-  // NEXT.
+    count += 1;
+    if (counted) {
+      counted->push_back(kmer);
+    }
 
-  HashIntoType f, r;
-  const unsigned int rc_left_shift = _ksize*2 - 2;
+    // are we at the threshold? truncate search.
+    if (threshold && count >= threshold) {
+      return;
+    }
 
-  f = next_f(kmer_f, 'A');
-  r = next_r(kmer_r, 'A');
-  calc_connected_graph_size(f, r, count, keeper, threshold, break_on_circum);
+    // otherwise, explore in all directions: the previous k-mers are
+    // pushed first, so the next ones are visited first, as before.
+    for (int i = 3; i >= 0; i--) {
+      stack.push_back(std::make_pair(prev_f(f, bases[i]),
+				     prev_r(r, bases[i])));
+    }
+    for (int i = 3; i >= 0; i--) {
+      stack.push_back(std::make_pair(next_f(f, bases[i]),
+				     next_r(r, bases[i])));
+    }
+  }
+}
 
-  f = next_f(kmer_f, 'C');
-  r = next_r(kmer_r, 'C');
-  calc_connected_graph_size(f, r, count, keeper, threshold, break_on_circum);
+unsigned long long Hashbits::connected_graph_size(HashIntoType kmer_f,
+						  HashIntoType kmer_r,
+						  GraphSizeCache &cache,
+						  unsigned long long threshold,
+						  bool break_on_circum) const
+{
+  unsigned long long size = 0;
+  if (cache.lookup(uniqify_rc(kmer_f, kmer_r), threshold, size)) {
+    return size;
+  }
 
-  f = next_f(kmer_f, 'G');
-  r = next_r(kmer_r, 'G');
-  calc_connected_graph_size(f, r, count, keeper, threshold, break_on_circum);
+  SeenSet keeper;
+  std::vector<HashIntoType> counted;
+  calc_connected_graph_size(kmer_f, kmer_r, size, keeper, threshold,
+			    break_on_circum, &counted);
 
-  f = next_f(kmer_f, 'T');
-  r = next_r(kmer_r, 'T');
-  calc_connected_graph_size(f, r, count, keeper, threshold, break_on_circum);
+  // a traversal that stopped at the threshold may have missed some.
+  cache.add(counted, size, !(threshold && size >= threshold));
+  return size;
+}
 
-  // PREVIOUS.
+void Hashbits::calc_connected_graph_sizes(const std::string &filename,
+					  std::vector<unsigned long long> &sizes,
+					  GraphSizeCache &cache,
+					  unsigned long long threshold,
+					  bool break_on_circum,
+					  CallbackFn callback,
+					  void * callback_data) const
+{
+  IParser* parser = IParser::get_parser(filename.c_str());
+  Read read;
+  unsigned int total_reads = 0;
 
-  
-  r = prev_r(kmer_r, 'A');
-  f = prev_f(kmer_f, 'A');
-  calc_connected_graph_size(f, r, count, keeper, threshold, break_on_circum);
+  while(!parser->is_complete()) {
+    read = parser->get_next_read();
 
-  r = prev_r(kmer_r, 'C');
-  f = prev_f(kmer_f, 'C');
-  calc_connected_graph_size(f, r, count, keeper, threshold, break_on_circum);
+    unsigned long long size = 0;
+    if (read.seq.length() >= _ksize) {
+      const std::string first_kmer = read.seq.substr(0, _ksize);
+      if (check_read(first_kmer)) {
+	HashIntoType f, r;
+	_hash(first_kmer.c_str(), _ksize, f, r);
+	size = connected_graph_size(f, r, cache, threshold, break_on_circum);
+      }
+    }
+    sizes.push_back(size);
+    total_reads++;
 
-  r = prev_r(kmer_r, 'G');
-  f = prev_f(kmer_f, 'G');
-  calc_connected_graph_size(f, r, count, keeper, threshold, break_on_circum);
+    // run callback, if specified
+    if (total_reads % CALLBACK_PERIOD == 0 && callback) {
+      try {
+	callback("calc_connected_graph_sizes", callback_data, total_reads,
+		 cache.hits);
+      } catch (...) {
+	delete parser; parser = NULL;
+	throw;
+      }
+    }
+  }
 
-  r = prev_r(kmer_r, 'T');
-  f = prev_f(kmer_f, 'T');
-  calc_connected_graph_size(f, r, count, keeper, threshold, break_on_circum);
+  delete parser; parser = NULL;
 }
 
 void Hashbits::save_tagset(std::string outfilename)
@@ -348,29 +740,39 @@ void Hashbits::consume_sequence_and_tag(const std::string& seq,
 
   KMerIterator kmers(seq.c_str(), _ksize);
   HashIntoType kmer;
+  HashIntoType batch[KMER_BATCH_SIZE];
+  unsigned int n;
 
   unsigned int since = _tag_density / 2 + 1;
 
-  while(!kmers.done()) {
-    kmer = kmers.next();
-
-    is_new_kmer = (bool) !get_count(kmer);
-    if (is_new_kmer) {
-      count(kmer);
-      n_consumed++;
+  // k-mers are taken in batches whose bins are all prefetched first; each
+  // is still looked up, counted and tagged in order.
+  while ((n = kmers.next_batch(batch, KMER_BATCH_SIZE)) > 0) {
+    for (unsigned int i = 0; i < n; i++) {
+      prefetch(batch[i], true);
     }
 
-    if (!is_new_kmer && set_contains(all_tags, kmer)) {
-      since = 1;
-      if (found_tags) { found_tags->insert(kmer); }
-    } else {
-      since++;
-    }
+    for (unsigned int i = 0; i < n; i++) {
+      kmer = batch[i];
 
-    if (since >= _tag_density) {
-      all_tags.insert(kmer);
-      if (found_tags) { found_tags->insert(kmer); }
-      since = 1;
+      is_new_kmer = (bool) !get_count(kmer);
+      if (is_new_kmer) {
+	count(kmer);
+	n_consumed++;
+      }
+
+      if (!is_new_kmer && set_contains(all_tags, kmer)) {
+	since = 1;
+	if (found_tags) { found_tags->insert(kmer); }
+      } else {
+	since++;
+      }
+
+      if (since >= _tag_density) {
+	all_tags.insert(kmer);
+	if (found_tags) { found_tags->insert(kmer); }
+	since = 1;
+      }
     }
   }
 
@@ -500,18 +902,213 @@ void Hashbits::consume_fasta_and_tag_with_stoptags(const std::string &filename,
 //
 
 void Hashbits::divide_tags_into_subsets(unsigned int subset_size,
-					 SeenSet& divvy)
+					 std::vector<HashIntoType>& divvy)
 {
-  unsigned int i = 0;
+  std::vector<HashIntoType> tags;
+  get_tags_in_range(0, 0, tags);
+
+  divvy.clear();
+  for (size_t i = 0; i < tags.size(); i += subset_size) {
+    divvy.push_back(tags[i]);
+  }
+}
+
+//
+// partition_all - partition all of the subsets from
+//   divide_tags_into_subsets on a pool of worker threads.  Workers grab the
+//   next unclaimed subset off a shared cursor, so a thread that lands on
+//   cheap subsets just takes more of them; the main thread only waits and
+//   reports progress.  Each subset is written to a temp file and renamed
+//   into place, so a .pmap file that exists is always complete.
+//
 
-  for (SeenSet::const_iterator si = all_tags.begin(); si != all_tags.end();
-       si++) {
-    if (i % subset_size == 0) {
-      divvy.insert(*si);
-      i = 0;
+struct _PartitionAllState {
+  Hashbits * ht;
+  const std::string * basename;
+  const std::vector<HashIntoType> * divvy;
+  bool break_on_stop_tags;
+  bool stop_big_traversals;
+
+  unsigned int next_subset;	// claimed with __sync_fetch_and_add
+  unsigned int n_done;
+  volatile bool stop;
+  std::string error;
+
+  pthread_mutex_t lock;
+  pthread_cond_t subset_done;
+};
+
+static std::string _subset_filename(const std::string& basename,
+				    unsigned int n)
+{
+  char buf[32];
+  snprintf(buf, sizeof(buf), ".subset.%u.pmap", n);
+  return basename + buf;
+}
+
+static void * _partition_all_worker(void * data)
+{
+  _PartitionAllState * state = (_PartitionAllState *) data;
+  const std::vector<HashIntoType>& divvy = *state->divvy;
+
+  while (!state->stop) {
+    unsigned int n = __sync_fetch_and_add(&state->next_subset, 1);
+    if (n >= divvy.size()) {
+      break;
     }
-    i++;
+
+    std::string outfile = _subset_filename(*state->basename, n);
+    std::string error;
+
+    struct stat st;
+    if (stat(outfile.c_str(), &st) != 0) {
+      try {
+	SubsetPartition subset(state->ht);
+	subset.do_partition(divvy[n], n + 1 < divvy.size() ? divvy[n + 1] : 0,
+			    state->break_on_stop_tags,
+			    state->stop_big_traversals);
+
+	std::string tmpfile = outfile + ".tmp";
+	subset.save_partitionmap(tmpfile);
+	if (rename(tmpfile.c_str(), outfile.c_str()) != 0) {
+	  error = "cannot write " + outfile;
+	}
+      } catch (khmer_exception &e) {
+	error = e.get_message();
+      } catch (std::exception &e) {
+	error = e.what();
+      }
+    }
+
+    pthread_mutex_lock(&state->lock);
+    if (!error.empty()) {
+      state->error = error;
+      state->stop = true;
+    }
+    state->n_done++;
+    pthread_cond_signal(&state->subset_done);
+    pthread_mutex_unlock(&state->lock);
+  }
+
+  return NULL;
+}
+
+unsigned int Hashbits::partition_all(const std::string& basename,
+				     unsigned int n_threads,
+				     unsigned int subset_size,
+				     bool break_on_stop_tags,
+				     bool stop_big_traversals,
+				     CallbackFn callback,
+				     void * callback_data)
+{
+  std::vector<HashIntoType> divvy;
+  divide_tags_into_subsets(subset_size, divvy);
+
+  const unsigned int n_subsets = divvy.size();
+  if (n_threads > n_subsets) {
+    n_threads = n_subsets;
+  }
+  if (n_threads == 0) {
+    return n_subsets;
+  }
+
+  _PartitionAllState state;
+  state.ht = this;
+  state.basename = &basename;
+  state.divvy = &divvy;
+  state.break_on_stop_tags = break_on_stop_tags;
+  state.stop_big_traversals = stop_big_traversals;
+  state.next_subset = 0;
+  state.n_done = 0;
+  state.stop = false;
+  pthread_mutex_init(&state.lock, NULL);
+  pthread_cond_init(&state.subset_done, NULL);
+
+  std::vector<pthread_t> threads(n_threads);
+  unsigned int n_started = 0;
+  for (; n_started < n_threads; n_started++) {
+    if (pthread_create(&threads[n_started], NULL, _partition_all_worker,
+		       &state) != 0) {
+      break;
+    }
+  }
+  if (n_started == 0) {
+    state.error = "cannot start partitioning threads";
+    state.stop = true;
+  }
+
+  // wait for the subsets to come in, reporting each one.
+  try {
+    unsigned int n_reported = 0;
+
+    pthread_mutex_lock(&state.lock);
+    while (!state.stop && n_reported < n_subsets) {
+      while (!state.stop && state.n_done == n_reported) {
+	pthread_cond_wait(&state.subset_done, &state.lock);
+      }
+      n_reported = state.n_done;
+      pthread_mutex_unlock(&state.lock);
+
+      if (callback) {
+	callback("partition_all", callback_data, n_reported, n_subsets);
+      }
+
+      pthread_mutex_lock(&state.lock);
+    }
+    pthread_mutex_unlock(&state.lock);
+  } catch (...) {
+    state.stop = true;
+    for (unsigned int i = 0; i < n_started; i++) {
+      pthread_join(threads[i], NULL);
+    }
+    pthread_cond_destroy(&state.subset_done);
+    pthread_mutex_destroy(&state.lock);
+    throw;
   }
+
+  for (unsigned int i = 0; i < n_started; i++) {
+    pthread_join(threads[i], NULL);
+  }
+  pthread_cond_destroy(&state.subset_done);
+  pthread_mutex_destroy(&state.lock);
+
+  if (!state.error.empty()) {
+    throw khmer_exception(state.error);
+  }
+
+  return n_subsets;
+}
+
+//
+// get_tags_in_range - all_tags is unordered, so keep a sorted copy around
+//   to slice subsets out of.  Safe to call from several partitioning
+//   threads at once (as long as nobody is adding tags).
+//
+
+void Hashbits::get_tags_in_range(HashIntoType first, HashIntoType last,
+				 std::vector<HashIntoType>& tags)
+{
+  pthread_mutex_lock(&_sorted_tags_lock);
+
+  if (!_sorted_tags_valid ||
+      _sorted_tags_generation != all_tags.generation()) {
+    all_tags.get_sorted(_sorted_tags);
+    _sorted_tags_generation = all_tags.generation();
+    _sorted_tags_valid = true;
+  }
+
+  std::vector<HashIntoType>::const_iterator start, end;
+  start = _sorted_tags.begin();
+  if (first) {
+    start = std::lower_bound(_sorted_tags.begin(), _sorted_tags.end(), first);
+  }
+  end = _sorted_tags.end();
+  if (last) {
+    end = std::lower_bound(start, end, last);
+  }
+  tags.assign(start, end);
+
+  pthread_mutex_unlock(&_sorted_tags_lock);
 }
 
 static PartitionID _parse_partition_id(string name)
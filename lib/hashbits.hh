@@ -2,7 +2,12 @@
 #define HASHBITS_HH
 
 #include <vector>
+#include <deque>
+#include <pthread.h>
+#include <sys/mman.h>
 #include "hashtable.hh"
+#include "blocked_table.hh"
+#include "sparse_table.hh"
 #include "subset.hh"
 
 #define next_f(kmer_f, ch) ((((kmer_f) << 2) & bitmask) | (twobit_repr(ch)))
@@ -16,6 +21,103 @@
 namespace khmer {
   class CountingHash;
 
+  //
+  // GraphSizeCache: component sizes already measured by
+  // Hashbits::connected_graph_size, looked up by any k-mer counted in
+  // them, so that another query landing in the same component needs no
+  // traversal.  A traversal cut short at a threshold is kept as "at
+  // least this big", which still answers queries with that threshold or
+  // a lower one.
+  //
+  // At most max_kmers k-mers are kept; the oldest components go first.
+  // The sizes are only good for the table, stop tags and break_on_circum
+  // they were measured with, so clear() the cache if any of those change.
+  //
+
+  class GraphSizeCache {
+  protected:
+    struct _Component {
+      unsigned long long size;
+      bool complete;
+      std::vector<HashIntoType> kmers;
+    };
+
+    KmerMap<unsigned long long> _serials; // k-mer => its component's serial
+    std::deque<_Component> _components;	  // oldest first
+    unsigned long long _first_serial;	  // serial of _components.front()
+    unsigned long long _n_kmers;
+    unsigned long long _max_kmers;
+
+    void _evict_oldest() {
+      const _Component &c = _components.front();
+      for (size_t i = 0; i < c.kmers.size(); i++) {
+	KmerMap<unsigned long long>::iterator it = _serials.find(c.kmers[i]);
+	if (it != _serials.end() && it->second == _first_serial) {
+	  _serials.erase(c.kmers[i]);
+	}
+      }
+      _n_kmers -= c.kmers.size();
+      _components.pop_front();
+      _first_serial++;
+    }
+  public:
+    unsigned long long hits, misses;
+
+    GraphSizeCache(unsigned long long max_kmers) :
+      _first_serial(0), _n_kmers(0), _max_kmers(max_kmers),
+      hits(0), misses(0) { }
+
+    // the size of kmer's component, as a traversal with the given
+    // threshold would find it, if that's known.
+    bool lookup(HashIntoType kmer, unsigned long long threshold,
+		unsigned long long &size) {
+      KmerMap<unsigned long long>::const_iterator it = _serials.find(kmer);
+      if (it != _serials.end()) {
+	const _Component &c = _components[it->second - _first_serial];
+	if (c.complete || (threshold && c.size >= threshold)) {
+	  size = (threshold && c.size > threshold) ? threshold : c.size;
+	  hits++;
+	  return true;
+	}
+      }
+      misses++;
+      return false;
+    }
+
+    // remember the k-mers counted by a traversal, and what it found.  A
+    // traversal that counted none (from a stop tag, say) leaves nothing
+    // to look up, and would never be evicted, so it isn't kept.
+    void add(const std::vector<HashIntoType> &kmers, unsigned long long size,
+	     bool complete) {
+      if (kmers.empty() || kmers.size() > _max_kmers) {
+	return;
+      }
+      while (_n_kmers + kmers.size() > _max_kmers) {
+	_evict_oldest();
+      }
+
+      const unsigned long long serial = _first_serial + _components.size();
+      _components.push_back(_Component());
+      _Component &c = _components.back();
+      c.size = size;
+      c.complete = complete;
+      c.kmers = kmers;
+      for (size_t i = 0; i < kmers.size(); i++) {
+	_serials[kmers[i]] = serial;
+      }
+      _n_kmers += kmers.size();
+    }
+
+    void clear() {
+      _serials.clear();
+      _components.clear();
+      _first_serial = 0;
+      _n_kmers = 0;
+    }
+
+    unsigned long long n_kmers() const { return _n_kmers; }
+  };
+
   class Hashbits : public khmer::Hashtable {
     friend class SubsetPartition;
   protected:
@@ -27,6 +129,72 @@ namespace khmer {
 	HashIntoType _n_overlap_kmers;
     Byte ** _counts;
 
+    // if _blocked, all the bits are in one table, _counts[0], laid out
+    // by _layout; _tablesizes are the sizes of its slices.
+    bool _blocked;
+    BlockedLayout _layout;
+
+    // if _fast_hash, bins are picked by mixed_table_bin() rather than
+    // khash % _tablesizes[i], and the table sizes needn't be prime.  The
+    // bins for khash come from _bin_hash(khash), computed once.
+    bool _fast_hash;
+
+    HashIntoType _bin_hash(HashIntoType khash) const {
+      return _fast_hash ? mix_table_hash(khash) : khash;
+    }
+
+    HashIntoType _table_bin(HashIntoType h, unsigned int i) const {
+      return _fast_hash ? mixed_table_bin(h, i, _tablesizes[i]) :
+	h % _tablesizes[i];
+    }
+
+    // set if the tables live in a file mapping rather than on the heap.
+    Byte * _mmap_base;
+    size_t _mmap_size;
+
+    // all_tags in sorted order, for handing out ranges of tags to
+    // partition; rebuilt when all_tags changes.
+    std::vector<HashIntoType> _sorted_tags;
+    unsigned long long _sorted_tags_generation;
+    bool _sorted_tags_valid;
+    pthread_mutex_t _sorted_tags_lock;
+
+    // switch to a blocked table using (about) as much memory as the
+    // tables in _tablesizes would.
+    void _init_blocked_layout() {
+      assert(_tablesizes.size() <= MAX_BLOCKED_TABLES);
+
+      HashIntoType n_bytes = 0;
+      for (unsigned int i = 0; i < _tablesizes.size(); i++) {
+	n_bytes += _tablesizes[i] / 8 + 1;
+      }
+      _layout.init(n_bytes, TABLE_BLOCK_BYTES * 8, _tablesizes.size());
+      _tablesizes.assign(_tablesizes.size(), _layout.tablesize());
+    }
+
+    void _merge(const Hashbits& other, TableMergeOp op,
+		unsigned int n_threads);
+
+    // would saving the tables in the sparse encoding (see
+    // sparse_table.hh) take less than half the space?
+    bool _save_sparse() const {
+      HashIntoType dense = 0, sparse = 0;
+      if (_blocked) {
+	dense = _layout.n_bytes();
+	sparse = sparse_table_bytes(_counts[0], dense);
+      }
+      for (unsigned int i = 0; !_blocked && i < _n_tables; i++) {
+	const HashIntoType tablebytes = _tablesizes[i] / 8 + 1;
+	dense += tablebytes;
+	sparse += sparse_table_bytes(_counts[i], tablebytes);
+      }
+      return 2 * sparse < dense;
+    }
+
+    // save to, or load from, a _FileOut / ChunkedGzWriter (and so on).
+    template <class Out> void _save(Out &outfile, bool allow_sparse) const;
+    template <class In> void _load(In &infile);
+
     virtual void _allocate_counters() {
       _n_tables = _tablesizes.size();
 
@@ -35,6 +203,14 @@ namespace khmer {
 
       _counts = new Byte*[_n_tables];
 
+      if (_blocked) {
+	_counts[0] = _layout.allocate();
+	for (unsigned int i = 1; i < _n_tables; i++) {
+	  _counts[i] = NULL;
+	}
+	return;
+      }
+
       for (unsigned int i = 0; i < _n_tables; i++) {
 	tablesize = _tablesizes[i];
 	tablebytes = tablesize / 8 + 1;
@@ -43,6 +219,28 @@ namespace khmer {
 	memset(_counts[i], 0, tablebytes);
       }
     }
+
+    void _release_counters() {
+      if (_counts) {
+	if (_blocked && !_mmap_base) {
+	  free(_counts[0]);
+	} else if (!_mmap_base) {
+	  for (unsigned int i = 0; i < _n_tables; i++) {
+	    delete[] _counts[i];
+	    _counts[i] = NULL;
+	  }
+	}
+	delete[] _counts;
+	_counts = NULL;
+      }
+
+      if (_mmap_base) {
+	munmap(_mmap_base, _mmap_size);
+	_mmap_base = NULL;
+	_mmap_size = 0;
+      }
+      _n_tables = 0;
+    }
             
     void _clear_all_partitions() {
       if (partition != NULL) {
@@ -60,8 +258,12 @@ namespace khmer {
       if (partition) { partition->_validate_pmap(); }
     }
 
-    Hashbits(WordLength ksize, std::vector<HashIntoType>& tablesizes) :
-      khmer::Hashtable(ksize), _tablesizes(tablesizes) {
+    Hashbits(WordLength ksize, std::vector<HashIntoType>& tablesizes,
+	     bool blocked = false, bool fast_hash = false) :
+      khmer::Hashtable(ksize), _tablesizes(tablesizes), _blocked(blocked),
+      _fast_hash(fast_hash), _mmap_base(NULL), _mmap_size(0), _sorted_tags_generation(0),
+      _sorted_tags_valid(false) {
+      pthread_mutex_init(&_sorted_tags_lock, NULL);
       _tag_density = DEFAULT_TAG_DENSITY;
       assert(_tag_density % 2 == 0);
       partition = new SubsetPartition(this);
@@ -69,30 +271,49 @@ namespace khmer {
       _n_unique_kmers = 0;
 	  _n_overlap_kmers = 0;
 
+      if (_blocked) {
+	_init_blocked_layout();
+      }
       _allocate_counters();
     }
 
     ~Hashbits() {
-      if (_counts) {
-	for (unsigned int i = 0; i < _n_tables; i++) {
-	  delete _counts[i];
-	  _counts[i] = NULL;
-	}
-	delete _counts;
-	_counts = NULL;
-
-	_n_tables = 0;
-      }
+      _release_counters();
 
       _clear_all_partitions();
+      pthread_mutex_destroy(&_sorted_tags_lock);
     }
 
     std::vector<HashIntoType> get_tablesizes() const {
       return _tablesizes;
     }
 
-    virtual void save(std::string);
-    virtual void load(std::string);
+    bool is_blocked() const { return _blocked; }
+    bool has_fast_hash() const { return _fast_hash; }
+
+    // bins in each table's slice of a block, if blocked; else 0.
+    unsigned int get_slice_bins() const {
+      return _blocked ? _layout.slice_bins : 0;
+    }
+
+    // set the bits of other, a table of the same shape, in this one
+    // (the union of the two sets of k-mers); or clear those not set in
+    // other (their intersection).
+    void update(const Hashbits& other, unsigned int n_threads = 1);
+    void intersection_update(const Hashbits& other,
+			     unsigned int n_threads = 1);
+
+    // recount the occupancy from the tables, and estimate the number of
+    // unique k-mers from it, e.g. for files saved before they were kept.
+    void recount_occupancy();
+
+    virtual void save(std::string, unsigned int n_threads = 1,
+		      bool allow_sparse = true);
+    virtual void load(std::string, unsigned int n_threads = 1);
+
+    // map the tables of a saved file instead of reading them in; returns
+    // false if the file can't be mapped (e.g. old format).
+    bool load_mmap(std::string);
     virtual void save_tagset(std::string);
     virtual void load_tagset(std::string, bool clear_tags=true);
 
@@ -120,12 +341,37 @@ namespace khmer {
       calc_connected_graph_size(f, r, count, keeper, threshold, break_on_circum);
     }
 
+    // count the k-mers connected to kmer (and not yet in keeper), adding
+    // them to keeper; stop once count reaches threshold, if it's set.
+    // With break_on_circum, k-mers of degree > 4 are neither counted nor
+    // traversed.  If counted isn't NULL, the k-mers counted go in it.
     void calc_connected_graph_size(const HashIntoType kmer_f,
 				   const HashIntoType kmer_r,
 				   unsigned long long& count,
 				   SeenSet& keeper,
 				   const unsigned long long threshold=0,
-				   bool break_on_circum=false) const;
+				   bool break_on_circum=false,
+				   std::vector<HashIntoType> * counted=NULL)
+      const;
+
+    // the size of kmer's component, up to threshold (if set), from the
+    // cache if it's there; otherwise measured, and added to the cache.
+    unsigned long long connected_graph_size(HashIntoType kmer_f,
+					    HashIntoType kmer_r,
+					    GraphSizeCache &cache,
+					    unsigned long long threshold = 0,
+					    bool break_on_circum = false)
+      const;
+
+    // connected_graph_size for the first k-mer of each read in a file,
+    // in order; reads too short, or with non-ACGT bases there, get 0.
+    void calc_connected_graph_sizes(const std::string &filename,
+				    std::vector<unsigned long long> &sizes,
+				    GraphSizeCache &cache,
+				    unsigned long long threshold = 0,
+				    bool break_on_circum = false,
+				    CallbackFn callback = 0,
+				    void * callback_data = 0) const;
 
     typedef void (*kmer_cb)(const char * k, unsigned int n_reads, void *data);
 
@@ -133,7 +379,24 @@ namespace khmer {
 
     unsigned int n_tags() const { return all_tags.size(); }
 
-    void divide_tags_into_subsets(unsigned int subset_size, SeenSet& divvy);
+    void divide_tags_into_subsets(unsigned int subset_size,
+				  std::vector<HashIntoType>& divvy);
+
+    // the tags t with first <= t < last, in order; 0 means 'no bound'.
+    void get_tags_in_range(HashIntoType first, HashIntoType last,
+			   std::vector<HashIntoType>& tags);
+
+    // partition every subset of the tags on a pool of n_threads worker
+    // threads, saving each as <basename>.subset.N.pmap as it completes;
+    // subsets whose file already exists are skipped.  Returns the number
+    // of subsets.
+    unsigned int partition_all(const std::string& basename,
+			       unsigned int n_threads,
+			       unsigned int subset_size,
+			       bool break_on_stop_tags=false,
+			       bool stop_big_traversals=false,
+			       CallbackFn callback=0,
+			       void * callback_data=0);
 
     void add_kmer_to_tags(HashIntoType kmer) {
       all_tags.insert(kmer);
@@ -205,16 +468,17 @@ namespace khmer {
       return kmer_degree(kmer_f, kmer_r);
     }
 
-    // count number of occupied bins
+    // count number of occupied bins (per table, on average).  This and
+    // the number of unique k-mers are kept as k-mers are counted, and
+    // saved with the tables.
     virtual const HashIntoType n_occupied(HashIntoType start=0,
 				  HashIntoType stop=0) const {
-      // @@ CTB need to be able to *save* this...
       return _occupied_bins/_n_tables;
     }
       
     virtual const HashIntoType n_kmers(HashIntoType start=0,
                   HashIntoType stop=0) const {
-      return _n_unique_kmers;	// @@ CTB need to be able to *save* this...
+      return _n_unique_kmers;
     }
 
     virtual const HashIntoType n_overlap_kmers(HashIntoType start=0,
@@ -227,35 +491,46 @@ namespace khmer {
       count(hash);
     }
 
+    // count() is safe to call from several threads at once; bits are set
+    // with an atomic OR, so each newly set bit is seen by exactly one caller.
     virtual void count(HashIntoType khash) {
+      test_and_set(khash);
+    }
+
+    // set khash's bits, and return true if any of them weren't set
+    // already, i.e. if khash is new to the table.  Of several threads
+    // setting the same new k-mer at once, exactly one gets true.
+    bool test_and_set(HashIntoType khash) {
       bool is_new_kmer = false;
 
+      HashIntoType bins[MAX_BLOCKED_TABLES];
+      if (_blocked) {
+	_layout.get_bins(khash, bins);
+      }
+      const HashIntoType h = _bin_hash(khash);
+
       for (unsigned int i = 0; i < _n_tables; i++) {
-	HashIntoType bin = khash % _tablesizes[i];
+	Byte * table = _blocked ? _counts[0] : _counts[i];
+	HashIntoType bin = _blocked ? bins[i] : _table_bin(h, i);
 	HashIntoType byte = bin / 8;
 	unsigned char bit = bin % 8;
-	if (!( _counts[i][byte] & (1<<bit))) {
-	  _occupied_bins += 1;
+	if (table[byte] & (1<<bit)) {
+	  continue;			// already set; skip the atomic op.
+	}
+	Byte old = __sync_fetch_and_or(&table[byte], (Byte) (1 << bit));
+	if (!(old & (1<<bit))) {
+	  __sync_fetch_and_add(&_occupied_bins, 1);
 	  is_new_kmer = true;
 	}
-	_counts[i][byte] |= (1 << bit);
       }
       if (is_new_kmer) {
-	_n_unique_kmers +=1;
+	__sync_fetch_and_add(&_n_unique_kmers, 1);
       }
+      return is_new_kmer;
     }
 
 	virtual bool check_overlap(HashIntoType khash, Hashbits &ht2) {
-
-	  for (unsigned int i = 0; i < ht2._n_tables; i++) {
-		HashIntoType bin = khash % ht2._tablesizes[i];
-		HashIntoType byte = bin / 8;
-		unsigned char bit = bin % 8;
-		if (!( ht2._counts[i][byte] & (1<<bit))) {
-		  return false;
-	}
-      }
-	  return true;
+	  return ht2.get_count(khash);
 	  }
 
     virtual void count_overlap(const char * kmer, Hashbits &ht2) {
@@ -266,15 +541,22 @@ namespace khmer {
     virtual void count_overlap(HashIntoType khash, Hashbits &ht2) {
       bool is_new_kmer = false;
 
+      HashIntoType bins[MAX_BLOCKED_TABLES];
+      if (_blocked) {
+	_layout.get_bins(khash, bins);
+      }
+      const HashIntoType h = _bin_hash(khash);
+
       for (unsigned int i = 0; i < _n_tables; i++) {
-	HashIntoType bin = khash % _tablesizes[i];
+	Byte * table = _blocked ? _counts[0] : _counts[i];
+	HashIntoType bin = _blocked ? bins[i] : _table_bin(h, i);
 	HashIntoType byte = bin / 8;
 	unsigned char bit = bin % 8;
-	if (!( _counts[i][byte] & (1<<bit))) {
+	if (!( table[byte] & (1<<bit))) {
 	  _occupied_bins += 1;
 	  is_new_kmer = true;
 	}
-	_counts[i][byte] |= (1 << bit);
+	table[byte] |= (1 << bit);
       }
       if (is_new_kmer) {
 	_n_unique_kmers +=1;
@@ -284,6 +566,18 @@ namespace khmer {
     }
 	}
 
+    virtual void prefetch(HashIntoType khash, bool for_write = false) const {
+      if (_blocked) {
+	prefetch_address(_counts[0] + _layout.block_offset(khash), for_write);
+	return;
+      }
+
+      const HashIntoType h = _bin_hash(khash);
+      for (unsigned int i = 0; i < _n_tables; i++) {
+	prefetch_address(&_counts[i][_table_bin(h, i) / 8], for_write);
+      }
+    }
+
     // get the count for the given k-mer.
     virtual const BoundedCounterType get_count(const char * kmer) const {
       HashIntoType hash = _hash(kmer, _ksize);
@@ -292,18 +586,57 @@ namespace khmer {
 
     // get the count for the given k-mer hash.
     virtual const BoundedCounterType get_count(HashIntoType khash) const {
+      HashIntoType bins[MAX_BLOCKED_TABLES];
+      if (_blocked) {
+	_layout.get_bins(khash, bins);
+      }
+      const HashIntoType h = _bin_hash(khash);
+
       for (unsigned int i = 0; i < _n_tables; i++) {
-	HashIntoType bin = khash % _tablesizes[i];
+	const Byte * table = _blocked ? _counts[0] : _counts[i];
+	HashIntoType bin = _blocked ? bins[i] : _table_bin(h, i);
 	HashIntoType byte = bin / 8;
 	unsigned char bit = bin % 8;
       
-	if (!(_counts[i][byte] & (1 << bit))) {
+	if (!(table[byte] & (1 << bit))) {
 	  return 0;
 	}
       }
       return 1;
     }
 
+    // which of the n k-mers are present: present[j] says whether to look
+    // up khashes[j] on the way in, and whether it was found on the way
+    // out.  Goes table by table so that the lookups can overlap; in a
+    // blocked table each k-mer is one cache line anyway.
+    void check_present(const HashIntoType * khashes, bool * present,
+		       unsigned int n) const {
+      if (_blocked) {
+	for (unsigned int j = 0; j < n; j++) {
+	  if (present[j]) {
+	    present[j] = get_count(khashes[j]);
+	  }
+	}
+	return;
+      }
+
+      for (unsigned int i = 0; i < _n_tables; i++) {
+	const Byte * table = _counts[i];
+
+	bool any = false;
+	for (unsigned int j = 0; j < n; j++) {
+	  if (present[j]) {
+	    HashIntoType bin = _table_bin(_bin_hash(khashes[j]), i);
+	    present[j] = table[bin / 8] & (1 << (bin % 8));
+	    any = any || present[j];
+	  }
+	}
+	if (!any) {
+	  return;
+	}
+      }
+    }
+
     void filter_if_present(const std::string infilename,
 			   const std::string outputfilename,
 			   CallbackFn callback=0,
@@ -1,6 +1,12 @@
 #include "khmer.hh"
 #include "hashtable.hh"
 #include "parsers.hh"
+#include "read_queue.hh"
+
+#include <string.h>
+#include <pthread.h>
+#include <math.h>
+#include <algorithm>
 
 using namespace khmer;
 using namespace std;
@@ -138,6 +144,117 @@ void Hashtable::consume_fasta(const std::string &filename,
   }
 }
 
+//
+// consume_fasta_threaded: consume a FASTA file of reads, with the calling
+// thread parsing reads into batches and n_threads workers hashing them.
+// Requires a count() that is safe to call concurrently.
+//
+
+struct _consume_worker_state {
+  Hashtable * ht;
+  ReadBatchQueue * queue;
+  HashIntoType lower_bound;
+  HashIntoType upper_bound;
+  unsigned long long * n_consumed;
+};
+
+static void * _consume_fasta_worker(void * data)
+{
+  _consume_worker_state * state = (_consume_worker_state *) data;
+  ReadBatch * batch;
+
+  while ((batch = state->queue->pop()) != NULL) {
+    unsigned long long batch_consumed = 0;
+
+    for (ReadBatch::const_iterator it = batch->begin(); it != batch->end();
+	 ++it) {
+      bool is_valid;
+      unsigned int this_n_consumed;
+
+      this_n_consumed = state->ht->check_and_process_read(it->seq, is_valid,
+							  state->lower_bound,
+							  state->upper_bound);
+      if (is_valid) {
+	batch_consumed += this_n_consumed;
+      }
+    }
+    __sync_fetch_and_add(state->n_consumed, batch_consumed);
+
+    delete batch;
+  }
+
+  return NULL;
+}
+
+void Hashtable::consume_fasta_threaded(const std::string &filename,
+				       unsigned int n_threads,
+				       unsigned int &total_reads,
+				       unsigned long long &n_consumed,
+				       HashIntoType lower_bound,
+				       HashIntoType upper_bound,
+				       CallbackFn callback,
+				       void * callback_data)
+{
+  total_reads = 0;
+  n_consumed = 0;
+
+  if (n_threads < 1) {
+    n_threads = 1;
+  }
+
+  IParser* parser = IParser::get_parser(filename.c_str());
+
+  ReadBatchQueue queue;
+  _consume_worker_state state = { this, &queue, lower_bound, upper_bound,
+				  &n_consumed };
+
+  std::vector<pthread_t> workers(n_threads);
+  for (unsigned int i = 0; i < n_threads; i++) {
+    pthread_create(&workers[i], NULL, _consume_fasta_worker, &state);
+  }
+
+  ReadBatch * batch = new ReadBatch;
+  batch->reserve(READ_BATCH_SIZE);
+
+  try {
+    while(!parser->is_complete())  {
+      batch->push_back(parser->get_next_read());
+
+      if (batch->size() == READ_BATCH_SIZE) {
+	queue.push(batch);
+	batch = new ReadBatch;
+	batch->reserve(READ_BATCH_SIZE);
+      }
+
+      total_reads++;
+
+      // run callback, if specified
+      if (total_reads % CALLBACK_PERIOD == 0 && callback) {
+	callback("consume_fasta", callback_data, total_reads,
+		 __sync_fetch_and_add(&n_consumed, 0));
+      }
+    }
+  } catch (...) {
+    // drain the workers before letting the error through.
+    delete batch;
+    queue.close();
+    for (unsigned int i = 0; i < n_threads; i++) {
+      pthread_join(workers[i], NULL);
+    }
+    delete parser;
+    throw;
+  }
+
+  queue.push(batch);
+  queue.close();
+
+  for (unsigned int i = 0; i < n_threads; i++) {
+    pthread_join(workers[i], NULL);
+  }
+
+  delete parser;
+}
+
 //
 // consume_string: run through every k-mer in the given string, & hash it.
 //
@@ -152,21 +269,229 @@ unsigned int Hashtable::consume_string(const std::string &s,
   bool bounded = true;
 
   KMerIterator kmers(sp, _ksize);
-  HashIntoType kmer;
+  HashIntoType batch[KMER_BATCH_SIZE];
+  unsigned int n;
 
   if (lower_bound == upper_bound && upper_bound == 0) {
     bounded = false;
   }
 
-  while(!kmers.done()) {
-    kmer = kmers.next();
-  
-    if (!bounded || (kmer >= lower_bound && kmer < upper_bound)) {
-      count(kmer);
-      n_consumed++;
+  while ((n = kmers.next_batch(batch, KMER_BATCH_SIZE)) > 0) {
+    if (bounded) {
+      unsigned int n_kept = 0;
+      for (unsigned int i = 0; i < n; i++) {
+	if (batch[i] >= lower_bound && batch[i] < upper_bound) {
+	  batch[n_kept++] = batch[i];
+	}
+      }
+      n = n_kept;
     }
+
+    count_batch(batch, n);
+    n_consumed += n;
   }
 
   return n_consumed;
 }
 
+
+//
+// get_kmer_counts: look up every k-mer in the string, a batch at a time.
+//
+
+void Hashtable::get_kmer_counts(const std::string &s,
+				std::vector<BoundedCounterType> &counts,
+				HashIntoType lower_bound,
+				HashIntoType upper_bound) const
+{
+  KMerIterator kmers(s.c_str(), _ksize);
+  HashIntoType batch[KMER_BATCH_SIZE];
+  unsigned int n;
+
+  const bool bounded = !(lower_bound == upper_bound && upper_bound == 0);
+
+  counts.clear();
+  while ((n = kmers.next_batch(batch, KMER_BATCH_SIZE)) > 0) {
+    const size_t start = counts.size();
+    counts.resize(start + n);
+    get_count_batch(batch, &counts[start], n);
+
+    if (bounded) {
+      for (unsigned int i = 0; i < n; i++) {
+	if (batch[i] < lower_bound || batch[i] >= upper_bound) {
+	  counts[start + i] = 0;
+	}
+      }
+    }
+  }
+}
+
+//
+// merge_table_bytes: combine two tables a 64-bit word at a time.  The
+// saturating add works on all of the counters packed in a word at once:
+// each counter's top bit is summed separately from the rest so that no
+// carry spills into the next counter, and a counter that carries out
+// of its top bit is saturated to all ones.
+//
+
+static inline HashIntoType _saturating_add(HashIntoType a, HashIntoType b,
+					   HashIntoType high,
+					   unsigned int counter_bits)
+{
+  const HashIntoType sum = ((a & ~high) + (b & ~high)) ^ ((a ^ b) & high);
+  const HashIntoType carry = ((a & b) | ((a | b) & ~sum)) & high;
+
+  return sum | carry | (carry - (carry >> (counter_bits - 1)));
+}
+
+struct _merge_table_state {
+  Byte * dst;
+  const Byte * src;
+  HashIntoType start, stop;
+  TableMergeOp op;
+  unsigned int counter_bits;
+};
+
+static inline HashIntoType _merge_word(HashIntoType a, HashIntoType b,
+				       const _merge_table_state * state,
+				       HashIntoType high)
+{
+  switch (state->op) {
+  case TABLE_MERGE_ADD:
+    return _saturating_add(a, b, high, state->counter_bits);
+  case TABLE_MERGE_OR:
+    return a | b;
+  default:
+    return a & b;
+  }
+}
+
+static void * _merge_table_worker(void * data)
+{
+  _merge_table_state * state = (_merge_table_state *) data;
+
+  // the top bit of every counter in a word.
+  HashIntoType high = 0;
+  for (unsigned int i = 0; i < 64; i += state->counter_bits) {
+    high |= 1ULL << (i + state->counter_bits - 1);
+  }
+
+  const size_t word = sizeof(HashIntoType);
+  HashIntoType i = state->start;
+  for (; i + word <= state->stop; i += word) {
+    HashIntoType a, b;
+    memcpy(&a, state->dst + i, word);
+    memcpy(&b, state->src + i, word);
+    a = _merge_word(a, b, state, high);
+    memcpy(state->dst + i, &a, word);
+  }
+
+  if (i < state->stop) {		// a partial word at the end
+    HashIntoType a = 0, b = 0;
+    memcpy(&a, state->dst + i, state->stop - i);
+    memcpy(&b, state->src + i, state->stop - i);
+    a = _merge_word(a, b, state, high);
+    memcpy(state->dst + i, &a, state->stop - i);
+  }
+
+  return NULL;
+}
+
+void khmer::merge_table_bytes(Byte * dst, const Byte * src,
+			      HashIntoType n_bytes, TableMergeOp op,
+			      unsigned int counter_bits,
+			      unsigned int n_threads)
+{
+  if (n_threads < 1) {
+    n_threads = 1;
+  }
+
+  // split into cache-line-aligned chunks, one per thread.
+  HashIntoType chunk = (n_bytes + n_threads - 1) / n_threads;
+  chunk = (chunk + 63) & ~(HashIntoType) 63;
+
+  std::vector<_merge_table_state> states;
+  for (HashIntoType start = 0; start < n_bytes; start += chunk) {
+    _merge_table_state state;
+    state.dst = dst;
+    state.src = src;
+    state.start = start;
+    state.stop = std::min(n_bytes, start + chunk);
+    state.op = op;
+    state.counter_bits = op == TABLE_MERGE_ADD ? counter_bits : 8;
+    states.push_back(state);
+  }
+
+  // the calling thread takes the first chunk itself.
+  std::vector<pthread_t> workers(states.size());
+  for (size_t t = 1; t < states.size(); t++) {
+    pthread_create(&workers[t], NULL, _merge_table_worker, &states[t]);
+  }
+  if (states.size()) {
+    _merge_table_worker(&states[0]);
+  }
+  for (size_t t = 1; t < states.size(); t++) {
+    pthread_join(workers[t], NULL);
+  }
+}
+
+HashIntoType khmer::count_table_bits(const Byte * p, HashIntoType n_bytes)
+{
+  HashIntoType n = 0;
+  HashIntoType i = 0;
+  for (; i + sizeof(HashIntoType) <= n_bytes; i += sizeof(HashIntoType)) {
+    HashIntoType word;
+    memcpy(&word, p + i, sizeof(word));
+    n += __builtin_popcountll(word);
+  }
+  for (; i < n_bytes; i++) {
+    n += __builtin_popcount(p[i]);
+  }
+  return n;
+}
+
+//
+// count_table_nonzero: a word at a time, like count_table_bits.  Adding
+// 0111... to the low bits of each counter carries into its top bit if
+// and only if they're nonzero, without spilling into the next counter;
+// OR in the top bits themselves, and each nonzero counter has its top
+// bit set.
+//
+
+static inline HashIntoType _nonzero_counters(HashIntoType word,
+					     HashIntoType high)
+{
+  return __builtin_popcountll((((word & ~high) + ~high) | word) & high);
+}
+
+HashIntoType khmer::count_table_nonzero(const Byte * p, HashIntoType n_bytes,
+					unsigned int counter_bits)
+{
+  HashIntoType high = 0;
+  for (unsigned int i = 0; i < 64; i += counter_bits) {
+    high |= 1ULL << (i + counter_bits - 1);
+  }
+
+  HashIntoType n = 0;
+  HashIntoType i = 0;
+  for (; i + sizeof(HashIntoType) <= n_bytes; i += sizeof(HashIntoType)) {
+    HashIntoType word;
+    memcpy(&word, p + i, sizeof(word));
+    n += _nonzero_counters(word, high);
+  }
+  if (i < n_bytes) {			// a partial word at the end
+    HashIntoType word = 0;
+    memcpy(&word, p + i, n_bytes - i);
+    n += _nonzero_counters(word, high);
+  }
+  return n;
+}
+
+// m bins with x of them occupied hold about -m ln(1 - x/m) k-mers.
+HashIntoType khmer::estimate_n_kmers(HashIntoType tablesize,
+				     double n_occupied)
+{
+  const double m = (double) tablesize;
+  const double x = std::min(n_occupied, m - 1);
+  return (HashIntoType) (-m * log(1. - x / m) + .5);
+}
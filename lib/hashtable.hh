@@ -13,21 +13,24 @@
 #include <queue>
 
 #include "khmer.hh"
+#include "kmer_hash.hh"
 #include "storage.hh"
 
 #define CALLBACK_PERIOD 100000
 
+// k-mers looked up or counted at a time by the batched kernels: enough
+// for their cache misses to overlap, few enough that the prefetched
+// lines are still in cache when they're used.
+#define KMER_BATCH_SIZE 16
+
 namespace khmer {
   typedef unsigned int PartitionID;
-  typedef std::set<HashIntoType> SeenSet;
+  typedef KmerSet SeenSet;
   typedef std::set<PartitionID> PartitionSet;
-  typedef std::map<HashIntoType, PartitionID*> PartitionMap;
-  typedef std::map<PartitionID, PartitionID*> PartitionPtrMap;
+  typedef KmerMap<PartitionID> PartitionMap;
+  typedef std::map<PartitionID, PartitionID> PartitionIDMap;
   typedef std::map<PartitionID, SeenSet*> PartitionsToTagsMap;
-  typedef std::set<PartitionID *> PartitionPtrSet;
-  typedef std::map<PartitionID, PartitionPtrSet*> ReversePartitionMap;
   typedef std::queue<HashIntoType> NodeQueue;
-  typedef std::map<PartitionID, PartitionID*> PartitionToPartitionPMap;
   typedef std::map<HashIntoType, unsigned int> TagCountMap;
   typedef std::map<PartitionID, unsigned int> PartitionCountMap;
   typedef std::map<unsigned long long, unsigned long long> PartitionCountDistribution;
@@ -107,9 +110,50 @@ namespace khmer {
     HashIntoType first() { return first(_kmer_f, _kmer_r); }
     HashIntoType next() { return next(_kmer_f, _kmer_r); }
 
+    // put up to n of the next k-mers in khashes; returns how many.
+    unsigned int next_batch(HashIntoType * khashes, unsigned int n) {
+      unsigned int i = 0;
+      while (i < n && !done()) {
+	khashes[i++] = next();
+      }
+      return i;
+    }
+
     bool done() { return index >= length; }
   };
 
+  // start pulling the cache line at p in, to be read or written soon.
+  inline void prefetch_address(const void * p, bool for_write) {
+    if (for_write) {
+      __builtin_prefetch(p, 1);
+    } else {
+      __builtin_prefetch(p, 0);
+    }
+  }
+
+  // how merge_table_bytes() combines two tables.
+  enum TableMergeOp {
+    TABLE_MERGE_ADD,		// saturating add of packed counters
+    TABLE_MERGE_OR,
+    TABLE_MERGE_AND
+  };
+
+  // combine the n_bytes of src into dst, in place, on n_threads threads.
+  // For TABLE_MERGE_ADD the bytes hold counter_bits-wide counters.
+  void merge_table_bytes(Byte * dst, const Byte * src, HashIntoType n_bytes,
+			 TableMergeOp op, unsigned int counter_bits,
+			 unsigned int n_threads);
+
+  // the number of set bits in the n_bytes at p.
+  HashIntoType count_table_bits(const Byte * p, HashIntoType n_bytes);
+
+  // the number of nonzero counter_bits-wide counters in the n_bytes at p.
+  HashIntoType count_table_nonzero(const Byte * p, HashIntoType n_bytes,
+				   unsigned int counter_bits);
+
+  // about how many k-mers fill n_occupied bins of a table of tablesize.
+  HashIntoType estimate_n_kmers(HashIntoType tablesize, double n_occupied);
+
   class Hashtable {		// Base class implementation of a Bloom ht.
   protected:
     WordLength _ksize;
@@ -159,14 +203,51 @@ namespace khmer {
     virtual const BoundedCounterType get_count(const char * kmer) const = 0;
     virtual const BoundedCounterType get_count(HashIntoType khash) const = 0;
 
-    virtual void save(std::string) = 0;
-    virtual void load(std::string) = 0;
+    // .gz files are compressed (and decompressed) on n_threads threads.
+    // Mostly empty tables are saved in a sparse encoding unless
+    // allow_sparse is false (sparse files can't be load_mmap()ed).
+    virtual void save(std::string, unsigned int n_threads = 1,
+		      bool allow_sparse = true) = 0;
+    virtual void load(std::string, unsigned int n_threads = 1) = 0;
+
+    // start fetching the table bins for khash into cache, ahead of a
+    // count() (for_write) or get_count() on it.
+    virtual void prefetch(HashIntoType khash, bool for_write = false) const { }
+
+    // count n k-mers, or get their counts.  All of their bins are
+    // prefetched first, so that the cache misses overlap rather than
+    // being taken one k-mer at a time.
+    void count_batch(const HashIntoType * khashes, unsigned int n) {
+      for (unsigned int i = 0; i < n; i++) {
+	prefetch(khashes[i], true);
+      }
+      for (unsigned int i = 0; i < n; i++) {
+	count(khashes[i]);
+      }
+    }
+
+    void get_count_batch(const HashIntoType * khashes,
+			 BoundedCounterType * counts, unsigned int n) const {
+      for (unsigned int i = 0; i < n; i++) {
+	prefetch(khashes[i]);
+      }
+      for (unsigned int i = 0; i < n; i++) {
+	counts[i] = get_count(khashes[i]);
+      }
+    }
 
     // count every k-mer in the string.
     unsigned int consume_string(const std::string &s,
 				HashIntoType lower_bound = 0,
 				HashIntoType upper_bound = 0);
     
+    // the count of every k-mer in the string, in order; k-mers outside
+    // [lower_bound, upper_bound) (if given) count as 0.
+    void get_kmer_counts(const std::string &s,
+			 std::vector<BoundedCounterType> &counts,
+			 HashIntoType lower_bound = 0,
+			 HashIntoType upper_bound = 0) const;
+
     // checks each read for non-ACGT characters
     bool check_read(const std::string &read) const;
 
@@ -186,6 +267,16 @@ namespace khmer {
 		       bool update_readmask = true,
 		       CallbackFn callback = NULL,
 		       void * callback_data = NULL);
+
+    // count every k-mer in the FASTA file, hashing on n_threads threads.
+    void consume_fasta_threaded(const std::string &filename,
+				unsigned int n_threads,
+				unsigned int &total_reads,
+				unsigned long long &n_consumed,
+				HashIntoType lower_bound = 0,
+				HashIntoType upper_bound = 0,
+				CallbackFn callback = NULL,
+				void * callback_data = NULL);
   };
 
 			  
@@ -0,0 +1,225 @@
+#include "hllcounter.hh"
+#include "hashtable.hh"
+#include "parsers.hh"
+#include "read_queue.hh"
+
+#include <math.h>
+#include <pthread.h>
+
+using namespace std;
+using namespace khmer;
+
+HLLCounter::HLLCounter(WordLength ksize, unsigned int precision) :
+  _ksize(ksize), _precision(precision)
+{
+  assert(precision >= MIN_HLL_PRECISION && precision <= MAX_HLL_PRECISION);
+  _registers.assign(1 << precision, 0);
+}
+
+void HLLCounter::merge(const HLLCounter &other)
+{
+  if (other._ksize != _ksize || other._precision != _precision) {
+    throw khmer_exception("cannot merge HyperLogLog counters of different "
+			  "shapes");
+  }
+
+  for (size_t i = 0; i < _registers.size(); i++) {
+    if (other._registers[i] > _registers[i]) {
+      _registers[i] = other._registers[i];
+    }
+  }
+}
+
+//
+// estimate_cardinality: Ertl's improved estimator ("New cardinality
+// estimation algorithms for HyperLogLog sketches", 2017), which is
+// unbiased from a handful of k-mers up, without the switch to linear
+// counting and the empirical bias tables of the original.  It works from
+// the histogram of register values alone.
+//
+
+// sigma(x) = x + sum_{k >= 1} x^(2^k) 2^(k-1)
+static double _hll_sigma(double x)
+{
+  if (x == 1.) {
+    return INFINITY;
+  }
+
+  double y = 1.;
+  double z = x;
+  double z_old;
+  do {
+    x *= x;
+    z_old = z;
+    z += x * y;
+    y += y;
+  } while (z != z_old);
+  return z;
+}
+
+// tau(x) = (1 - x - sum_{k >= 1} (1 - x^(2^-k))^2 2^-k) / 3
+static double _hll_tau(double x)
+{
+  if (x == 0. || x == 1.) {
+    return 0.;
+  }
+
+  double y = 1.;
+  double z = 1. - x;
+  double z_old;
+  do {
+    x = sqrt(x);
+    z_old = z;
+    y *= 0.5;
+    z -= (1. - x) * (1. - x) * y;
+  } while (z != z_old);
+  return z / 3.;
+}
+
+HashIntoType HLLCounter::estimate_cardinality() const
+{
+  const unsigned int q = 64 - _precision;
+  const double m = (double) _registers.size();
+
+  std::vector<unsigned int> hist(q + 2, 0);
+  for (size_t i = 0; i < _registers.size(); i++) {
+    hist[_registers[i]]++;
+  }
+  if (hist[0] == _registers.size()) {
+    return 0;
+  }
+
+  double z = m * _hll_tau(1. - hist[q + 1] / m);
+  for (unsigned int k = q; k >= 1; k--) {
+    z = 0.5 * (z + hist[k]);
+  }
+  z += m * _hll_sigma(hist[0] / m);
+
+  return (HashIntoType) (m * m / (2. * log(2.)) / z + .5);
+}
+
+unsigned int HLLCounter::consume_string(const std::string &s)
+{
+  if (s.length() < _ksize) {
+    return 0;
+  }
+  for (unsigned int i = 0; i < s.length(); i++) {
+    if (!is_valid_dna(s[i])) {
+      return 0;
+    }
+  }
+
+  KMerIterator kmers(s.c_str(), _ksize);
+  unsigned int n = 0;
+  while (!kmers.done()) {
+    add(kmers.next());
+    n++;
+  }
+  return n;
+}
+
+//
+// consume_fasta: the calling thread parses reads into batches, as for
+// Hashtable::consume_fasta_threaded, and each of n_threads workers adds
+// them to a sketch of its own.  The sketches are merged at the end.
+//
+
+struct _hll_worker_state {
+  HLLCounter * hll;
+  ReadBatchQueue * queue;
+  unsigned long long * n_consumed;
+  pthread_mutex_t * lock;
+};
+
+static void * _hll_consume_worker(void * data)
+{
+  _hll_worker_state * state = (_hll_worker_state *) data;
+  HLLCounter hll(state->hll->ksize(), state->hll->precision());
+  unsigned long long n_consumed = 0;
+  ReadBatch * batch;
+
+  while ((batch = state->queue->pop()) != NULL) {
+    for (ReadBatch::const_iterator it = batch->begin(); it != batch->end();
+	 ++it) {
+      n_consumed += hll.consume_string(it->seq);
+    }
+    delete batch;
+  }
+
+  pthread_mutex_lock(state->lock);
+  state->hll->merge(hll);
+  *state->n_consumed += n_consumed;
+  pthread_mutex_unlock(state->lock);
+
+  return NULL;
+}
+
+void HLLCounter::consume_fasta(const std::string &filename,
+			       unsigned int n_threads,
+			       unsigned int max_reads,
+			       unsigned int &total_reads,
+			       unsigned long long &n_consumed,
+			       CallbackFn callback,
+			       void * callback_data)
+{
+  total_reads = 0;
+  n_consumed = 0;
+
+  if (n_threads < 1) {
+    n_threads = 1;
+  }
+
+  IParser* parser = IParser::get_parser(filename.c_str());
+
+  ReadBatchQueue queue;
+  pthread_mutex_t lock;
+  pthread_mutex_init(&lock, NULL);
+  _hll_worker_state state = { this, &queue, &n_consumed, &lock };
+
+  std::vector<pthread_t> workers(n_threads);
+  for (unsigned int i = 0; i < n_threads; i++) {
+    pthread_create(&workers[i], NULL, _hll_consume_worker, &state);
+  }
+
+  ReadBatch * batch = new ReadBatch;
+  batch->reserve(READ_BATCH_SIZE);
+
+  try {
+    while(!parser->is_complete() && (!max_reads || total_reads < max_reads)) {
+      batch->push_back(parser->get_next_read());
+
+      if (batch->size() == READ_BATCH_SIZE) {
+	queue.push(batch);
+	batch = new ReadBatch;
+	batch->reserve(READ_BATCH_SIZE);
+      }
+
+      total_reads++;
+
+      // run callback, if specified
+      if (total_reads % CALLBACK_PERIOD == 0 && callback) {
+	callback("consume_fasta", callback_data, total_reads, 0);
+      }
+    }
+  } catch (...) {
+    // drain the workers before letting the error through.
+    delete batch;
+    queue.close();
+    for (unsigned int i = 0; i < n_threads; i++) {
+      pthread_join(workers[i], NULL);
+    }
+    pthread_mutex_destroy(&lock);
+    delete parser;
+    throw;
+  }
+
+  queue.push(batch);
+  queue.close();
+
+  for (unsigned int i = 0; i < n_threads; i++) {
+    pthread_join(workers[i], NULL);
+  }
+  pthread_mutex_destroy(&lock);
+
+  delete parser;
+}
@@ -0,0 +1,76 @@
+#ifndef HLLCOUNTER_HH
+#define HLLCOUNTER_HH
+
+#include <string>
+#include <vector>
+#include "khmer.hh"
+#include "kmer_hash.hh"
+
+// default number of bits of a k-mer's hash that pick its register: 2**14
+// one-byte registers, for a relative error of about 0.8%.
+#define DEFAULT_HLL_PRECISION 14
+#define MIN_HLL_PRECISION 4
+#define MAX_HLL_PRECISION 18
+
+namespace khmer {
+
+  //
+  // HLLCounter: a HyperLogLog sketch, estimating the number of distinct
+  // k-mers in a stream in 2**precision bytes, to size tables before
+  // loading them.  K-mers are counted by their canonical hashes, as the
+  // tables count them, from reads that check_read() would take.
+  //
+  // The top precision bits of a (mixed) k-mer hash pick a register, which
+  // keeps the most leading zeros seen in the rest of the hash, plus one.
+  // Sketches of the same shape merge by taking the larger of each
+  // register, so threads (or files) can be counted separately.
+  //
+
+  class HLLCounter {
+  protected:
+    WordLength _ksize;
+    unsigned int _precision;
+    std::vector<Byte> _registers;
+  public:
+    HLLCounter(WordLength ksize,
+	       unsigned int precision = DEFAULT_HLL_PRECISION);
+
+    WordLength ksize() const { return _ksize; }
+    unsigned int precision() const { return _precision; }
+
+    // add a k-mer, by its hash.
+    void add(HashIntoType khash) {
+      const HashIntoType h = _kmer_hash_mix(khash);
+      const HashIntoType rest = h << _precision;
+      const Byte rank = rest ? __builtin_clzll(rest) + 1 :
+	64 - _precision + 1;
+
+      Byte &reg = _registers[h >> (64 - _precision)];
+      if (rank > reg) {
+	reg = rank;
+      }
+    }
+
+    // add the other sketch, of the same k and precision, to this one.
+    void merge(const HLLCounter &other);
+
+    // the estimated number of distinct k-mers added.
+    HashIntoType estimate_cardinality() const;
+
+    // add every k-mer in the read, if it's valid; returns the number
+    // added.
+    unsigned int consume_string(const std::string &s);
+
+    // add the k-mers of the first max_reads reads (or of all of them, if
+    // max_reads is 0) in a FASTA/FASTQ file, hashing on n_threads threads.
+    void consume_fasta(const std::string &filename,
+		       unsigned int n_threads,
+		       unsigned int max_reads,
+		       unsigned int &total_reads,
+		       unsigned long long &n_consumed,
+		       CallbackFn callback = NULL,
+		       void * callback_data = NULL);
+  };
+};
+
+#endif // HLLCOUNTER_HH
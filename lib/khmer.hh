@@ -1,3 +1,8 @@
+#ifndef KHMER_HH
+#define KHMER_HH
+
+#include <string>
+
 #define VERSION "0.5"
 
 #define MAX_COUNT 255
@@ -15,6 +20,27 @@
 #define SAVED_STOPTAGS 4
 #define SAVED_SUBSET 5
 
+// counting & presence tables: all table sizes up front, then each table
+// starting on a page boundary, so that they can be mmap'ed.
+#define SAVED_TABLE_FORMAT_VERSION 4
+#define SAVED_TABLE_ALIGNMENT 4096
+
+// counting tables: version 5 added the counter width (in bits) after the
+// number of tables, and version 6 the table flags after that.  Presence
+// tables: version 5 added the table flags after the number of tables.
+// Then both (counting version 7, presence version 6) added the number of
+// occupied bins and of unique k-mers after the flags, 8 bytes each.
+#define SAVED_COUNTING_FLAGS_VERSION 6
+#define SAVED_HASHBITS_FLAGS_VERSION 5
+#define SAVED_COUNTING_FORMAT_VERSION 7
+#define SAVED_HASHBITS_FORMAT_VERSION 6
+
+// table flags.
+#define SAVED_TABLE_BLOCKED 0x01	// one blocked table; see BlockedLayout
+#define SAVED_TABLE_FAST_HASH 0x02	// bins by mixed_table_bin, not modulus
+#define SAVED_TABLE_CONSERVATIVE 0x04	// counted by conservative update
+#define SAVED_TABLE_SPARSE 0x08	// tables in the sparse encoding
+
 #define VERBOSE_REPARTITION 0
 
 namespace khmer {
@@ -36,4 +62,28 @@ namespace khmer {
 			     unsigned long long n_reads,
 			     unsigned long long other);
 
+  // thrown by library code on bad input data.
+  class khmer_exception {
+  protected:
+    std::string _message;
+  public:
+    khmer_exception(const std::string &message) : _message(message) { };
+    const std::string &get_message() const { return _message; };
+  };
+
+  // thrown when a file can't be opened or written.
+  class khmer_file_exception : public khmer_exception {
+  public:
+    khmer_file_exception(const std::string &message) :
+      khmer_exception(message) { };
+  };
+
+  // bytes of padding needed to bring a file offset up to a table boundary.
+  inline unsigned long long table_padding(unsigned long long offset) {
+    return (SAVED_TABLE_ALIGNMENT - offset % SAVED_TABLE_ALIGNMENT) %
+      SAVED_TABLE_ALIGNMENT;
+  }
+
 };
+
+#endif // KHMER_HH
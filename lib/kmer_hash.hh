@@ -0,0 +1,427 @@
+#ifndef KMER_HASH_HH
+#define KMER_HASH_HH
+
+#include <stdlib.h>
+#include <assert.h>
+#include <utility>
+#include <vector>
+#include <algorithm>
+
+#include "khmer.hh"
+
+//
+// KmerSet and KmerMap: compact open-addressing (linear probing) hash
+// containers keyed on k-mers, standing in for std::set<HashIntoType> and
+// std::map<HashIntoType, V>.  A std::set node costs ~40 bytes plus a
+// pointer chase per lookup; these cost 8 (set) or 16 (map) bytes per slot
+// at <= 70% load, and probe a contiguous array.
+//
+// The interface is the subset of std::set/std::map that khmer uses.
+// Iteration order is arbitrary (use get_sorted() if you need order), and
+// inserting or erasing invalidates all iterators.
+//
+
+// the smallest table we'll allocate; a power of two.
+#define KMER_HASH_MIN_CAPACITY 16
+
+namespace khmer {
+  // marks an unused slot.  (It's also a legitimate 32-mer, TTT...T, so
+  // if that is ever inserted it is kept in a slot of its own.)
+  const HashIntoType KMER_HASH_EMPTY = ~(HashIntoType) 0;
+
+  // k-mers are 2-bit packed bases, so mix them up before picking a bucket
+  // (the finalizer from MurmurHash3).
+  inline HashIntoType _kmer_hash_mix(HashIntoType x) {
+    x ^= x >> 33;
+    x *= 0xff51afd7ed558ccdULL;
+    x ^= x >> 33;
+    x *= 0xc4ceb9fe1a85ec53ULL;
+    x ^= x >> 33;
+    return x;
+  }
+
+  // how to get at the key of a set or map entry.
+  struct _KmerSetKey {
+    static HashIntoType& key(HashIntoType& e) { return e; }
+    static const HashIntoType& key(const HashIntoType& e) { return e; }
+  };
+
+  template <class Entry>
+  struct _KmerMapKey {
+    static HashIntoType& key(Entry& e) { return e.first; }
+    static const HashIntoType& key(const Entry& e) { return e.first; }
+  };
+
+  //
+  // the slot array holds _capacity + 1 entries; the extra one at the end
+  // holds the entry for KMER_HASH_EMPTY, if there is one.
+  //
+
+  template <class Entry, class KeyOf, class Ref, class Ptr>
+  struct _kmer_hash_iterator {
+    Entry * _p;
+    Entry * _last;		// the KMER_HASH_EMPTY slot
+    bool _last_used;
+
+    _kmer_hash_iterator() : _p(NULL), _last(NULL), _last_used(false) { }
+    _kmer_hash_iterator(Entry * p, Entry * last, bool last_used) :
+      _p(p), _last(last), _last_used(last_used) { _skip(); }
+
+    // iterator -> const_iterator
+    template <class R2, class P2>
+    _kmer_hash_iterator(const _kmer_hash_iterator<Entry, KeyOf, R2, P2>& o) :
+      _p(o._p), _last(o._last), _last_used(o._last_used) { }
+
+    void _skip() {
+      while (_p < _last && KeyOf::key(*_p) == KMER_HASH_EMPTY) {
+	_p++;
+      }
+      if (_p == _last && !_last_used) {
+	_p++;
+      }
+    }
+
+    Ref operator*() const { return *_p; }
+    Ptr operator->() const { return _p; }
+
+    _kmer_hash_iterator& operator++() { _p++; _skip(); return *this; }
+    _kmer_hash_iterator operator++(int) {
+      _kmer_hash_iterator tmp = *this;
+      ++(*this);
+      return tmp;
+    }
+
+    template <class R2, class P2>
+    bool operator==(const _kmer_hash_iterator<Entry, KeyOf, R2, P2>& o) const {
+      return _p == o._p;
+    }
+    template <class R2, class P2>
+    bool operator!=(const _kmer_hash_iterator<Entry, KeyOf, R2, P2>& o) const {
+      return _p != o._p;
+    }
+  };
+
+  template <class Entry, class KeyOf>
+  class _KmerHashTable {
+  public:
+    typedef _kmer_hash_iterator<Entry, KeyOf, Entry&, Entry*> _iterator;
+    typedef _kmer_hash_iterator<Entry, KeyOf, const Entry&, const Entry*>
+      const_iterator;
+    typedef HashIntoType key_type;
+    typedef size_t size_type;
+
+  protected:
+    Entry * _slots;
+    size_t _capacity;		// always a power of two
+    size_t _size;
+    bool _has_empty_key;
+    unsigned long long _generation; // bumped on every change
+
+    void _alloc(size_t capacity) {
+      _capacity = capacity;
+      _slots = new Entry[_capacity + 1];
+      for (size_t i = 0; i <= _capacity; i++) {
+	KeyOf::key(_slots[i]) = KMER_HASH_EMPTY;
+      }
+    }
+
+    size_t _home(HashIntoType key) const {
+      return _kmer_hash_mix(key) & (_capacity - 1);
+    }
+
+    // the slot holding 'key', or the empty slot where it would go.
+    size_t _probe(HashIntoType key) const {
+      size_t i = _home(key);
+      while (1) {
+	const HashIntoType k = KeyOf::key(_slots[i]);
+	if (k == key || k == KMER_HASH_EMPTY) {
+	  return i;
+	}
+	i = (i + 1) & (_capacity - 1);
+      }
+    }
+
+    void _rehash(size_t capacity) {
+      Entry * old_slots = _slots;
+      size_t old_capacity = _capacity;
+
+      _alloc(capacity);
+      for (size_t i = 0; i < old_capacity; i++) {
+	if (KeyOf::key(old_slots[i]) != KMER_HASH_EMPTY) {
+	  _slots[_probe(KeyOf::key(old_slots[i]))] = old_slots[i];
+	}
+      }
+      _slots[_capacity] = old_slots[old_capacity];
+      delete[] old_slots;
+    }
+
+    // find or make the entry for 'key'; 'inserted' says which.
+    Entry * _insert_key(HashIntoType key, bool& inserted) {
+      inserted = false;
+      if (key == KMER_HASH_EMPTY) {
+	if (!_has_empty_key) {
+	  _slots[_capacity] = Entry();
+	  KeyOf::key(_slots[_capacity]) = KMER_HASH_EMPTY;
+	  _has_empty_key = true;
+	  _size++;
+	  _generation++;
+	  inserted = true;
+	}
+	return &_slots[_capacity];
+      }
+
+      size_t i = _probe(key);
+      if (KeyOf::key(_slots[i]) == key) {
+	return &_slots[i];
+      }
+
+      // grow at 70% full.
+      if ((_size + 1) * 10 > _capacity * 7) {
+	_rehash(_capacity * 2);
+	i = _probe(key);
+      }
+
+      _slots[i] = Entry();
+      KeyOf::key(_slots[i]) = key;
+      _size++;
+      _generation++;
+      inserted = true;
+
+      return &_slots[i];
+    }
+
+    Entry * _find(HashIntoType key) const {
+      if (key == KMER_HASH_EMPTY) {
+	return _has_empty_key ? &_slots[_capacity] : _slots + _capacity + 1;
+      }
+      size_t i = _probe(key);
+      if (KeyOf::key(_slots[i]) == key) {
+	return &_slots[i];
+      }
+      return _slots + _capacity + 1;
+    }
+
+  public:
+    _KmerHashTable() : _size(0), _has_empty_key(false), _generation(0) {
+      _alloc(KMER_HASH_MIN_CAPACITY);
+    }
+
+    _KmerHashTable(const _KmerHashTable& other) :
+      _size(other._size), _has_empty_key(other._has_empty_key),
+      _generation(0) {
+      _alloc(other._capacity);
+      std::copy(other._slots, other._slots + _capacity + 1, _slots);
+    }
+
+    ~_KmerHashTable() { delete[] _slots; }
+
+    _KmerHashTable& operator=(const _KmerHashTable& other) {
+      if (this != &other) {
+	_KmerHashTable tmp(other);
+	swap(tmp);
+      }
+      return *this;
+    }
+
+    size_t size() const { return _size; }
+    bool empty() const { return _size == 0; }
+
+    // bytes of table memory in use.
+    size_t memory_usage() const { return (_capacity + 1) * sizeof(Entry); }
+
+    // changes whenever the contents do; handy for invalidating caches.
+    unsigned long long generation() const { return _generation; }
+
+    const_iterator begin() const {
+      return const_iterator(_slots, _slots + _capacity, _has_empty_key);
+    }
+    const_iterator end() const {
+      return const_iterator(_slots + _capacity + 1, _slots + _capacity,
+			    _has_empty_key);
+    }
+
+    const_iterator find(HashIntoType key) const {
+      return const_iterator(_find(key), _slots + _capacity, _has_empty_key);
+    }
+
+    size_t count(HashIntoType key) const {
+      return _find(key) != _slots + _capacity + 1 ? 1 : 0;
+    }
+
+    size_t erase(HashIntoType key) {
+      if (key == KMER_HASH_EMPTY) {
+	if (!_has_empty_key) {
+	  return 0;
+	}
+	_has_empty_key = false;
+	_slots[_capacity] = Entry();
+	KeyOf::key(_slots[_capacity]) = KMER_HASH_EMPTY;
+	_size--;
+	_generation++;
+	return 1;
+      }
+
+      size_t i = _probe(key);
+      if (KeyOf::key(_slots[i]) != key) {
+	return 0;
+      }
+
+      // backward-shift deletion: pull later members of the probe run
+      // into the hole, so that lookups never need tombstones.
+      const size_t mask = _capacity - 1;
+      size_t j = i;
+      while (1) {
+	j = (j + 1) & mask;
+	if (KeyOf::key(_slots[j]) == KMER_HASH_EMPTY) {
+	  break;
+	}
+	size_t home = _home(KeyOf::key(_slots[j]));
+	// can the entry at j move back to i?  only if its home isn't
+	// (cyclically) in (i, j].
+	bool stays = (i <= j) ? (i < home && home <= j) :
+	  (i < home || home <= j);
+	if (!stays) {
+	  _slots[i] = _slots[j];
+	  i = j;
+	}
+      }
+      _slots[i] = Entry();
+      KeyOf::key(_slots[i]) = KMER_HASH_EMPTY;
+
+      _size--;
+      _generation++;
+      return 1;
+    }
+
+    // empties the table; a table much bigger than its contents is
+    // shrunk, so that repeated clear()s cost O(size), not O(capacity).
+    void clear() {
+      if (_capacity > KMER_HASH_MIN_CAPACITY && _size * 4 < _capacity) {
+	delete[] _slots;
+	_alloc(KMER_HASH_MIN_CAPACITY);
+      } else {
+	for (size_t i = 0; i <= _capacity; i++) {
+	  _slots[i] = Entry();
+	  KeyOf::key(_slots[i]) = KMER_HASH_EMPTY;
+	}
+      }
+      _size = 0;
+      _has_empty_key = false;
+      _generation++;
+    }
+
+    // make room for n entries without rehashing.
+    void reserve(size_t n) {
+      size_t capacity = _capacity;
+      while (n * 10 > capacity * 7) {
+	capacity *= 2;
+      }
+      if (capacity != _capacity) {
+	_rehash(capacity);
+      }
+    }
+
+    void swap(_KmerHashTable& other) {
+      std::swap(_slots, other._slots);
+      std::swap(_capacity, other._capacity);
+      std::swap(_size, other._size);
+      std::swap(_has_empty_key, other._has_empty_key);
+
+      unsigned long long gen = std::max(_generation, other._generation) + 1;
+      _generation = other._generation = gen;
+    }
+
+    // all of the keys, in ascending order.
+    void get_sorted(std::vector<HashIntoType>& keys) const {
+      keys.clear();
+      keys.reserve(_size);
+      for (const_iterator it = begin(); it != end(); ++it) {
+	keys.push_back(KeyOf::key(*it));
+      }
+      std::sort(keys.begin(), keys.end());
+    }
+  };
+
+  //
+  // KmerSet: a set of k-mers.  Entries can't be modified in place, so
+  // 'iterator' is the same as 'const_iterator', as with std::set.
+  //
+
+  class KmerSet : public _KmerHashTable<HashIntoType, _KmerSetKey> {
+  public:
+    typedef HashIntoType value_type;
+    typedef const_iterator iterator;
+
+    std::pair<iterator, bool> insert(HashIntoType key) {
+      bool inserted;
+      HashIntoType * e = _insert_key(key, inserted);
+      return std::make_pair(iterator(e, _slots + _capacity, _has_empty_key),
+			    inserted);
+    }
+
+    template <class InputIterator>
+    void insert(InputIterator first, InputIterator last) {
+      for (; first != last; ++first) {
+	insert(*first);
+      }
+    }
+
+    using _KmerHashTable<HashIntoType, _KmerSetKey>::erase;
+    void erase(const_iterator it) { erase(*it); }
+  };
+
+  //
+  // KmerMap: k-mer => V.  Missing keys read through operator[] are
+  // inserted with a value-initialized V, as with std::map.
+  //
+
+  template <class V>
+  class KmerMap :
+    public _KmerHashTable<std::pair<HashIntoType, V>,
+			  _KmerMapKey<std::pair<HashIntoType, V> > > {
+    typedef std::pair<HashIntoType, V> _Entry;
+    typedef _KmerHashTable<_Entry, _KmerMapKey<_Entry> > _Base;
+  public:
+    typedef V mapped_type;
+    typedef _Entry value_type;
+    typedef typename _Base::_iterator iterator;
+    typedef typename _Base::const_iterator const_iterator;
+
+    using _Base::begin;
+    using _Base::end;
+    using _Base::find;
+
+    iterator begin() {
+      return iterator(this->_slots, this->_slots + this->_capacity,
+		      this->_has_empty_key);
+    }
+    iterator end() {
+      return iterator(this->_slots + this->_capacity + 1,
+		      this->_slots + this->_capacity, this->_has_empty_key);
+    }
+    iterator find(HashIntoType key) {
+      return iterator(this->_find(key), this->_slots + this->_capacity,
+		      this->_has_empty_key);
+    }
+
+    V& operator[](HashIntoType key) {
+      bool inserted;
+      return this->_insert_key(key, inserted)->second;
+    }
+
+    std::pair<iterator, bool> insert(const _Entry& entry) {
+      bool inserted;
+      _Entry * e = this->_insert_key(entry.first, inserted);
+      if (inserted) {
+	e->second = entry.second;
+      }
+      return std::make_pair(iterator(e, this->_slots + this->_capacity,
+				     this->_has_empty_key), inserted);
+    }
+
+    using _Base::erase;
+    void erase(iterator it) { this->erase(it->first); }
+  };
+};
+
+#endif // KMER_HASH_HH
@@ -0,0 +1,63 @@
+//
+// parsebench: measure FASTA/FASTQ parsing throughput in MB/s, both for
+// the raw SequenceStream and for the IParser wrapper on top of it.
+//
+// % make parsebench && ./parsebench reads.fa [ reads.fq.gz ... ]
+//
+
+#include <iostream>
+#include <sys/stat.h>
+#include <sys/time.h>
+#include "parsers.hh"
+
+using namespace std;
+
+static double now()
+{
+  struct timeval tv;
+  gettimeofday(&tv, NULL);
+  return tv.tv_sec + tv.tv_usec / 1e6;
+}
+
+static void report(const char * what, const char * filename,
+		   unsigned long long n_reads, unsigned long long n_bases,
+		   double elapsed)
+{
+  struct stat st;
+  stat(filename, &st);
+
+  double mb = st.st_size / (1024. * 1024.);
+  cout << what << "\t" << filename << "\t" << n_reads << " reads\t"
+       << n_bases << " bases\t" << elapsed << "s\t"
+       << mb / elapsed << " MB/s" << endl;
+}
+
+int main(int argc, char * argv[])
+{
+  for (int i = 1; i < argc; i++) {
+    unsigned long long n_reads = 0, n_bases = 0;
+    double start = now();
+
+    SequenceStream stream(argv[i]);
+    ReadView rv;
+    while (stream.next_record(rv)) {
+      n_reads++;
+      n_bases += rv.seq_len;
+    }
+    report("stream", argv[i], n_reads, n_bases, now() - start);
+
+    n_reads = n_bases = 0;
+    start = now();
+
+    IParser * parser = IParser::get_parser(argv[i]);
+    while (!parser->is_complete()) {
+      Read read = parser->get_next_read();
+      n_reads++;
+      n_bases += read.seq.length();
+    }
+    delete parser;
+    report("iparser", argv[i], n_reads, n_bases, now() - start);
+  }
+
+  return 0;
+}
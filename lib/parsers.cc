@@ -1,431 +1,310 @@
 #include "parsers.hh"
 
+#include <stdlib.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <algorithm>
+
 IParser* IParser::get_parser(const std::string &inputfile)
 {
-   std::string filename(inputfile);
-   int found = filename.find_last_of(".");
-
-   std::string type = filename.substr(found+1);
-
-   if (type == "fq" || type == "fastq") {
-      return new FastqParser(inputfile);
-   } else if (type == "fa" || type == "fasta") {
-      return new FastaParser(inputfile);
-   } else if (type == "gz") {
-      if ((signed int)filename.find("fastq") != -1 || 
-          (signed int)filename.find("fq") != -1) {
-         return new FastqGzParser(inputfile);
-      }
-      else {
-         return new FastaGzParser(inputfile);
-      }
-   } else {
-      return new FastaParser(inputfile);
-   }
+   // FASTA vs FASTQ and gzip vs plain are sniffed from the file itself.
+   return new BufferedParser(inputfile);
 }
 
-FastaParser::FastaParser(const std::string &inputfile) : 
-                         infile(inputfile.c_str())
-{
-   std::string line, seq;
-   next_name = "";
-   
-   assert(infile.is_open());
-
-   bool valid_read = 0;
-
-   while (!valid_read)  {
-      line = "";
-      seq = "";
-      if (next_name == "")  {
-        getline(infile, current_read.name);
-        assert(current_read.name[0] == '>');
-        current_read.name = current_read.name.substr(1);
-      }
-      else  {
-         current_read.name = next_name;
-         next_name = "";
-      }
-      
-      while(line[0] != '>' && !infile.eof()) {
-         getline(infile, line);
-         if (line[0] != '>') {
-            seq += line;
-         }
-      }
-
-      if ((int)seq.find('N') == -1)  {
-         valid_read = 1;
-      }
-
-      if (line[0] == '>') {
-         next_name = line.substr(1);
-      } else {
-         seq += line;
-      }
+//
+// SequenceStream
+//
 
+SequenceStream::SequenceStream(const std::string &inputfile,
+                               size_t blocksize) :
+   _fd(-1), _gzfile(NULL), _is_fastq(false), _bufsize(blocksize),
+   _start(0), _end(0), _eof(false)
+{
+   _fd = open(inputfile.c_str(), O_RDONLY);
+   assert(_fd >= 0);
+
+   // gzip magic number?  if so, hand the descriptor over to zlib.
+   unsigned char magic[2] = { 0, 0 };
+   ssize_t n_magic = read(_fd, magic, 2);
+   lseek(_fd, 0, SEEK_SET);
+
+   if (n_magic == 2 && magic[0] == 0x1f && magic[1] == 0x8b) {
+      _gzfile = gzdopen(_fd, "rb");
+      assert(_gzfile != NULL);
+      _fd = -1;
    }
 
-   one_read_left = false;
-
-   if (infile.eof())
-   {
-      one_read_left = true;
+   if (_bufsize < 2) {
+      _bufsize = 2;
    }
+   _buf = (char *) malloc(_bufsize);
+   assert(_buf != NULL);
 
-   current_read.seq = seq;
+   // skip any leading blank lines, then peek at the first record.
+   _fill();
+   while (_start < _end && (_buf[_start] == '\n' || _buf[_start] == '\r')) {
+      _start++;
+   }
+   if (_start < _end) {
+      _is_fastq = (_buf[_start] == '@');
+   }
 }
 
-FastaGzParser::FastaGzParser(const std::string &inputfile)
+SequenceStream::~SequenceStream()
 {
-   infile = gzopen(inputfile.c_str(), "rb");
-
-   std::string line, seq;
-   int MAXLINE = 1000;
-   char tmp[1000];
-   next_name = "";
-
-   bool valid_read = 0;
-
-   while (!valid_read)  {
-      line = "";
-      seq = "";
-      if (next_name == "")  {
-         gzgets(infile, tmp, MAXLINE);
-         tmp[strlen(tmp)-1] = '\0';
-         current_read.name = tmp;
-         //getline(infile, current_read.name);
-         assert(current_read.name[0] == '>');
-         current_read.name = current_read.name.substr(1);
-      }
-      else  {
-         current_read.name = next_name;
-         next_name = "";
-      }
-
-      while(line[0] != '>' && !gzeof(infile)) {
-         gzgets(infile, tmp, MAXLINE);
-         tmp[strlen(tmp)-1] = '\0';
-         line = tmp;
-         //getline(infile, line);
-         if (line[0] != '>') {
-            seq += line;
-         }
-      }
-
-      if ((int)seq.find('N') == -1)  {
-         valid_read = 1;
-      }
-
-      if (line[0] == '>') {
-         next_name = line.substr(1);
-      } else {
-         seq += line;
-      }
-
+   if (_gzfile) {
+      gzclose(_gzfile);
    }
-
-   one_read_left = false;
-
-   if (gzeof(infile))
-   {
-      one_read_left = true;
+   if (_fd >= 0) {
+      close(_fd);
    }
-
-   current_read.seq = seq;
+   free(_buf);
 }
 
+// move the unconsumed bytes to the front of the buffer (growing it if
+// it's full) and read more; returns false at end of file.  Invalidates
+// all pointers into the buffer.
 
-Read FastaParser::get_next_read()
+bool SequenceStream::_fill()
 {
-   std::string line = "", seq = "";
-   Read next_read = current_read;
+   if (_eof) {
+      return false;
+   }
 
-   if (one_read_left)  {
-      one_read_left = false;
-      return next_read;
+   if (_start > 0) {
+      memmove(_buf, _buf + _start, _end - _start);
+      _end -= _start;
+      _start = 0;
    }
 
-   bool valid_read = 0;
+   if (_end + 1 >= _bufsize) {
+      _bufsize *= 2;
+      _buf = (char *) realloc(_buf, _bufsize);
+      assert(_buf != NULL);
+   }
 
-   while (!valid_read)  {
-      current_read.name = next_name;
-      next_name = "";
-      current_read.seq = "";
+   // always leave one spare byte, so that the last line of the file can
+   // be NUL-terminated even if it has no trailing newline.
+   size_t want = _bufsize - _end - 1;
+   long n;
 
-      getline(infile, line);
+   if (_gzfile) {
+      n = gzread(_gzfile, _buf + _end, (unsigned int) want);
+   } else {
+      do {
+         n = read(_fd, _buf + _end, want);
+      } while (n < 0 && errno == EINTR);
+   }
 
-      while(line[0] != '>' && !infile.eof())
-      {
+   if (n <= 0) {
+      _eof = true;
+      return false;
+   }
 
-         if (line[0] != '>')  {
-            seq += line;
-         }
-         getline(infile, line);
-      }
+   _end += n;
+   return true;
+}
 
-      if (line[0] == '>')  {
-         next_name = line.substr(1);
+bool SequenceStream::next_record(ReadView &rv)
+{
+   // skip blank lines between records.
+   while (1) {
+      while (_start < _end &&
+             (_buf[_start] == '\n' || _buf[_start] == '\r')) {
+         _start++;
       }
-
-      if ((int)seq.find('N') == -1)  {
-         valid_read = 1;
-      }  else if (infile.eof())  {
-         one_read_left = false;
+      if (_start < _end) {
          break;
       }
-
-      current_read.seq = seq;
-      seq = "";
-
-      if (infile.eof()) {
-         one_read_left = true;
+      if (!_fill()) {
+         return false;
       }
-
    }
 
-   return next_read;
-}
-
-Read FastaGzParser::get_next_read()
-{
-   int MAXLINE = 1000;
-   char tmp[MAXLINE];
-   std::string line = "", seq = "";
-   Read next_read = current_read;
-
-   if (one_read_left)  {
-      one_read_left = false;
-      return next_read;
+   if (_is_fastq) {
+      return _next_fastq(rv);
    }
+   return _next_fasta(rv);
+}
 
-   bool valid_read = 0;
-
-   while (!valid_read)  {
-      current_read.name = next_name;
-      next_name = "";
-      current_read.seq = "";
-
-      gzgets(infile, tmp, MAXLINE);
-      tmp[strlen(tmp)-1] = '\0';
-      line = tmp;
+// a FASTA record runs up to the next newline followed by '>'.
 
-      while(line[0] != '>' && !gzeof(infile))
-      {
-         if (line[0] != '>')  {
-            seq += line;
+bool SequenceStream::_next_fasta(ReadView &rv)
+{
+   assert(_buf[_start] == '>');
+
+   // offsets are relative to _start, which _fill() may move.
+   size_t scan = 1;
+   size_t rec_len;
+
+   while (1) {
+      char * p = (char *) memchr(_buf + _start + scan, '\n',
+                                 _end - _start - scan);
+      if (p) {
+         size_t nl = p - (_buf + _start);
+         if (_start + nl + 1 < _end) {
+            if (p[1] == '>') {
+               rec_len = nl + 1;
+               break;
+            }
+            scan = nl + 1;
+            continue;
          }
-         gzgets(infile, tmp, MAXLINE);
-         tmp[strlen(tmp)-1] = '\0';
-         line = tmp;
+         scan = nl;		// need to see the byte after the newline
+      } else {
+         scan = _end - _start;
       }
 
-      if (gzeof(infile)) {
-         seq += line;
+      if (!_fill()) {
+         rec_len = _end - _start;
+         break;
       }
+   }
 
-      if (line[0] == '>')  {
-         next_name = line.substr(1);
-      }
+   char * rec = _buf + _start;
+   char * rec_end = rec + rec_len;
 
-      if ((int)seq.find('N') == -1)  {
-         valid_read = 1;
-      }  else if (gzeof(infile))  {
-         one_read_left = false;
-         break;
-      }
+   char * eol = (char *) memchr(rec, '\n', rec_len);
+   if (!eol) {
+      eol = rec_end;
+   }
+   char * name_end = eol;
+   if (name_end > rec + 1 && name_end[-1] == '\r') {
+      name_end--;
+   }
 
-      current_read.seq = seq;
-      seq = "";
+   // squeeze the sequence lines together in place.
+   char * seq = (eol < rec_end) ? eol + 1 : rec_end;
+   char * w = seq;
+   char * r = seq;
 
-      if (gzeof(infile)) {
-         one_read_left = true;
+   while (r < rec_end) {
+      char * nl = (char *) memchr(r, '\n', rec_end - r);
+      if (!nl) {
+         nl = rec_end;
       }
-
+      char * line_end = nl;
+      if (line_end > r && line_end[-1] == '\r') {
+         line_end--;
+      }
+      if (w != r) {
+         memmove(w, r, line_end - r);
+      }
+      w += line_end - r;
+      r = nl + 1;
    }
 
-   return next_read;
-}
-
-FastqParser::FastqParser(const std::string &inputfile) :
-                         infile(inputfile.c_str())
-{
-   std::string line_three, quality_scores;
+   *name_end = '\0';
+   *w = '\0';
 
-   assert(infile.is_open());
+   rv.name = rec + 1;
+   rv.name_len = name_end - (rec + 1);
+   rv.seq = seq;
+   rv.seq_len = w - seq;
+   rv.quality = "";
+   rv.quality_len = 0;
 
-   bool valid_read = 0;
+   _start += rec_len;
 
-   while (!valid_read && !infile.eof())  {
-      getline(infile, current_read.name);
-      getline(infile, current_read.seq);
-      getline(infile, line_three); 
-      getline(infile, quality_scores);
+   return true;
+}
 
-      assert(current_read.name[0] == '@');
-      assert(line_three[0] == '+' || line_three[0] == '#');
-      assert(quality_scores.length() == current_read.seq.length());
-   
-      current_read.name = current_read.name.substr(1);
+// a FASTQ record is exactly four lines: @name, sequence, +, qualities.
 
-      if ((int)current_read.seq.find('N') == -1)  {
-         valid_read = 1;
+bool SequenceStream::_next_fastq(ReadView &rv)
+{
+   size_t line_ends[4];
+   unsigned int n_lines = 0;
+   size_t scan = 0;
+
+   while (n_lines < 4) {
+      char * p = (char *) memchr(_buf + _start + scan, '\n',
+                                 _end - _start - scan);
+      if (p) {
+         line_ends[n_lines++] = p - (_buf + _start);
+         scan = line_ends[n_lines - 1] + 1;
+         continue;
       }
-   }
-}
 
-FastqGzParser::FastqGzParser(const std::string &inputfile)
-{
-   int MAXLINE = 1000;
-   char tmp[MAXLINE];
-   infile = gzopen(inputfile.c_str(), "rb");
-   std::string line_three, quality_scores;
-
-   one_read_left = 0;
-
-   bool valid_read = 0;
-
-   while (!valid_read && !gzeof(infile))  {
-      //getline(infile, current_read.name);
-      //getline(infile, current_read.seq);
-      //getline(infile, line_three);
-      //getline(infile, quality_scores);
-      gzgets(infile, tmp, MAXLINE);
-      tmp[strlen(tmp)-1] = '\0';
-      current_read.name = tmp;
-      gzgets(infile, tmp, MAXLINE);
-      tmp[strlen(tmp)-1] = '\0';
-      current_read.seq = tmp;
-      gzgets(infile, tmp, MAXLINE);
-      tmp[strlen(tmp)-1] = '\0';
-      line_three = tmp;
-      gzgets(infile, tmp, MAXLINE);
-      tmp[strlen(tmp)-1] = '\0';
-      quality_scores = tmp;
-
-      //std::cout << current_read.name[0] << std::endl;
-
-      assert(current_read.name[0] == '@');
-      assert(line_three[0] == '+');
-      assert(quality_scores.length() == current_read.seq.length());
-
-      current_read.name = current_read.name.substr(1);
-
-      if ((int)current_read.seq.find('N') == -1)  {
-         valid_read = 1;
+      if (!_fill()) {
+         if (n_lines == 3) {	// quality line w/o trailing newline
+            line_ends[n_lines++] = _end - _start;
+         }
+         break;
       }
    }
-}
-
-Read FastqParser::get_next_read()
-{
-   Read next_read = current_read;
-   std::string line_three, quality_scores;
-
-   bool valid_read = 0;
-
-   while (!valid_read && !infile.eof())  {
+   assert(n_lines == 4);	// truncated record?
 
-      getline(infile, current_read.name);
+   char * rec = _buf + _start;
+   char * lines[4];
+   size_t lens[4];
 
-      if (infile.eof())  {
-         return next_read;
+   size_t line_start = 0;
+   for (unsigned int i = 0; i < 4; i++) {
+      size_t line_end = line_ends[i];
+      if (line_end > line_start && rec[line_end - 1] == '\r') {
+         line_end--;
       }
+      lines[i] = rec + line_start;
+      lens[i] = line_end - line_start;
+      rec[line_end] = '\0';
 
-      getline(infile, current_read.seq);
-      getline(infile, line_three);
-      getline(infile, quality_scores);
-   
-      assert(current_read.name[0] == '@');
-      assert(line_three[0] == '+' || line_three[0] == '#');
-      assert(quality_scores.length() == current_read.seq.length());
+      line_start = line_ends[i] + 1;
+   }
 
-      current_read.name = current_read.name.substr(1);
+   assert(lines[0][0] == '@');
+   assert(lines[2][0] == '+' || lines[2][0] == '#');
+   assert(lens[3] == lens[1]);
 
-      if ((int)current_read.seq.find('N') == -1)  {
-         valid_read = 1;
-      }
-   }
+   rv.name = lines[0] + 1;
+   rv.name_len = lens[0] - 1;
+   rv.seq = lines[1];
+   rv.seq_len = lens[1];
+   rv.quality = lines[3];
+   rv.quality_len = lens[3];
 
-   return next_read;
+   _start = (line_start < _end - _start) ? _start + line_start : _end;
+
+   return true;
 }
 
-Read FastqGzParser::get_next_read()
+//
+// BufferedParser
+//
+
+BufferedParser::BufferedParser(const std::string &inputfile) :
+   _stream(inputfile), _have_read(false)
 {
-   int MAXLINE = 1000;
-   char tmp[MAXLINE];
-   Read next_read = current_read;
-   std::string line_three, quality_scores;
+   _advance();
+}
 
-   bool valid_read = 0;
+// load the next read without an 'N' in it into current_read.
 
-   if (gzeof(infile)) {
-      one_read_left = 0;
-      return next_read;
-   }
+void BufferedParser::_advance()
+{
+   ReadView rv;
 
-   while (!valid_read && !gzeof(infile))  {
-
-      //getline(infile, current_read.name);
-      gzgets(infile, tmp, MAXLINE);
-      tmp[strlen(tmp)-1] = '\0';
-      current_read.name = tmp;
-
-      //if (gzeof(infile))  {
-      //   one_read_left = 0;
-      //   return next_read;
-      //}
-
-      //getline(infile, current_read.seq);
-      //getline(infile, line_three);
-      //getline(infile, quality_scores);
-      gzgets(infile, tmp, MAXLINE);
-      tmp[strlen(tmp)-1] = '\0';
-      current_read.seq = tmp;
-      gzgets(infile, tmp, MAXLINE);
-      tmp[strlen(tmp)-1] = '\0';
-      line_three = tmp;
-      gzgets(infile, tmp, MAXLINE);
-      tmp[strlen(tmp)-1] = '\0';
-      quality_scores = tmp;
-
-      assert(current_read.name[0] == '@');
-      assert(line_three[0] == '+');
-      assert(quality_scores.length() == current_read.seq.length());
-
-      current_read.name = current_read.name.substr(1);
-
-      if ((int)current_read.seq.find('N') == -1)  {
-         valid_read = 1;
+   _have_read = false;
+   while (_stream.next_record(rv)) {
+      if (memchr(rv.seq, 'N', rv.seq_len)) {
+         continue;
       }
 
-      if (gzeof(infile) && valid_read) {
-         one_read_left = 1;
-      }
+      current_read.name.assign(rv.name, rv.name_len);
+      current_read.seq.assign(rv.seq, rv.seq_len);
+      current_read.quality.assign(rv.quality, rv.quality_len);
+      _have_read = true;
+      break;
    }
-
-   return next_read;
 }
 
-
-int main()
+Read BufferedParser::get_next_read()
 {
-   IParser* parser = IParser::get_parser("test.fasta.gz");
-   
-   while(!parser->is_complete())  {
-      Read next_read = parser->get_next_read();
-      std::cout << next_read.name << ": " << next_read.seq << std::endl;
-   }
-
-   delete parser;
+   Read next_read;
 
-   IParser* parser2 = IParser::get_parser("test.fq.gz");
-   while (!parser2->is_complete()) {
-      Read next_read = parser2->get_next_read();
-      std::cout << next_read.name << ": " << next_read.seq << std::endl;
-   }
-
-   delete parser2;
+   std::swap(next_read, current_read);
+   _advance();
 
-   return 0;
+   return next_read;
 }
@@ -8,11 +8,63 @@
 #include <assert.h>
 #include "zlib-1.2.3/zlib.h"
 
+// initial size of the SequenceStream read buffer; grows for huge records.
+#define PARSER_BLOCK_SIZE (4*1024*1024)
+
 struct Read
 {
    std::string name;
    std::string seq;
-   //std::string quality;
+   std::string quality;		// empty for FASTA
+};
+
+//
+// ReadView: one record as pointers into a SequenceStream's buffer.  All
+// three strings are NUL-terminated in place, and stay valid only until
+// the next call to SequenceStream::next_record().
+//
+
+struct ReadView
+{
+   const char * name;
+   size_t name_len;
+   const char * seq;
+   size_t seq_len;
+   const char * quality;	// "" for FASTA
+   size_t quality_len;
+};
+
+//
+// SequenceStream: block-buffered FASTA/FASTQ reader.  Reads the input in
+// large chunks (through zlib for gzipped files), finds record boundaries
+// with memchr, and hands out records without copying them.  The format
+// and compression are detected from the file contents.
+//
+
+class SequenceStream
+{
+private:
+   int _fd;
+   gzFile _gzfile;
+   bool _is_fastq;
+
+   char * _buf;
+   size_t _bufsize;
+   size_t _start;		// first unconsumed byte in _buf
+   size_t _end;			// one past the last valid byte in _buf
+   bool _eof;
+
+   bool _fill();
+   bool _next_fasta(ReadView &rv);
+   bool _next_fastq(ReadView &rv);
+public:
+   SequenceStream(const std::string &inputfile,
+                  size_t blocksize = PARSER_BLOCK_SIZE);
+   ~SequenceStream();
+
+   // fill in the next record; returns false at end of file.
+   bool next_record(ReadView &rv);
+   bool is_fastq() const { return _is_fastq; }
 };
 
 class IParser
@@ -24,58 +76,49 @@ public:
    static IParser* get_parser(const std::string &inputfile);
 };
 
+//
+// BufferedParser: the IParser interface on top of a SequenceStream.
+// Like the old line-based parsers, it silently skips reads containing 'N'.
+//
 
-class FastaParser : public IParser
+class BufferedParser : public IParser
 {
 private:
-   std::ifstream infile;
+   SequenceStream _stream;
    Read current_read;
-   std::string next_name;
-   bool one_read_left;
+   bool _have_read;
+
+   void _advance();
 public:
-   FastaParser(const std::string &inputfile);
-   ~FastaParser() { infile.close();  }
+   BufferedParser(const std::string &inputfile);
    Read get_next_read();
-   bool is_complete() { return !one_read_left && infile.eof(); } 
+   bool is_complete() { return !_have_read; }
 };
 
-class FastaGzParser : public IParser
+// the old per-format parsers are now all the same thing.
+
+class FastaParser : public BufferedParser
 {
-private:
-   gzFile infile;
-   Read current_read;
-   std::string next_name;
-   bool one_read_left;
 public:
-   FastaGzParser(const std::string &inputfile);
-   ~FastaGzParser() { gzclose(infile);  }
-   Read get_next_read();
-   bool is_complete() { return !one_read_left && gzeof(infile); }
+   FastaParser(const std::string &inputfile) : BufferedParser(inputfile) { }
 };
 
-class FastqParser : public IParser
+class FastaGzParser : public BufferedParser
 {
-private:
-   std::ifstream infile;
-   Read current_read;
 public:
-   FastqParser(const std::string &inputfile);
-   ~FastqParser() { infile.close(); }
-   Read get_next_read();
-   bool is_complete() { return infile.eof(); }
+   FastaGzParser(const std::string &inputfile) : BufferedParser(inputfile) { }
 };
 
-class FastqGzParser : public IParser
+class FastqParser : public BufferedParser
 {
-private:
-   gzFile infile;
-   Read current_read;
-   bool one_read_left;
 public:
-   FastqGzParser(const std::string &inputfile);
-   ~FastqGzParser() { gzclose(infile); }
-   Read get_next_read();
-   bool is_complete() { return !one_read_left && gzeof(infile); }
+   FastqParser(const std::string &inputfile) : BufferedParser(inputfile) { }
+};
+
+class FastqGzParser : public BufferedParser
+{
+public:
+   FastqGzParser(const std::string &inputfile) : BufferedParser(inputfile) { }
 };
 
 #endif
@@ -0,0 +1,104 @@
+#ifndef READ_QUEUE_HH
+#define READ_QUEUE_HH
+
+#include <deque>
+#include <vector>
+#include <string>
+#include <pthread.h>
+#include "parsers.hh"
+
+// number of reads handed to a worker at a time.
+#define READ_BATCH_SIZE 1000
+
+// max number of batches waiting in the queue before the reader blocks.
+#define READ_QUEUE_DEPTH 32
+
+namespace khmer {
+  typedef std::vector<Read> ReadBatch;
+
+  //
+  // ReadBatchQueue: a bounded, blocking queue of read batches, filled by
+  // one producer (the file reader) and drained by any number of workers.
+  //
+
+  class ReadBatchQueue {
+  protected:
+    std::deque<ReadBatch *> _batches;
+    unsigned int _max_depth;
+    bool _closed;
+
+    pthread_mutex_t _lock;
+    pthread_cond_t _not_empty;
+    pthread_cond_t _not_full;
+
+  public:
+    ReadBatchQueue(unsigned int max_depth = READ_QUEUE_DEPTH) :
+      _max_depth(max_depth), _closed(false) {
+      pthread_mutex_init(&_lock, NULL);
+      pthread_cond_init(&_not_empty, NULL);
+      pthread_cond_init(&_not_full, NULL);
+    }
+
+    ~ReadBatchQueue() {
+      while (!_batches.empty()) {
+	delete _batches.front();
+	_batches.pop_front();
+      }
+      pthread_cond_destroy(&_not_full);
+      pthread_cond_destroy(&_not_empty);
+      pthread_mutex_destroy(&_lock);
+    }
+
+    // add a batch, blocking while the queue is full; takes ownership.
+    // returns false (and drops the batch) if the queue has been closed.
+    bool push(ReadBatch * batch) {
+      bool accepted = false;
+
+      pthread_mutex_lock(&_lock);
+      while (_batches.size() >= _max_depth && !_closed) {
+	pthread_cond_wait(&_not_full, &_lock);
+      }
+      if (!_closed) {
+	_batches.push_back(batch);
+	pthread_cond_signal(&_not_empty);
+	accepted = true;
+      }
+      pthread_mutex_unlock(&_lock);
+
+      if (!accepted) {
+	delete batch;
+      }
+      return accepted;
+    }
+
+    // get the next batch, or NULL once the queue is closed and drained.
+    // the caller owns (and must delete) the returned batch.
+    ReadBatch * pop() {
+      ReadBatch * batch = NULL;
+
+      pthread_mutex_lock(&_lock);
+      while (_batches.empty() && !_closed) {
+	pthread_cond_wait(&_not_empty, &_lock);
+      }
+      if (!_batches.empty()) {
+	batch = _batches.front();
+	_batches.pop_front();
+	pthread_cond_signal(&_not_full);
+      }
+      pthread_mutex_unlock(&_lock);
+
+      return batch;
+    }
+
+    // no more batches are coming; wake everyone up.
+    void close() {
+      pthread_mutex_lock(&_lock);
+      _closed = true;
+      pthread_cond_broadcast(&_not_empty);
+      pthread_cond_broadcast(&_not_full);
+      pthread_mutex_unlock(&_lock);
+    }
+  };
+};
+
+#endif // READ_QUEUE_HH
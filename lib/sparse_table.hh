@@ -0,0 +1,146 @@
+#ifndef SPARSE_TABLE_HH
+#define SPARSE_TABLE_HH
+
+#include <string.h>
+#include <stdint.h>
+#include <vector>
+#include <algorithm>
+#include "khmer.hh"
+
+// small enough that scattered counts leave most blocks empty, but big
+// enough that the bitmap is only 1/64th of the table.
+#define SPARSE_BLOCK_BYTES 8
+
+namespace khmer {
+
+  //
+  // The sparse encoding of a table, for saving mostly-empty tables: a
+  // bitmap with a bit for each SPARSE_BLOCK_BYTES block of the table, set
+  // if the block has anything in it, then those blocks and no others.
+  // (The last block may be short.)  It's written and read through
+  // anything with write() / read(), such as a file stream or a
+  // ChunkedGzWriter / ChunkedGzReader.
+  //
+
+  inline HashIntoType _sparse_n_blocks(HashIntoType n_bytes) {
+    return (n_bytes + SPARSE_BLOCK_BYTES - 1) / SPARSE_BLOCK_BYTES;
+  }
+
+  inline size_t _sparse_block_size(HashIntoType block, HashIntoType n_bytes) {
+    const HashIntoType start = block * SPARSE_BLOCK_BYTES;
+    return n_bytes - start < SPARSE_BLOCK_BYTES ? n_bytes - start :
+      SPARSE_BLOCK_BYTES;
+  }
+
+  // fill in the bitmap of occupied blocks, and return the bytes in them.
+  // Whole blocks are tested a word at a time, eight to a bitmap byte.
+  inline HashIntoType _sparse_bitmap(const Byte * table, HashIntoType n_bytes,
+				     std::vector<Byte> &bitmap) {
+    const HashIntoType n_blocks = _sparse_n_blocks(n_bytes);
+    const HashIntoType n_whole = n_bytes / SPARSE_BLOCK_BYTES;
+    bitmap.assign((n_blocks + 7) / 8, 0);
+
+    HashIntoType occupied = 0;
+    HashIntoType b = 0;
+    for (; b + 8 <= n_whole; b += 8) {
+      uint64_t x[8];
+      memcpy(x, table + b * SPARSE_BLOCK_BYTES, sizeof(x));
+      Byte bits = 0;
+      for (unsigned int j = 0; j < 8; j++) {
+	bits |= (x[j] != 0) << j;
+      }
+      bitmap[b / 8] = bits;
+      occupied += __builtin_popcount(bits);
+    }
+
+    HashIntoType total = occupied * SPARSE_BLOCK_BYTES;
+    for (; b < n_blocks; b++) {
+      const size_t n = _sparse_block_size(b, n_bytes);
+      const Byte * p = table + b * SPARSE_BLOCK_BYTES;
+      bool empty = true;
+      for (size_t j = 0; j < n; j++) {
+	empty = empty && !p[j];
+      }
+      if (!empty) {
+	bitmap[b / 8] |= 1 << (b % 8);
+	total += n;
+      }
+    }
+    return total;
+  }
+
+  // bytes needed to save the table sparsely.
+  inline HashIntoType sparse_table_bytes(const Byte * table,
+					 HashIntoType n_bytes) {
+    std::vector<Byte> bitmap;
+    const HashIntoType packed = _sparse_bitmap(table, n_bytes, bitmap);
+    return bitmap.size() + packed;
+  }
+
+  template <class Out>
+  void write_sparse_table(Out &outfile, const Byte * table,
+			  HashIntoType n_bytes) {
+    const HashIntoType n_blocks = _sparse_n_blocks(n_bytes);
+
+    std::vector<Byte> bitmap;
+    _sparse_bitmap(table, n_bytes, bitmap);
+    if (bitmap.size()) {
+      outfile.write((const char *) &bitmap[0], bitmap.size());
+    }
+
+    // write each run of occupied blocks in one go.
+    HashIntoType b = 0;
+    while (b < n_blocks) {
+      if (!(bitmap[b / 8] & (1 << (b % 8)))) {
+	b++;
+	continue;
+      }
+      const HashIntoType start = b * SPARSE_BLOCK_BYTES;
+      while (b < n_blocks && (bitmap[b / 8] & (1 << (b % 8)))) {
+	b++;
+      }
+      const HashIntoType stop = std::min(b * SPARSE_BLOCK_BYTES, n_bytes);
+      outfile.write((const char *) table + start, stop - start);
+    }
+  }
+
+  // read a sparsely saved table into the n_bytes at table, zeroing the
+  // rest.  The blocks are read in one go, then put in place.
+  template <class In>
+  void read_sparse_table(In &infile, Byte * table, HashIntoType n_bytes) {
+    const HashIntoType n_blocks = _sparse_n_blocks(n_bytes);
+
+    std::vector<Byte> bitmap((n_blocks + 7) / 8);
+    if (bitmap.size()) {
+      infile.read((char *) &bitmap[0], bitmap.size());
+    }
+
+    // the last block may be short.
+    HashIntoType packed_bytes = 0;
+    for (size_t i = 0; i < bitmap.size(); i++) {
+      packed_bytes += __builtin_popcount(bitmap[i]) * SPARSE_BLOCK_BYTES;
+    }
+    if (n_blocks && (bitmap[(n_blocks - 1) / 8] & (1 << ((n_blocks - 1) % 8)))) {
+      packed_bytes -= SPARSE_BLOCK_BYTES - _sparse_block_size(n_blocks - 1,
+							      n_bytes);
+    }
+
+    std::vector<Byte> packed(packed_bytes);
+    if (packed_bytes) {
+      infile.read((char *) &packed[0], packed_bytes);
+    }
+
+    memset(table, 0, n_bytes);
+    const Byte * p = packed.size() ? &packed[0] : NULL;
+    for (size_t i = 0; i < bitmap.size(); i++) {
+      for (Byte bits = bitmap[i]; bits; bits &= bits - 1) {
+	const HashIntoType b = i * 8 + __builtin_ctz(bits);
+	const size_t n = _sparse_block_size(b, n_bytes);
+	memcpy(table + b * SPARSE_BLOCK_BYTES, p, n);
+	p += n;
+      }
+    }
+  }
+};
+
+#endif // SPARSE_TABLE_HH
@@ -47,9 +47,8 @@ void SubsetPartition::count_partitions(unsigned int& n_partitions,
 
   for (PartitionMap::const_iterator pi = partition_map.begin();
        pi != partition_map.end(); pi++) {
-    PartitionID * partition_p = pi->second;
-    if (partition_p) {
-      partitions.insert(*partition_p);
+    if (pi->second) {
+      partitions.insert(_find_root(pi->second));
     }
     else {
       n_unassigned++;
@@ -95,11 +94,13 @@ unsigned int SubsetPartition::output_partitioned_file(const std::string infilena
       const char * kmer_s = seq.c_str();
 
       bool found_tag = false;
+      PartitionMap::const_iterator pi;
       for (unsigned int i = 0; i < seq.length() - ksize + 1; i++) {
 	kmer = _hash(kmer_s + i, ksize);
 
 	// is this a known tag?
-	if (set_contains(partition_map, kmer)) {
+	pi = partition_map.find(kmer);
+	if (pi != partition_map.end()) {
 	  found_tag = true;
 	  break;
 	}
@@ -111,12 +112,10 @@ unsigned int SubsetPartition::output_partitioned_file(const std::string infilena
 
       PartitionID partition_id = 0;
       if (found_tag) {
-	PartitionID * partition_p = partition_map[kmer];
-	if (partition_p == NULL ){
-	  partition_id = 0;
+	if (pi->second == 0) {
 	  n_singletons++;
 	} else {
-	  partition_id = *partition_p;
+	  partition_id = _find_root(pi->second);
 	  partitions.insert(partition_id);
 	}
       }
@@ -197,10 +196,10 @@ unsigned int SubsetPartition::find_unpart(const std::string infilename,
 
       for (SeenSet::iterator si = found_tags.begin(); si != found_tags.end();
 	   si++) {
-	PartitionMap::iterator pi = partition_map.find(*si);
+	PartitionMap::const_iterator pi = partition_map.find(*si);
 	PartitionID partition_id = 0;
-	if (pi != partition_map.end() && pi->second != NULL) {
-	  partition_id = *(pi->second);
+	if (pi != partition_map.end()) {
+	  partition_id = _find_root(pi->second);
 	}
 	if (partition_id == 0) {
 	  found_zero = true;
@@ -299,29 +298,29 @@ void SubsetPartition::find_all_tags(HashIntoType kmer_f,
 				    HashIntoType kmer_r,
 				    SeenSet& tagged_kmers,
 				    const SeenSet& all_tags,
+				    TraversalWorkspace& workspace,
 				    bool break_on_stop_tags,
-				    bool stop_big_traversals)
+				    bool stop_big_traversals) const
 {
   const HashIntoType bitmask = _ht->bitmask;
 
-  HashIntoType f, r;
   bool first = true;
-  NodeQueue node_q;
-  std::queue<unsigned int> breadth_q;
   unsigned int cur_breadth = 0;
-  unsigned int breadth = 0;
   const unsigned int max_breadth = (2 * _ht->_tag_density) + 1;
 
   const unsigned int rc_left_shift = _ht->ksize()*2 - 2;
   unsigned int total = 0;
 
-  SeenSet keeper;		// keep track of traversed kmers
+  KmerVisitSet& keeper = workspace.visited; // keep track of traversed kmers
+  TraversalQueue& node_q = workspace.queue;
+  workspace.clear();
+
+  KmerNeighbors neighbors;
+  bool present[8];
 
   // start breadth-first search.
 
-  node_q.push(kmer_f);
-  node_q.push(kmer_r);
-  breadth_q.push(0);
+  node_q.push(kmer_f, kmer_r, 0);
 
   while(!node_q.empty()) {
     if (stop_big_traversals && keeper.size() > BIG_TRAVERSALS_ARE) {
@@ -329,17 +328,13 @@ void SubsetPartition::find_all_tags(HashIntoType kmer_f,
       break;
     }
 
-    kmer_f = node_q.front();
-    node_q.pop();
-    kmer_r = node_q.front();
-    node_q.pop();
-    breadth = breadth_q.front();
-    breadth_q.pop();
+    TraversalNode node = node_q.pop();
+    const unsigned int breadth = node.breadth;
 
-    HashIntoType kmer = uniqify_rc(kmer_f, kmer_r);
+    HashIntoType kmer = uniqify_rc(node.kmer_f, node.kmer_r);
 
     // Have we already seen this k-mer?  If so, skip.
-    if (set_contains(keeper, kmer)) {
+    if (keeper.contains(kmer)) {
       continue;
     }
 
@@ -367,73 +362,21 @@ void SubsetPartition::find_all_tags(HashIntoType kmer_f,
     if (breadth >= max_breadth) { continue; } // truncate search @CTB exit?
 
     //
-    // Enqueue next set of nodes.
+    // Enqueue next set of nodes: all 8 neighbors (next, then previous)
+    // that we haven't seen yet and that are in the graph.
     //
 
-    // NEXT
-    f = next_f(kmer_f, 'A');
-    r = next_r(kmer_r, 'A');
-    if (_ht->get_count(uniqify_rc(f,r)) &&
-	!set_contains(keeper, uniqify_rc(f,r))) {
-      node_q.push(f); node_q.push(r);
-      breadth_q.push(breadth + 1);
-    }
-
-    f = next_f(kmer_f, 'C');
-    r = next_r(kmer_r, 'C');
-    if (_ht->get_count(uniqify_rc(f,r)) && 
-        !set_contains(keeper, uniqify_rc(f,r))) {
-      node_q.push(f); node_q.push(r);
-      breadth_q.push(breadth + 1);
-    }
-
-    f = next_f(kmer_f, 'G');
-    r = next_r(kmer_r, 'G');
-    if (_ht->get_count(uniqify_rc(f,r)) && 
-        !set_contains(keeper, uniqify_rc(f,r))) {
-      node_q.push(f); node_q.push(r);
-      breadth_q.push(breadth + 1);
-    }
-
-    f = next_f(kmer_f, 'T');
-    r = next_r(kmer_r, 'T');
-    if (_ht->get_count(uniqify_rc(f,r)) && 
-        !set_contains(keeper, uniqify_rc(f,r))) {
-      node_q.push(f); node_q.push(r);
-      breadth_q.push(breadth + 1);
+    get_kmer_neighbors(node.kmer_f, node.kmer_r, bitmask, rc_left_shift,
+		       neighbors);
+    for (unsigned int i = 0; i < 8; i++) {
+      present[i] = !keeper.contains(neighbors.kmer[i]);
     }
+    _ht->check_present(neighbors.kmer, present, 8);
 
-    // PREVIOUS.
-    r = prev_r(kmer_r, 'A');
-    f = prev_f(kmer_f, 'A');
-    if (_ht->get_count(uniqify_rc(f,r)) && 
-        !set_contains(keeper, uniqify_rc(f,r))) {
-      node_q.push(f); node_q.push(r);
-      breadth_q.push(breadth + 1);
-    }
-
-    r = prev_r(kmer_r, 'C');
-    f = prev_f(kmer_f, 'C');
-    if (_ht->get_count(uniqify_rc(f,r)) && 
-        !set_contains(keeper, uniqify_rc(f,r))) {
-      node_q.push(f); node_q.push(r);
-      breadth_q.push(breadth + 1);
-    }
-    
-    r = prev_r(kmer_r, 'G');
-    f = prev_f(kmer_f, 'G');
-    if (_ht->get_count(uniqify_rc(f,r)) && 
-        !set_contains(keeper, uniqify_rc(f,r))) {
-      node_q.push(f); node_q.push(r);
-      breadth_q.push(breadth + 1);
-    }
-
-    r = prev_r(kmer_r, 'T');
-    f = prev_f(kmer_f, 'T');
-    if (_ht->get_count(uniqify_rc(f,r)) && 
-        !set_contains(keeper, uniqify_rc(f,r))) {
-      node_q.push(f); node_q.push(r);
-      breadth_q.push(breadth + 1);
+    for (unsigned int i = 0; i < 8; i++) {
+      if (present[i]) {
+	node_q.push(neighbors.kmer_f[i], neighbors.kmer_r[i], breadth + 1);
+      }
     }
 
     first = false;
@@ -456,20 +399,11 @@ void SubsetPartition::do_partition(HashIntoType first_kmer,
   SeenSet tagged_kmers;
   const unsigned char ksize = _ht->ksize();
 
-  SeenSet::const_iterator si, end;
-
-  if (first_kmer) {
-    si = _ht->all_tags.find(first_kmer);
-  } else {
-    si = _ht->all_tags.begin();
-  }
-  if (last_kmer) {
-    end = _ht->all_tags.find(last_kmer);
-  } else {
-    end = _ht->all_tags.end();
-  }
+  std::vector<HashIntoType> tags;
+  _ht->get_tags_in_range(first_kmer, last_kmer, tags);
 
-  for (; si != end; si++) {
+  for (std::vector<HashIntoType>::const_iterator si = tags.begin();
+       si != tags.end(); si++) {
     total_reads++;
 
     kmer_s = _revhash(*si, ksize); // @CTB hackity hack hack!
@@ -512,17 +446,10 @@ void SubsetPartition::set_partition_id(std::string kmer_s, PartitionID p)
 
 void SubsetPartition::set_partition_id(HashIntoType kmer, PartitionID p)
 {
-  PartitionPtrSet * s = reverse_pmap[p];
-  PartitionID * pp = NULL;
-  if (s == NULL) {
-    s = new PartitionPtrSet();
-    pp = new unsigned int(p);
-    s->insert(pp);
-    reverse_pmap[p] = s;
-  } else {
-    pp = *(s->begin());
-  }
-  partition_map[kmer] = pp;
+  assert(p != 0);
+
+  _add_partition(p);
+  partition_map[kmer] = p;
 
   if (next_partition_id <= p) {
     next_partition_id = p + 1;
@@ -534,15 +461,11 @@ PartitionID SubsetPartition::assign_partition_id(HashIntoType kmer,
 
 {
   PartitionID return_val = 0; 
-  PartitionID * pp = NULL;
 
   // did we find a tagged kmer?
   if (tagged_kmers.size() >= 1) {
-    pp = _join_partitions_by_tags(tagged_kmers, kmer);
-    return_val = *pp;
+    return_val = _join_partitions_by_tags(tagged_kmers, kmer);
   } else {
-    PartitionMap::iterator pi = partition_map.find(kmer);
-
     partition_map.erase(kmer);
     return_val = 0;
   }
@@ -551,91 +474,46 @@ PartitionID SubsetPartition::assign_partition_id(HashIntoType kmer,
 }
 
 // _join_partitions_by_tags combines the tags in 'tagged_kmers' into a single
-// partition, creating or reassigning partitions as necessary.  Low level
+// partition, creating or joining partitions as necessary.  Low level
 // function!
 
-PartitionID * SubsetPartition::_join_partitions_by_tags(
+PartitionID SubsetPartition::_join_partitions_by_tags(
                    const SeenSet& tagged_kmers,
 		   const HashIntoType kmer)
 {
   SeenSet::const_iterator it = tagged_kmers.begin();
-  unsigned int * this_partition_p = NULL;
+  PartitionID this_partition = 0;
 
   // find first assigned partition ID in tagged set
   while (it != tagged_kmers.end()) {
-    this_partition_p = partition_map[*it];
-    if (this_partition_p != NULL) {
+    PartitionMap::const_iterator pi = partition_map.find(*it);
+    if (pi != partition_map.end() && pi->second) {
+      this_partition = pi->second;
       break;
     }
     it++;
   }
 
   // no partition ID? allocate new!
-  if (this_partition_p == NULL) {
-    this_partition_p = new PartitionID(next_partition_id);
-    next_partition_id++;
-
-    PartitionPtrSet * s = new PartitionPtrSet();
-    s->insert(this_partition_p);
-    reverse_pmap[*this_partition_p] = s;
+  if (this_partition == 0) {
+    this_partition = get_new_partition();
   }
   
-  // reassign all partitions individually.
+  // assign or join partitions individually.
   it = tagged_kmers.begin();
   for (; it != tagged_kmers.end(); ++it) {
-    PartitionMap::iterator pi = partition_map.find(*it);
+    PartitionID& p = partition_map[*it];
 
-    if (pi == partition_map.end()) { // no entry? insert.
-      partition_map[*it] = this_partition_p;
-    } else {
-      PartitionID * pp_id = pi->second;
-
-      if (pp_id == NULL) {	// entry is null? set;
-	pi->second = this_partition_p;
-      } else if (*pp_id != *this_partition_p) { // != entry? join partitions.
-	_merge_two_partitions(this_partition_p, pp_id);
-      }
+    if (p == 0) {		// no entry? set.
+      p = this_partition;
+    } else {			// join partitions (a no-op if the same).
+      _union_partitions(this_partition, p);
     }
   }
 
-  assert(this_partition_p != NULL);
-  partition_map[kmer] = this_partition_p;
+  partition_map[kmer] = this_partition;
 
-  return this_partition_p;
-}
-
-// _merge_two_partitions merges the 'merge_pp' partition into the
-// 'the_pp' partition.  It does this by joining the reverse pointer
-// map structures for two partitions and resetting each partition
-// pointer individually.
-
-PartitionID * SubsetPartition::_merge_two_partitions(PartitionID *the_pp,
-						     PartitionID *merge_pp)
-{
-  PartitionPtrSet * s = reverse_pmap[*the_pp];
-  PartitionPtrSet * t = reverse_pmap[*merge_pp];
-
-  // Choose the smaller of two sets to loop over.
-  if (s->size() < t->size()) {
-    PartitionPtrSet * tmp = s;  s = t; t = tmp;
-    PartitionID * tmp2 = the_pp; the_pp = merge_pp; merge_pp = tmp2;
-  }
-
-  // Get rid of the reverse pointer for the old partition.
-  reverse_pmap.erase(*merge_pp);
-
-  // Merge all of the elements in the to-be-replaced PartitionPtrSet
-  // into the merged partition.
-  for (PartitionPtrSet::iterator pi = t->begin(); pi != t->end(); pi++) {
-    PartitionID * iter_pp;
-    iter_pp = *pi;
-
-    *iter_pp = *the_pp;	// reset the partition ID to the new one.
-    s->insert(iter_pp);
-  }
-  delete t;
-
-  return the_pp;
+  return _find_root(this_partition);
 }
 
 PartitionID SubsetPartition::join_partitions(PartitionID orig, PartitionID join)
@@ -643,19 +521,11 @@ PartitionID SubsetPartition::join_partitions(PartitionID orig, PartitionID join)
   if (orig == join) { return orig; }
   if (orig == 0 || join == 0) { return 0; }
 
-  if (reverse_pmap.find(orig) == reverse_pmap.end() ||
-      reverse_pmap.find(join) == reverse_pmap.end() ||
-      reverse_pmap[orig] == NULL ||
-      reverse_pmap[join] == NULL) {
+  if (!_is_partition(orig) || !_is_partition(join)) {
     return 0;
   }
 
-  PartitionID * orig_pp = *(reverse_pmap[orig]->begin());
-  PartitionID * join_pp = *(reverse_pmap[join]->begin());
-
-  _merge_two_partitions(orig_pp, join_pp);
-
-  return orig;
+  return _union_partitions(orig, join);
 }
 
 PartitionID SubsetPartition::get_partition_id(std::string kmer_s)
@@ -669,12 +539,9 @@ PartitionID SubsetPartition::get_partition_id(std::string kmer_s)
 
 PartitionID SubsetPartition::get_partition_id(HashIntoType kmer)
 {
-  if (partition_map.find(kmer) != partition_map.end()) {
-    PartitionID * pp = partition_map[kmer];
-    if (pp == NULL) {
-      return 0;
-    }
-    return *pp;
+  PartitionMap::const_iterator pi = partition_map.find(kmer);
+  if (pi != partition_map.end()) {
+    return _find_root(pi->second);
   }
   return 0;
 }
@@ -683,12 +550,12 @@ void SubsetPartition::merge(SubsetPartition * other)
 {
   if (this == other) { return; }
 
-  PartitionPtrMap other_to_this;
+  PartitionIDMap other_to_this;
 
   PartitionMap::const_iterator pi = other->partition_map.begin();
   for (; pi != other->partition_map.end(); pi++) {
     if (pi->second) {
-      _merge_other(pi->first, *(pi->second), other_to_this);
+      _merge_other(pi->first, other->_find_root(pi->second), other_to_this);
     }
   }
 }
@@ -698,53 +565,38 @@ void SubsetPartition::merge(SubsetPartition * other)
 
 void SubsetPartition::_merge_other(HashIntoType tag,
 				   PartitionID other_partition,
-				   PartitionPtrMap& diskp_to_pp)
+				   PartitionIDMap& diskp_to_pp)
 {
   if (set_contains(_ht->stop_tags, tag)) { // don't merge if it's a stop_tag
     return;
   }
 
-  // OK.  Does our current partitionmap have this?
-  PartitionID * pp_0;
-  pp_0 = partition_map[tag];
+  // have we already mapped other_partition onto one of ours?
+  PartitionID existing_p = 0;
+  PartitionIDMap::iterator di = diskp_to_pp.find(other_partition);
+  if (di != diskp_to_pp.end()) {
+    existing_p = di->second;
+  }
 
-  if (pp_0 == NULL) {	// No!  OK, map to new 'un.
-    PartitionID * existing_pp_0 = diskp_to_pp[other_partition];
+  // OK.  Does our current partitionmap have this?
+  PartitionID& p = partition_map[tag];
 
-    if (existing_pp_0) {	// already seen this other_partition
-      partition_map[tag] = existing_pp_0;
+  if (p == 0) {			// No!  OK, map to new 'un.
+    if (existing_p) {		// already seen this other_partition
+      p = existing_p;
     }
     else {			// new other_partition! create a new partition.
-      pp_0 = get_new_partition();
-
-      PartitionPtrSet * pp_set = new PartitionPtrSet();
-      pp_set->insert(pp_0);
-      reverse_pmap[*pp_0] = pp_set;
-      partition_map[tag] = pp_0;
-
-      diskp_to_pp[other_partition] = pp_0;
+      p = get_new_partition();
+      diskp_to_pp[other_partition] = p;
     }
   }
-  else {			// yes, we've seen this tag before...
-    PartitionID * existing_pp_0 = diskp_to_pp[other_partition];
-
-    if (existing_pp_0) {	// mapping exists.  copacetic?
-      if (*pp_0 == *existing_pp_0) {
-	;			// yep! nothing to do, yay!
-      } else {
-	// remapping must be done... we need to merge!
-	// the two partitions to merge are *pp_0 and *existing_pp_0.
-	// we also need to reset existing_pp_0 in diskp_to_pp to pp_0.
-
-	pp_0 = _merge_two_partitions(pp_0, existing_pp_0);
-	diskp_to_pp[other_partition] = pp_0;
-      }
-    }
-    else {
-      // no, does not exist in our mapping yet.  but that's ok,
-      // we can fix that.
-      diskp_to_pp[other_partition] = pp_0;
-    }
+  else if (existing_p) {	// yes; mapping exists, so join the two.
+    _union_partitions(p, existing_p);
+  }
+  else {
+    // no, does not exist in our mapping yet.  but that's ok,
+    // we can fix that.
+    diskp_to_pp[other_partition] = p;
   }
 }
 
@@ -775,7 +627,7 @@ void SubsetPartition::merge_from_disk(string other_filename)
 
   assert(infile.is_open());
 
-  PartitionPtrMap diskp_to_pp;
+  PartitionIDMap diskp_to_pp;
 
   HashIntoType * kmer_p = NULL;
   PartitionID * diskp = NULL;
@@ -850,8 +702,8 @@ void SubsetPartition::save_partitionmap(string pmap_filename)
     PartitionID p_id;
 
     HashIntoType kmer = pi->first;
-    if (pi->second != NULL) {	// if a partition ID has been assigned... save.
-      p_id = *(pi->second);
+    if (pi->second) {		// if a partition ID has been assigned... save.
+      p_id = _find_root(pi->second);
 
       // each record consists of one tag followed by one PartitionID.
       kmer_p = (HashIntoType *) (buf + n_bytes);
@@ -892,27 +744,19 @@ void SubsetPartition::_validate_pmap()
   for (PartitionMap::const_iterator pi = partition_map.begin();
        pi != partition_map.end(); pi++) {
     //HashIntoType kmer = (*pi).first;
-    PartitionID * pp_id = (*pi).second;
+    PartitionID p = (*pi).second;
 
-    if (pp_id != NULL) {
-      assert(*pp_id >= 1);
-      assert(*pp_id < next_partition_id);
+    if (p) {
+      assert(p >= 1);
+      assert(p < next_partition_id);
+      assert(_is_partition(p));
     }
   }
 
-  for (ReversePartitionMap::const_iterator ri = reverse_pmap.begin();
-       ri != reverse_pmap.end(); ri++) {
-    PartitionID p = (*ri).first;
-    PartitionPtrSet *s = (*ri).second;
-
-    assert(s != NULL);
-
-    for (PartitionPtrSet::const_iterator si = s->begin(); si != s->end();
-	 si++) {
-      PartitionID * pp;
-      pp = *si;
-
-      assert (p == *pp);
+  for (PartitionID p = 1; p < _parent.size(); p++) {
+    if (_parent[p]) {
+      assert(_is_partition(_parent[p]));
+      assert(_is_partition(_find_root(p)));
     }
   }
 }
@@ -921,17 +765,9 @@ void SubsetPartition::_validate_pmap()
 
 void SubsetPartition::_clear_all_partitions()
 {
-  for (ReversePartitionMap::iterator ri = reverse_pmap.begin();
-       ri != reverse_pmap.end(); ri++) {
-    PartitionPtrSet * s = (*ri).second;
-
-    for (PartitionPtrSet::iterator pi = s->begin(); pi != s->end(); pi++) {
-      PartitionID * pp = (*pi);
-      delete pp;
-    }
-    delete s;
-  }
   partition_map.clear();
+  _parent.clear();
+  _set_size.clear();
   next_partition_id = 1;
 }
 
@@ -945,17 +781,14 @@ bool SubsetPartition::is_single_partition(std::string seq)
   HashIntoType kmer;
 
   PartitionSet partitions;
-  PartitionID *pp;
 
   KMerIterator kmers(seq.c_str(), _ht->ksize());
   while (!kmers.done()) {
     kmer = kmers.next();
 
-    if (partition_map.find(kmer) != partition_map.end()) {
-      pp = partition_map[kmer];
-      if (pp) {
-	partitions.insert(*pp);
-      }
+    PartitionMap::const_iterator pi = partition_map.find(kmer);
+    if (pi != partition_map.end() && pi->second) {
+      partitions.insert(_find_root(pi->second));
     }
   }
 
@@ -992,7 +825,7 @@ const
   for (PartitionMap::const_iterator pi = partition_map.begin();
        pi != partition_map.end(); pi++) {
     if (pi->second) {
-      cm[*(pi->second)]++;
+      cm[_find_root(pi->second)]++;
     } else {
       n_unassigned++;
     }
@@ -1022,7 +855,7 @@ unsigned int SubsetPartition::repartition_largest_partition(unsigned int distanc
   for (PartitionMap::const_iterator pi = partition_map.begin();
        pi != partition_map.end(); pi++) {
     if (pi->second) {
-      cm[*(pi->second)]++;
+      cm[_find_root(pi->second)]++;
     } else {
       n_unassigned++;
     }
@@ -1163,14 +996,15 @@ void SubsetPartition::repartition_a_partition(const SeenSet& partition_tags)
     find_all_tags(kmer_f, kmer_r, tagged_kmers, _ht->all_tags, true, false);
 
     // only join things already in bigtags.
-    for (SeenSet::iterator ssi = tagged_kmers.begin();
+    SeenSet joined_kmers;
+    for (SeenSet::const_iterator ssi = tagged_kmers.begin();
 	 ssi != tagged_kmers.end(); ssi++) {
-      if (!set_contains(partition_tags, *ssi)) {
-	tagged_kmers.erase(ssi);
+      if (set_contains(partition_tags, *ssi)) {
+	joined_kmers.insert(*ssi);
       }
     }
-    // std::cout << "joining: " << tagged_kmers.size() << "\n";
-    assign_partition_id(kmer, tagged_kmers);
+    // std::cout << "joining: " << joined_kmers.size() << "\n";
+    assign_partition_id(kmer, joined_kmers);
   }
 }
 
@@ -1183,9 +1017,9 @@ void SubsetPartition::_clear_partition(PartitionID the_partition,
 {
   partition_tags.clear();
 
-  for (PartitionMap::iterator pi = partition_map.begin();
+  for (PartitionMap::const_iterator pi = partition_map.begin();
        pi != partition_map.end(); pi++) {
-    if (pi->second && *(pi->second) == the_partition) {
+    if (pi->second && _find_root(pi->second) == the_partition) {
       partition_tags.insert(pi->first);
     }
   }
@@ -1194,13 +1028,4 @@ void SubsetPartition::_clear_partition(PartitionID the_partition,
        si != partition_tags.end(); si++) {
     partition_map.erase(*si);
   }
-
-  // clear out the reverse partition mapping, too.
-  PartitionPtrSet * ps = reverse_pmap[the_partition];
-  for (PartitionPtrSet::iterator psi = ps->begin(); psi != ps->end(); psi++) {
-    delete *psi;
-  }
-  delete ps;
-
-  reverse_pmap.erase(the_partition);
 }
@@ -1,7 +1,10 @@
 #ifndef SUBSET_HH
 #define SUBSET_HH
 
+#include <vector>
+#include <algorithm>
 #include "hashtable.hh"
+#include "traversal.hh"
 
 namespace khmer {
   class CountingHash;
@@ -12,15 +15,67 @@ namespace khmer {
   protected:
     unsigned int next_partition_id;
     Hashbits * _ht;
+
+    // tag => partition ID, 0 if unassigned.  The ID stored for a tag may
+    // since have been joined to another partition; its current ID is
+    // _find_root(partition_map[tag]).
     PartitionMap partition_map;
-    ReversePartitionMap reverse_pmap;
+
+    // scratch space for find_all_tags().
+    TraversalWorkspace _traversal;
+
+    // union-find forest over partition IDs: _parent[p] == p for live
+    // partitions, 0 for IDs that were never handed out.  _set_size is
+    // only meaningful for roots.
+    mutable std::vector<PartitionID> _parent;
+    std::vector<unsigned int> _set_size;
 
     void _clear_all_partitions();
 
-    PartitionID * _merge_two_partitions(PartitionID *orig_pp,
-					PartitionID *new_pp);
-    PartitionID * _join_partitions_by_tags(const SeenSet& tagged_kmers,
-					   const HashIntoType kmer);
+    void _add_partition(PartitionID p) {
+      if (p >= _parent.size()) {
+	_parent.resize(p + 1, 0);
+	_set_size.resize(p + 1, 0);
+      }
+      if (_parent[p] == 0) {
+	_parent[p] = p;
+	_set_size[p] = 1;
+      }
+    }
+
+    bool _is_partition(PartitionID p) const {
+      return p != 0 && p < _parent.size() && _parent[p] != 0;
+    }
+
+    // the current ID of partition p (with path halving).
+    PartitionID _find_root(PartitionID p) const {
+      if (p == 0) {
+	return 0;
+      }
+      while (_parent[p] != p) {
+	_parent[p] = _parent[_parent[p]];
+	p = _parent[p];
+      }
+      return p;
+    }
+
+    // join two partitions, by size; returns the ID of the result.
+    PartitionID _union_partitions(PartitionID a, PartitionID b) {
+      a = _find_root(a);
+      b = _find_root(b);
+      if (a == b) {
+	return a;
+      }
+      if (_set_size[a] < _set_size[b]) {
+	std::swap(a, b);
+      }
+      _parent[b] = a;
+      _set_size[a] += _set_size[b];
+      return a;
+    }
+
+    PartitionID _join_partitions_by_tags(const SeenSet& tagged_kmers,
+					 const HashIntoType kmer);
 
   public:
     SubsetPartition(Hashbits * ht) : next_partition_id(2), _ht(ht) {
@@ -37,15 +92,15 @@ namespace khmer {
     PartitionID get_partition_id(std::string kmer_s);
     PartitionID get_partition_id(HashIntoType kmer);
 
-    PartitionID * get_new_partition() {
-      PartitionID* pp = new PartitionID(next_partition_id);
+    PartitionID get_new_partition() {
+      PartitionID p = next_partition_id;
       next_partition_id++;
-      return pp;
+      _add_partition(p);
+      return p;
     }
 
     void merge(SubsetPartition *);
     void merge_from_disk(std::string);
-    void _merge_from_disk_consolidate(PartitionPtrMap&);
 
     void save_partitionmap(std::string outfile);
     void load_partitionmap(std::string infile);
@@ -55,7 +110,19 @@ namespace khmer {
 		       SeenSet& tagged_kmers,
 		       const SeenSet& all_tags,
 		       bool break_on_stop_tags=false,
-		       bool stop_big_traversals=false);
+		       bool stop_big_traversals=false) {
+      find_all_tags(kmer_f, kmer_r, tagged_kmers, all_tags, _traversal,
+		    break_on_stop_tags, stop_big_traversals);
+    }
+
+    // as above, but with caller-supplied scratch space, so that several
+    // threads can search the same graph at once.
+    void find_all_tags(HashIntoType kmer_f, HashIntoType kmer_r,
+		       SeenSet& tagged_kmers,
+		       const SeenSet& all_tags,
+		       TraversalWorkspace& workspace,
+		       bool break_on_stop_tags=false,
+		       bool stop_big_traversals=false) const;
 
     void do_partition(HashIntoType first_kmer,
 		      HashIntoType last_kmer,
@@ -94,7 +161,7 @@ namespace khmer {
 
     void _merge_other(HashIntoType tag,
 		      PartitionID other_partition,
-		      PartitionPtrMap& diskp_to_pp);
+		      PartitionIDMap& diskp_to_pp);
   };
 }
 
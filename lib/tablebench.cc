@@ -0,0 +1,139 @@
+//
+// tablebench: speed and false positive rate of the classic (one table
+// per hash, bins by modulus), fast-hash (one table per hash, bins by
+// mixing and multiply-shift) and blocked (one cache line per k-mer)
+// table layouts.
+//
+// Inserts n_kmers random k-mers into a Hashbits and a CountingHash of
+// each layout, using the same memory, then looks up the same number of
+// k-mers that weren't inserted.  Reports ns/k-mer for inserts and
+// lookups, and the false positive rate (presence tables) or the fraction
+// of inserted k-mers overcounted (counting tables).
+//
+// % make tablebench && ./tablebench [ n_kmers [ tablesize [ n_tables ] ] ]
+//
+
+#include <iostream>
+#include <stdlib.h>
+#include <sys/time.h>
+#include "hashbits.hh"
+#include "counting.hh"
+
+using namespace std;
+using namespace khmer;
+
+static double now()
+{
+  struct timeval tv;
+  gettimeofday(&tv, NULL);
+  return tv.tv_sec + tv.tv_usec / 1e6;
+}
+
+static HashIntoType random_kmer()
+{
+  return ((HashIntoType) random() << 33) ^ ((HashIntoType) random() << 11) ^
+    (HashIntoType) random();
+}
+
+static bool is_prime(HashIntoType n)
+{
+  if (n < 2) { return false; }
+  for (HashIntoType d = 2; d * d <= n; d++) {
+    if (n % d == 0) { return false; }
+  }
+  return true;
+}
+
+// n_tables distinct primes at or above tablesize, as new_hashbits() does.
+static vector<HashIntoType> get_primes(HashIntoType tablesize,
+				       unsigned int n_tables)
+{
+  vector<HashIntoType> primes;
+  for (HashIntoType n = tablesize; primes.size() < n_tables; n++) {
+    if (is_prime(n)) {
+      primes.push_back(n);
+    }
+  }
+  return primes;
+}
+
+template <class Table>
+static void bench(const char * what, Table& ht,
+		  const vector<HashIntoType>& kmers,
+		  const vector<HashIntoType>& misses)
+{
+  double start = now();
+  for (size_t i = 0; i < kmers.size(); i++) {
+    ht.count(kmers[i]);
+  }
+  double t_insert = now() - start;
+
+  start = now();
+  size_t n_over = 0;
+  for (size_t i = 0; i < kmers.size(); i++) {
+    n_over += ht.get_count(kmers[i]) > 1;
+  }
+  size_t n_false = 0;
+  for (size_t i = 0; i < misses.size(); i++) {
+    n_false += ht.get_count(misses[i]) > 0;
+  }
+  double t_lookup = now() - start;
+
+  vector<HashIntoType> sizes = ht.get_tablesizes();
+  double occupancy = (double) ht.n_occupied() / sizes[0];
+
+  cout << what << "\t"
+       << t_insert / kmers.size() * 1e9 << " ns/insert\t"
+       << t_lookup / (kmers.size() + misses.size()) * 1e9 << " ns/lookup\t"
+       << "FP " << (double) n_false / misses.size() << "\t"
+       << "overcount " << (double) n_over / kmers.size() << "\t"
+       << "occupancy " << occupancy << endl;
+}
+
+int main(int argc, char * argv[])
+{
+  size_t n_kmers = argc > 1 ? atol(argv[1]) : 2000000;
+  HashIntoType tablesize = argc > 2 ? atoll(argv[2]) : 10000000;
+  unsigned int n_tables = argc > 3 ? atoi(argv[3]) : 4;
+
+  srandom(1);
+  vector<HashIntoType> kmers, misses;
+  kmers.reserve(n_kmers);
+  misses.reserve(n_kmers);
+  for (size_t i = 0; i < n_kmers; i++) {
+    kmers.push_back(random_kmer());
+    misses.push_back(random_kmer());
+  }
+
+  vector<HashIntoType> primes = get_primes(tablesize, n_tables);
+
+  cout << n_kmers << " k-mers, " << n_tables << " tables of "
+       << tablesize << endl;
+
+  {
+    Hashbits ht(32, primes);
+    bench("presence/classic", ht, kmers, misses);
+  }
+  {
+    Hashbits ht(32, primes, false, true);
+    bench("presence/fast", ht, kmers, misses);
+  }
+  {
+    Hashbits ht(32, primes, true);
+    bench("presence/blocked", ht, kmers, misses);
+  }
+  {
+    CountingHash ht(32, primes);
+    bench("counting/classic", ht, kmers, misses);
+  }
+  {
+    CountingHash ht(32, primes, DEFAULT_COUNTER_BITS, false, true);
+    bench("counting/fast", ht, kmers, misses);
+  }
+  {
+    CountingHash ht(32, primes, DEFAULT_COUNTER_BITS, true);
+    bench("counting/blocked", ht, kmers, misses);
+  }
+
+  return 0;
+}
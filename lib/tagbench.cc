@@ -0,0 +1,170 @@
+//
+// tagbench: memory use and speed of the tag containers.
+//
+// First compares std::set/std::map against KmerSet/KmerMap on random
+// k-mers (insert, then lookups that hit and that miss).  Then, if given
+// a FASTA file, tags it into a Hashbits and times a full do_partition(),
+// i.e. find_all_tags on every tag, reporting heap growth.
+//
+// % make tagbench && ./tagbench [ n_kmers [ reads.fa [ ksize tablesize ] ] ]
+//
+
+#include <iostream>
+#include <set>
+#include <map>
+#include <stdlib.h>
+#include <malloc.h>
+#include <sys/time.h>
+#include "hashbits.hh"
+
+using namespace std;
+using namespace khmer;
+
+static double now()
+{
+  struct timeval tv;
+  gettimeofday(&tv, NULL);
+  return tv.tv_sec + tv.tv_usec / 1e6;
+}
+
+// bytes currently allocated from the heap (glibc), including mmap'ed
+// blocks; unlike RSS, this isn't fooled by freed memory being reused.
+static double heap_in_use()
+{
+  struct mallinfo2 mi = mallinfo2();
+  return (double) mi.uordblks + mi.hblkhd;
+}
+
+static HashIntoType random_kmer()
+{
+  return ((HashIntoType) random() << 33) ^ ((HashIntoType) random() << 11) ^
+    (HashIntoType) random();
+}
+
+template <class Set>
+static void bench_set(const char * what, const vector<HashIntoType>& kmers,
+		      const vector<HashIntoType>& misses)
+{
+  double mem_start = heap_in_use();
+  double start = now();
+
+  Set * s = new Set;
+  for (size_t i = 0; i < kmers.size(); i++) {
+    s->insert(kmers[i]);
+  }
+  double t_insert = now() - start;
+  double mem = heap_in_use() - mem_start;
+
+  start = now();
+  size_t n_found = 0;
+  for (size_t i = 0; i < kmers.size(); i++) {
+    n_found += s->find(kmers[i]) != s->end();
+  }
+  for (size_t i = 0; i < misses.size(); i++) {
+    n_found += s->find(misses[i]) != s->end();
+  }
+  double t_find = now() - start;
+
+  cout << what << "\t" << s->size() << " keys\t"
+       << mem / kmers.size() << " bytes/key\t"
+       << kmers.size() / t_insert / 1e6 << " M inserts/s\t"
+       << (kmers.size() + misses.size()) / t_find / 1e6 << " M finds/s\t("
+       << n_found << " found)" << endl;
+
+  delete s;
+}
+
+template <class Map>
+static void bench_map(const char * what, const vector<HashIntoType>& kmers,
+		      const vector<HashIntoType>& misses)
+{
+  PartitionID pid = 1;
+  double mem_start = heap_in_use();
+  double start = now();
+
+  Map * m = new Map;
+  for (size_t i = 0; i < kmers.size(); i++) {
+    (*m)[kmers[i]] = &pid;
+  }
+  double t_insert = now() - start;
+  double mem = heap_in_use() - mem_start;
+
+  start = now();
+  size_t n_found = 0;
+  for (size_t i = 0; i < kmers.size(); i++) {
+    n_found += m->find(kmers[i]) != m->end();
+  }
+  for (size_t i = 0; i < misses.size(); i++) {
+    n_found += m->find(misses[i]) != m->end();
+  }
+  double t_find = now() - start;
+
+  cout << what << "\t" << m->size() << " keys\t"
+       << mem / kmers.size() << " bytes/key\t"
+       << kmers.size() / t_insert / 1e6 << " M inserts/s\t"
+       << (kmers.size() + misses.size()) / t_find / 1e6 << " M finds/s\t("
+       << n_found << " found)" << endl;
+
+  delete m;
+}
+
+static void bench_partition(const char * filename, WordLength ksize,
+			    HashIntoType tablesize)
+{
+  vector<HashIntoType> tablesizes;
+  tablesizes.push_back(tablesize);
+  tablesizes.push_back(tablesize - 2);
+  tablesizes.push_back(tablesize - 4);
+  tablesizes.push_back(tablesize - 6);
+
+  Hashbits ht(ksize, tablesizes);
+
+  unsigned int total_reads = 0;
+  unsigned long long n_consumed = 0;
+
+  double mem_start = heap_in_use();
+  double start = now();
+  ht.consume_fasta_and_tag(filename, total_reads, n_consumed);
+  double t_tag = now() - start;
+  double mem_tag = heap_in_use() - mem_start;
+
+  cout << "tag\t" << total_reads << " reads\t" << ht.n_tags() << " tags\t"
+       << t_tag << "s\t" << mem_tag / (1024. * 1024.) << " MB" << endl;
+
+  mem_start = heap_in_use();
+  start = now();
+  ht.partition->do_partition(0, 0);
+  double t_part = now() - start;
+  double mem_part = heap_in_use() - mem_start;
+
+  cout << "partition\t" << ht.n_tags() << " tags\t" << t_part << "s\t"
+       << ht.n_tags() / t_part << " tags/s\t"
+       << mem_part / (1024. * 1024.) << " MB" << endl;
+}
+
+int main(int argc, char * argv[])
+{
+  size_t n_kmers = argc > 1 ? atol(argv[1]) : 1000000;
+
+  srandom(1);
+  vector<HashIntoType> kmers, misses;
+  kmers.reserve(n_kmers);
+  misses.reserve(n_kmers);
+  for (size_t i = 0; i < n_kmers; i++) {
+    kmers.push_back(random_kmer());
+    misses.push_back(random_kmer());
+  }
+
+  bench_set<std::set<HashIntoType> >("std::set", kmers, misses);
+  bench_set<KmerSet>("KmerSet", kmers, misses);
+  bench_map<std::map<HashIntoType, PartitionID*> >("std::map", kmers, misses);
+  bench_map<KmerMap<PartitionID*> >("KmerMap", kmers, misses);
+
+  if (argc > 2) {
+    WordLength ksize = argc > 3 ? atoi(argv[3]) : 32;
+    HashIntoType tablesize = argc > 4 ? atoll(argv[4]) : 100000000;
+    bench_partition(argv[2], ksize, tablesize);
+  }
+
+  return 0;
+}
@@ -0,0 +1,238 @@
+#ifndef TRAVERSAL_HH
+#define TRAVERSAL_HH
+
+#include <stdlib.h>
+#include <string.h>
+#include <assert.h>
+
+#include "khmer.hh"
+#include "kmer_hash.hh"
+#include "ktable.hh"
+
+// initial sizes of the traversal workspace; both grow as needed.
+#define TRAVERSAL_VISITED_SIZE 4096
+#define TRAVERSAL_QUEUE_SIZE 1024
+
+namespace khmer {
+
+  //
+  // KmerVisitSet: a set of k-mers for marking nodes seen during a graph
+  // traversal, meant to be reused for traversal after traversal.  Each
+  // slot is stamped with the generation that filled it, so clear() just
+  // bumps the generation instead of touching the table.
+  //
+
+  class KmerVisitSet {
+  protected:
+    HashIntoType * _keys;
+    unsigned int * _stamps;
+    size_t _capacity;		// a power of two
+    size_t _size;
+    unsigned int _generation;
+
+    KmerVisitSet(const KmerVisitSet&); // not copyable
+    KmerVisitSet& operator=(const KmerVisitSet&);
+
+    void _alloc(size_t capacity) {
+      _capacity = capacity;
+      _keys = new HashIntoType[_capacity];
+      _stamps = new unsigned int[_capacity];
+      memset(_stamps, 0, _capacity * sizeof(unsigned int));
+    }
+
+    void _grow() {
+      HashIntoType * old_keys = _keys;
+      unsigned int * old_stamps = _stamps;
+      size_t old_capacity = _capacity;
+
+      _alloc(_capacity * 2);
+      for (size_t i = 0; i < old_capacity; i++) {
+	if (old_stamps[i] == _generation) {
+	  size_t j = _kmer_hash_mix(old_keys[i]) & (_capacity - 1);
+	  while (_stamps[j] == _generation) {
+	    j = (j + 1) & (_capacity - 1);
+	  }
+	  _keys[j] = old_keys[i];
+	  _stamps[j] = _generation;
+	}
+      }
+
+      delete[] old_keys;
+      delete[] old_stamps;
+    }
+
+  public:
+    KmerVisitSet(size_t capacity = TRAVERSAL_VISITED_SIZE) :
+      _size(0), _generation(1) {
+      size_t c = 16;
+      while (c < capacity) {
+	c *= 2;
+      }
+      _alloc(c);
+    }
+
+    ~KmerVisitSet() {
+      delete[] _keys;
+      delete[] _stamps;
+    }
+
+    size_t size() const { return _size; }
+
+    void clear() {
+      _size = 0;
+      _generation++;
+      if (_generation == 0) {	// wrapped around; really clear.
+	memset(_stamps, 0, _capacity * sizeof(unsigned int));
+	_generation = 1;
+      }
+    }
+
+    bool contains(HashIntoType kmer) const {
+      size_t i = _kmer_hash_mix(kmer) & (_capacity - 1);
+      while (_stamps[i] == _generation) {
+	if (_keys[i] == kmer) {
+	  return true;
+	}
+	i = (i + 1) & (_capacity - 1);
+      }
+      return false;
+    }
+
+    // add kmer; returns false if it was already there.
+    bool insert(HashIntoType kmer) {
+      if ((_size + 1) * 2 > _capacity) {
+	_grow();
+      }
+
+      size_t i = _kmer_hash_mix(kmer) & (_capacity - 1);
+      while (_stamps[i] == _generation) {
+	if (_keys[i] == kmer) {
+	  return false;
+	}
+	i = (i + 1) & (_capacity - 1);
+      }
+      _keys[i] = kmer;
+      _stamps[i] = _generation;
+      _size++;
+
+      return true;
+    }
+  };
+
+  //
+  // TraversalQueue: a FIFO of (forward, reverse, breadth) nodes in a flat
+  // ring buffer.
+  //
+
+  struct TraversalNode {
+    HashIntoType kmer_f;
+    HashIntoType kmer_r;
+    unsigned int breadth;
+  };
+
+  class TraversalQueue {
+  protected:
+    TraversalNode * _nodes;
+    size_t _capacity;		// a power of two
+    size_t _head;
+    size_t _size;
+
+    TraversalQueue(const TraversalQueue&); // not copyable
+    TraversalQueue& operator=(const TraversalQueue&);
+
+    void _grow() {
+      TraversalNode * nodes = new TraversalNode[_capacity * 2];
+      for (size_t i = 0; i < _size; i++) {
+	nodes[i] = _nodes[(_head + i) & (_capacity - 1)];
+      }
+      delete[] _nodes;
+
+      _nodes = nodes;
+      _capacity *= 2;
+      _head = 0;
+    }
+
+  public:
+    TraversalQueue() : _capacity(TRAVERSAL_QUEUE_SIZE), _head(0), _size(0) {
+      _nodes = new TraversalNode[_capacity];
+    }
+
+    ~TraversalQueue() { delete[] _nodes; }
+
+    bool empty() const { return _size == 0; }
+    size_t size() const { return _size; }
+    void clear() { _head = 0; _size = 0; }
+
+    void push(HashIntoType kmer_f, HashIntoType kmer_r, unsigned int breadth) {
+      if (_size == _capacity) {
+	_grow();
+      }
+      TraversalNode &node = _nodes[(_head + _size) & (_capacity - 1)];
+      node.kmer_f = kmer_f;
+      node.kmer_r = kmer_r;
+      node.breadth = breadth;
+      _size++;
+    }
+
+    TraversalNode pop() {
+      assert(_size > 0);
+      TraversalNode node = _nodes[_head];
+      _head = (_head + 1) & (_capacity - 1);
+      _size--;
+      return node;
+    }
+  };
+
+  //
+  // KmerNeighbors: the 8 possible neighbors of a k-mer in the graph, i.e.
+  // A, C, G and T appended on the right, then prepended on the left, as
+  // forward/reverse hashes plus the canonical one.
+  //
+
+  struct KmerNeighbors {
+    HashIntoType kmer_f[8];
+    HashIntoType kmer_r[8];
+    HashIntoType kmer[8];
+  };
+
+  inline void get_kmer_neighbors(HashIntoType kmer_f, HashIntoType kmer_r,
+				 HashIntoType bitmask,
+				 unsigned int rc_left_shift,
+				 KmerNeighbors& n)
+  {
+    // 2-bit codes for A, C, G, T (see twobit_repr); the complement of
+    // a base's code is the code with the low bit flipped.
+    static const HashIntoType bases[4] = { 0, 2, 3, 1 };
+
+    for (unsigned int i = 0; i < 4; i++) {
+      const HashIntoType b = bases[i];
+
+      n.kmer_f[i] = ((kmer_f << 2) & bitmask) | b;
+      n.kmer_r[i] = (kmer_r >> 2) | ((b ^ 1) << rc_left_shift);
+
+      n.kmer_f[i + 4] = (kmer_f >> 2) | (b << rc_left_shift);
+      n.kmer_r[i + 4] = ((kmer_r << 2) & bitmask) | (b ^ 1);
+    }
+    for (unsigned int i = 0; i < 8; i++) {
+      n.kmer[i] = uniqify_rc(n.kmer_f[i], n.kmer_r[i]);
+    }
+  }
+
+  //
+  // TraversalWorkspace: everything a breadth-first search needs, kept
+  // around between searches so that they don't allocate.  Not thread-safe;
+  // use one per thread.
+  //
+
+  struct TraversalWorkspace {
+    KmerVisitSet visited;
+    TraversalQueue queue;
+
+    void clear() {
+      visited.clear();
+      queue.clear();
+    }
+  };
+};
+
+#endif // TRAVERSAL_HH
@@ -10,6 +10,7 @@
 #include "hashtable.hh"
 #include "hashbits.hh"
 #include "counting.hh"
+#include "hllcounter.hh"
 #include "storage.hh"
 
 //
@@ -52,8 +53,13 @@ static PyObject *_callback_obj = NULL;
 void _report_fn(const char * info, void * data, unsigned long long n_reads,
 		unsigned long long other)
 {
+  // we may be called from code that has released the GIL; grab it back
+  // before touching any Python objects.
+  PyGILState_STATE gil_state = PyGILState_Ensure();
+
   // handle signals etc. (like CTRL-C)
   if (PyErr_CheckSignals() != 0) {
+    PyGILState_Release(gil_state);
     throw _khmer_signal("PyErr_CheckSignals received a signal");
   }
 
@@ -75,12 +81,15 @@ void _report_fn(const char * info, void * data, unsigned long long n_reads,
   }
 
   if (PyErr_Occurred()) {
+    PyGILState_Release(gil_state);
     throw _khmer_signal("PyErr_Occurred is set");
   }
 
   // ...allow other Python threads to do stuff...
   Py_BEGIN_ALLOW_THREADS;
   Py_END_ALLOW_THREADS;
+
+  PyGILState_Release(gil_state);
 }
 
 
@@ -593,6 +602,40 @@ static PyTypeObject khmer_ReadMaskType = {
     "readmask object",           /* tp_doc */
 };
 
+typedef struct {
+  PyObject_HEAD
+  khmer::HLLCounter * hll;
+} khmer_HLLCounterObject;
+
+#define is_hllcounter_obj(v)  ((v)->ob_type == &khmer_HLLCounterType)
+
+static void khmer_hllcounter_dealloc(PyObject *);
+static PyObject * khmer_hllcounter_getattr(PyObject *, char *);
+
+static PyTypeObject khmer_HLLCounterType = {
+    PyObject_HEAD_INIT(NULL)
+    0,
+    "HLLCounter", sizeof(khmer_HLLCounterObject),
+    0,
+    khmer_hllcounter_dealloc,	/*tp_dealloc*/
+    0,				/*tp_print*/
+    khmer_hllcounter_getattr,	/*tp_getattr*/
+    0,				/*tp_setattr*/
+    0,				/*tp_compare*/
+    0,				/*tp_repr*/
+    0,				/*tp_as_number*/
+    0,				/*tp_as_sequence*/
+    0,				/*tp_as_mapping*/
+    0,				/*tp_hash */
+    0,				/*tp_call*/
+    0,				/*tp_str*/
+    0,				/*tp_getattro*/
+    0,				/*tp_setattro*/
+    0,				/*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT,		/*tp_flags*/
+    "HyperLogLog k-mer counter object", /* tp_doc */
+};
+
 typedef struct {
   PyObject_HEAD
   khmer::MinMaxTable * mmt;
@@ -663,6 +706,78 @@ static PyObject * hash_get_use_bigcount(PyObject * self, PyObject * args)
   return PyBool_FromLong((int)val);
 }
 
+static PyObject * hash_get_counter_bits(PyObject * self, PyObject * args)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyInt_FromLong(counting->get_counter_bits());
+}
+
+static PyObject * hash_is_blocked(PyObject * self, PyObject * args)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyBool_FromLong(counting->is_blocked());
+}
+
+static PyObject * hash_get_slice_bins(PyObject * self, PyObject * args)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyInt_FromLong(counting->get_slice_bins());
+}
+
+static PyObject * hash_has_fast_hash(PyObject * self, PyObject * args)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyBool_FromLong(counting->has_fast_hash());
+}
+
+static PyObject * hash_is_conservative(PyObject * self, PyObject * args)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyBool_FromLong(counting->is_conservative());
+}
+
+static PyObject * hash_get_counter_max(PyObject * self, PyObject * args)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyInt_FromLong(counting->get_counter_max());
+}
+
 static PyObject * hash_n_occupied(PyObject * self, PyObject * args)
 {
   khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
@@ -679,6 +794,18 @@ static PyObject * hash_n_occupied(PyObject * self, PyObject * args)
   return PyInt_FromLong(n);
 }
 
+static PyObject * hash_n_unique_kmers(PyObject * self, PyObject * args)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyInt_FromLong(counting->n_unique_kmers());
+}
+
 static PyObject * hash_n_entries(PyObject * self, PyObject * args)
 {
   khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
@@ -962,7 +1089,8 @@ static PyObject * hash_filter_fasta_file_run(PyObject * self, PyObject *args)
   return (PyObject *) readmask_obj;
 }
 
-static PyObject * hash_consume_fasta(PyObject * self, PyObject * args)
+static PyObject * hash_consume_fasta(PyObject * self, PyObject * args,
+				    PyObject * kwds)
 {
   khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
   khmer::CountingHash * counting = me->counting;
@@ -972,10 +1100,22 @@ static PyObject * hash_consume_fasta(PyObject * self, PyObject * args)
   PyObject * update_readmask_bool = NULL;
   khmer::HashIntoType lower_bound = 0, upper_bound = 0;
   PyObject * callback_obj = NULL;
+  unsigned int n_threads = 1;
 
-  if (!PyArg_ParseTuple(args, "s|iiOOO", &filename, &lower_bound, &upper_bound,
-			&readmask_obj, &update_readmask_bool,
-			&callback_obj)) {
+  static const char * kwlist[] = { "filename", "lower_bound", "upper_bound",
+				   "readmask", "update_readmask", "callback",
+				   "n_threads", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "s|KKOOOI", (char **) kwlist,
+				   &filename, &lower_bound, &upper_bound,
+				   &readmask_obj, &update_readmask_bool,
+				   &callback_obj, &n_threads)) {
+    return NULL;
+  }
+
+  if (n_threads > 1 && readmask_obj && readmask_obj != Py_None) {
+    PyErr_SetString(PyExc_ValueError,
+		    "readmasks cannot be used with n_threads > 1");
     return NULL;
   }
 
@@ -1002,12 +1142,27 @@ static PyObject * hash_consume_fasta(PyObject * self, PyObject * args)
 
   unsigned long long n_consumed;
   unsigned int total_reads;
+  bool exc_raised = false;
 
+  // counting is thread-safe, so let other Python threads consume into
+  // the same table while we work.
+  Py_BEGIN_ALLOW_THREADS
   try {
-    counting->consume_fasta(filename, total_reads, n_consumed,
-			     lower_bound, upper_bound, &readmask,
-			     update_readmask, _report_fn, callback_obj);
+    if (n_threads > 1) {
+      counting->consume_fasta_threaded(filename, n_threads, total_reads,
+				       n_consumed, lower_bound, upper_bound,
+				       _report_fn, callback_obj);
+    } else {
+      counting->consume_fasta(filename, total_reads, n_consumed,
+			      lower_bound, upper_bound, &readmask,
+			      update_readmask, _report_fn, callback_obj);
+    }
   } catch (_khmer_signal &e) {
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
     return NULL;
   }
 
@@ -1067,7 +1222,7 @@ static PyObject * hash_consume(PyObject * self, PyObject * args)
   char * long_str;
   khmer::HashIntoType lower_bound = 0, upper_bound = 0;
 
-  if (!PyArg_ParseTuple(args, "s|ll", &long_str, &lower_bound, &upper_bound)) {
+  if (!PyArg_ParseTuple(args, "s|KK", &long_str, &lower_bound, &upper_bound)) {
     return NULL;
   }
   
@@ -1078,7 +1233,9 @@ static PyObject * hash_consume(PyObject * self, PyObject * args)
   }
 
   unsigned int n_consumed;
+  Py_BEGIN_ALLOW_THREADS
   n_consumed = counting->consume_string(long_str, lower_bound, upper_bound);
+  Py_END_ALLOW_THREADS
 
   return PyInt_FromLong(n_consumed);
 }
@@ -1091,7 +1248,7 @@ static PyObject * hash_get_min_count(PyObject * self, PyObject * args)
 
   char * long_str;
 
-  if (!PyArg_ParseTuple(args, "s|ll", &long_str, &lower_bound, &upper_bound)) {
+  if (!PyArg_ParseTuple(args, "s|KK", &long_str, &lower_bound, &upper_bound)) {
     return NULL;
   }
 
@@ -1109,6 +1266,29 @@ static PyObject * hash_get_min_count(PyObject * self, PyObject * args)
   return PyInt_FromLong(N);
 }
 
+static PyObject * hash_get_kmer_counts(PyObject * self, PyObject * args)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+  khmer::HashIntoType lower_bound = 0, upper_bound = 0;
+
+  char * long_str;
+
+  if (!PyArg_ParseTuple(args, "s|KK", &long_str, &lower_bound, &upper_bound)) {
+    return NULL;
+  }
+
+  std::vector<khmer::BoundedCounterType> counts;
+  counting->get_kmer_counts(long_str, counts, lower_bound, upper_bound);
+
+  PyObject * x = PyList_New(counts.size());
+  for (unsigned int i = 0; i < counts.size(); i++) {
+    PyList_SET_ITEM(x, i, PyInt_FromLong(counts[i]));
+  }
+
+  return x;
+}
+
 static PyObject * hash_get_max_count(PyObject * self, PyObject * args)
 {
   khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
@@ -1117,7 +1297,7 @@ static PyObject * hash_get_max_count(PyObject * self, PyObject * args)
 
   char * long_str;
 
-  if (!PyArg_ParseTuple(args, "s|ll", &long_str, &lower_bound, &upper_bound)) {
+  if (!PyArg_ParseTuple(args, "s|KK", &long_str, &lower_bound, &upper_bound)) {
     return NULL;
   }
 
@@ -1160,6 +1340,223 @@ static PyObject * hash_get_median_count(PyObject * self, PyObject * args)
   return Py_BuildValue("iff", med, average, stddev);
 }
 
+// wrap a block of raw numbers up as a Python array.array, which numpy
+// can use directly via numpy.frombuffer.
+
+static PyObject * _make_array(const char * typecode, const void * data,
+			      Py_ssize_t nbytes)
+{
+  PyObject * array_mod = PyImport_ImportModule("array");
+  if (!array_mod) {
+    return NULL;
+  }
+
+  PyObject * raw = PyString_FromStringAndSize((const char *) data, nbytes);
+  PyObject * arr = NULL;
+  if (raw) {
+    arr = PyObject_CallMethod(array_mod, (char *) "array", (char *) "sO",
+			      typecode, raw);
+  }
+  Py_XDECREF(raw);
+  Py_DECREF(array_mod);
+
+  return arr;
+}
+
+static PyObject * hash_get_median_counts(PyObject * self, PyObject * args,
+					 PyObject * kwds)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  PyObject * seqs_obj;
+  unsigned int n_threads = 1;
+
+  static const char * kwlist[] = { "seqs", "n_threads", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|I", (char **) kwlist,
+				   &seqs_obj, &n_threads)) {
+    return NULL;
+  }
+
+  std::vector<std::string> seqs;
+
+  if (PyString_Check(seqs_obj)) {
+    // a packed buffer of newline-separated sequences.
+    const char * buf = PyString_AS_STRING(seqs_obj);
+    const char * end = buf + PyString_GET_SIZE(seqs_obj);
+
+    while (buf < end) {
+      const char * eol = (const char *) memchr(buf, '\n', end - buf);
+      if (!eol) {
+	eol = end;
+      }
+      seqs.push_back(std::string(buf, eol - buf));
+      buf = eol + 1;
+    }
+  } else {
+    PyObject * seq_list = PySequence_Fast(seqs_obj,
+			"seqs must be a string or a sequence of strings");
+    if (!seq_list) {
+      return NULL;
+    }
+
+    Py_ssize_t n = PySequence_Fast_GET_SIZE(seq_list);
+    seqs.reserve(n);
+    for (Py_ssize_t i = 0; i < n; i++) {
+      PyObject * item = PySequence_Fast_GET_ITEM(seq_list, i);
+      if (!PyString_Check(item)) {
+	Py_DECREF(seq_list);
+	PyErr_SetString(PyExc_TypeError, "seqs must contain only strings");
+	return NULL;
+      }
+      seqs.push_back(std::string(PyString_AS_STRING(item),
+				 PyString_GET_SIZE(item)));
+    }
+    Py_DECREF(seq_list);
+  }
+
+  size_t n_seqs = seqs.size();
+  khmer::BoundedCounterType * medians = new khmer::BoundedCounterType[n_seqs];
+  float * averages = new float[n_seqs];
+  float * stddevs = new float[n_seqs];
+
+  Py_BEGIN_ALLOW_THREADS
+  counting->get_median_counts(seqs, medians, averages, stddevs, n_threads);
+  Py_END_ALLOW_THREADS
+
+  PyObject * med_o = _make_array("H", medians,
+				 n_seqs * sizeof(khmer::BoundedCounterType));
+  PyObject * avg_o = _make_array("f", averages, n_seqs * sizeof(float));
+  PyObject * dev_o = _make_array("f", stddevs, n_seqs * sizeof(float));
+
+  delete[] medians;
+  delete[] averages;
+  delete[] stddevs;
+
+  if (!med_o || !avg_o || !dev_o) {
+    Py_XDECREF(med_o);
+    Py_XDECREF(avg_o);
+    Py_XDECREF(dev_o);
+    return NULL;
+  }
+
+  return Py_BuildValue("NNN", med_o, avg_o, dev_o);
+}
+
+static PyObject * hash_normalize_by_median(PyObject * self, PyObject * args,
+					   PyObject * kwds)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  char * infilename;
+  char * outfilename;
+  unsigned int cutoff;
+  PyObject * paired_obj = NULL;
+  PyObject * callback_obj = NULL;
+
+  static const char * kwlist[] = { "infilename", "outfilename", "cutoff",
+				   "paired", "callback", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "ssI|OO", (char **) kwlist,
+				   &infilename, &outfilename, &cutoff,
+				   &paired_obj, &callback_obj)) {
+    return NULL;
+  }
+
+  bool paired = (paired_obj && PyObject_IsTrue(paired_obj));
+
+  unsigned long long n_total = 0, n_kept = 0;
+  bool exc_raised = false;
+  std::string err_message;
+  PyObject * err_type = PyExc_ValueError;
+
+  Py_BEGIN_ALLOW_THREADS
+  try {
+    counting->normalize_by_median(infilename, outfilename, cutoff, paired,
+				  n_total, n_kept, _report_fn, callback_obj);
+  } catch (_khmer_signal &e) {
+    exc_raised = true;
+  } catch (khmer::khmer_file_exception &e) {
+    err_message = e.get_message();
+    err_type = PyExc_IOError;
+    exc_raised = true;
+  } catch (khmer::khmer_exception &e) {
+    err_message = e.get_message();
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
+    if (!err_message.empty()) {
+      PyErr_SetString(err_type, err_message.c_str());
+    }
+    return NULL;
+  }
+
+  return Py_BuildValue("KK", n_total, n_kept);
+}
+
+static PyObject * _hash_filter_abund(PyObject * self, PyObject * args,
+				     PyObject * kwds, bool below)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  char * infilename;
+  char * outfilename;
+  unsigned int cutoff;
+  unsigned int n_threads = 1;
+  PyObject * callback_obj = NULL;
+
+  static const char * kwlist[] = { "infilename", "outfilename", "cutoff",
+				   "n_threads", "callback", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "ssI|IO", (char **) kwlist,
+				   &infilename, &outfilename, &cutoff,
+				   &n_threads, &callback_obj)) {
+    return NULL;
+  }
+
+  unsigned long long n_total = 0, n_kept = 0;
+  bool exc_raised = false;
+  std::string err_message;
+
+  Py_BEGIN_ALLOW_THREADS
+  try {
+    counting->filter_abund(infilename, outfilename, cutoff, below, n_threads,
+			   n_total, n_kept, _report_fn, callback_obj);
+  } catch (_khmer_signal &e) {
+    exc_raised = true;
+  } catch (khmer::khmer_file_exception &e) {
+    err_message = e.get_message();
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
+    if (!err_message.empty()) {
+      PyErr_SetString(PyExc_IOError, err_message.c_str());
+    }
+    return NULL;
+  }
+
+  return Py_BuildValue("KK", n_total, n_kept);
+}
+
+static PyObject * hash_filter_abund(PyObject * self, PyObject * args,
+				    PyObject * kwds)
+{
+  return _hash_filter_abund(self, args, kwds, false);
+}
+
+static PyObject * hash_filter_below_abund(PyObject * self, PyObject * args,
+					  PyObject * kwds)
+{
+  return _hash_filter_abund(self, args, kwds, true);
+}
+
 static PyObject * hash_get_kadian_count(PyObject * self, PyObject * args)
 {
   khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
@@ -1317,7 +1714,8 @@ static PyObject * count_trim_below_abundance(PyObject * self, PyObject * args)
   return ret;
 }
 
-static PyObject * hash_abundance_distribution(PyObject * self, PyObject * args)
+static PyObject * hash_abundance_distribution(PyObject * self, PyObject * args,
+					      PyObject * kwds)
 {
   khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
   khmer::CountingHash * counting = me->counting;
@@ -1325,8 +1723,14 @@ static PyObject * hash_abundance_distribution(PyObject * self, PyObject * args)
   char * filename = NULL;
   PyObject * tracking_obj = NULL;
   PyObject * callback_obj = NULL;
-  if (!PyArg_ParseTuple(args, "sO|O", &filename, &tracking_obj,
-			&callback_obj)) {
+  unsigned int n_threads = 1;
+
+  static const char * kwlist[] = { "filename", "tracking", "callback",
+				   "n_threads", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "sO|OI", (char **) kwlist,
+				   &filename, &tracking_obj, &callback_obj,
+				   &n_threads)) {
     return NULL;
   }
 
@@ -1337,15 +1741,66 @@ static PyObject * hash_abundance_distribution(PyObject * self, PyObject * args)
 
 
   khmer::HashIntoType * dist;
-  dist = counting->abundance_distribution(filename, hashbits,
-					  _report_fn, callback_obj);
+  try {
+    if (n_threads > 1) {
+      dist = counting->abundance_distribution_threaded(filename, hashbits,
+						       n_threads, _report_fn,
+						       callback_obj);
+    } else {
+      dist = counting->abundance_distribution(filename, hashbits,
+					      _report_fn, callback_obj);
+    }
+  } catch (_khmer_signal &e) {
+    return NULL;
+  }
   
   PyObject * x = PyList_New(MAX_BIGCOUNT + 1);
   for (int i = 0; i < MAX_BIGCOUNT + 1; i++) {
     PyList_SET_ITEM(x, i, PyInt_FromLong(dist[i]));
   }
 
-  delete dist;
+  delete[] dist;
+
+  return x;
+}
+
+static PyObject * hash_approx_abundance_distribution(PyObject * self,
+						     PyObject * args,
+						     PyObject * kwds)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  unsigned int n_threads = 1;
+
+  static const char * kwlist[] = { "n_threads", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "|I", (char **) kwlist,
+				   &n_threads)) {
+    return NULL;
+  }
+
+  khmer::HashIntoType * dist = NULL;
+  std::string err_message;
+  Py_BEGIN_ALLOW_THREADS
+  try {
+    dist = counting->approx_abundance_distribution(n_threads);
+  } catch (khmer::khmer_exception &e) {
+    err_message = e.get_message();
+  }
+  Py_END_ALLOW_THREADS
+
+  if (!dist) {
+    PyErr_SetString(PyExc_ValueError, err_message.c_str());
+    return NULL;
+  }
+
+  PyObject * x = PyList_New(MAX_BIGCOUNT + 1);
+  for (int i = 0; i < MAX_BIGCOUNT + 1; i++) {
+    PyList_SET_ITEM(x, i, PyInt_FromLong(dist[i]));
+  }
+
+  delete[] dist;
 
   return x;
 }
@@ -1458,7 +1913,7 @@ void _dump_report_fn(const char * info, unsigned int count, void * data)
 }
 
 
-static PyObject * hash_load(PyObject * self, PyObject * args)
+static PyObject * hash_load_mmap(PyObject * self, PyObject * args)
 {
   khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
   khmer::CountingHash * counting = me->counting;
@@ -1469,24 +1924,113 @@ static PyObject * hash_load(PyObject * self, PyObject * args)
     return NULL;
   }
 
-  counting->load(filename);
+  bool mapped = false;
+  bool exc_raised = false;
+  std::string err_message;
+  Py_BEGIN_ALLOW_THREADS
+  try {
+    mapped = counting->load_mmap(filename);
+  } catch (khmer::khmer_file_exception &e) {
+    err_message = e.get_message();
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
+    PyErr_SetString(PyExc_IOError, err_message.c_str());
+    return NULL;
+  }
+
+  return PyBool_FromLong(mapped);
+}
+
+static PyObject * hash_add(PyObject * self, PyObject * args,
+			   PyObject * kwds)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  PyObject * other_o = NULL;
+  unsigned int n_threads = 1;
+
+  static const char * kwlist[] = { "other", "n_threads", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|I", (char **) kwlist,
+				   &other_o, &n_threads)) {
+    return NULL;
+  }
+
+  if (other_o->ob_type != self->ob_type) {
+    PyErr_SetString(PyExc_TypeError, "other must be a counting hash");
+    return NULL;
+  }
+  khmer::CountingHash * other =
+    ((khmer_KCountingHashObject *) other_o)->counting;
+
+  bool exc_raised = false;
+  std::string err_message;
+
+  Py_BEGIN_ALLOW_THREADS
+  try {
+    counting->add(*other, n_threads);
+  } catch (khmer::khmer_exception &e) {
+    err_message = e.get_message();
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
+    PyErr_SetString(PyExc_ValueError, err_message.c_str());
+    return NULL;
+  }
 
   Py_INCREF(Py_None);
   return Py_None;
 }
 
-static PyObject * hash_save(PyObject * self, PyObject * args)
+static PyObject * hash_load(PyObject * self, PyObject * args)
 {
   khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
   khmer::CountingHash * counting = me->counting;
 
   char * filename = NULL;
+  unsigned int n_threads = 1;
 
-  if (!PyArg_ParseTuple(args, "s", &filename)) {
+  if (!PyArg_ParseTuple(args, "s|I", &filename, &n_threads)) {
     return NULL;
   }
 
-  counting->save(filename);
+  Py_BEGIN_ALLOW_THREADS
+  counting->load(filename, n_threads);
+  Py_END_ALLOW_THREADS
+
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+static PyObject * hash_save(PyObject * self, PyObject * args,
+			     PyObject * kwargs)
+{
+  khmer_KCountingHashObject * me = (khmer_KCountingHashObject *) self;
+  khmer::CountingHash * counting = me->counting;
+
+  char * filename = NULL;
+  unsigned int n_threads = 1;
+  PyObject * sparse_o = NULL;
+
+  static const char * kwlist[] = { "filename", "n_threads", "sparse", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|IO", (char **) kwlist,
+				   &filename, &n_threads, &sparse_o)) {
+    return NULL;
+  }
+
+  // sparse=False always saves the tables whole, so they can be mmapped.
+  bool allow_sparse = sparse_o == NULL || PyObject_IsTrue(sparse_o);
+
+  Py_BEGIN_ALLOW_THREADS
+  counting->save(filename, n_threads, allow_sparse);
+  Py_END_ALLOW_THREADS
 
   Py_INCREF(Py_None);
   return Py_None;
@@ -1534,11 +2078,20 @@ static PyMethodDef khmer_counting_methods[] = {
   { "hashsizes", hash_get_hashsizes, METH_VARARGS, "" },
   { "set_use_bigcount", hash_set_use_bigcount, METH_VARARGS, "" },
   { "get_use_bigcount", hash_get_use_bigcount, METH_VARARGS, "" },
+  { "counter_bits", hash_get_counter_bits, METH_VARARGS, "" },
+  { "counter_max", hash_get_counter_max, METH_VARARGS, "" },
+  { "is_blocked", hash_is_blocked, METH_VARARGS, "" },
+  { "slice_bins", hash_get_slice_bins, METH_VARARGS, "" },
+  { "has_fast_hash", hash_has_fast_hash, METH_VARARGS, "" },
+  { "is_conservative", hash_is_conservative, METH_VARARGS, "" },
+  { "add", (PyCFunction) hash_add, METH_VARARGS | METH_KEYWORDS, "Add the counts of another counting hash of the same shape to this one" },
   { "n_occupied", hash_n_occupied, METH_VARARGS, "Count the number of occupied bins" },
+  { "n_unique_kmers", hash_n_unique_kmers, METH_VARARGS, "Count the number of unique k-mers counted" },
   { "n_entries", hash_n_entries, METH_VARARGS, "" },
   { "count", hash_count, METH_VARARGS, "Count the given kmer" },
   { "consume", hash_consume, METH_VARARGS, "Count all k-mers in the given string" },
-  { "consume_fasta", hash_consume_fasta, METH_VARARGS, "Count all k-mers in a given file" },
+  { "consume_fasta", (PyCFunction) hash_consume_fasta,
+    METH_VARARGS | METH_KEYWORDS, "Count all k-mers in a given file" },
   { "consume_fasta_build_readmask", hash_consume_fasta_build_readmask, METH_VARARGS, "Count all k-mers in a given file, creating a readmask object to mask off bad reads" },
   { "fasta_file_to_minmax", hash_fasta_file_to_minmax, METH_VARARGS, "" },
   { "filter_fasta_file_limit_n", hash_filter_fasta_file_limit_n, METH_VARARGS, "" },
@@ -1550,15 +2103,29 @@ static PyMethodDef khmer_counting_methods[] = {
   { "max_hamming1_count", hash_max_hamming1_count, METH_VARARGS, "Get the count for the given k-mer" },
   { "get_min_count", hash_get_min_count, METH_VARARGS, "Get the smallest count of all the k-mers in the string" },
   { "get_max_count", hash_get_max_count, METH_VARARGS, "Get the largest count of all the k-mers in the string" },
+  { "get_kmer_counts", hash_get_kmer_counts, METH_VARARGS, "Get the count of each k-mer in the string, in order" },
   { "get_median_count", hash_get_median_count, METH_VARARGS, "Get the median, average, and stddev of the k-mer counts in the string" },
+  { "get_median_counts", (PyCFunction) hash_get_median_counts,
+    METH_VARARGS | METH_KEYWORDS, "Get arrays of the median, average, and stddev of the k-mer counts for each of a list (or newline-separated string) of sequences" },
+  { "normalize_by_median", (PyCFunction) hash_normalize_by_median,
+    METH_VARARGS | METH_KEYWORDS, "Digitally normalize a FASTA/FASTQ file, writing the reads kept to outfilename; returns (n_reads, n_kept)" },
   { "get_kadian_count", hash_get_kadian_count, METH_VARARGS, "Get the kadian (abundance of k-th rank-ordered k-mer) of the k-mer counts in the string" },
   { "trim_on_abundance", count_trim_on_abundance, METH_VARARGS, "Trim on >= abundance" },
   { "trim_below_abundance", count_trim_below_abundance, METH_VARARGS, "Trim on >= abundance" },
-  { "abundance_distribution", hash_abundance_distribution, METH_VARARGS, "" },
+  { "filter_abund", (PyCFunction) hash_filter_abund,
+    METH_VARARGS | METH_KEYWORDS, "Trim each read in a FASTA/FASTQ file at its first k-mer below cutoff, writing those left, in order, to outfilename; returns (n_reads, n_kept)" },
+  { "filter_below_abund", (PyCFunction) hash_filter_below_abund,
+    METH_VARARGS | METH_KEYWORDS, "Trim each read in a FASTA/FASTQ file at its first k-mer above cutoff, writing those left, in order, to outfilename; returns (n_reads, n_kept)" },
+  { "abundance_distribution", (PyCFunction) hash_abundance_distribution,
+    METH_VARARGS | METH_KEYWORDS, "" },
+  { "approx_abundance_distribution",
+    (PyCFunction) hash_approx_abundance_distribution,
+    METH_VARARGS | METH_KEYWORDS, "" },
   { "fasta_count_kmers_by_position", hash_fasta_count_kmers_by_position, METH_VARARGS, "" },
   { "fasta_dump_kmers_by_abundance", hash_fasta_dump_kmers_by_abundance, METH_VARARGS, "" },
   { "load", hash_load, METH_VARARGS, "" },
-  { "save", hash_save, METH_VARARGS, "" },
+  { "load_mmap", hash_load_mmap, METH_VARARGS, "Map the tables of a saved file into memory; returns False if the file can't be mapped" },
+  { "save", (PyCFunction) hash_save, METH_VARARGS | METH_KEYWORDS, "" },
   { "get_kmer_abund_abs_deviation", hash_get_kmer_abund_abs_deviation, METH_VARARGS, "" },
   { "get_kmer_abund_mean", hash_get_kmer_abund_mean, METH_VARARGS, "" },
   { "collect_high_abundance_kmers", hash_collect_high_abundance_kmers,
@@ -1628,8 +2195,18 @@ static PyObject* _new_counting_hash(PyObject * self, PyObject * args)
 {
   unsigned int k = 0;
   PyObject* sizes_list_o = NULL;
+  unsigned int counter_bits = DEFAULT_COUNTER_BITS;
+  PyObject * blocked_o = NULL;
+  PyObject * fast_hash_o = NULL;
+  PyObject * conservative_o = NULL;
+
+  if (!PyArg_ParseTuple(args, "IO|IOOO", &k, &sizes_list_o, &counter_bits,
+			&blocked_o, &fast_hash_o, &conservative_o)) {
+    return NULL;
+  }
 
-  if (!PyArg_ParseTuple(args, "IO", &k, &sizes_list_o)) {
+  if (counter_bits != 8 && counter_bits != 4 && counter_bits != 2) {
+    PyErr_SetString(PyExc_ValueError, "counter_bits must be 8, 4 or 2");
     return NULL;
   }
 
@@ -1639,10 +2216,20 @@ static PyObject* _new_counting_hash(PyObject * self, PyObject * args)
     sizes.push_back(PyLong_AsLongLong(size_o));
   }
 
+  bool blocked = (blocked_o && PyObject_IsTrue(blocked_o));
+  if (blocked && sizes.size() > MAX_BLOCKED_TABLES) {
+    PyErr_SetString(PyExc_ValueError, "too many tables for a blocked table");
+    return NULL;
+  }
+
   khmer_KCountingHashObject * kcounting_obj = (khmer_KCountingHashObject *) \
     PyObject_New(khmer_KCountingHashObject, &khmer_KCountingHashType);
 
-  kcounting_obj->counting = new khmer::CountingHash(k, sizes);
+  bool fast_hash = (fast_hash_o && PyObject_IsTrue(fast_hash_o));
+  bool conservative = (conservative_o && PyObject_IsTrue(conservative_o));
+  kcounting_obj->counting = new khmer::CountingHash(k, sizes, counter_bits,
+						    blocked, fast_hash,
+						    conservative);
 
   return (PyObject *) kcounting_obj;
 }
@@ -1800,7 +2387,7 @@ static PyObject * hashbits_consume(PyObject * self, PyObject * args)
   char * long_str;
   khmer::HashIntoType lower_bound = 0, upper_bound = 0;
 
-  if (!PyArg_ParseTuple(args, "s|ll", &long_str, &lower_bound, &upper_bound)) {
+  if (!PyArg_ParseTuple(args, "s|KK", &long_str, &lower_bound, &upper_bound)) {
     return NULL;
   }
   
@@ -2009,6 +2596,49 @@ static PyObject * hashbits_calc_connected_graph_size(PyObject * self, PyObject *
   return PyInt_FromLong(size);
 }
 
+static PyObject * hashbits_calc_connected_graph_sizes(PyObject * self,
+						      PyObject * args,
+						      PyObject * kwargs)
+{
+  khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
+  khmer::Hashbits * hashbits = me->hashbits;
+
+  char * filename = NULL;
+  unsigned long long max_size = 0;
+  PyObject * break_on_circum_o = NULL;
+  unsigned long long cache_size = 10000000;
+  PyObject * callback_obj = NULL;
+
+  static const char * kwlist[] = { "filename", "max_size", "break_on_circum",
+				   "cache_size", "callback", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|KOKO", (char **) kwlist,
+				   &filename, &max_size, &break_on_circum_o,
+				   &cache_size, &callback_obj)) {
+    return NULL;
+  }
+
+  bool break_on_circum = (break_on_circum_o &&
+			  PyObject_IsTrue(break_on_circum_o));
+
+  std::vector<unsigned long long> sizes;
+  khmer::GraphSizeCache cache(cache_size);
+
+  try {
+    hashbits->calc_connected_graph_sizes(filename, sizes, cache, max_size,
+					 break_on_circum, _report_fn,
+					 callback_obj);
+  } catch (_khmer_signal &e) {
+    return NULL;
+  }
+
+  PyObject * x = PyList_New(sizes.size());
+  for (unsigned int i = 0; i < sizes.size(); i++) {
+    PyList_SET_ITEM(x, i, PyInt_FromLong(sizes[i]));
+  }
+  return x;
+}
+
 static PyObject * hashbits_kmer_degree(PyObject * self, PyObject * args)
 {
   khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
@@ -2144,35 +2774,105 @@ static PyObject * hashbits_do_subset_partition(PyObject * self, PyObject * args)
   PyObject * break_on_stop_tags_o = NULL;
   PyObject * stop_big_traversals_o = NULL;
 
-  if (!PyArg_ParseTuple(args, "|KKOOO", &start_kmer, &end_kmer,
-			&break_on_stop_tags_o,
-			&stop_big_traversals_o,
-			&callback_obj)) {
+  if (!PyArg_ParseTuple(args, "|KKOOO", &start_kmer, &end_kmer,
+			&break_on_stop_tags_o,
+			&stop_big_traversals_o,
+			&callback_obj)) {
+    return NULL;
+  }
+
+  bool break_on_stop_tags = false;
+  if (break_on_stop_tags_o && PyObject_IsTrue(break_on_stop_tags_o)) {
+    break_on_stop_tags = true;
+  }
+  bool stop_big_traversals = false;
+  if (stop_big_traversals_o && PyObject_IsTrue(stop_big_traversals_o)) {
+    stop_big_traversals = true;
+  }
+
+  khmer::SubsetPartition * subset_p = NULL;
+  bool exc_raised = false;
+
+  Py_BEGIN_ALLOW_THREADS
+  try {
+    subset_p = new khmer::SubsetPartition(hashbits);
+    subset_p->do_partition(start_kmer, end_kmer, break_on_stop_tags,
+			   stop_big_traversals,
+			   _report_fn, callback_obj);
+  } catch (_khmer_signal &e) {
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
+    delete subset_p;
+    return NULL;
+  }
+
+  return PyCObject_FromVoidPtr(subset_p, free_subset_partition_info);
+}
+
+static PyObject * hashbits_partition_all(PyObject * self, PyObject * args,
+					 PyObject * kwds)
+{
+  khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
+  khmer::Hashbits * hashbits = me->hashbits;
+
+  char * basename;
+  unsigned int n_threads = 1;
+  unsigned int subset_size = 100000;
+  PyObject * break_on_stop_tags_o = NULL;
+  PyObject * stop_big_traversals_o = NULL;
+  PyObject * callback_obj = NULL;
+
+  static const char * kwlist[] = { "basename", "n_threads", "subset_size",
+				   "break_on_stop_tags", "stop_big_traversals",
+				   "callback", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "s|IIOOO", (char **) kwlist,
+				   &basename, &n_threads, &subset_size,
+				   &break_on_stop_tags_o,
+				   &stop_big_traversals_o, &callback_obj)) {
     return NULL;
   }
 
-  bool break_on_stop_tags = false;
-  if (break_on_stop_tags_o && PyObject_IsTrue(break_on_stop_tags_o)) {
-    break_on_stop_tags = true;
-  }
-  bool stop_big_traversals = false;
-  if (stop_big_traversals_o && PyObject_IsTrue(stop_big_traversals_o)) {
-    stop_big_traversals = true;
+  if (n_threads < 1 || subset_size < 1) {
+    PyErr_SetString(PyExc_ValueError,
+		    "n_threads and subset_size must be at least 1");
+    return NULL;
   }
 
-  khmer::SubsetPartition * subset_p = NULL;
+  bool break_on_stop_tags = (break_on_stop_tags_o &&
+			     PyObject_IsTrue(break_on_stop_tags_o));
+  bool stop_big_traversals = (stop_big_traversals_o &&
+			      PyObject_IsTrue(stop_big_traversals_o));
+
+  unsigned int n_subsets = 0;
+  bool exc_raised = false;
+  std::string err_message;
+
+  Py_BEGIN_ALLOW_THREADS
   try {
-    Py_BEGIN_ALLOW_THREADS
-    subset_p = new khmer::SubsetPartition(hashbits);
-    subset_p->do_partition(start_kmer, end_kmer, break_on_stop_tags,
-			   stop_big_traversals,
-			   _report_fn, callback_obj);
-    Py_END_ALLOW_THREADS
+    n_subsets = hashbits->partition_all(basename, n_threads, subset_size,
+					break_on_stop_tags,
+					stop_big_traversals,
+					_report_fn, callback_obj);
   } catch (_khmer_signal &e) {
+    exc_raised = true;
+  } catch (khmer::khmer_exception &e) {
+    err_message = e.get_message();
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
+    if (!err_message.empty()) {
+      PyErr_SetString(PyExc_ValueError, err_message.c_str());
+    }
     return NULL;
   }
 
-  return PyCObject_FromVoidPtr(subset_p, free_subset_partition_info);
+  return PyInt_FromLong(n_subsets);
 }
 
 static PyObject * hashbits_join_partitions_by_path(PyObject * self, PyObject *args)
@@ -2230,7 +2930,8 @@ static PyObject * hashbits_merge_from_disk(PyObject * self, PyObject *args)
   return Py_None;
 }
 
-static PyObject * hashbits_consume_fasta(PyObject * self, PyObject * args)
+static PyObject * hashbits_consume_fasta(PyObject * self, PyObject * args,
+					PyObject * kwds)
 {
   khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
   khmer::Hashbits * hashbits = me->hashbits;
@@ -2240,10 +2941,22 @@ static PyObject * hashbits_consume_fasta(PyObject * self, PyObject * args)
   PyObject * update_readmask_bool = NULL;
   khmer::HashIntoType lower_bound = 0, upper_bound = 0;
   PyObject * callback_obj = NULL;
+  unsigned int n_threads = 1;
 
-  if (!PyArg_ParseTuple(args, "s|iiOOO", &filename, &lower_bound, &upper_bound,
-			&readmask_obj, &update_readmask_bool,
-			&callback_obj)) {
+  static const char * kwlist[] = { "filename", "lower_bound", "upper_bound",
+				   "readmask", "update_readmask", "callback",
+				   "n_threads", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "s|KKOOOI", (char **) kwlist,
+				   &filename, &lower_bound, &upper_bound,
+				   &readmask_obj, &update_readmask_bool,
+				   &callback_obj, &n_threads)) {
+    return NULL;
+  }
+
+  if (n_threads > 1 && readmask_obj && readmask_obj != Py_None) {
+    PyErr_SetString(PyExc_ValueError,
+		    "readmasks cannot be used with n_threads > 1");
     return NULL;
   }
 
@@ -2271,12 +2984,25 @@ static PyObject * hashbits_consume_fasta(PyObject * self, PyObject * args)
 
   unsigned long long n_consumed;
   unsigned int total_reads;
+  bool exc_raised = false;
 
+  Py_BEGIN_ALLOW_THREADS
   try {
-    hashbits->consume_fasta(filename, total_reads, n_consumed,
-			     lower_bound, upper_bound, &readmask,
-			     update_readmask, _report_fn, callback_obj);
+    if (n_threads > 1) {
+      hashbits->consume_fasta_threaded(filename, n_threads, total_reads,
+				       n_consumed, lower_bound, upper_bound,
+				       _report_fn, callback_obj);
+    } else {
+      hashbits->consume_fasta(filename, total_reads, n_consumed,
+			      lower_bound, upper_bound, &readmask,
+			      update_readmask, _report_fn, callback_obj);
+    }
   } catch (_khmer_signal &e) {
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
     return NULL;
   }
 
@@ -2773,7 +3499,7 @@ static PyObject * hashbits_subset_partition_size_distribution(PyObject * self,
   return Py_BuildValue("Oi", x, n_unassigned);
 }
 
-static PyObject * hashbits_load(PyObject * self, PyObject * args)
+static PyObject * hashbits_load_mmap(PyObject * self, PyObject * args)
 {
   khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
   khmer::Hashbits * hashbits = me->hashbits;
@@ -2784,24 +3510,69 @@ static PyObject * hashbits_load(PyObject * self, PyObject * args)
     return NULL;
   }
 
-  hashbits->load(filename);
+  bool mapped = false;
+  bool exc_raised = false;
+  std::string err_message;
+  Py_BEGIN_ALLOW_THREADS
+  try {
+    mapped = hashbits->load_mmap(filename);
+  } catch (khmer::khmer_file_exception &e) {
+    err_message = e.get_message();
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
+    PyErr_SetString(PyExc_IOError, err_message.c_str());
+    return NULL;
+  }
+
+  return PyBool_FromLong(mapped);
+}
+
+static PyObject * hashbits_load(PyObject * self, PyObject * args)
+{
+  khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
+  khmer::Hashbits * hashbits = me->hashbits;
+
+  char * filename = NULL;
+  unsigned int n_threads = 1;
+
+  if (!PyArg_ParseTuple(args, "s|I", &filename, &n_threads)) {
+    return NULL;
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  hashbits->load(filename, n_threads);
+  Py_END_ALLOW_THREADS
 
   Py_INCREF(Py_None);
   return Py_None;
 }
 
-static PyObject * hashbits_save(PyObject * self, PyObject * args)
+static PyObject * hashbits_save(PyObject * self, PyObject * args,
+			     PyObject * kwargs)
 {
   khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
   khmer::Hashbits * hashbits = me->hashbits;
 
   char * filename = NULL;
+  unsigned int n_threads = 1;
+  PyObject * sparse_o = NULL;
 
-  if (!PyArg_ParseTuple(args, "s", &filename)) {
+  static const char * kwlist[] = { "filename", "n_threads", "sparse", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|IO", (char **) kwlist,
+				   &filename, &n_threads, &sparse_o)) {
     return NULL;
   }
 
-  hashbits->save(filename);
+  // sparse=False always saves the tables whole, so they can be mmapped.
+  bool allow_sparse = sparse_o == NULL || PyObject_IsTrue(sparse_o);
+
+  Py_BEGIN_ALLOW_THREADS
+  hashbits->save(filename, n_threads, allow_sparse);
+  Py_END_ALLOW_THREADS
 
   Py_INCREF(Py_None);
   return Py_None;
@@ -3074,14 +3845,12 @@ static PyObject * hashbits_divide_tags_into_subsets(PyObject * self, PyObject *
     return NULL;
   }
 
-  khmer::SeenSet divvy;
+  std::vector<khmer::HashIntoType> divvy;
   hashbits->divide_tags_into_subsets(subset_size, divvy);
 
   PyObject * x = PyList_New(divvy.size());
-  unsigned int i = 0;
-  for (khmer::SeenSet::const_iterator si = divvy.begin(); si != divvy.end();
-       si++, i++) {
-    PyList_SET_ITEM(x, i, PyLong_FromUnsignedLongLong(*si));
+  for (size_t i = 0; i < divvy.size(); i++) {
+    PyList_SET_ITEM(x, i, PyLong_FromUnsignedLongLong(divvy[i]));
   }
 
   return x;
@@ -3209,6 +3978,102 @@ static PyObject * hashbits_get_ksize(PyObject * self, PyObject * args)
 }
 
 
+static PyObject * hashbits_is_blocked(PyObject * self, PyObject * args)
+{
+  khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
+  khmer::Hashbits * hashbits = me->hashbits;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyBool_FromLong(hashbits->is_blocked());
+}
+
+static PyObject * hashbits_get_slice_bins(PyObject * self, PyObject * args)
+{
+  khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
+  khmer::Hashbits * hashbits = me->hashbits;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyInt_FromLong(hashbits->get_slice_bins());
+}
+
+static PyObject * hashbits_has_fast_hash(PyObject * self, PyObject * args)
+{
+  khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
+  khmer::Hashbits * hashbits = me->hashbits;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyBool_FromLong(hashbits->has_fast_hash());
+}
+
+static PyObject * _hashbits_merge(PyObject * self, PyObject * args,
+				   PyObject * kwds, bool intersect)
+{
+  khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
+  khmer::Hashbits * hashbits = me->hashbits;
+
+  PyObject * other_o = NULL;
+  unsigned int n_threads = 1;
+
+  static const char * kwlist[] = { "other", "n_threads", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|I", (char **) kwlist,
+				   &other_o, &n_threads)) {
+    return NULL;
+  }
+
+  if (other_o->ob_type != self->ob_type) {
+    PyErr_SetString(PyExc_TypeError, "other must be a hashbits");
+    return NULL;
+  }
+  khmer::Hashbits * other = ((khmer_KHashbitsObject *) other_o)->hashbits;
+
+  bool exc_raised = false;
+  std::string err_message;
+
+  Py_BEGIN_ALLOW_THREADS
+  try {
+    if (intersect) {
+      hashbits->intersection_update(*other, n_threads);
+    } else {
+      hashbits->update(*other, n_threads);
+    }
+  } catch (khmer::khmer_exception &e) {
+    err_message = e.get_message();
+    exc_raised = true;
+  }
+  Py_END_ALLOW_THREADS
+
+  if (exc_raised) {
+    PyErr_SetString(PyExc_ValueError, err_message.c_str());
+    return NULL;
+  }
+
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+static PyObject * hashbits_update(PyObject * self, PyObject * args,
+				  PyObject * kwds)
+{
+  return _hashbits_merge(self, args, kwds, false);
+}
+
+static PyObject * hashbits_intersection_update(PyObject * self,
+					       PyObject * args,
+					       PyObject * kwds)
+{
+  return _hashbits_merge(self, args, kwds, true);
+}
+
 static PyObject * hashbits_get_hashsizes(PyObject * self, PyObject * args)
 {
   khmer_KHashbitsObject * me = (khmer_KHashbitsObject *) self;
@@ -3255,6 +4120,11 @@ static PyMethodDef khmer_hashbits_methods[] = {
   { "extract_unique_paths", hashbits_extract_unique_paths, METH_VARARGS, "" },
   { "ksize", hashbits_get_ksize, METH_VARARGS, "" },
   { "hashsizes", hashbits_get_hashsizes, METH_VARARGS, "" },
+  { "is_blocked", hashbits_is_blocked, METH_VARARGS, "" },
+  { "slice_bins", hashbits_get_slice_bins, METH_VARARGS, "" },
+  { "has_fast_hash", hashbits_has_fast_hash, METH_VARARGS, "" },
+  { "update", (PyCFunction) hashbits_update, METH_VARARGS | METH_KEYWORDS, "Add the k-mers of another hashbits of the same shape to this one" },
+  { "intersection_update", (PyCFunction) hashbits_intersection_update, METH_VARARGS | METH_KEYWORDS, "Keep only the k-mers also in another hashbits of the same shape" },
   { "n_occupied", hashbits_n_occupied, METH_VARARGS, "Count the number of occupied bins" },
   { "n_unique_kmers", hashbits_n_unique_kmers,  METH_VARARGS, "Count the number of unique kmers" },
   { "count", hashbits_count, METH_VARARGS, "Count the given kmer" },
@@ -3266,6 +4136,9 @@ static PyMethodDef khmer_hashbits_methods[] = {
   { "print_tagset", hashbits_print_tagset, METH_VARARGS, "" },
   { "get", hashbits_get, METH_VARARGS, "Get the count for the given k-mer" },
   { "calc_connected_graph_size", hashbits_calc_connected_graph_size, METH_VARARGS, "" },
+  { "calc_connected_graph_sizes",
+    (PyCFunction) hashbits_calc_connected_graph_sizes,
+    METH_VARARGS | METH_KEYWORDS, "Calculate the connected graph size for the first k-mer of each read in a file, reusing the sizes of components already measured" },
   { "kmer_degree", hashbits_kmer_degree, METH_VARARGS, "" },
   { "trim_on_degree", hashbits_trim_on_degree, METH_VARARGS, "" },
   { "trim_on_sodd", hashbits_trim_on_sodd, METH_VARARGS, "" },
@@ -3273,6 +4146,8 @@ static PyMethodDef khmer_hashbits_methods[] = {
   { "identify_stoptags_by_position", hashbits_identify_stoptags_by_position, METH_VARARGS, "" },
   { "trim_on_density_explosion", hashbits_trim_on_density_explosion, METH_VARARGS, "" },
   { "do_subset_partition", hashbits_do_subset_partition, METH_VARARGS, "" },
+  { "partition_all", (PyCFunction) hashbits_partition_all,
+    METH_VARARGS | METH_KEYWORDS, "" },
   { "find_all_tags", hashbits_find_all_tags, METH_VARARGS, "" },
   { "assign_partition_id", hashbits_assign_partition_id, METH_VARARGS, "" },
   { "output_partitions", hashbits_output_partitions, METH_VARARGS, "" },
@@ -3283,7 +4158,9 @@ static PyMethodDef khmer_hashbits_methods[] = {
   { "get_stop_tags", hashbits_get_stop_tags, METH_VARARGS, "" },
   { "get_tagset", hashbits_get_tagset, METH_VARARGS, "" },
   { "load", hashbits_load, METH_VARARGS, "" },
-  { "save", hashbits_save, METH_VARARGS, "" },
+  { "load_mmap", hashbits_load_mmap, METH_VARARGS, "Map the tables of a saved file into memory; returns False if the file can't be mapped" },
+  { "save", (PyCFunction) hashbits_save, METH_VARARGS | METH_KEYWORDS,
+    "" },
   { "load_tagset", hashbits_load_tagset, METH_VARARGS, "" },
   { "save_tagset", hashbits_save_tagset, METH_VARARGS, "" },
   { "n_tags", hashbits_n_tags, METH_VARARGS, "" },
@@ -3293,7 +4170,8 @@ static PyMethodDef khmer_hashbits_methods[] = {
   { "_validate_partitionmap", hashbits__validate_partitionmap, METH_VARARGS, "" },
   { "_get_tag_density", hashbits__get_tag_density, METH_VARARGS, "" },
   { "_set_tag_density", hashbits__set_tag_density, METH_VARARGS, "" },
-  { "consume_fasta", hashbits_consume_fasta, METH_VARARGS, "Count all k-mers in a given file" },
+  { "consume_fasta", (PyCFunction) hashbits_consume_fasta,
+    METH_VARARGS | METH_KEYWORDS, "Count all k-mers in a given file" },
   { "consume_fasta_and_tag", hashbits_consume_fasta_and_tag, METH_VARARGS, "Count all k-mers in a given file" },
   { "traverse_from_reads", hashbits_traverse_from_reads, METH_VARARGS, "" },
   { "consume_fasta_and_traverse", hashbits_consume_fasta_and_traverse, METH_VARARGS, "" },
@@ -3338,8 +4216,11 @@ static PyObject* _new_hashbits(PyObject * self, PyObject * args)
 {
   unsigned int k = 0;
   PyObject* sizes_list_o = NULL;
+  PyObject * blocked_o = NULL;
+  PyObject * fast_hash_o = NULL;
 
-  if (!PyArg_ParseTuple(args, "IO", &k, &sizes_list_o)) {
+  if (!PyArg_ParseTuple(args, "IO|OO", &k, &sizes_list_o, &blocked_o,
+			&fast_hash_o)) {
     return NULL;
   }
 
@@ -3349,10 +4230,17 @@ static PyObject* _new_hashbits(PyObject * self, PyObject * args)
     sizes.push_back(PyLong_AsLongLong(size_o));
   }
 
+  bool blocked = (blocked_o && PyObject_IsTrue(blocked_o));
+  if (blocked && sizes.size() > MAX_BLOCKED_TABLES) {
+    PyErr_SetString(PyExc_ValueError, "too many tables for a blocked table");
+    return NULL;
+  }
+
   khmer_KHashbitsObject * khashbits_obj = (khmer_KHashbitsObject *) \
     PyObject_New(khmer_KHashbitsObject, &khmer_KHashbitsType);
 
-  khashbits_obj->hashbits = new khmer::Hashbits(k, sizes);
+  bool fast_hash = (fast_hash_o && PyObject_IsTrue(fast_hash_o));
+  khashbits_obj->hashbits = new khmer::Hashbits(k, sizes, blocked, fast_hash);
 
   return (PyObject *) khashbits_obj;
 }
@@ -3650,6 +4538,191 @@ static void khmer_readmask_dealloc(PyObject* self)
   PyObject_Del((PyObject *) obj);
 }
 
+//
+// HLLCounter object
+//
+
+static PyObject * hllcounter_add(PyObject * self, PyObject * args)
+{
+  khmer::HLLCounter * hll = ((khmer_HLLCounterObject *) self)->hll;
+
+  char * kmer;
+
+  if (!PyArg_ParseTuple(args, "s", &kmer)) {
+    return NULL;
+  }
+
+  if (strlen(kmer) < hll->ksize()) {
+    PyErr_SetString(PyExc_ValueError,
+		    "k-mer length must be at least the k-mer size");
+    return NULL;
+  }
+
+  hll->add(khmer::_hash(kmer, hll->ksize()));
+
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+static PyObject * hllcounter_consume(PyObject * self, PyObject * args)
+{
+  khmer::HLLCounter * hll = ((khmer_HLLCounterObject *) self)->hll;
+
+  char * long_str;
+
+  if (!PyArg_ParseTuple(args, "s", &long_str)) {
+    return NULL;
+  }
+
+  return PyInt_FromLong(hll->consume_string(long_str));
+}
+
+static PyObject * hllcounter_consume_fasta(PyObject * self, PyObject * args,
+					   PyObject * kwds)
+{
+  khmer::HLLCounter * hll = ((khmer_HLLCounterObject *) self)->hll;
+
+  char * filename;
+  unsigned int n_threads = 1;
+  unsigned int max_reads = 0;
+  PyObject * callback_obj = NULL;
+
+  static const char * kwlist[] = { "filename", "n_threads", "max_reads",
+				   "callback", NULL };
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "s|IIO", (char **) kwlist,
+				   &filename, &n_threads, &max_reads,
+				   &callback_obj)) {
+    return NULL;
+  }
+
+  unsigned int total_reads;
+  unsigned long long n_consumed;
+  try {
+    hll->consume_fasta(filename, n_threads, max_reads, total_reads,
+		       n_consumed, _report_fn, callback_obj);
+  } catch (_khmer_signal &e) {
+    return NULL;
+  }
+
+  return Py_BuildValue("IK", total_reads, n_consumed);
+}
+
+static PyObject * hllcounter_estimate_cardinality(PyObject * self,
+						  PyObject * args)
+{
+  khmer::HLLCounter * hll = ((khmer_HLLCounterObject *) self)->hll;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyLong_FromUnsignedLongLong(hll->estimate_cardinality());
+}
+
+static PyObject * hllcounter_merge(PyObject * self, PyObject * args)
+{
+  khmer::HLLCounter * hll = ((khmer_HLLCounterObject *) self)->hll;
+
+  PyObject * other_o;
+
+  if (!PyArg_ParseTuple(args, "O!", &khmer_HLLCounterType, &other_o)) {
+    return NULL;
+  }
+
+  khmer::HLLCounter * other = ((khmer_HLLCounterObject *) other_o)->hll;
+
+  try {
+    hll->merge(*other);
+  } catch (khmer::khmer_exception &e) {
+    PyErr_SetString(PyExc_ValueError, e.get_message().c_str());
+    return NULL;
+  }
+
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+static PyObject * hllcounter_ksize(PyObject * self, PyObject * args)
+{
+  khmer::HLLCounter * hll = ((khmer_HLLCounterObject *) self)->hll;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyInt_FromLong(hll->ksize());
+}
+
+static PyObject * hllcounter_precision(PyObject * self, PyObject * args)
+{
+  khmer::HLLCounter * hll = ((khmer_HLLCounterObject *) self)->hll;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+
+  return PyInt_FromLong(hll->precision());
+}
+
+static PyMethodDef khmer_hllcounter_methods[] = {
+  { "add", hllcounter_add, METH_VARARGS, "Add a k-mer" },
+  { "consume", hllcounter_consume, METH_VARARGS, "Add all the k-mers in a sequence" },
+  { "consume_fasta", (PyCFunction) hllcounter_consume_fasta,
+    METH_VARARGS | METH_KEYWORDS, "Add all the k-mers in a FASTA/FASTQ file (or in its first max_reads reads); returns (n_reads, n_kmers)" },
+  { "estimate_cardinality", hllcounter_estimate_cardinality, METH_VARARGS, "Estimate the number of distinct k-mers added" },
+  { "merge", hllcounter_merge, METH_VARARGS, "Add the k-mers of another counter of the same k and precision" },
+  { "ksize", hllcounter_ksize, METH_VARARGS, "" },
+  { "precision", hllcounter_precision, METH_VARARGS, "" },
+  {NULL, NULL, 0, NULL}           /* sentinel */
+};
+
+static PyObject *
+khmer_hllcounter_getattr(PyObject * obj, char * name)
+{
+  return Py_FindMethod(khmer_hllcounter_methods, obj, name);
+}
+
+//
+// new_hll_counter
+//
+
+static PyObject* new_hll_counter(PyObject * self, PyObject * args)
+{
+  unsigned int ksize;
+  unsigned int precision = DEFAULT_HLL_PRECISION;
+
+  if (!PyArg_ParseTuple(args, "I|I", &ksize, &precision)) {
+    return NULL;
+  }
+
+  if (precision < MIN_HLL_PRECISION || precision > MAX_HLL_PRECISION) {
+    PyErr_Format(PyExc_ValueError, "precision must be from %d to %d",
+		 MIN_HLL_PRECISION, MAX_HLL_PRECISION);
+    return NULL;
+  }
+
+  khmer_HLLCounterObject * hll_obj = (khmer_HLLCounterObject *) \
+    PyObject_New(khmer_HLLCounterObject, &khmer_HLLCounterType);
+
+  hll_obj->hll = new khmer::HLLCounter(ksize, precision);
+
+  return (PyObject *) hll_obj;
+}
+
+//
+// khmer_hllcounter_dealloc -- clean up an HLLCounter object.
+//
+
+static void khmer_hllcounter_dealloc(PyObject* self)
+{
+  khmer_HLLCounterObject * obj = (khmer_HLLCounterObject *) self;
+  delete obj->hll;
+  obj->hll = NULL;
+  
+  PyObject_Del((PyObject *) obj);
+}
+
 //
 // MinMaxTable object
 //
@@ -3942,6 +5015,7 @@ static PyMethodDef KhmerMethods[] = {
   { "_new_hashbits", _new_hashbits, METH_VARARGS, "Create an empty hashbits table" },
   { "new_readmask", new_readmask, METH_VARARGS, "Create a new read mask table" },
   { "new_minmax", new_minmax, METH_VARARGS, "Create a new min/max value table" },
+  { "new_hll_counter", new_hll_counter, METH_VARARGS, "Create a HyperLogLog counter of distinct k-mers" },
   { "consume_genome", consume_genome, METH_VARARGS, "Create a new ktable from a genome" },
   { "forward_hash", forward_hash, METH_VARARGS, "", },
   { "forward_hash_no_rc", forward_hash_no_rc, METH_VARARGS, "", },
@@ -3955,6 +5029,9 @@ DL_EXPORT(void) init_khmer(void)
   khmer_KTableType.ob_type = &PyType_Type;
   khmer_KCountingHashType.ob_type = &PyType_Type;
 
+  // C++ code calls back into Python from threads that released the GIL.
+  PyEval_InitThreads();
+
   PyObject * m;
   m = Py_InitModule("_khmer", KhmerMethods);
 
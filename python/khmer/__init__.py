@@ -1,5 +1,6 @@
 __version__ = "0.5"
 
+import math
 import _khmer
 from _khmer import new_ktable
 from _khmer import new_hashtable
@@ -7,6 +8,7 @@ from _khmer import _new_counting_hash
 from _khmer import _new_hashbits
 from _khmer import new_readmask
 from _khmer import new_minmax
+from _khmer import new_hll_counter
 from _khmer import consume_genome
 from _khmer import forward_hash, forward_hash_no_rc, reverse_hash
 from _khmer import set_reporting_callback
@@ -15,25 +17,70 @@ from filter_utils import filter_fasta_file_any, filter_fasta_file_all, filter_fa
 
 ###
 
-def new_hashbits(k, starting_size, n_tables=2):
-    primes = get_n_primes_above_x(n_tables, starting_size)
+def _get_tablesizes(n_tables, starting_size, fast_hash):
+    # classic tables pick bins by khash % size, so the sizes must be
+    # distinct primes; fast_hash tables mix khash once and take each
+    # table's bin from that by double hashing instead.
+    if fast_hash:
+        return [ int(starting_size) ] * n_tables
+    return get_n_primes_above_x(n_tables, starting_size)
+
+def new_hashbits(k, starting_size, n_tables=2, blocked=False,
+                 fast_hash=False):
+    """
+    Make a presence table.  With blocked=True, all n_tables bits for a
+    k-mer go in one 64-byte block of a single table (of about the same
+    size), which is faster but has a somewhat higher false positive rate.
+
+    With fast_hash=True, the k-mer's hash is mixed once, and table i's bin
+    comes from h + i * h2 (double hashing, with h2 also taken from the
+    mixed hash), scaled down to the table size with a multiply instead of
+    divided by a prime table size; the tables are all starting_size.
+    """
+    sizes = _get_tablesizes(n_tables, starting_size, fast_hash)
     
-    return _new_hashbits(k, primes)
+    return _new_hashbits(k, sizes, blocked, fast_hash)
 
-def new_counting_hash(k, starting_size, n_tables=2):
-    primes = get_n_primes_above_x(n_tables, starting_size)
+def new_counting_hash(k, starting_size, n_tables=2, counter_bits=8,
+                      blocked=False, fast_hash=False, conservative=False):
+    """
+    Make a counting table.  Counters are 'counter_bits' wide (8, 4 or 2),
+    saturating at 255, 15 or 3 unless set_use_bigcount(True) is on; the
+    narrower ones fit 2 or 4 times as many bins into the same memory.
+    See new_hashbits for 'blocked' and 'fast_hash'.
+
+    With conservative=True, counting a k-mer raises only those of its
+    bins that hold its current (lowest) count, so that k-mers sharing
+    bins overcount each other much less, for a little more time per
+    k-mer.  Counts are never underestimated either way.
+    """
+    sizes = _get_tablesizes(n_tables, starting_size, fast_hash)
     
-    return _new_counting_hash(k, primes)
+    return _new_counting_hash(k, sizes, counter_bits, blocked, fast_hash,
+                              conservative)
 
-def load_hashbits(filename):
+def load_hashbits(filename, mmap=False, n_threads=1):
+    """
+    Load a saved presence table.  With mmap=True the tables are mapped
+    into memory (and shared with other processes) if the file format
+    allows it, and read in as usual otherwise; .gz files and mostly empty
+    tables saved sparsely (see save's 'sparse' option) can't be mapped.
+    Compressed (.gz) tables are decompressed on n_threads threads.
+    """
     ht = _new_hashbits(1, [1])
-    ht.load(filename)
+    if not (mmap and ht.load_mmap(filename)):
+        ht.load(filename, n_threads)
 
     return ht
 
-def load_counting_hash(filename):
+def load_counting_hash(filename, mmap=False, n_threads=1):
+    """
+    Load a saved counting table; see load_hashbits for 'mmap' and
+    'n_threads'.
+    """
     ht = _new_counting_hash(1, [1])
-    ht.load(filename)
+    if not (mmap and ht.load_mmap(filename)):
+        ht.load(filename, n_threads)
     
     return ht
 
@@ -55,10 +102,112 @@ def calc_expected_collisions(ht):
     min_size = min(sizes)
 
     fp_one = occupancy / min_size
+
+    if ht.is_blocked():
+        if fp_one >= 1.:
+            return 1.
+        # work back from the occupancy to the number of k-mers.
+        slice_bins = ht.slice_bins()
+        n_kmers = -min_size * math.log(1. - fp_one)
+        return _blocked_fp_rate(n_kmers, min_size, slice_bins, len(sizes))
+
     fp_all = fp_one ** n_ht
 
     return fp_all
 
+def _blocked_fp_rate(n_kmers, tablesize, slice_bins, n_tables):
+    """
+    The expected false positive rate of a blocked table of n_tables tables
+    of tablesize bins, holding n_kmers k-mers.  The tables aren't
+    independent: a block that gets more than its share of k-mers has more
+    bins set in every slice.  So the rate for a block holding j k-mers,
+    (1 - (1 - 1/slice_bins)^j)^n_tables, is averaged over j, which is
+    Poisson distributed.
+    """
+    load = float(n_kmers) * slice_bins / tablesize
+    if not load:
+        return 0.
+
+    fp = 0.
+    j = 0
+    while True:
+        p_j = math.exp(j * math.log(load) - load - math.lgamma(j + 1))
+        fp += p_j * (1. - (1. - 1. / slice_bins) ** j) ** n_tables
+        if j > load and p_j < 1e-12:
+            break
+        j += 1
+
+    return fp
+
+# bits in a block of a blocked table, and the most tables one can have
+# (TABLE_BLOCK_BYTES and MAX_BLOCKED_TABLES in lib/blocked_table.hh).
+_TABLE_BLOCK_BITS = 64 * 8
+_MAX_BLOCKED_TABLES = 16
+
+def choose_table_sizes(n_kmers, max_memory, counter_bits=8, target_fp=0.01,
+                       max_tables=8, blocked=False):
+    """
+    Pick a hashsize and number of tables for about n_kmers distinct k-mers:
+    the fewest bytes that bring the expected false positive rate (as
+    calc_expected_collisions reckons it) down to target_fp or, if those
+    don't fit in max_memory bytes, the lowest rate that does fit.  With
+    blocked=True, the rate is that of a blocked table of that size.
+
+    Returns (hashsize, n_tables, expected fp rate).
+    """
+    n_kmers = float(n_kmers)
+    if blocked:
+        max_tables = min(max_tables, _MAX_BLOCKED_TABLES)
+
+    def fp_rate(hashsize, n_tables):
+        if blocked:
+            slice_bins = _TABLE_BLOCK_BITS // counter_bits // n_tables
+            n_bits = n_tables * hashsize * counter_bits
+            n_blocks = (n_bits + _TABLE_BLOCK_BITS - 1) // _TABLE_BLOCK_BITS
+            return _blocked_fp_rate(n_kmers, n_blocks * slice_bins,
+                                    slice_bins, n_tables)
+        return (1. - math.exp(-n_kmers / hashsize)) ** n_tables
+
+    # each table must be occupied no more than target_fp ** (1/N).
+    best = None
+    for n_tables in range(1, max_tables + 1):
+        occupancy = target_fp ** (1. / n_tables)
+        hashsize = int(-n_kmers / math.log(1. - occupancy)) + 1
+        if blocked and fp_rate(hashsize, n_tables) > target_fp:
+            # blocked tables need more room; find how much by bisection.
+            low = hashsize
+            while fp_rate(hashsize, n_tables) > target_fp:
+                low, hashsize = hashsize, hashsize * 2
+            while hashsize - low > 1:
+                middle = (low + hashsize) // 2
+                if fp_rate(middle, n_tables) > target_fp:
+                    low = middle
+                else:
+                    hashsize = middle
+        memory = n_tables * hashsize * counter_bits / 8.
+        if best is None or memory < best[0]:
+            best = (memory, hashsize, n_tables)
+
+    memory, hashsize, n_tables = best
+    if memory <= max_memory:
+        return hashsize, n_tables, fp_rate(hashsize, n_tables)
+
+    # too big: use all of max_memory, split the best way.
+    best = None
+    for n_tables in range(1, max_tables + 1):
+        hashsize = int(max_memory * 8 / (counter_bits * n_tables))
+        if hashsize < 1:
+            break
+        fp = fp_rate(hashsize, n_tables)
+        if best is None or fp < best[0]:
+            best = (fp, hashsize, n_tables)
+
+    if best is None:
+        raise ValueError("max_memory is too small for even one table")
+
+    fp, hashsize, n_tables = best
+    return hashsize, n_tables, fp
+
 ###
 
 class KmerCount(object):
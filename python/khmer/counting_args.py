@@ -1,9 +1,12 @@
 import os
 import argparse
+from khmer.table_size_args import add_table_size_args, set_table_sizes, \
+     DEFAULT_TARGET_FP
 
 DEFAULT_K=32
 DEFAULT_N_HT=4
 DEFAULT_MIN_HASHSIZE=1e6
+DEFAULT_COUNTER_BITS=8
 
 def build_construct_args():
 
@@ -13,6 +16,8 @@ def build_construct_args():
     env_ksize = os.environ.get('KHMER_KSIZE', DEFAULT_K)
     env_n_hashes = os.environ.get('KHMER_N_HASHES', DEFAULT_N_HT)
     env_hashsize = os.environ.get('KHMER_MIN_HASHSIZE', DEFAULT_MIN_HASHSIZE)
+    env_counter_bits = os.environ.get('KHMER_COUNTER_BITS',
+                                      DEFAULT_COUNTER_BITS)
 
     parser.add_argument('-q', '--quiet', dest='quiet', default=False,
                         action='store_true')
@@ -25,6 +30,23 @@ def build_construct_args():
     parser.add_argument('--hashsize', '-x', type=float, dest='min_hashsize',
                         default=env_hashsize,
                         help='lower bound on hashsize to use')
+    parser.add_argument('--counter-bits', '-b', type=int, dest='counter_bits',
+                        default=env_counter_bits, choices=[8, 4, 2],
+                        help='bits per counter; 4 or 2 fit more counters in '
+                        'the same memory, but saturate at 15 or 3')
+    parser.add_argument('--blocked', dest='blocked', default=False,
+                        action='store_true',
+                        help='put all of a k-mer\'s hashes in one cache line '
+                        '(faster, slightly higher false positive rate)')
+    parser.add_argument('--fast-hash', dest='fast_hash', default=False,
+                        action='store_true',
+                        help='pick bins by mixing and multiplying rather than '
+                        'dividing by prime table sizes (faster)')
+    parser.add_argument('--conservative', dest='conservative', default=False,
+                        action='store_true',
+                        help='count by conservative update: only raise the '
+                        'lowest of a k-mer\'s counters (more accurate counts)')
+    add_table_size_args(parser)
 
     return parser
 
@@ -1,5 +1,7 @@
 import os
 import argparse
+from khmer.table_size_args import add_table_size_args, set_table_sizes, \
+     DEFAULT_TARGET_FP
 
 DEFAULT_K=32
 DEFAULT_N_HT=4
@@ -25,5 +27,14 @@ def build_construct_args():
     parser.add_argument('--hashsize', '-x', type=float, dest='min_hashsize',
                         default=env_hashsize,
                         help='lower bound on hashsize to use')
+    parser.add_argument('--blocked', dest='blocked', default=False,
+                        action='store_true',
+                        help='put all of a k-mer\'s hashes in one cache line '
+                        '(faster, slightly higher false positive rate)')
+    parser.add_argument('--fast-hash', dest='fast_hash', default=False,
+                        action='store_true',
+                        help='pick bins by mixing and multiplying rather than '
+                        'dividing by prime table sizes (faster)')
+    add_table_size_args(parser)
 
     return parser
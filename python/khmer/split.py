@@ -1,4 +1,11 @@
+import math
+import array
+import struct
+import bisect
+import operator
+import multiprocessing
 import _khmer
+import khmer
 from _khmer import new_ktable
 from _khmer import new_hashtable
 from _khmer import consume_genome
@@ -17,9 +24,9 @@ class SplitHashtable(object):
         self.lower_bound = self.partition_size * partition
 
         if partition == n_partitions - 1:
-            self.upper_bound = self.lower_bound + self.partition_size
-        else:
             self.upper_bound = 4**ksize
+        else:
+            self.upper_bound = self.lower_bound + self.partition_size
 
     def consume(self, s):
         s = s.upper()
@@ -35,3 +42,247 @@ class SplitHashtable(object):
 
         return self._kh.get_min_count(s, self.lower_bound, self.upper_bound), \
                self._kh.get_max_count(s, self.lower_bound, self.upper_bound)
+
+###
+
+def get_shard_bounds(ksize, n_shards):
+    """
+    Split the k-mer hashes into n_shards ranges, returning the n_shards + 1
+    boundaries.  The ranges hold about the same number of k-mers each:
+    k-mers are hashed to the smaller of their forward and reverse
+    complement hashes, so for random k-mers P(hash < x) = 1 - (1 - x/4**k)**2
+    and equal-width ranges would leave the first shard with the most.
+    """
+    max_hash = 4**ksize
+    bounds = [ 0 ]
+    for i in range(1, n_shards):
+        x = 1 - math.sqrt(1 - float(i) / n_shards)
+        bounds.append(int(max_hash * x))
+    bounds.append(min(max_hash, 2**64 - 1))
+    return bounds
+
+def _shard_worker(conn, make_table, lower_bound, upper_bound):
+    ht = make_table()
+
+    while 1:
+        request = conn.recv()
+        if request is None:
+            break
+
+        name, args = request
+        try:
+            if name == 'consume':
+                result = ht.consume(args[0], lower_bound, upper_bound)
+            elif name == 'consume_fasta':
+                filename, n_threads = args
+                result = ht.consume_fasta(filename, lower_bound, upper_bound,
+                                          callback=None, n_threads=n_threads)
+            elif name == 'get_kmer_counts':
+                # all packed into one string, as that's much quicker to
+                # send than lists.
+                counts = array.array('H')
+                for seq in args[0]:
+                    counts.extend(ht.get_kmer_counts(seq, lower_bound,
+                                                     upper_bound))
+                result = counts.tostring()
+            else:
+                result = getattr(ht, name)(*args)
+            conn.send((True, result))
+        except Exception, e:
+            conn.send((False, e))
+
+    conn.close()
+
+class _NewShard(object):
+    def __init__(self, ksize, tablesize, n_tables, options):
+        self.args = (ksize, tablesize, n_tables)
+        self.options = options
+
+    def __call__(self):
+        return khmer.new_counting_hash(*self.args, **self.options)
+
+class _LoadShard(object):
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __call__(self):
+        return khmer.load_counting_hash(self.filename, mmap=True)
+
+class ShardedCountingHash(object):
+    """
+    A counting hash split across n_shards worker processes, each owning
+    the k-mers in one range of hash values (see get_shard_bounds) with
+    its own tablesize x n_tables table.  The shards together can use
+    more memory and cores than a single table.
+
+    Every shard reads all of the input and keeps only its own k-mers;
+    queries go to all of the shards at once, and their answers are
+    combined here.
+    """
+    def __init__(self, ksize, tablesize, n_tables, n_shards, **options):
+        self._ksize = ksize
+        self._bounds = get_shard_bounds(ksize, n_shards)
+        self._start([ _NewShard(ksize, tablesize, n_tables, options) ] *
+                    n_shards)
+
+    def _start(self, makers):
+        self._conns = []
+        self._workers = []
+        for i, make_table in enumerate(makers):
+            conn, child_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_shard_worker,
+                                             args=(child_conn, make_table,
+                                                   self._bounds[i],
+                                                   self._bounds[i + 1]))
+            worker.daemon = True
+            worker.start()
+            child_conn.close()
+
+            self._conns.append(conn)
+            self._workers.append(worker)
+
+    def _receive(self, conn):
+        ok, result = conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def _call_each(self, requests):
+        for conn, request in zip(self._conns, requests):
+            conn.send(request)
+
+        # collect every answer before raising, so the pipes stay in step.
+        results, error = [], None
+        for conn in self._conns:
+            try:
+                results.append(self._receive(conn))
+            except Exception, e:
+                error = e
+        if error is not None:
+            raise error
+        return results
+
+    def _call_all(self, name, *args):
+        return self._call_each([ (name, args) ] * len(self._conns))
+
+    def _shard_for(self, kmer):
+        h = forward_hash(kmer, self._ksize)
+        return bisect.bisect_right(self._bounds, h) - 1
+
+    def n_shards(self):
+        return len(self._conns)
+
+    def ksize(self):
+        return self._ksize
+
+    def set_use_bigcount(self, b):
+        self._call_all('set_use_bigcount', b)
+
+    def consume(self, seq):
+        return sum(self._call_all('consume', seq))
+
+    def consume_fasta(self, filename, n_threads=1):
+        """
+        Count the k-mers in the given file; each shard reads it on
+        n_threads threads.  Returns (n_reads, n_kmers) like
+        CountingHash.consume_fasta.
+        """
+        results = self._call_all('consume_fasta', filename, n_threads)
+        return results[0][0], sum([ n_kmers for (_, n_kmers) in results ])
+
+    def get(self, kmer):
+        conn = self._conns[self._shard_for(kmer)]
+        conn.send(('get', (kmer,)))
+        return self._receive(conn)
+
+    def get_kmer_counts(self, seq):
+        return self.get_kmer_counts_many([ seq ])[0]
+
+    def get_kmer_counts_many(self, seqs):
+        """
+        The count of every k-mer in each of seqs.  Each k-mer belongs to
+        exactly one shard, and the others report 0 for it, so the counts
+        are the sums over the shards.
+        """
+        results = self._call_all('get_kmer_counts', seqs)
+
+        counts = array.array('H', results[0])
+        for packed in results[1:]:
+            counts = map(operator.add, counts, array.array('H', packed))
+
+        result = []
+        start = 0
+        for seq in seqs:
+            n = max(len(seq) - self._ksize + 1, 0)
+            result.append(list(counts[start:start + n]))
+            start += n
+        assert start == len(counts)
+        return result
+
+    def get_median_count(self, seq):
+        return self.get_median_counts([ seq ])[0]
+
+    def get_median_counts(self, seqs):
+        """
+        (median, average, stddev) of the k-mer counts of each of seqs, as
+        CountingHash.get_median_count; ask for many reads at once to
+        save round trips to the shards.
+        """
+        results = []
+        for counts in self.get_kmer_counts_many(seqs):
+            if not counts:
+                results.append((0, 0., 0.))
+                continue
+
+            n = float(len(counts))
+            average = sum(counts) / n
+            variance = sum(map(operator.mul, counts, counts)) / n - \
+                       average * average
+            median = sorted(counts)[len(counts) / 2]
+            results.append((median, average, math.sqrt(max(variance, 0.))))
+        return results
+
+    def save(self, basename):
+        """
+        Save each shard as <basename>.shard.N; load them back with
+        load_sharded_counting_hash.  The shards aren't saved sparse, so
+        the workers can map them rather than read them.
+        """
+        self._call_each([ ('save', ('%s.shard.%d' % (basename, i), 1, False))
+                          for i in range(len(self._conns)) ])
+
+    def close(self):
+        for conn, worker in zip(self._conns, self._workers):
+            conn.send(None)
+            worker.join()
+            conn.close()
+        self._conns, self._workers = [], []
+
+    def __del__(self):
+        if getattr(self, '_conns', None):
+            self.close()
+
+def _read_ksize(filename):
+    # a saved counting table starts with its version, type, bigcount flag
+    # and (4-byte) k-mer size.
+    fp = open(filename, 'rb')
+    try:
+        header = fp.read(7)
+    finally:
+        fp.close()
+    if len(header) < 7:
+        raise IOError("%s is truncated" % filename)
+    return struct.unpack('=BBBI', header)[3]
+
+def load_sharded_counting_hash(basename, n_shards):
+    """
+    Load the shards saved by ShardedCountingHash.save, mapping each one
+    into its worker.
+    """
+    filenames = [ '%s.shard.%d' % (basename, i) for i in range(n_shards) ]
+
+    ht = ShardedCountingHash.__new__(ShardedCountingHash)
+    ht._ksize = _read_ksize(filenames[0])
+    ht._bounds = get_shard_bounds(ht._ksize, n_shards)
+    ht._start([ _LoadShard(filename) for filename in filenames ])
+    return ht
@@ -0,0 +1,62 @@
+import sys
+import khmer
+
+DEFAULT_TARGET_FP=0.01
+
+def add_table_size_args(parser):
+    """
+    Add the options for sizing tables to fit the input, shared by the
+    counting and presence table parsers; see set_table_sizes.
+    """
+    parser.add_argument('--max-memory', '-M', type=float, dest='max_memory',
+                        default=None,
+                        help='size the tables (overriding -x and -N) for the '
+                        'number of distinct k-mers in the input, estimated '
+                        'in a quick first pass, using at most this many '
+                        'bytes')
+    parser.add_argument('--target-fp', type=float, dest='target_fp',
+                        default=DEFAULT_TARGET_FP,
+                        help='with -M, the false positive rate to size the '
+                        'tables for, memory permitting')
+    parser.add_argument('--sample-reads', type=int, dest='sample_reads',
+                        default=0,
+                        help='with -M, estimate from only the first this '
+                        'many reads of each file (faster, but low if later '
+                        'reads hold new k-mers)')
+
+def set_table_sizes(args, filenames, counter_bits=None, n_threads=1):
+    """
+    If --max-memory was given, estimate the number of distinct k-mers in
+    the input files and set args.min_hashsize and args.n_hashes to fit
+    them, at counter_bits bits a bin (by default args.counter_bits, or 1
+    for presence tables, which have none), allowing for --blocked.
+    Returns the estimate, or None.
+    """
+    if not args.max_memory:
+        return None
+
+    if counter_bits is None:
+        counter_bits = getattr(args, 'counter_bits', 1)
+
+    hll = khmer.new_hll_counter(args.ksize)
+    for filename in filenames:
+        hll.consume_fasta(filename, n_threads=n_threads,
+                          max_reads=args.sample_reads)
+    n_kmers = hll.estimate_cardinality()
+
+    hashsize, n_tables, fp = khmer.choose_table_sizes(n_kmers,
+                                                      args.max_memory,
+                                                      counter_bits,
+                                                      args.target_fp,
+                                                      blocked=args.blocked)
+    args.min_hashsize = hashsize
+    args.n_hashes = n_tables
+
+    if not args.quiet:
+        print>>sys.stderr, 'estimated %d distinct k-mers; expected fp rate ' \
+            'is %1.3f' % (n_kmers, fp)
+    if fp > args.target_fp:
+        print>>sys.stderr, '** WARNING: --max-memory is too small for ' \
+            '--target-fp %g' % args.target_fp
+
+    return n_kmers
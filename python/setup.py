@@ -3,15 +3,18 @@ from distutils.core import setup, Extension
 # the c++ extension module (needs to be linked in with ktable.o ...)
 extension_mod = Extension("khmer._khmermodule",
                           ["_khmermodule.cc"],
-                          extra_compile_args=['-g'],
+                          extra_compile_args=['-g', '-pthread'],
+                          extra_link_args=['-pthread'],
                           include_dirs=['../lib',],
                           library_dirs=['../lib',],
                           extra_objects=['../lib/ktable.o',
                                          '../lib/hashtable.o',
+                                         '../lib/chunked_gz.o',
                                          '../lib/parsers.o',
                                          '../lib/hashbits.o',
                                          '../lib/counting.o',
                                          '../lib/subset.o',
+                                         '../lib/hllcounter.o',
                                          '../lib/zlib-1.2.3/adler32.o',
                                          '../lib/zlib-1.2.3/compress.o',
                                          '../lib/zlib-1.2.3/crc32.o',
@@ -28,8 +31,17 @@ extension_mod = Extension("khmer._khmermodule",
                                    '../lib/khmer.hh',
                                    '../lib/ktable.hh',
                                    '../lib/hashtable.hh',
+                                   '../lib/kmer_hash.hh',
+                                   '../lib/traversal.hh',
+                                   '../lib/blocked_table.hh',
+                                   '../lib/sparse_table.hh',
+                                   '../lib/subset.hh',
+                                   '../lib/hashbits.hh',
                                    '../lib/counting.hh',
+                                   '../lib/chunked_gz.hh',
+                                   '../lib/hllcounter.hh',
                                    '../lib/hashtable.o',
+                                   '../lib/chunked_gz.o',
                                    '../lib/ktable.o',
                                    '../lib/parsers.o',
                                    '../lib/hashbits.o',
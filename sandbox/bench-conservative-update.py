@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+"""
+Compare the counting accuracy of the usual and the conservative-update
+counting tables over a range of table sizes, on reads simulated from a
+random genome.
+
+% python figuregen/simgenome.py sim.fa 1000000 1 sim
+% python sandbox/bench-conservative-update.py sim.fa [ <coverage> [ <error rate> ] ]
+
+Samples 100bp reads with uniform substitution errors (default 10x, 1%),
+counts their k-mers exactly, then loads them into 4-table counting hashes
+of each size.  For each, reports the memory used, the expected false
+positive rate (as normalize-by-median.py checks it), the fraction of
+k-mers whose count is too high, the mean overcount, and the fraction of a
+sample of reads whose median k-mer count is wrong.
+"""
+import sys
+import os
+import random
+import shutil
+import tempfile
+import screed
+import khmer
+
+K = 20
+N_HT = 4
+READ_LEN = 100
+N_MEDIAN_READS = 10000
+
+# bins per table, as a multiple of the number of distinct k-mers.
+SIZE_FACTORS = [ 0.25, 0.5, 1, 2, 4 ]
+
+def mutate(seq, error_rate):
+    seq = list(seq)
+    for i in range(len(seq)):
+        if random.random() < error_rate:
+            seq[i] = random.choice([ b for b in 'ACGT' if b != seq[i] ])
+    return ''.join(seq)
+
+def make_reads(genome, coverage, error_rate, filename):
+    n_reads = int(len(genome) * coverage / READ_LEN)
+    reads = []
+    fp = open(filename, 'w')
+    for i in range(n_reads):
+        start = random.randint(0, len(genome) - READ_LEN)
+        read = mutate(genome[start:start + READ_LEN], error_rate)
+        fp.write('>%d\n%s\n' % (i, read))
+        reads.append(read)
+    fp.close()
+    return reads
+
+def median(counts):
+    counts = sorted(counts)
+    return counts[len(counts) / 2]
+
+def main():
+    genome = ''.join([ r['sequence'] for r in screed.open(sys.argv[1]) ])
+    coverage = 10.
+    if len(sys.argv) > 2:
+        coverage = float(sys.argv[2])
+    error_rate = 0.01
+    if len(sys.argv) > 3:
+        error_rate = float(sys.argv[3])
+
+    random.seed(1)
+    tempdir = tempfile.mkdtemp()
+    try:
+        readsfile = os.path.join(tempdir, 'reads.fa')
+        reads = make_reads(genome, coverage, error_rate, readsfile)
+
+        true_counts = {}
+        for read in reads:
+            for i in range(len(read) - K + 1):
+                kmer = read[i:i + K]
+                true_counts[kmer] = true_counts.get(kmer, 0) + 1
+        n_distinct = len(true_counts)
+
+        sample = random.sample(reads, min(N_MEDIAN_READS, len(reads)))
+        true_medians = [ median([ true_counts[read[i:i + K]]
+                                  for i in range(len(read) - K + 1) ])
+                         for read in sample ]
+
+        print '%d reads, %d distinct %d-mers' % (len(reads), n_distinct, K)
+        print 'mode\t\tMB\tFP\tovercounted\tmean over\tmedian wrong'
+
+        for factor in SIZE_FACTORS:
+            size = int(n_distinct * factor)
+            for conservative in (False, True):
+                ht = khmer.new_counting_hash(K, size, N_HT,
+                                             conservative=conservative)
+                ht.consume_fasta(readsfile)
+
+                n_over = 0
+                total_over = 0
+                for kmer, count in true_counts.iteritems():
+                    over = ht.get(kmer) - count
+                    if over:
+                        n_over += 1
+                        total_over += over
+
+                n_wrong = 0
+                for read, true_median in zip(sample, true_medians):
+                    if ht.get_median_count(read)[0] != true_median:
+                        n_wrong += 1
+
+                print '%s\t%.1f\t%.3f\t%.4f\t\t%.3f\t\t%.4f' % \
+                      (conservative and 'conservative' or 'usual\t',
+                       sum(ht.hashsizes()) / 1e6,
+                       khmer.calc_expected_collisions(ht),
+                       float(n_over) / n_distinct,
+                       float(total_over) / n_distinct,
+                       float(n_wrong) / len(sample))
+    finally:
+        shutil.rmtree(tempdir)
+
+if __name__ == '__main__':
+    main()
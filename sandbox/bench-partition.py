@@ -0,0 +1,70 @@
+#! /usr/bin/env python
+"""
+Benchmark graph partitioning: divide the tags into subsets and run
+do_subset_partition on each, one thread; then run the native partition_all
+driver (as partition-graph.py does) on 1, 2, 4... up to <n threads> threads.
+
+% python scripts/load-graph.py <base> <reads.fa>
+% python sandbox/bench-partition.py <base> [ <subset size> [ <n threads> ] ]
+
+Reports the partitioning rate in tags/second.  partition_all writes its
+<base>.bench.subset.N.pmap files into a temp directory.
+"""
+import sys
+import os
+import time
+import glob
+import shutil
+import tempfile
+import khmer
+
+DEFAULT_SUBSET_SIZE = int(1e5)
+
+def main():
+    basename = sys.argv[1]
+    subset_size = DEFAULT_SUBSET_SIZE
+    if len(sys.argv) > 2:
+        subset_size = int(float(sys.argv[2]))
+    max_threads = 4
+    if len(sys.argv) > 3:
+        max_threads = int(sys.argv[3])
+
+    ht = khmer.load_hashbits(basename + '.ht')
+    ht.load_tagset(basename + '.tagset')
+    n_tags = ht.n_tags()
+
+    divvy = ht.divide_tags_into_subsets(subset_size)
+    n_subsets = len(divvy)
+    divvy.append(0)
+
+    start = time.time()
+    for i in range(n_subsets):
+        subset = ht.do_subset_partition(divvy[i], divvy[i + 1], True, False)
+        del subset
+    elapsed = time.time() - start
+
+    print '%d tags in %d subsets: %.2fs, %.0f tags/s' % \
+          (n_tags, n_subsets, elapsed, n_tags / elapsed)
+
+    tempdir = tempfile.mkdtemp()
+    outbase = os.path.join(tempdir, 'bench')
+    try:
+        n_threads = 1
+        while n_threads <= max_threads:
+            start = time.time()
+            ht.partition_all(outbase, n_threads=n_threads,
+                             subset_size=subset_size, break_on_stop_tags=True,
+                             callback=None)
+            elapsed = time.time() - start
+
+            print 'partition_all, %d threads: %.2fs, %.0f tags/s' % \
+                  (n_threads, elapsed, n_tags / elapsed)
+
+            for filename in glob.glob(outbase + '.subset.*.pmap'):
+                os.unlink(filename)
+            n_threads *= 2
+    finally:
+        shutil.rmtree(tempdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+"""
+Benchmark sharded counting: load the reads into one counting hash, then
+into a ShardedCountingHash of 1, 2, 4... up to <n shards> worker
+processes, each with a table of <hashsize> / n_shards; then look up the
+median count of every read, in batches.
+
+% python sandbox/bench-sharded-counting.py <reads.fa> [ <hashsize> [ <n shards> ] ]
+
+Reports k-mers/second for each.
+"""
+import sys
+import time
+import screed
+import khmer
+from khmer.split import ShardedCountingHash
+
+K = 20
+N_HT = 4
+DEFAULT_HASHSIZE = 1e8
+BATCH_SIZE = 10000
+
+def bench(name, ht, filename, seqs):
+    sharded = isinstance(ht, ShardedCountingHash)
+
+    start = time.time()
+    if sharded:
+        n_reads, n_kmers = ht.consume_fasta(filename)
+    else:
+        n_reads, n_kmers = ht.consume_fasta(filename, callback=None)
+    t_consume = time.time() - start
+
+    start = time.time()
+    if sharded:
+        for i in range(0, len(seqs), BATCH_SIZE):
+            ht.get_median_counts(seqs[i:i + BATCH_SIZE])
+    else:
+        for seq in seqs:
+            ht.get_median_count(seq)
+    t_median = time.time() - start
+
+    print '%s\tconsume_fasta %.2fs, %.2f M k-mers/s\t' \
+          'median counts %.2fs, %.2f M k-mers/s' % \
+          (name, t_consume, n_kmers / t_consume / 1e6,
+           t_median, n_kmers / t_median / 1e6)
+
+def main():
+    filename = sys.argv[1]
+    hashsize = DEFAULT_HASHSIZE
+    if len(sys.argv) > 2:
+        hashsize = float(sys.argv[2])
+    max_shards = 4
+    if len(sys.argv) > 3:
+        max_shards = int(sys.argv[3])
+
+    seqs = [ record['sequence'] for record in screed.open(filename) ]
+    seqs = [ seq for seq in seqs if len(seq) >= K ]
+
+    ht = khmer.new_counting_hash(K, hashsize, N_HT)
+    bench('single table', ht, filename, seqs)
+    del ht
+
+    n_shards = 1
+    while n_shards <= max_shards:
+        ht = ShardedCountingHash(K, hashsize / n_shards, N_HT, n_shards)
+        try:
+            bench('%d shards' % n_shards, ht, filename, seqs)
+        finally:
+            ht.close()
+        n_shards *= 2
+
+if __name__ == '__main__':
+    main()
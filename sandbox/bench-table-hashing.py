@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+"""
+Benchmark the ways of picking table bins: classic (k-mer hash modulo a
+prime table size), fast_hash (per-table mix plus multiply-shift) and
+blocked, on consume_fasta and get_median_count.
+
+% python sandbox/bench-table-hashing.py <reads.fa> [ <hashsize> [ <n_ht> ] ]
+
+Reports k-mers/second for loading the reads into a counting hash, and
+for looking up the median count of every read; also the expected false
+positive rate of each table.
+"""
+import sys
+import time
+import screed
+import khmer
+
+K = 20
+DEFAULT_HASHSIZE = 1e8
+DEFAULT_N_HT = 4
+
+LAYOUTS = [ ('classic', dict()),
+            ('fast_hash', dict(fast_hash=True)),
+            ('blocked', dict(blocked=True)) ]
+
+def main():
+    filename = sys.argv[1]
+    hashsize = DEFAULT_HASHSIZE
+    if len(sys.argv) > 2:
+        hashsize = float(sys.argv[2])
+    n_ht = DEFAULT_N_HT
+    if len(sys.argv) > 3:
+        n_ht = int(sys.argv[3])
+
+    seqs = [ record['sequence'] for record in screed.open(filename) ]
+    seqs = [ seq for seq in seqs if len(seq) >= K ]
+
+    for name, options in LAYOUTS:
+        ht = khmer.new_counting_hash(K, hashsize, n_ht, **options)
+
+        start = time.time()
+        n_reads, n_kmers = ht.consume_fasta(filename)
+        t_consume = time.time() - start
+
+        start = time.time()
+        for seq in seqs:
+            ht.get_median_count(seq)
+        t_median = time.time() - start
+
+        fp = khmer.calc_expected_collisions(ht)
+        print '%s\tconsume_fasta %.2fs, %.2f M k-mers/s\t' \
+              'get_median_count %.2fs, %.2f M k-mers/s\tFP %.3g' % \
+              (name, t_consume, n_kmers / t_consume / 1e6,
+               t_median, n_kmers / t_median / 1e6, fp)
+
+if __name__ == '__main__':
+    main()
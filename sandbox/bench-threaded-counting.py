@@ -0,0 +1,50 @@
+#! /usr/bin/env python
+"""
+Benchmark concurrent consume_fasta into a single counting hash.
+
+% python sandbox/bench-threaded-counting.py <file1> [ <file2> ... ]
+
+Each input file is consumed by its own thread, for 1, 2, 4, ... threads,
+up to the number of files given; split your reads into as many files as
+you want threads.
+"""
+import sys
+import time
+import threading
+import khmer
+
+K = 20
+HASHTABLE_SIZE = int(1e8)
+N_HT = 4
+
+def consume_all(filenames):
+    ht = khmer.new_counting_hash(K, HASHTABLE_SIZE, N_HT)
+
+    threads = []
+    for filename in filenames:
+        t = threading.Thread(target=ht.consume_fasta, args=(filename,))
+        threads.append(t)
+
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.time() - start
+
+def main():
+    filenames = sys.argv[1:]
+
+    n_threads = 1
+    base = None
+    while n_threads <= len(filenames):
+        elapsed = consume_all(filenames[:n_threads])
+        if base is None:
+            base = elapsed
+
+        print '%d threads: %.2fs for %d files (%.2fx per-file speedup)' % \
+              (n_threads, elapsed, n_threads, base * n_threads / elapsed)
+        n_threads *= 2
+
+if __name__ == '__main__':
+    main()
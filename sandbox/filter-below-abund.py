@@ -1,9 +1,7 @@
-import sys, screed.fasta, os
+import sys, os
 import khmer
-from khmer.thread_utils import ThreadedSequenceProcessor, verbose_fasta_iter
 
 WORKER_THREADS=8
-GROUPSIZE=100
 
 CUTOFF=50
 
@@ -26,24 +24,9 @@ def main():
        print 'filtering', infile
        outfile = os.path.basename(infile) + '.below'
 
-       outfp = open(outfile, 'w')
-
-       def process_fn(record, ht=ht):
-          name = record['name']
-          seq = record['sequence']
-          if 'N' in seq:
-              return None, None
-
-          trim_seq, trim_at = ht.trim_below_abundance(seq, CUTOFF)
-
-          if trim_at >= K:
-              return name, trim_seq
-
-          return None, None
-
-       tsp = ThreadedSequenceProcessor(process_fn, WORKER_THREADS, GROUPSIZE)
-
-       tsp.start(verbose_fasta_iter(infile), outfp)
+       n_reads, n_kept = ht.filter_below_abund(infile, outfile, CUTOFF,
+                                               n_threads=WORKER_THREADS)
+       print 'kept %d of %d reads' % (n_kept, n_reads)
 
 if __name__ == '__main__':
     main()
@@ -2,17 +2,15 @@ import khmer
 import sys
 import screed
 import os.path
-from khmer.thread_utils import ThreadedSequenceProcessor, verbose_fasta_iter
 
 K = 32
 HASHTABLE_SIZE=int(4e9)
 THRESHOLD=500
 N_HT=4
-WORKER_THREADS=5
 
-###
-
-GROUPSIZE=100
+# k-mers to remember component sizes for; reads starting in a component
+# that's already been measured don't traverse it again.
+CACHE_SIZE=int(1e7)
 
 ###
 
@@ -29,7 +27,7 @@ def main():
     print 'HASHTABLE SIZE %g' % HASHTABLE_SIZE
     print 'N HASHTABLES %d' % N_HT
     print 'THRESHOLD', THRESHOLD
-    print 'N THREADS', WORKER_THREADS
+    print 'CACHE SIZE %g' % CACHE_SIZE
     print '--'
 
     print 'creating ht'
@@ -38,21 +36,17 @@ def main():
     total_reads, n_consumed = ht.consume_fasta(infile)
     outfp = open(outfile, 'w')
 
-    ###
-    
-    def process_fn(record, ht=ht):
-        kmer = record['sequence'][:K]
-        size = ht.calc_connected_graph_size(kmer, THRESHOLD)
-        if size >= THRESHOLD:
-            return record['name'], record['sequence']
-
-        return None, None
-
-    tsp = ThreadedSequenceProcessor(process_fn, WORKER_THREADS, GROUPSIZE)
+    print 'measuring graph sizes'
+    sizes = ht.calc_connected_graph_sizes(infile, THRESHOLD,
+                                          cache_size=CACHE_SIZE)
 
-    ###
+    n_kept = 0
+    for record, size in zip(screed.open(infile), sizes):
+        if size >= THRESHOLD:
+            print >>outfp, '>%s\n%s' % (record['name'], record['sequence'])
+            n_kept += 1
 
-    tsp.start(verbose_fasta_iter(infile), outfp)
+    print 'kept %d of %d reads' % (n_kept, len(sizes))
 
 if __name__ == '__main__':
     main()
@@ -2,7 +2,8 @@
 """
 Produce the k-mer abundance distribution for the given file.
 
-% python scripts/abundance-dist.py [ -z -s ] <htname> <data> <histout>
+% python scripts/abundance-dist.py [ -z -s -T <threads> ] <htname> <data> <histout>
+% python scripts/abundance-dist.py [ -z -s -T <threads> ] --approximate <htname> <histout>
 
 Use '-h' for parameter help.
 """
@@ -14,7 +15,9 @@ def main():
     parser = argparse.ArgumentParser(description="Output k-mer abundance distribution.")
     
     parser.add_argument('hashname')
-    parser.add_argument('datafile')
+    parser.add_argument('datafile', nargs='?',
+                        help='the reads to count k-mers from (not with '
+                        '--approximate)')
     parser.add_argument('histout')
 
     parser.add_argument('-z', '--no-zero', dest='output_zero', default=True,
@@ -23,18 +26,31 @@ def main():
     parser.add_argument('-s', '--squash', dest='squash_output', default=False,
                         action='store_true',
                         help='Overwrite output file if it exists')
+    parser.add_argument('--threads', '-T', type=int, dest='n_threads',
+                        default=1, help='number of threads to use')
+    parser.add_argument('--approximate', dest='approximate', default=False,
+                        action='store_true',
+                        help='Estimate the distribution from the counting '
+                        'table alone, without reading <data> (for all the '
+                        'k-mers counted into the table)')
 
     args = parser.parse_args()
+    if args.datafile is None and not args.approximate:
+        parser.error('datafile is required unless --approximate is given')
     hashfile = args.hashname
     datafile = args.datafile
     histout = args.histout
 
     print 'hashtable from', hashfile
-    ht = khmer.load_counting_hash(hashfile)
+    ht = khmer.load_counting_hash(hashfile, mmap=True)
 
     K = ht.ksize()
     sizes = ht.hashsizes()
-    tracking = khmer._new_hashbits(K, sizes)
+
+    if args.approximate and ht.is_conservative():
+        print >>sys.stderr, 'ERROR: --approximate does not work for ' \
+            'conservative-update tables; give a datafile instead.'
+        sys.exit(-1)
 
     print 'K:', K
     print 'HT sizes:', sizes
@@ -48,7 +64,14 @@ def main():
         print '** squashing existing file %s' % histout
 
     print 'preparing hist...'
-    z = ht.abundance_distribution(datafile, tracking)
+    if args.approximate:
+        z = ht.approx_abundance_distribution(n_threads=args.n_threads)
+    else:
+        # the tracking table's tables need distinct (prime) sizes; the
+        # counting table's may all be one size, with fast_hash or blocked.
+        tracking = khmer.new_hashbits(K, sizes[0], len(sizes))
+        z = ht.abundance_distribution(datafile, tracking,
+                                      n_threads=args.n_threads)
     total = sum(z)
 
     if 0 == total:
@@ -16,11 +16,15 @@ import sys, screed, os
 import khmer
 import argparse
 
+BATCH_SIZE = 10000
+
 ###
 
 def main():
     parser = argparse.ArgumentParser(description='Count k-mers summary stats for sequences')
 
+    parser.add_argument('--threads', '-T', type=int, dest='n_threads',
+                        default=1, help='number of threads to use')
     parser.add_argument('htfile')
     parser.add_argument('input')
     parser.add_argument('output')
@@ -32,20 +36,34 @@ def main():
     output_filename = args.output
     
     print 'loading counting hash from', htfile
-    ht = khmer.load_counting_hash(htfile)
+    ht = khmer.load_counting_hash(htfile, mmap=True)
     K = ht.ksize()
 
     print 'writing to', output_filename
     output = open(output_filename, 'w')
-    
+
+    def output_batch(names, seqs):
+        medians, averages, stddevs = ht.get_median_counts(seqs,
+                                                    n_threads=args.n_threads)
+        for i in range(len(seqs)):
+           print >>output, names[i], medians[i], averages[i], stddevs[i], \
+                 len(seqs[i])
+
+    names, seqs = [], []
     for record in screed.open(input_filename):
        seq = record.sequence.upper()
        if 'N' in seq:
            seq = seq.replace('N', 'G')
 
        if K <= len(seq):
-           a, b, c = ht.get_median_count(seq)
-           print >>output, record.name, a, b, c, len(seq)
+           names.append(record.name)
+           seqs.append(seq)
+
+           if len(seqs) == BATCH_SIZE:
+               output_batch(names, seqs)
+               names, seqs = [], []
+
+    output_batch(names, seqs)
 
 if __name__ == '__main__':
     main()
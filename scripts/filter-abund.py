@@ -7,9 +7,8 @@ hash table.  Output sequences will be placed in 'infile.abundfilt'.
 
 Use '-h' for parameter help.
 """
-import sys, screed.fasta, os
+import sys, os
 import khmer
-from khmer.thread_utils import ThreadedSequenceProcessor, verbose_loader
 
 from khmer.counting_args import build_counting_multifile_args
 
@@ -22,6 +21,9 @@ def main():
     parser.add_argument('--cutoff', '-C', dest='cutoff',
                         default=DEFAULT_CUTOFF, type=int,
                         help="Trim at k-mers below this abundance.")
+    parser.add_argument('--threads', '-T', type=int, dest='n_threads',
+                        default=1,
+                        help='number of threads to trim reads on')
     args = parser.parse_args()
 
     counting_ht = args.input_table
@@ -30,35 +32,20 @@ def main():
     print 'file with ht: %s' % counting_ht
 
     print 'loading hashtable'
-    ht = khmer.load_counting_hash(counting_ht)
+    ht = khmer.load_counting_hash(counting_ht, mmap=True)
     K = ht.ksize()
 
     print "K:", K
 
-    ### the filtering function.
-    def process_fn(record):
-        name = record['name']
-        seq = record['sequence']
-        if 'N' in seq:
-            return None, None
-
-        trim_seq, trim_at = ht.trim_on_abundance(seq, args.cutoff)
-
-        if trim_at >= K:
-            return name, trim_seq
-
-        return None, None
-
-
     ### the filtering loop
     for infile in infiles:
        print 'filtering', infile
        outfile = os.path.basename(infile) + '.abundfilt'
-       outfp = open(outfile, 'w')
 
-       tsp = ThreadedSequenceProcessor(process_fn)
-       tsp.start(verbose_loader(infile), outfp)
+       n_reads, n_kept = ht.filter_abund(infile, outfile, args.cutoff,
+                                         n_threads=args.n_threads)
 
+       print 'kept %d of %d reads' % (n_kept, n_reads)
        print 'output in', outfile
 
 if __name__ == '__main__':
@@ -15,7 +15,8 @@ import os.path
 
 import sys, screed
 import khmer
-from khmer.hashbits_args import build_construct_args, DEFAULT_MIN_HASHSIZE
+from khmer.hashbits_args import build_construct_args, DEFAULT_MIN_HASHSIZE, \
+     set_table_sizes
 
 def main():
     parser = build_construct_args()
@@ -26,15 +27,18 @@ def main():
     parser.add_argument('input_filenames', nargs='+')
 
     args = parser.parse_args()
+    set_table_sizes(args, args.input_filenames)
 
     if not args.quiet:
-        if args.min_hashsize == DEFAULT_MIN_HASHSIZE:
+        if args.min_hashsize == DEFAULT_MIN_HASHSIZE and not args.max_memory:
             print>>sys.stderr, "** WARNING: hashsize is default!  You absodefly want to increase this!\n** Please read the docs!"
 
         print>>sys.stderr, '\nPARAMETERS:'
         print>>sys.stderr, ' - kmer size =    %d \t\t(-k)' % args.ksize
         print>>sys.stderr, ' - n hashes =     %d \t\t(-N)' % args.n_hashes
         print>>sys.stderr, ' - min hashsize = %-5.2g \t(-x)' % args.min_hashsize
+        print>>sys.stderr, ' - blocked =      %s \t\t(--blocked)' % args.blocked
+        print>>sys.stderr, ' - fast hash =    %s \t\t(--fast-hash)' % args.fast_hash
         print>>sys.stderr, ''
         print>>sys.stderr, 'Estimated memory usage is %.2g bytes (n_hashes x min_hashsize / 8)' % (args.n_hashes * args.min_hashsize / 8.)
         print>>sys.stderr, '-'*8
@@ -56,7 +60,7 @@ def main():
     ###
     
     print 'making hashtable'
-    ht = khmer.new_hashbits(K, HT_SIZE, N_HT)
+    ht = khmer.new_hashbits(K, HT_SIZE, N_HT, args.blocked, args.fast_hash)
 
     for n, filename in enumerate(filenames):
        print 'consuming input', filename
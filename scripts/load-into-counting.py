@@ -11,27 +11,38 @@ Use '-h' for parameter help.
 
 import sys, screed
 import khmer
-from khmer.counting_args import build_construct_args, DEFAULT_MIN_HASHSIZE
+from khmer.counting_args import build_construct_args, DEFAULT_MIN_HASHSIZE, \
+     set_table_sizes
 
 ###
 
 def main():
     parser = build_construct_args()
+    parser.add_argument('--threads', '-T', type=int, dest='n_threads',
+                        default=1,
+                        help='number of threads to hash reads on (and to '
+                        'compress the table on, if saving to .gz)')
     parser.add_argument('output_filename')
     parser.add_argument('input_filenames', nargs='+')
 
     args = parser.parse_args()
+    set_table_sizes(args, args.input_filenames, n_threads=args.n_threads)
 
     if not args.quiet:
-        if args.min_hashsize == DEFAULT_MIN_HASHSIZE:
+        if args.min_hashsize == DEFAULT_MIN_HASHSIZE and not args.max_memory:
             print>>sys.stderr, "** WARNING: hashsize is default!  You absodefly want to increase this!\n** Please read the docs!"
 
         print>>sys.stderr, '\nPARAMETERS:'
         print>>sys.stderr, ' - kmer size =    %d \t\t(-k)' % args.ksize
         print>>sys.stderr, ' - n hashes =     %d \t\t(-N)' % args.n_hashes
         print>>sys.stderr, ' - min hashsize = %-5.2g \t(-x)' % args.min_hashsize
+        print>>sys.stderr, ' - counter bits = %d \t\t(-b)' % args.counter_bits
+        print>>sys.stderr, ' - blocked =      %s \t\t(--blocked)' % args.blocked
+        print>>sys.stderr, ' - fast hash =    %s \t\t(--fast-hash)' % args.fast_hash
+        print>>sys.stderr, ' - conservative = %s \t\t(--conservative)' % args.conservative
+        print>>sys.stderr, ' - n threads =    %d \t\t(-T)' % args.n_threads
         print>>sys.stderr, ''
-        print>>sys.stderr, 'Estimated memory usage is %.2g bytes (n_hashes x min_hashsize)' % (args.n_hashes * args.min_hashsize)
+        print>>sys.stderr, 'Estimated memory usage is %.2g bytes (n_hashes x min_hashsize x counter_bits / 8)' % (args.n_hashes * args.min_hashsize * args.counter_bits / 8)
         print>>sys.stderr, '-'*8
 
 
@@ -48,20 +59,22 @@ def main():
     ###
     
     print 'making hashtable'
-    ht = khmer.new_counting_hash(K, HT_SIZE, N_HT)
+    ht = khmer.new_counting_hash(K, HT_SIZE, N_HT, args.counter_bits,
+                                 args.blocked, args.fast_hash,
+                                 args.conservative)
     ht.set_use_bigcount(True)
 
     for n, filename in enumerate(filenames):
        print 'consuming input', filename
-       ht.consume_fasta(filename)
+       ht.consume_fasta(filename, n_threads=args.n_threads)
 
        if n > 0 and n % 10 == 0:
            print 'mid-save', base
-           ht.save(base)
+           ht.save(base, args.n_threads)
            open(base + '.info', 'w').write('through %s' % filename)
 
     print 'saving', base
-    ht.save(base)
+    ht.save(base, args.n_threads)
 
     info_fp = open(base + '.info', 'w')
     info_fp.write('through end: %s\n' % filename)
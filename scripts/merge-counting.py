@@ -0,0 +1,50 @@
+#! /usr/bin/env python
+"""
+Add up counting hashes built with the same parameters (e.g. by
+load-into-counting.py on different input files), and save the total in
+<output.kh>.
+
+% python scripts/merge-counting.py [ -T <threads> ] <output.kh> <input1.kh> <input2.kh> ...
+
+The first input is loaded into memory; the rest are mapped from disk (if
+they aren't gzipped) and added to it one at a time, so only two tables
+are ever open at once.
+
+Use '-h' for parameter help.
+"""
+import sys
+import argparse
+import khmer
+
+def main():
+    parser = argparse.ArgumentParser(description="Add up counting hashes.")
+    parser.add_argument('--threads', '-T', type=int, dest='n_threads',
+                        default=1, help='number of threads to add tables on')
+    parser.add_argument('output_filename')
+    parser.add_argument('input_filenames', nargs='+')
+
+    args = parser.parse_args()
+
+    print 'loading', args.input_filenames[0]
+    ht = khmer.load_counting_hash(args.input_filenames[0])
+
+    for filename in args.input_filenames[1:]:
+        print 'adding', filename
+        other = khmer.load_counting_hash(filename, mmap=True)
+        try:
+            ht.add(other, n_threads=args.n_threads)
+        except ValueError, e:
+            print >>sys.stderr, 'ERROR: %s: %s' % (filename, e)
+            sys.exit(-1)
+        del other
+
+    print 'saving', args.output_filename
+    ht.save(args.output_filename)
+
+    fp_rate = khmer.calc_expected_collisions(ht)
+    print 'fp rate estimated to be %1.3f' % fp_rate
+
+    print 'DONE.'
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#! /usr/bin/env python
+"""
+Merge presence tables (.ht files, e.g. from load-graph.py) built with the
+same parameters, and save the result in <output.ht>: the union of their
+k-mers, or with --intersect, only the k-mers in all of them.
+
+% python scripts/merge-presence.py [ --intersect ] [ -T <threads> ] <output.ht> <input1.ht> <input2.ht> ...
+
+Use '-h' for parameter help.
+"""
+import sys
+import argparse
+import khmer
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge presence tables.")
+    parser.add_argument('--intersect', dest='intersect', default=False,
+                        action='store_true',
+                        help='keep only k-mers present in every table')
+    parser.add_argument('--threads', '-T', type=int, dest='n_threads',
+                        default=1, help='number of threads to merge tables on')
+    parser.add_argument('output_filename')
+    parser.add_argument('input_filenames', nargs='+')
+
+    args = parser.parse_args()
+
+    print 'loading', args.input_filenames[0]
+    ht = khmer.load_hashbits(args.input_filenames[0])
+
+    for filename in args.input_filenames[1:]:
+        print 'merging', filename
+        other = khmer.load_hashbits(filename, mmap=True)
+        try:
+            if args.intersect:
+                ht.intersection_update(other, n_threads=args.n_threads)
+            else:
+                ht.update(other, n_threads=args.n_threads)
+        except ValueError, e:
+            print >>sys.stderr, 'ERROR: %s: %s' % (filename, e)
+            sys.exit(-1)
+        del other
+
+    print 'saving', args.output_filename
+    ht.save(args.output_filename)
+
+    print 'about %d unique k-mers' % ht.n_unique_kmers()
+    print 'DONE.'
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,8 @@ Use '-h' for parameter help.
 
 import sys, screed, os
 import khmer
-from khmer.counting_args import build_construct_args, DEFAULT_MIN_HASHSIZE
+from khmer.counting_args import build_construct_args, DEFAULT_MIN_HASHSIZE, \
+     set_table_sizes
 
 DEFAULT_DESIRED_COVERAGE=5
 
@@ -24,17 +25,23 @@ def main():
     parser.add_argument('input_filenames', nargs='+')
 
     args = parser.parse_args()
+    if not args.loadhash:
+        set_table_sizes(args, args.input_filenames)
 
     if not args.quiet:
-        if args.min_hashsize == DEFAULT_MIN_HASHSIZE:
+        if args.min_hashsize == DEFAULT_MIN_HASHSIZE and not args.max_memory:
             print>>sys.stderr, "** WARNING: hashsize is default!  You absodefly want to increase this!\n** Please read the docs!"
 
         print>>sys.stderr, '\nPARAMETERS:'
         print>>sys.stderr, ' - kmer size =    %d \t\t(-k)' % args.ksize
         print>>sys.stderr, ' - n hashes =     %d \t\t(-N)' % args.n_hashes
         print>>sys.stderr, ' - min hashsize = %-5.2g \t(-x)' % args.min_hashsize
+        print>>sys.stderr, ' - counter bits = %d \t\t(-b)' % args.counter_bits
+        print>>sys.stderr, ' - blocked =      %s \t\t(--blocked)' % args.blocked
+        print>>sys.stderr, ' - fast hash =    %s \t\t(--fast-hash)' % args.fast_hash
+        print>>sys.stderr, ' - conservative = %s \t\t(--conservative)' % args.conservative
         print>>sys.stderr, ''
-        print>>sys.stderr, 'Estimated memory usage is %.2g bytes (n_hashes x min_hashsize)' % (args.n_hashes * args.min_hashsize)
+        print>>sys.stderr, 'Estimated memory usage is %.2g bytes (n_hashes x min_hashsize x counter_bits / 8)' % (args.n_hashes * args.min_hashsize * args.counter_bits / 8)
         print>>sys.stderr, '-'*8
 
     K=args.ksize
@@ -49,7 +56,9 @@ def main():
         ht = khmer.load_counting_hash(args.loadhash)
     else:
         print 'making hashtable'
-        ht = khmer.new_counting_hash(K, HT_SIZE, N_HT)
+        ht = khmer.new_counting_hash(K, HT_SIZE, N_HT, args.counter_bits,
+                                     args.blocked, args.fast_hash,
+                                     args.conservative)
 
     total = 0
     discarded = 0
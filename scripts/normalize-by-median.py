@@ -8,26 +8,14 @@ DESIRED_COVERAGE.  Output sequences will be placed in 'infile.keep'.
 Use '-h' for parameter help.
 """
 
-import sys, screed, os
+import sys, os
 import khmer
-from itertools import izip
-from khmer.counting_args import build_construct_args, DEFAULT_MIN_HASHSIZE
+from khmer.counting_args import build_construct_args, DEFAULT_MIN_HASHSIZE, \
+     set_table_sizes
 import argparse
 
 DEFAULT_DESIRED_COVERAGE=5
 
-# Iterate a collection in arbitrary batches
-# from: http://stackoverflow.com/questions/4628290/pairs-from-single-list
-def batchwise(t, size):
-    it = iter(t)
-    return izip(*[it]*size)
-
-# Returns true if the pair of records are properly pairs
-def validpair(r0, r1):
-    return r0.name[-1] == "1" and \
-           r1.name[-1] == "2" and \
-           r0.name[0:-1] == r1.name[0:-1]
-
 def main():
     parser = build_construct_args()
     parser.add_argument('-C', '--cutoff', type=int, dest='cutoff',
@@ -41,18 +29,24 @@ def main():
     parser.add_argument('input_filenames', nargs='+')
 
     args = parser.parse_args()
+    if not args.loadhash:
+        set_table_sizes(args, args.input_filenames)
 
     if not args.quiet:
-        if args.min_hashsize == DEFAULT_MIN_HASHSIZE:
+        if args.min_hashsize == DEFAULT_MIN_HASHSIZE and not args.max_memory:
             print>>sys.stderr, "** WARNING: hashsize is default!  You absodefly want to increase this!\n** Please read the docs!"
 
         print>>sys.stderr, '\nPARAMETERS:'
         print>>sys.stderr, ' - kmer size =    %d \t\t(-k)' % args.ksize
         print>>sys.stderr, ' - n hashes =     %d \t\t(-N)' % args.n_hashes
         print>>sys.stderr, ' - min hashsize = %-5.2g \t(-x)' % args.min_hashsize
+        print>>sys.stderr, ' - counter bits = %d \t\t(-b)' % args.counter_bits
+        print>>sys.stderr, ' - blocked =      %s \t\t(--blocked)' % args.blocked
+        print>>sys.stderr, ' - fast hash =    %s \t\t(--fast-hash)' % args.fast_hash
+        print>>sys.stderr, ' - conservative = %s \t\t(--conservative)' % args.conservative
         print>>sys.stderr, ' - paired =	      %s \t\t(-p)' % args.paired
         print>>sys.stderr, ''
-        print>>sys.stderr, 'Estimated memory usage is %.2g bytes (n_hashes x min_hashsize)' % (args.n_hashes * args.min_hashsize)
+        print>>sys.stderr, 'Estimated memory usage is %.2g bytes (n_hashes x min_hashsize x counter_bits / 8)' % (args.n_hashes * args.min_hashsize * args.counter_bits / 8)
         print>>sys.stderr, '-'*8
 
     K=args.ksize
@@ -62,78 +56,56 @@ def main():
     report_fp = args.report_file
     filenames = args.input_filenames
 
-    # In paired mode we read two records at a time
-    batch_size = 1
-    if args.paired:
-        batch_size = 2
-
     if args.loadhash:
         print 'loading hashtable from', args.loadhash
         ht = khmer.load_counting_hash(args.loadhash)
     else:
         print 'making hashtable'
-        ht = khmer.new_counting_hash(K, HT_SIZE, N_HT)
+        ht = khmer.new_counting_hash(K, HT_SIZE, N_HT, args.counter_bits,
+                                     args.blocked, args.fast_hash,
+                                     args.conservative)
 
     total = 0
     discarded = 0
 
     for input_filename in filenames:
         output_name = os.path.basename(input_filename) + '.keep'
-        outfp = open(output_name, 'w')
-
-	n = -1
-        for n, batch in enumerate(batchwise(screed.open(input_filename), batch_size)):
-            if n > 0 and n % 100000 == 0:
-                print '... kept', total - discarded, 'of', total, ', or', \
-                    int(100. - discarded / float(total) * 100.), '%'
-                print '... in file', input_filename
-
-                if report_fp:
-                    print>>report_fp, total, total - discarded, \
-                        1. - (discarded / float(total))
-                    report_fp.flush()
-
-            total += batch_size
-
-            # If in paired mode, check that the reads are properly interleaved
-            if args.paired:
-                if not validpair(batch[0], batch[1]):
-                    print >>sys.stderr, 'Error: Improperly interleaved pairs %s %s' % (batch[0].name, batch[1].name)
-                    sys.exit(-1)
-
-            # Emit the batch of reads if any read passes the filter
-            # and all reads are longer than K
-            passed_filter = False
-            passed_length = True
-            for record in batch:
-                if len(record.sequence) < K:
-                    passed_length = False
-                    continue
-
-                seq = record.sequence.replace('N', 'A')
-                med, _, _ = ht.get_median_count(seq)
-
-                if med < DESIRED_COVERAGE:
-                    ht.consume(seq)
-                    passed_filter = True
-            
-            # Emit records if any passed
-            if passed_length and passed_filter:
-                for record in batch:
-                    if hasattr(record,'accuracy'):
-                        outfp.write('@%s\n%s\n+\n%s\n' % (record.name, 
-                                                          record.sequence, 
-                                                          record.accuracy))
-                    else:
-                        outfp.write('>%s\n%s\n' % (record.name, record.sequence))
-            else:
-                discarded += batch_size
-
-	if -1 < n:
-	    print 'DONE with', input_filename, '; kept', total - discarded, 'of',\
-		total, 'or', int(100. - discarded / float(total) * 100.), '%'
-	    print 'output in', output_name
-	else: print 'SKIPPED empty file', input_filename
+
+        # the C++ side reads, filters, and writes the file in one go, and
+        # calls back every 100,000 reads (or pairs) with its running totals.
+        def report(info, n_reads, n_kept):
+            file_total = total + n_reads
+            file_discarded = discarded + n_reads - n_kept
+            print '... kept', file_total - file_discarded, 'of', \
+                file_total, ', or', \
+                int(100. - file_discarded / float(file_total) * 100.), '%'
+            print '... in file', input_filename
+
+            if report_fp:
+                print>>report_fp, file_total, file_total - file_discarded, \
+                    1. - (file_discarded / float(file_total))
+                report_fp.flush()
+
+        try:
+            n_reads, n_kept = ht.normalize_by_median(input_filename,
+                                                     output_name,
+                                                     DESIRED_COVERAGE,
+                                                     paired=args.paired,
+                                                     callback=report)
+        except ValueError, e:
+            print >>sys.stderr, 'Error:', e
+            sys.exit(-1)
+
+        total += n_reads
+        discarded += n_reads - n_kept
+
+        if n_reads:
+            print 'DONE with', input_filename, '; kept', total - discarded, \
+                'of', total, 'or', \
+                int(100. - discarded / float(total) * 100.), '%'
+            print 'output in', output_name
+        else:
+            print 'SKIPPED empty file', input_filename
 
     if args.savehash:
         print 'Saving hashfile through', input_filename
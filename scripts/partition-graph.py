@@ -10,9 +10,6 @@ Use '-h' for parameter help.
 """
 
 import sys
-import threading
-import Queue
-import gc
 import os.path
 import argparse
 
@@ -34,29 +31,8 @@ DEFAULT_N_THREADS = 4
 
 ###
 
-def worker(q, basename, stop_big_traversals):
-    while 1:
-        try:
-            (ht, n, start, stop) = q.get(False)
-        except Queue.Empty:
-            print 'exiting'
-            return
-
-        outfile = basename + '.subset.%d.pmap' % (n,)
-        if os.path.exists(outfile):
-            print 'SKIPPING', outfile, ' -- already exists'
-            continue
-        
-        print 'starting:', basename, n
-
-        # pay attention to stoptags when partitioning; take command line
-        # direction on whether or not to exhaustively traverse.
-        subset = ht.do_subset_partition(start, stop, True, stop_big_traversals)
-
-        print 'saving:', basename, n
-        ht.save_subset_partitionmap(subset, outfile)
-        del subset
-        gc.collect()
+def report_progress(info, n_done, n_subsets):
+    print '... %d of %d subsets done' % (n_done, n_subsets)
 
 def main():
     parser = argparse.ArgumentParser(description="Partition a graph.")
@@ -73,7 +49,7 @@ def main():
                         help='Truncate graph joins at big traversals')
 
     parser.add_argument('--threads', '-T', dest='n_threads',
-                        default=DEFAULT_N_THREADS,
+                        default=DEFAULT_N_THREADS, type=int,
                         help='Number of simultaneous threads to execute')
 
     args = parser.parse_args()
@@ -110,42 +86,31 @@ def main():
     #
 
     # divide the tags up into subsets
-    divvy = ht.divide_tags_into_subsets(int(args.subset_size))
-    n_subsets = len(divvy)
-    divvy.append(0)
-
-    # build a queue of tasks:
-    worker_q = Queue.Queue()
+    n_subsets = len(ht.divide_tags_into_subsets(int(args.subset_size)))
 
-    # break up the subsets into a list of worker tasks
-    for i in range(0, n_subsets):
-        start = divvy[i]
-        end = divvy[i+1]
-        worker_q.put((ht, i, start, end))
-
-    print 'enqueued %d subset tasks' % n_subsets
+    print 'partitioning %d subsets' % n_subsets
     open('%s.info' % basename, 'w').write('%d subsets total\n' % (n_subsets))
 
+    for n in range(n_subsets):
+        outfile = basename + '.subset.%d.pmap' % (n,)
+        if os.path.exists(outfile):
+            print 'SKIPPING', outfile, ' -- already exists'
+
     n_threads = int(args.n_threads)
     if n_subsets < n_threads:
         n_threads = n_subsets
 
-    # start threads!
+    # partition on a pool of native threads; pay attention to stoptags,
+    # and take command line direction on whether or not to exhaustively
+    # traverse.
     print 'starting %d threads' % n_threads
     print '---'
 
-    threads = []
-    for n in range(n_threads):
-        t = threading.Thread(target=worker, args=(worker_q, basename,
-                                                  stop_big_traversals))
-        threads.append(t)
-        t.start()
-
-    print 'done starting threads'
-
-    # wait for threads
-    for t in threads:
-        t.join()
+    ht.partition_all(basename, n_threads=max(n_threads, 1),
+                     subset_size=int(args.subset_size),
+                     break_on_stop_tags=True,
+                     stop_big_traversals=stop_big_traversals,
+                     callback=report_progress)
 
     print '---'
     print 'done making subsets! see %s.subset.*.pmap' % (basename,)
@@ -2,6 +2,7 @@ import os
 import gzip
 
 import khmer
+import screed
 import khmer_tst_utils as utils
 
 MAX_COUNT=255
@@ -325,6 +326,85 @@ def test_save_load_gz():
     assert sum(x) == 3966, sum(x)
     assert x == y, (x,y)
 
+def test_save_load_gz_chunked():
+    # a .gz table is written in independently compressed chunks, on
+    # several threads; it's still an ordinary .gz file.
+    inpath = utils.get_test_data('random-20-a.fa')
+    savepath = utils.get_temp_filename('tempcountingsave3.ht')
+    gzpath = utils.get_temp_filename('tempcountingsave3.ht.gz')
+
+    hi = khmer.new_counting_hash(12, 3e6, 3)	# spans several chunks
+    hi.set_use_bigcount(True)
+    hi.consume_fasta(inpath)
+    for i in range(300):
+        hi.count(DNA[:12])
+    hi.save(savepath)
+    hi.save(gzpath, 3)
+
+    assert gzip.open(gzpath).read() == open(savepath, 'rb').read()
+
+    for n_threads in (1, 3):
+        ht = khmer.load_counting_hash(gzpath, n_threads=n_threads)
+        assert ht.hashsizes() == hi.hashsizes()
+        for i in range(len(DNA) - 12 + 1):
+            assert ht.get(DNA[i:i + 12]) == hi.get(DNA[i:i + 12])
+        assert ht.get(DNA[:12]) == hi.get(DNA[:12]) >= 300
+
+        ht.save(savepath)
+        assert gzip.open(gzpath).read() == open(savepath, 'rb').read()
+
+def test_save_load_sparse():
+    # mostly empty tables are saved in a sparse encoding.
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    for blocked in (False, True):
+        for ext in ('.ht', '.ht.gz'):
+            sparsepath = utils.get_temp_filename('tempsparse' + ext)
+            densepath = utils.get_temp_filename('tempdense' + ext)
+
+            hi = khmer.new_counting_hash(12, 1e6, 3, blocked=blocked)
+            hi.set_use_bigcount(True)
+            hi.consume_fasta(inpath)
+            for i in range(300):
+                hi.count(DNA[:12])
+            hi.save(sparsepath)
+            hi.save(densepath, sparse=False)
+            assert os.path.getsize(sparsepath) < \
+                   os.path.getsize(densepath) / 10 or ext == '.ht.gz'
+
+            ht = khmer._new_counting_hash(1, [1])
+            assert not ht.load_mmap(sparsepath)
+
+            ht = khmer.load_counting_hash(sparsepath, mmap=True)
+            assert ht.hashsizes() == hi.hashsizes()
+            assert ht.is_blocked() == blocked
+            assert ht.get(DNA[:12]) == hi.get(DNA[:12]) >= 300
+
+            tracking = khmer._new_hashbits(12, [1000003])
+            x = hi.abundance_distribution(inpath, tracking)
+            tracking = khmer._new_hashbits(12, [1000003])
+            y = ht.abundance_distribution(inpath, tracking)
+            assert x == y
+
+            # and saved again, the same way.
+            ht.save(densepath)
+            assert open(densepath, 'rb').read() == \
+                   open(sparsepath, 'rb').read()
+
+def test_save_full_is_dense():
+    savepath = utils.get_temp_filename('tempfull.ht')
+    densepath = utils.get_temp_filename('tempfull_dense.ht')
+
+    hi = khmer.new_counting_hash(4, 256, 2)
+    hi.consume('ACGT' * 100 + DNA)
+    hi.save(savepath)
+    hi.save(densepath, sparse=False)
+    assert open(densepath, 'rb').read() == open(savepath, 'rb').read()
+
+    ht = khmer._new_counting_hash(1, [1])
+    assert ht.load_mmap(savepath)
+    assert ht.get('ACGT') == hi.get('ACGT')
+
 def test_trim_full():
     hi = khmer.new_counting_hash(6, 1e6, 2)
 
@@ -344,7 +424,33 @@ def test_trim_short():
     assert DNA[:50] == seq, (seq, pos)
     assert hi.get(seq[-6:]) == 2
     assert hi.get(DNA[:51][-6:]) == 1
-    
+
+def _trim_reference(ht, seq, K, is_bad):
+    # the k-mer at a time loop that trim_on/below_abundance batch up.
+    counts = [ ht.get(seq[i:i + K]) for i in range(len(seq) - K + 1) ]
+    if len(counts) < 2 or is_bad(counts[0]):
+        return 0
+    for i in range(1, len(counts)):
+        if is_bad(counts[i]):
+            return K + i - 1
+    return len(seq)
+
+def test_trim_every_position():
+    # k-mers are looked up in batches; trimming must stop at the right
+    # k-mer wherever it falls in a batch.
+    K = 6
+    for cut in range(K, len(DNA) + 1):
+        hi = khmer.new_counting_hash(K, 1e6, 2)
+        hi.consume(DNA)
+        hi.consume(DNA[:cut])
+
+        seq, pos = hi.trim_on_abundance(DNA, 2)
+        assert pos == _trim_reference(hi, DNA, K, lambda c: c < 2), (cut, pos)
+        assert seq == DNA[:pos]
+
+        hi.consume(DNA[cut - K:])
+        seq, pos = hi.trim_below_abundance(DNA, 2)
+        assert pos == _trim_reference(hi, DNA, K, lambda c: c > 2), (cut, pos)
 
 def test_maxcount():
     # hashtable should saturate at some point so as not to overflow counter
@@ -497,3 +603,801 @@ def test_collect_high_abundance_kmers():
 
     kh = khmer.new_counting_hash(18, 1e6, 4)
     hb = kh.collect_high_abundance_kmers(seqpath, 2, 4)
+
+def test_threaded_consume():
+    import threading
+    
+    kh = khmer.new_counting_hash(6, 1e6, 2)
+    kh.set_use_bigcount(True)
+
+    def consume():
+        for i in range(100):
+            kh.consume(DNA)
+
+    threads = [ threading.Thread(target=consume) for i in range(4) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    serial = khmer.new_counting_hash(6, 1e6, 2)
+    serial.set_use_bigcount(True)
+    for i in range(400):
+        serial.consume(DNA)
+
+    for start in range(len(DNA) - 6 + 1):
+        kmer = DNA[start:start + 6]
+        assert kh.get(kmer) == serial.get(kmer), kmer
+    assert kh.get('AAAAAA') == 800, kh.get('AAAAAA') # twice in DNA
+
+def test_threaded_consume_narrow_counters():
+    # many threads counting one k-mer at once saturate its bins together;
+    # no count may be lost, however wide the counters.
+    import threading
+
+    readpath = utils.get_temp_filename('polyA.fa')
+    fp = open(readpath, 'w')
+    for i in range(500):
+        fp.write('>%d\n%s\n' % (i, 'A' * 50))
+    fp.close()
+
+    for counter_bits in (8, 4, 2):
+        kh = khmer.new_counting_hash(6, 1e6, 4, counter_bits)
+        kh.set_use_bigcount(True)
+
+        def consume():
+            for i in range(50):
+                kh.consume('A' * 105)
+
+        threads = [ threading.Thread(target=consume) for i in range(4) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert kh.get('AAAAAA') == 4 * 50 * 100, (counter_bits,
+                                                  kh.get('AAAAAA'))
+
+        kh = khmer.new_counting_hash(6, 1e6, 4, counter_bits)
+        kh.set_use_bigcount(True)
+        kh.consume_fasta(readpath, n_threads=4)
+
+        assert kh.get('AAAAAA') == 500 * 45, (counter_bits, kh.get('AAAAAA'))
+        assert kh.n_unique_kmers() == 1, kh.n_unique_kmers()
+
+def test_threaded_consume_fasta():
+    import threading
+    
+    seqpath = utils.get_test_data('test-abund-read-2.fa')
+
+    kh = khmer.new_counting_hash(18, 1e7, 4)
+    kh.set_use_bigcount(True)
+
+    threads = [ threading.Thread(target=kh.consume_fasta, args=(seqpath,))
+                for i in range(4) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert kh.get('GGTTGACGGGGCTCAGGG') == 4 * 1001
+
+def test_consume_fasta_n_threads():
+    seqpath = utils.get_test_data('random-20-a.fa')
+
+    serial = khmer.new_counting_hash(12, 1e6, 4)
+    serial_result = serial.consume_fasta(seqpath)
+
+    kh = khmer.new_counting_hash(12, 1e6, 4)
+    result = kh.consume_fasta(seqpath, n_threads=4)
+
+    assert result == serial_result, (result, serial_result)
+
+    tracking = khmer.new_hashbits(12, 1e6, 4)
+    x = serial.abundance_distribution(seqpath, tracking)
+    tracking = khmer.new_hashbits(12, 1e6, 4)
+    y = kh.abundance_distribution(seqpath, tracking)
+    assert x == y
+
+def test_abundance_distribution_n_threads():
+    seqpath = utils.get_test_data('random-20-a.fa')
+
+    for blocked in (False, True):
+        kh = khmer.new_counting_hash(12, 1e4, 4, blocked=blocked)
+        kh.consume_fasta(seqpath)
+
+        tracking = khmer.new_hashbits(12, 1e4, 4)
+        x = kh.abundance_distribution(seqpath, tracking)
+        for n_threads in (1, 4):
+            tracking = khmer.new_hashbits(12, 1e4, 4)
+            y = kh.abundance_distribution(seqpath, tracking,
+                                          n_threads=n_threads)
+            assert x == y, (blocked, n_threads)
+
+def test_approx_abundance_distribution():
+    seqpath = utils.get_test_data('random-20-a.fa')
+
+    for blocked in (False, True):
+        kh = khmer.new_counting_hash(12, 1e5, 4, blocked=blocked)
+        kh.consume_fasta(seqpath)
+
+        tracking = khmer.new_hashbits(12, 1e5, 4)
+        x = kh.abundance_distribution(seqpath, tracking)
+        for n_threads in (1, 4):
+            y = kh.approx_abundance_distribution(n_threads=n_threads)
+            assert abs(sum(y) - sum(x)) < 0.02 * sum(x), (sum(x), sum(y))
+            assert abs(y[1] - x[1]) < 0.02 * x[1], (x[1], y[1])
+
+def test_approx_abundance_distribution_bigcount():
+    kh = khmer.new_counting_hash(18, 1e7, 4)
+    kh.set_use_bigcount(True)
+
+    seqpath = utils.get_test_data('test-abund-read.fa')
+
+    kh.consume_fasta(seqpath)
+    for i in range(1000):
+        kh.count('GGTTGACGGGGCTCAGGG')
+
+    dist = kh.approx_abundance_distribution()
+    assert dist[1001] == 1
+    assert sum(dist[255:]) == 1
+
+def test_approx_abundance_distribution_conservative():
+    # conservative-update bins aren't sums of counts; no estimate.
+    kh = khmer.new_counting_hash(12, 1e5, 4, conservative=True)
+    kh.consume_fasta(utils.get_test_data('random-20-a.fa'))
+    try:
+        kh.approx_abundance_distribution()
+        assert 0, "should fail"
+    except ValueError:
+        pass
+
+def test_consume_fasta_n_threads_readmask():
+    seqpath = utils.get_test_data('random-20-a.fa')
+    readmask = khmer.new_readmask(1000)
+
+    kh = khmer.new_counting_hash(12, 1e6, 4)
+    try:
+        kh.consume_fasta(seqpath, 0, 0, readmask, n_threads=4)
+        assert 0, "should fail"
+    except ValueError:
+        pass
+
+def test_save_load_mmap():
+    inpath = utils.get_test_data('random-20-a.fa')
+    savepath = utils.get_temp_filename('tempcountingsave_mmap.ht')
+
+    hi = khmer.new_counting_hash(12, 1e6, 3)
+    hi.set_use_bigcount(True)
+    hi.consume_fasta(inpath)
+    for i in range(300):
+        hi.count('AAAAAAAAAAAA')
+    hi.save(savepath, sparse=False)	# mostly empty, but mappable
+
+    # tables are padded out to page boundaries; then comes the one bigcount.
+    assert os.path.getsize(savepath) % 4096 == 8 + (8 + 2)
+
+    ht = khmer.load_counting_hash(savepath, mmap=True)
+    assert ht.hashsizes() == hi.hashsizes()
+    assert ht.get('AAAAAAAAAAAA') == hi.get('AAAAAAAAAAAA') == 300
+
+    tracking = khmer._new_hashbits(12, [1000003])
+    x = hi.abundance_distribution(inpath, tracking)
+    tracking = khmer._new_hashbits(12, [1000003])
+    y = ht.abundance_distribution(inpath, tracking)
+    assert x == y
+
+    # writes go to a private copy, not the file.
+    ht.count('AAAAAAAAAAAC')
+    assert ht.get('AAAAAAAAAAAC') == hi.get('AAAAAAAAAAAC') + 1
+    assert khmer.load_counting_hash(savepath).get('AAAAAAAAAAAC') == \
+           hi.get('AAAAAAAAAAAC')
+
+def test_load_mmap_gz_falls_back():
+    savepath = utils.get_temp_filename('tempcountingsave_mmap.ht.gz')
+
+    hi = khmer.new_counting_hash(12, 1e6, 2)
+    hi.consume(DNA)
+    hi.save(savepath)
+
+    ht = khmer._new_counting_hash(1, [1])
+    assert not ht.load_mmap(savepath)
+
+    ht = khmer.load_counting_hash(savepath, mmap=True)
+    assert ht.get(DNA[:12]) == 1
+
+def test_load_mmap_truncated():
+    savepath = utils.get_temp_filename('tempcountingsave_mmap.ht')
+    truncpath = utils.get_temp_filename('tempcountingsave_trunc.ht')
+
+    for blocked in (False, True):
+        hi = khmer.new_counting_hash(12, 1e5, 2, blocked=blocked)
+        hi.consume(DNA)
+        hi.save(savepath, sparse=False)
+        data = open(savepath, 'rb').read()
+
+        for length in (20, len(data) / 2, len(data) - 8):
+            fp = open(truncpath, 'wb')
+            fp.write(data[:length])
+            fp.close()
+
+            ht = khmer._new_counting_hash(1, [1])
+            try:
+                ht.load_mmap(truncpath)
+                assert 0, "should fail"
+            except IOError:
+                pass
+
+def test_load_mmap_truncated_bigcounts():
+    import struct
+    savepath = utils.get_temp_filename('tempcountingsave_mmap.ht')
+    truncpath = utils.get_temp_filename('tempcountingsave_trunc.ht')
+
+    hi = khmer.new_counting_hash(12, 1e5, 2)
+    hi.set_use_bigcount(True)
+    for i in range(300):
+        hi.consume(DNA)
+    hi.save(savepath, sparse=False)
+    data = open(savepath, 'rb').read()
+
+    # the table ends on a page boundary; then come the bigcount records.
+    n_counts_at = len(data) - len(data) % 4096
+    n_counts, = struct.unpack('=Q', data[n_counts_at:n_counts_at + 8])
+    assert n_counts > 1
+
+    for bad in (data[:-1], data[:n_counts_at] + struct.pack('=Q', 2 ** 62) +
+                data[n_counts_at + 8:]):
+        fp = open(truncpath, 'wb')
+        fp.write(bad)
+        fp.close()
+
+        ht = khmer._new_counting_hash(1, [1])
+        try:
+            ht.load_mmap(truncpath)
+            assert 0, "should fail"
+        except IOError:
+            pass
+
+def test_load_version_3():
+    # the old format interleaved table sizes with the tables
+    import struct
+    savepath = utils.get_temp_filename('tempcountingsave_v3.ht')
+
+    tables = [ (7, [0, 1, 2, 3, 4, 5, 6]), (11, [0] * 10 + [9]) ]
+    fp = open(savepath, 'wb')
+    fp.write(struct.pack('=BBBIB', 3, 1, 0, 4, len(tables)))
+    for size, table in tables:
+        fp.write(struct.pack('=Q', size))
+        fp.write(''.join([ chr(x) for x in table ]))
+    fp.write(struct.pack('=Q', 0))
+    fp.close()
+
+    ht = khmer.load_counting_hash(savepath, mmap=True)
+    assert ht.ksize() == 4
+    assert ht.hashsizes() == [7, 11]
+
+def test_get_median_counts():
+    hi = khmer.new_counting_hash(6, 1e6, 2)
+
+    hi.consume("AAAAAA")
+    hi.consume("AAAAAT")
+    hi.consume("AAAAAT")
+
+    seqs = [ "AAAAAA", "AAAAAAT", DNA, "AAA" ]
+    medians, averages, stddevs = hi.get_median_counts(seqs)
+
+    assert len(medians) == len(averages) == len(stddevs) == 4
+    for i, seq in enumerate(seqs[:3]):
+        assert (medians[i], averages[i], stddevs[i]) == \
+               hi.get_median_count(seq), seq
+
+    # too short to have any k-mers
+    assert (medians[3], averages[3], stddevs[3]) == (0, 0.0, 0.0)
+
+def test_get_median_counts_packed_threads():
+    seqpath = utils.get_test_data('test-abund-read-2.fa')
+    
+    hi = khmer.new_counting_hash(18, 1e6, 2)
+    hi.set_use_bigcount(True)
+    hi.consume_fasta(seqpath)
+
+    seqs = [ DNA[i:i + 20] for i in range(len(DNA) - 20) ] + \
+           [ 'GGTTGACGGGGCTCAGGG' ]
+
+    a = hi.get_median_counts(seqs)
+    b = hi.get_median_counts("\n".join(seqs), n_threads=4)
+
+    assert list(a[0]) == list(b[0])
+    assert list(a[1]) == list(b[1])
+    assert list(a[2]) == list(b[2])
+    assert a[0][-1] == 1001
+
+def test_normalize_by_median_fq():
+    infile = utils.get_test_data('test-abund-read-2.fq')
+    outfile = utils.get_temp_filename('test.fq.keep')
+
+    hi = khmer.new_counting_hash(17, 1e6, 2)
+    n_reads, n_kept = hi.normalize_by_median(infile, outfile, 2)
+
+    assert n_reads == 1001, n_reads
+    assert n_kept == 2, n_kept
+
+    # records, qualities included, come through untouched.
+    lines = open(outfile).read().splitlines()
+    assert len(lines) == 8, lines
+    assert lines[0] == '@895:1:37:17593:9954/1', lines[0]
+    assert lines[1].startswith('GGTTGACGGGGCTCAGGGGG'), lines[1]
+    assert lines[3] == '#' * len(lines[1]), lines[3]
+    assert lines[4:6] == ['@seq', 'GGTTGACGGGGCTCAGGG'], lines[4:6]
+
+def test_normalize_by_median_impaired():
+    infile = utils.get_test_data('test-abund-read-impaired.fa')
+    outfile = utils.get_temp_filename('test.fa.keep')
+
+    hi = khmer.new_counting_hash(17, 1e6, 2)
+    try:
+        hi.normalize_by_median(infile, outfile, 1, paired=True)
+        assert 0, "should fail"
+    except ValueError:
+        pass
+
+def test_normalize_by_median_bad_outfile():
+    infile = utils.get_test_data('test-abund-read-2.fq')
+
+    hi = khmer.new_counting_hash(17, 1e6, 2)
+    try:
+        hi.normalize_by_median(infile, '/nonexistent/dir/out.fq', 2)
+        assert 0, "should fail"
+    except IOError:
+        pass
+
+def test_filter_abund_fq():
+    infile = utils.get_test_data('test-abund-read-2.fq')
+    outfile = utils.get_temp_filename('test.fq.abundfilt')
+
+    hi = khmer.new_counting_hash(17, 1e6, 2)
+    hi.consume_fasta(infile)
+    n_reads, n_kept = hi.filter_abund(infile, outfile, 2)
+
+    assert n_reads == 1001, n_reads
+    assert n_kept == 1001, n_kept
+
+    # the first read is trimmed, quality and all.
+    lines = open(outfile).read().splitlines()
+    assert len(lines) == 4 * 1001, len(lines)
+    assert lines[0:4] == ['@895:1:37:17593:9954/1', 'GGTTGACGGGGCTCAGGG',
+                          '+', '#' * 18], lines[0:4]
+    assert lines[4:6] == ['@seq', 'GGTTGACGGGGCTCAGGG'], lines[4:6]
+
+def test_filter_abund_bad_outfile():
+    infile = utils.get_test_data('test-abund-read-2.fq')
+
+    hi = khmer.new_counting_hash(17, 1e6, 2)
+    hi.consume_fasta(infile)
+    for n_threads in (1, 4):
+        try:
+            hi.filter_abund(infile, '/nonexistent/dir/out.fq', 0,
+                            n_threads=n_threads)
+            assert 0, "should fail"
+        except IOError:
+            pass
+
+def _make_numbered_reads(n_copies):
+    # enough copies of random-20-a.fa to fill several batches of reads.
+    records = list(screed.open(utils.get_test_data('random-20-a.fa')))
+    infile = utils.get_temp_filename('numbered.fa')
+    fp = open(infile, 'w')
+    for i in range(n_copies):
+        for j, record in enumerate(records):
+            fp.write('>%d-%d\n%s\n' % (i, j, record.sequence))
+    fp.close()
+
+    return infile
+
+def test_filter_abund_threads():
+    infile = _make_numbered_reads(50)
+
+    hi = khmer.new_counting_hash(20, 1e6, 2)
+    hi.consume_fasta(infile)
+
+    outfile1 = utils.get_temp_filename('out1.fa')
+    n_reads, n_kept = hi.filter_abund(infile, outfile1, 2)
+    assert n_reads == 4950, n_reads
+    assert n_kept == 4950, n_kept
+
+    outfile4 = utils.get_temp_filename('out4.fa')
+    n_reads, n_kept = hi.filter_abund(infile, outfile4, 2, n_threads=4)
+    assert n_reads == 4950, n_reads
+    assert n_kept == 4950, n_kept
+
+    # the reads come out in order, whatever the number of threads.
+    assert open(outfile1).read() == open(infile).read()
+    assert open(outfile4).read() == open(infile).read()
+
+def test_filter_below_abund():
+    infile = _make_numbered_reads(50)
+
+    hi = khmer.new_counting_hash(20, 1e6, 2)
+    hi.consume_fasta(infile)
+
+    # every k-mer has been seen 50 times.
+    outfile = utils.get_temp_filename('out.fa')
+    n_reads, n_kept = hi.filter_below_abund(infile, outfile, 10, n_threads=2)
+    assert n_reads == 4950, n_reads
+    assert n_kept == 0, n_kept
+    assert open(outfile).read() == ''
+
+    n_reads, n_kept = hi.filter_below_abund(infile, outfile, 50, n_threads=2)
+    assert n_kept == 4950, n_kept
+
+def test_counter_bits_maxcount():
+    for counter_bits, max_count in [ (8, 255), (4, 15), (2, 3) ]:
+        kh = khmer.new_counting_hash(4, 4**4, 4, counter_bits)
+        assert kh.counter_bits() == counter_bits
+        assert kh.counter_max() == max_count
+
+        for i in range(300):
+            kh.count('AAAA')
+        assert kh.get('AAAA') == max_count, (counter_bits, kh.get('AAAA'))
+
+        kh = khmer.new_counting_hash(4, 4**4, 4, counter_bits)
+        kh.set_use_bigcount(True)
+        for i in range(300):
+            kh.count('AAAA')
+        assert kh.get('AAAA') == 300, (counter_bits, kh.get('AAAA'))
+
+def test_counter_bits_packed():
+    # counters sharing a byte don't step on each other.
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    hi = khmer.new_counting_hash(12, 1e4, 2)
+    hi.consume_fasta(inpath)
+    for counter_bits in (4, 2):
+        ht = khmer.new_counting_hash(12, 1e4, 2, counter_bits)
+        ht.consume_fasta(inpath)
+        assert ht.n_occupied() == hi.n_occupied()
+
+        for i in range(len(DNA) - 12 + 1):
+            kmer = DNA[i:i + 12]
+            assert ht.get(kmer) == min(hi.get(kmer), ht.counter_max())
+
+def test_counter_bits_save_load():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    hi = khmer.new_counting_hash(12, 1e6, 3, 4)
+    hi.consume_fasta(inpath)
+    for i in range(20):
+        hi.count('AAAAAAAAAAAA')
+
+    for suffix in ('.ht', '.ht.gz'):
+        savepath = utils.get_temp_filename('tempcountingsave_4bit' + suffix)
+        hi.save(savepath)
+
+        for mmap in (False, True):
+            ht = khmer.load_counting_hash(savepath, mmap=mmap)
+            assert ht.counter_bits() == 4
+            assert ht.hashsizes() == hi.hashsizes()
+            assert ht.get('AAAAAAAAAAAA') == 15
+            for i in range(len(DNA) - 12 + 1):
+                assert ht.get(DNA[i:i + 12]) == hi.get(DNA[i:i + 12])
+
+def test_load_version_4():
+    # 8-bit counters, with no counter width in the header
+    import struct
+    savepath = utils.get_temp_filename('tempcountingsave_v4.ht')
+
+    fp = open(savepath, 'wb')
+    fp.write(struct.pack('=BBBIB', 4, 1, 0, 4, 1))
+    fp.write(struct.pack('=Q', 7))
+    fp.write('\0' * (4096 - fp.tell()))
+    fp.write(''.join([ chr(x) for x in [0, 1, 2, 3, 4, 5, 200] ]))
+    fp.write('\0' * (4096 - 7))
+    fp.write(struct.pack('=Q', 0))
+    fp.close()
+
+    for mmap in (False, True):
+        ht = khmer.load_counting_hash(savepath, mmap=mmap)
+        assert ht.counter_bits() == 8
+        assert ht.hashsizes() == [7]
+        assert ht.get(khmer.reverse_hash(6, 4)) == 200
+        assert ht.n_occupied() == 6
+
+def test_n_occupied():
+    # the occupancy kept as k-mers are counted matches a count of the bins.
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    for counter_bits in (8, 4, 2):
+        for blocked in (False, True):
+            for conservative in (False, True):
+                for n_threads in (1, 4):
+                    ht = khmer.new_counting_hash(12, 1e4, 3, counter_bits,
+                                                 blocked=blocked,
+                                                 conservative=conservative)
+                    ht.consume_fasta(inpath, n_threads=n_threads)
+
+                    size = ht.hashsizes()[0]
+                    assert ht.n_occupied() == ht.n_occupied(0, size)
+                    assert 3000 < ht.n_unique_kmers() <= 3966
+
+def test_save_load_occupancy():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    for blocked in (False, True):
+        hi = khmer.new_counting_hash(12, 1e5, 3, 4, blocked=blocked)
+        hi.consume_fasta(inpath)
+
+        for suffix in ('.ht', '.ht.gz'):
+            savepath = utils.get_temp_filename('tempcountingsave_occ' + suffix)
+            for sparse in (False, True):
+                hi.save(savepath, sparse=sparse)
+                for mmap in (False, True):
+                    ht = khmer.load_counting_hash(savepath, mmap=mmap)
+                    assert ht.n_occupied() == hi.n_occupied()
+                    assert ht.n_unique_kmers() == hi.n_unique_kmers()
+
+def test_add_occupancy():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    for blocked in (False, True):
+        a = khmer.new_counting_hash(12, 1e5, 3, blocked=blocked)
+        a.consume_fasta(inpath)
+        b = khmer.new_counting_hash(12, 1e5, 3, blocked=blocked)
+        b.consume('G' * 12 + DNA)
+        c = khmer.new_counting_hash(12, 1e5, 3, blocked=blocked)
+        c.consume_fasta(inpath)
+        c.consume('G' * 12 + DNA)
+
+        a.add(b)
+        size = a.hashsizes()[0]
+        assert a.n_occupied() == a.n_occupied(0, size) == c.n_occupied()
+        assert abs(a.n_unique_kmers() - c.n_unique_kmers()) < 40, \
+               (a.n_unique_kmers(), c.n_unique_kmers())
+
+def test_bad_counter_bits():
+    try:
+        khmer.new_counting_hash(12, 1e6, 2, 3)
+        assert 0, "should fail"
+    except ValueError:
+        pass
+
+def test_blocked():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    hi = khmer.new_counting_hash(12, 1e6, 4)
+    hi.consume_fasta(inpath)
+    for counter_bits in (8, 4):
+        ht = khmer.new_counting_hash(12, 1e6, 4, counter_bits, blocked=True)
+        assert ht.is_blocked()
+        ht.consume_fasta(inpath)
+
+        for i in range(len(DNA) - 12 + 1):
+            kmer = DNA[i:i + 12]
+            assert ht.get(kmer) == min(hi.get(kmer), ht.counter_max())
+
+    ht.set_use_bigcount(True)
+    for i in range(300):
+        ht.count('AAAAAAAAAAAA')
+    assert ht.get('AAAAAAAAAAAA') == 300
+
+    for suffix in ('.ht', '.ht.gz'):
+        savepath = utils.get_temp_filename('tempcountingsave_blocked' + suffix)
+        ht.save(savepath)
+
+        for mmap in (False, True):
+            kh = khmer.load_counting_hash(savepath, mmap=mmap)
+            assert kh.is_blocked()
+            assert kh.counter_bits() == 4
+            assert kh.hashsizes() == ht.hashsizes()
+            assert kh.n_occupied() == ht.n_occupied()
+            assert kh.get('AAAAAAAAAAAA') == 300
+            for i in range(len(DNA) - 12 + 1):
+                assert kh.get(DNA[i:i + 12]) == ht.get(DNA[i:i + 12])
+
+def test_blocked_expected_collisions():
+    # a blocked table's tables aren't independent; the estimate has to
+    # allow for that to match the false positive rate actually seen.
+    import random
+    rng = random.Random(1)
+
+    def random_dna(n):
+        return ''.join(rng.choice('ACGT') for i in range(n))
+
+    ht = khmer.new_counting_hash(20, 1e5, 4, blocked=True)
+    ht.consume(random_dna(20000 + 20 - 1))
+
+    n_fp = 0
+    for i in range(100000):
+        if ht.get(random_dna(20)):
+            n_fp += 1
+    fp_rate = n_fp / 100000.
+
+    expected = khmer.calc_expected_collisions(ht)
+    assert abs(expected - fp_rate) < 0.2 * fp_rate, (expected, fp_rate)
+
+def test_fast_hash():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    hi = khmer.new_counting_hash(12, 1e6, 4)
+    hi.consume_fasta(inpath)
+
+    ht = khmer.new_counting_hash(12, 1e6, 4, fast_hash=True)
+    assert ht.has_fast_hash()
+    ht.consume_fasta(inpath)
+    for i in range(len(DNA) - 12 + 1):
+        assert ht.get(DNA[i:i + 12]) == hi.get(DNA[i:i + 12])
+
+    for suffix in ('.ht', '.ht.gz'):
+        savepath = utils.get_temp_filename('tempcountingsave_fast' + suffix)
+        ht.save(savepath)
+
+        for mmap in (False, True):
+            kh = khmer.load_counting_hash(savepath, mmap=mmap)
+            assert kh.has_fast_hash() and not kh.is_blocked()
+            assert kh.hashsizes() == ht.hashsizes()
+            for i in range(len(DNA) - 12 + 1):
+                assert kh.get(DNA[i:i + 12]) == ht.get(DNA[i:i + 12])
+
+def test_conservative():
+    # in a crowded table, conservative update overcounts less than
+    # the usual update, and never undercounts.
+    inpath = utils.get_test_data('random-20-a.fa')
+    K = 12
+
+    seqs = [ r['sequence'] for r in screed.open(inpath) ]
+    true_counts = {}
+    for seq in seqs:
+        for i in range(len(seq) - K + 1):
+            kmer = seq[i:i + K]
+            true_counts[kmer] = true_counts.get(kmer, 0) + 1
+
+    hi = khmer.new_counting_hash(K, 4000, 2)
+    ht = khmer.new_counting_hash(K, 4000, 2, conservative=True)
+    assert ht.is_conservative() and not hi.is_conservative()
+    hi.consume_fasta(inpath)
+    ht.consume_fasta(inpath)
+
+    over_hi = over_ht = 0
+    for kmer, count in true_counts.items():
+        assert ht.get(kmer) >= count
+        assert ht.get(kmer) <= hi.get(kmer)
+        over_hi += hi.get(kmer) - count
+        over_ht += ht.get(kmer) - count
+    assert over_ht < over_hi / 2, (over_ht, over_hi)
+
+    # threads counting at once mustn't lose counts, either.
+    kh = khmer.new_counting_hash(K, 4000, 2, conservative=True)
+    kh.consume_fasta(inpath, n_threads=4)
+    for kmer, count in true_counts.items():
+        assert kh.get(kmer) >= count
+
+    savepath = utils.get_temp_filename('tempcountingsave_conservative.ht')
+    ht.save(savepath)
+    kh = khmer.load_counting_hash(savepath)
+    assert kh.is_conservative()
+    kh.consume(seqs[0])
+    ht.consume(seqs[0])
+    for kmer in true_counts:
+        assert kh.get(kmer) == ht.get(kmer)
+
+def test_conservative_bigcount():
+    kh = khmer.new_counting_hash(4, 4**4, 4, 4, conservative=True)
+    kh.set_use_bigcount(True)
+    for i in range(300):
+        kh.count('AAAA')
+    assert kh.get('AAAA') == 300
+
+def test_bigcount_save_load():
+    # lots of bigcounts, from 2-bit counters; they're saved in k-mer
+    # order, so the same counts make the same file.
+    inpath = utils.get_test_data('random-20-a.fa')
+    seqs = [ r['sequence'] for r in screed.open(inpath) ]
+
+    hi = khmer.new_counting_hash(12, 1e6, 2, 2)
+    hi.set_use_bigcount(True)
+    for i in range(5):
+        for seq in seqs:
+            hi.consume(seq)
+
+    hj = khmer.new_counting_hash(12, 1e6, 2, 2)
+    hj.set_use_bigcount(True)
+    for seq in reversed(seqs):
+        for i in range(5):
+            hj.consume(seq)
+
+    for suffix in ('.ht', '.ht.gz'):
+        path_i = utils.get_temp_filename('tempbigcount_i' + suffix)
+        path_j = utils.get_temp_filename('tempbigcount_j' + suffix)
+        hi.save(path_i)
+        hj.save(path_j)
+        if suffix == '.ht':
+            assert open(path_i, 'rb').read() == open(path_j, 'rb').read()
+
+        for mmap in (False, True):
+            kh = khmer.load_counting_hash(path_i, mmap=mmap)
+            for i in range(len(DNA) - 12 + 1):
+                assert kh.get(DNA[i:i + 12]) == hi.get(DNA[i:i + 12])
+            for seq in seqs[:10]:
+                assert kh.get(seq[:12]) == hi.get(seq[:12]) >= 5
+
+def test_add():
+    inpath = utils.get_test_data('random-20-a.fa')
+    seqs = [ r['sequence'] for r in screed.open(inpath) ]
+    half = len(seqs) / 2
+
+    for options in (dict(), dict(blocked=True), dict(counter_bits=4),
+                    dict(counter_bits=2, fast_hash=True)):
+        both = khmer.new_counting_hash(12, 1e5, 2, **options)
+        hi = khmer.new_counting_hash(12, 1e5, 2, **options)
+        hj = khmer.new_counting_hash(12, 1e5, 2, **options)
+        for seq in seqs:
+            both.consume(seq)
+        for seq in seqs[:half]:
+            hi.consume(seq)
+        for seq in seqs[half:]:
+            hj.consume(seq)
+
+        savepath = utils.get_temp_filename('tempadd.kh')
+        hj.save(savepath)
+        hj = khmer.load_counting_hash(savepath, mmap=True)
+
+        hi.add(hj, n_threads=3)
+        for seq in seqs:
+            for i in range(len(seq) - 12 + 1):
+                assert hi.get(seq[i:i + 12]) == both.get(seq[i:i + 12])
+
+def test_add_saturates():
+    for counter_bits in (8, 4, 2):
+        hi = khmer.new_counting_hash(4, 4**4, 1, counter_bits)
+        hj = khmer.new_counting_hash(4, 4**4, 1, counter_bits)
+        max_count = hi.counter_max()
+        for i in range(max_count - 1):
+            hi.count('AAAA')
+        for i in range(2):
+            hj.count('AAAA')
+        hj.count('ACGT')
+        hi.add(hj)
+        assert hi.get('AAAA') == max_count
+        assert hi.get('ACGT') == 1
+        assert hi.get('CCCC') == 0
+
+def test_add_bigcount():
+    hi = khmer.new_counting_hash(4, 4**4, 2)
+    hj = khmer.new_counting_hash(4, 4**4, 2)
+    hi.set_use_bigcount(True)
+    for i in range(300):
+        hi.count('AAAA')
+        hj.count('CCCC')
+    for i in range(100):
+        hj.count('AAAA')
+    hi.add(hj)
+    assert hi.get('AAAA') == 400
+    assert hi.get('CCCC') == 255
+
+    hi.add(hi)
+    assert hi.get('AAAA') == 800
+
+def test_add_different_shapes():
+    hi = khmer.new_counting_hash(12, 1e4, 2)
+    for other in (khmer.new_counting_hash(12, 1e4, 3),
+                  khmer.new_counting_hash(13, 1e4, 2),
+                  khmer.new_counting_hash(12, 1e4, 2, 4),
+                  khmer.new_counting_hash(12, 1e4, 2, blocked=True),
+                  khmer.new_counting_hash(12, 1e4, 2, conservative=True)):
+        try:
+            hi.add(other)
+            assert 0, "should fail"
+        except ValueError:
+            pass
+
+    # the other way around, too.
+    try:
+        khmer.new_counting_hash(12, 1e4, 2, conservative=True).add(hi)
+        assert 0, "should fail"
+    except ValueError:
+        pass
+
+    try:
+        hi.add(khmer.new_hashbits(12, 1e4, 2))
+        assert 0, "should fail"
+    except TypeError:
+        pass
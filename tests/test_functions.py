@@ -36,3 +36,34 @@ def test_get_primes():
    primes = khmer.get_n_primes_near_x(7, 20)
 
    assert primes == [19, 17, 13, 11, 7, 5, 3]
+
+def test_choose_table_sizes():
+    # plenty of memory: just enough to reach the target.
+    hashsize, n_tables, fp = khmer.choose_table_sizes(1e6, 1e9, 8, 0.01)
+    assert fp <= 0.01, fp
+    assert fp > 0.009, fp
+    assert n_tables * hashsize < 1e7
+
+    # too little: all of it, at a higher rate.
+    hashsize, n_tables, fp = khmer.choose_table_sizes(1e6, 1e6, 8, 0.01)
+    assert n_tables * hashsize <= 1e6
+    assert n_tables * hashsize > 0.99e6
+    assert fp > 0.01, fp
+
+    # fewer bits per counter fit more bins.
+    hashsize2, n_tables2, fp2 = khmer.choose_table_sizes(1e6, 1e6, 1, 0.01)
+    assert n_tables2 * hashsize2 > 7.9e6
+    assert fp2 < fp
+
+def test_choose_table_sizes_blocked():
+    # a blocked table's slices aren't independent, so it takes more memory
+    # for the same rate.
+    hashsize, n_tables, fp = khmer.choose_table_sizes(1e6, 1e9, 8, 0.01)
+    hashsize2, n_tables2, fp2 = khmer.choose_table_sizes(1e6, 1e9, 8, 0.01,
+                                                         blocked=True)
+    assert fp2 <= 0.01, fp2
+    assert fp2 > 0.009, fp2
+    assert n_tables2 * hashsize2 > n_tables * hashsize
+
+    ht = khmer.new_counting_hash(20, hashsize2, n_tables2, blocked=True)
+    assert ht.hashsizes()[0] >= hashsize2 * 0.9
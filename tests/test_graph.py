@@ -1,4 +1,5 @@
 import khmer
+import screed
 
 import khmer_tst_utils as utils
 
@@ -25,6 +26,46 @@ class Test_ExactGraphFu(object):
         x = ht.calc_connected_graph_size(kmer)
         assert x == 36, x
 
+    def test_counts_batch(self):
+        ht = self.ht
+        ht.consume_fasta(utils.get_test_data('test-graph.fa'))
+
+        # two reads starting in each component.
+        filename = utils.get_temp_filename('test-graph-reads.fa')
+        fp = open(filename, 'w')
+        for record in screed.open(utils.get_test_data('test-graph.fa')):
+            fp.write('>%s\n%s\n' % (record['name'], record['sequence']))
+            fp.write('>%s.b\n%s\n' % (record['name'], record['sequence'][10:]))
+        fp.close()
+
+        expected = [ ht.calc_connected_graph_size(record['sequence'][:12])
+                     for record in screed.open(filename) ]
+        assert expected == [69, 69, 68, 68, 36, 36], expected
+
+        # the same from the component cache, however small...
+        for cache_size in (0, 10, 1000):
+            sizes = ht.calc_connected_graph_sizes(filename,
+                                                  cache_size=cache_size)
+            assert sizes == expected, (sizes, expected)
+
+        # ...and with a threshold.
+        for cache_size in (10, 1000):
+            sizes = ht.calc_connected_graph_sizes(filename, 40,
+                                                  cache_size=cache_size)
+            assert sizes == [ min(x, 40) for x in expected ], sizes
+
+    def test_deep_component(self):
+        # one long path; too deep for a recursive traversal.
+        import random
+        random.seed(1)
+        seq = ''.join([ random.choice('ACGT') for i in range(500000) ])
+
+        ht = khmer.new_hashbits(20, 4e6, 4)
+        ht.consume(seq)
+        x = ht.calc_connected_graph_size(seq[250000:250020])
+        assert x >= 500000 - 20 + 1, x
+        assert ht.calc_connected_graph_size(seq[:20], 1000) == 1000
+
     def test_graph_links_next_a(self):
         ht = self.ht
         word = "TGCGTTTCAATC"
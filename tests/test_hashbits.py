@@ -1,4 +1,6 @@
+import os
 import khmer
+import gzip
 
 import screed
 from screed.fasta import fasta_iter
@@ -479,3 +481,295 @@ def test_find_unpart_fail():
    ht.find_unpart(filename2, True, False)
    n, _ = ht.count_partitions()
    assert n == 49, n                    # only 49 sequences worth of tags
+
+def test_consume_fasta_n_threads():
+   filename = utils.get_test_data('random-20-a.fa')
+
+   ht1 = khmer.new_hashbits(20, 100000, 1)
+   ht1.consume_fasta(filename)
+
+   ht2 = khmer.new_hashbits(20, 100000, 1)
+   ht2.consume_fasta(filename, n_threads=4)
+
+   assert ht2.n_occupied() == ht1.n_occupied() == 3877
+   assert ht2.n_unique_kmers() == ht1.n_unique_kmers()
+
+def test_save_load_mmap():
+   filename = utils.get_test_data('random-20-a.fa')
+   savepath = utils.get_temp_filename('tempsave_mmap.ht')
+
+   ht1 = khmer.new_hashbits(20, 100000, 3)
+   ht1.consume_fasta(filename)
+   ht1.save(savepath)
+
+   ht2 = khmer.load_hashbits(savepath, mmap=True)
+   assert ht2.hashsizes() == ht1.hashsizes()
+
+   for n, record in enumerate(fasta_iter(open(filename))):
+      seq = record['sequence']
+      assert ht2.get(seq[:20]) == 1
+
+def test_load_mmap_truncated():
+   savepath = utils.get_temp_filename('tempsave_mmap.ht')
+   truncpath = utils.get_temp_filename('tempsave_trunc.ht')
+
+   for blocked in (False, True):
+      ht1 = khmer.new_hashbits(20, 100000, 3, blocked=blocked)
+      ht1.consume('ACGTACGTACGTACGTACGTACGT')
+      ht1.save(savepath, sparse=False)
+      data = open(savepath, 'rb').read()
+
+      # the last table is padded out to a page; cut into the table itself.
+      for length in (20, len(data) / 2, len(data) - 4097):
+         fp = open(truncpath, 'wb')
+         fp.write(data[:length])
+         fp.close()
+
+         ht2 = khmer._new_hashbits(1, [1])
+         try:
+            ht2.load_mmap(truncpath)
+            assert 0, "should fail"
+         except IOError:
+            pass
+
+def test_save_load_sparse():
+   filename = utils.get_test_data('random-20-a.fa')
+
+   for blocked in (False, True):
+      for ext in ('.ht', '.ht.gz'):
+         sparsepath = utils.get_temp_filename('tempsave_sparse' + ext)
+         densepath = utils.get_temp_filename('tempsave_dense' + ext)
+
+         ht1 = khmer.new_hashbits(20, 1e7, 3, blocked=blocked)
+         ht1.consume_fasta(filename)
+         ht1.save(sparsepath)
+         ht1.save(densepath, sparse=False)
+         assert os.path.getsize(sparsepath) < \
+                os.path.getsize(densepath) / 4 or ext == '.ht.gz'
+
+         ht2 = khmer._new_hashbits(1, [1])
+         assert not ht2.load_mmap(sparsepath)
+         assert ht2.load_mmap(densepath) or ext == '.ht.gz'
+
+         ht2 = khmer.load_hashbits(sparsepath, mmap=True)
+         assert ht2.is_blocked() == blocked
+         assert ht2.hashsizes() == ht1.hashsizes()
+         for record in fasta_iter(open(filename)):
+            seq = record['sequence']
+            for i in range(len(seq) - 20 + 1):
+               assert ht2.get(seq[i:i + 20]) == 1
+
+def test_save_load_occupancy():
+   filename = utils.get_test_data('random-20-a.fa')
+
+   ht1 = khmer.new_hashbits(20, 100000, 3)
+   ht1.consume_fasta(filename)
+   assert ht1.n_occupied() and ht1.n_unique_kmers()
+
+   for ext in ('.ht', '.ht.gz'):
+      savepath = utils.get_temp_filename('tempsave_occupancy' + ext)
+      ht1.save(savepath)
+      for mmap in (False, True):
+         ht2 = khmer.load_hashbits(savepath, mmap=mmap)
+         assert ht2.n_occupied() == ht1.n_occupied()
+         assert ht2.n_unique_kmers() == ht1.n_unique_kmers()
+
+def test_load_version_4():
+   # no occupancy in the header; it's recounted.
+   import struct
+   savepath = utils.get_temp_filename('tempsave_v4.ht')
+
+   fp = open(savepath, 'wb')
+   fp.write(struct.pack('=BBIB', 4, 2, 4, 1))
+   fp.write(struct.pack('=Q', 100))
+   fp.write('\0' * (4096 - fp.tell()))
+   fp.write('\x01\x03' + '\0' * 10 + '\x08')
+   fp.write('\0' * (4096 - 13))
+   fp.close()
+
+   for mmap in (False, True):
+      ht = khmer.load_hashbits(savepath, mmap=mmap)
+      assert ht.hashsizes() == [100]
+      assert ht.n_occupied() == 4
+      assert ht.n_unique_kmers() == 4
+      assert ht.get(khmer.reverse_hash(99, 4))
+
+def test_join_partitions_chain():
+   ht = khmer.new_hashbits(20, 1e4, 4)
+
+   dna = "AGCTTTTCATTCTGACTGCAACGGGCAATATGTCTCTGTGTGG"
+   kmers = [ dna[i:i + 20] for i in range(5) ]
+   for n, kmer in enumerate(kmers):
+      ht.set_partition_id(kmer, n + 2)
+   assert ht.count_partitions() == (5, 0)
+
+   # join in a chain; every k-mer ends up with the same (live) ID.
+   for n in range(2, 6):
+      assert ht.join_partitions(n, n + 1)
+
+   pids = set([ ht.get_partition_id(kmer) for kmer in kmers ])
+   assert len(pids) == 1, pids
+   assert pids.pop() in range(2, 7)
+   assert ht.count_partitions() == (1, 0)
+
+   # unknown partitions can't be joined.
+   assert ht.join_partitions(2, 100) == 0
+
+def test_blocked():
+   filename = utils.get_test_data('random-20-a.fa')
+   savepath = utils.get_temp_filename('tempsave_blocked.ht')
+
+   ht1 = khmer.new_hashbits(20, 100000, 4)
+   ht1.consume_fasta(filename)
+
+   ht2 = khmer.new_hashbits(20, 100000, 4, blocked=True)
+   assert ht2.is_blocked() and not ht1.is_blocked()
+   ht2.consume_fasta(filename)
+
+   assert ht2.n_unique_kmers() == ht1.n_unique_kmers()
+   assert 0 < khmer.calc_expected_collisions(ht2) < 0.01
+
+   for record in fasta_iter(open(filename)):
+      seq = record['sequence']
+      for i in range(len(seq) - 20 + 1):
+         assert ht2.get(seq[i:i + 20]) == 1
+
+   ht2.save(savepath)
+   for mmap in (False, True):
+      ht3 = khmer.load_hashbits(savepath, mmap=mmap)
+      assert ht3.is_blocked()
+      assert ht3.hashsizes() == ht2.hashsizes()
+      for record in fasta_iter(open(filename)):
+         assert ht3.get(record['sequence'][:20]) == 1
+
+def test_blocked_expected_collisions():
+   import random
+   rng = random.Random(1)
+
+   def random_dna(n):
+      return ''.join(rng.choice('ACGT') for i in range(n))
+
+   ht = khmer.new_hashbits(20, 1e5, 4, blocked=True)
+   ht.consume(random_dna(80000 + 20 - 1))
+
+   n_fp = 0
+   for i in range(100000):
+      if ht.get(random_dna(20)):
+         n_fp += 1
+   fp_rate = n_fp / 100000.
+
+   expected = khmer.calc_expected_collisions(ht)
+   assert abs(expected - fp_rate) < 0.1 * fp_rate, (expected, fp_rate)
+
+def test_blocked_too_many_tables():
+   try:
+      khmer.new_hashbits(20, 1e4, 17, blocked=True)
+      assert 0, "should fail"
+   except ValueError:
+      pass
+
+def test_fast_hash():
+   filename = utils.get_test_data('random-20-a.fa')
+   savepath = utils.get_temp_filename('tempsave_fast_hash.ht')
+
+   ht1 = khmer.new_hashbits(20, 100000, 4)
+   ht1.consume_fasta(filename)
+
+   ht2 = khmer.new_hashbits(20, 100000, 4, fast_hash=True)
+   assert ht2.has_fast_hash() and not ht1.has_fast_hash()
+   assert ht2.hashsizes() == [100000] * 4
+   ht2.consume_fasta(filename)
+   assert ht2.n_unique_kmers() == ht1.n_unique_kmers()
+
+   ht2.save(savepath)
+   for mmap in (False, True):
+      ht3 = khmer.load_hashbits(savepath, mmap=mmap)
+      assert ht3.has_fast_hash()
+      for record in fasta_iter(open(filename)):
+         seq = record['sequence']
+         for i in range(len(seq) - 20 + 1):
+            assert ht3.get(seq[i:i + 20]) == 1
+
+def test_update():
+   filename = utils.get_test_data('random-20-a.fa')
+   seqs = [ record['sequence'] for record in fasta_iter(open(filename)) ]
+   half = len(seqs) / 2
+
+   for blocked in (False, True):
+      ht1 = khmer.new_hashbits(20, 100000, 4, blocked=blocked)
+      ht2 = khmer.new_hashbits(20, 100000, 4, blocked=blocked)
+      both = khmer.new_hashbits(20, 100000, 4, blocked=blocked)
+      for seq in seqs[:half]:
+         ht1.consume(seq)
+      for seq in seqs[half:]:
+         ht2.consume(seq)
+      for seq in seqs:
+         both.consume(seq)
+
+      union = khmer.new_hashbits(20, 100000, 4, blocked=blocked)
+      union.update(ht1)
+      union.update(ht2, n_threads=2)
+      assert union.n_occupied() == both.n_occupied()
+      n = both.n_unique_kmers()
+      assert abs(union.n_unique_kmers() - n) < n / 20, \
+             (union.n_unique_kmers(), n)
+
+      ht1.intersection_update(ht2)
+      for seq in seqs:
+         assert not ht1.get(seq[:20]) or ht2.get(seq[:20])
+      for seq in seqs[:half]:
+         assert union.get(seq[:20])
+      for seq in seqs[half:]:
+         assert union.get(seq[:20])
+
+def test_update_different_shapes():
+   ht = khmer.new_hashbits(20, 1e4, 4)
+   try:
+      ht.update(khmer.new_hashbits(20, 1e4, 3))
+      assert 0, "should fail"
+   except ValueError:
+      pass
+
+   try:
+      ht.intersection_update(khmer.new_counting_hash(20, 1e4, 4))
+      assert 0, "should fail"
+   except TypeError:
+      pass
+
+def test_save_load_gz():
+   filename = utils.get_test_data('random-20-a.fa')
+   savepath = utils.get_temp_filename('tempsave_gz.ht')
+   gzpath = utils.get_temp_filename('tempsave_gz.ht.gz')
+
+   for blocked in (False, True):
+      ht = khmer.new_hashbits(20, 2e7, 3, blocked=blocked)
+      ht.consume_fasta(filename)
+      ht.save(savepath)
+      ht.save(gzpath, 2)
+      assert gzip.open(gzpath).read() == open(savepath, 'rb').read()
+
+      for mmap in (False, True):
+         ht2 = khmer.load_hashbits(gzpath, mmap=mmap, n_threads=2)
+         assert ht2.is_blocked() == blocked
+         assert ht2.hashsizes() == ht.hashsizes()
+         for record in fasta_iter(open(filename)):
+            assert ht2.get(record['sequence'][:20]) == 1
+
+def test_load_plain_gz():
+   # a table saved uncompressed, then gzipped outside of khmer.
+   filename = utils.get_test_data('random-20-a.fa')
+   savepath = utils.get_temp_filename('tempsave_plain.ht')
+   gzpath = utils.get_temp_filename('tempsave_plain.ht.gz')
+
+   ht = khmer.new_hashbits(20, 1e5, 3)
+   ht.consume_fasta(filename)
+   ht.save(savepath)
+
+   out_file = gzip.open(gzpath, 'wb')
+   out_file.write(open(savepath, 'rb').read())
+   out_file.close()
+
+   ht2 = khmer.load_hashbits(gzpath)
+   assert ht2.hashsizes() == ht.hashsizes()
+   for record in fasta_iter(open(filename)):
+      assert ht2.get(record['sequence'][:20]) == 1
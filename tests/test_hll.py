@@ -0,0 +1,83 @@
+import khmer
+from nose.tools import assert_raises
+
+import khmer_tst_utils as utils
+
+DNA = "AGCTTTTCATTCTGACTGCAACGGGCAATATGTCTCTGTGTGGATTAAAAAAAGAGTGTCTGATAGCAGC"
+
+def teardown():
+    utils.cleanup()
+
+def test_empty():
+    hll = khmer.new_hll_counter(20)
+    assert hll.ksize() == 20
+    assert hll.precision() == 14
+    assert hll.estimate_cardinality() == 0
+
+def test_add():
+    hll = khmer.new_hll_counter(4)
+    hll.add('AAAA')
+    hll.add('TTTT')                     # same k-mer, reverse complemented
+    assert hll.estimate_cardinality() == 1
+
+def test_consume():
+    hll = khmer.new_hll_counter(12)
+    n = hll.consume(DNA)
+    assert n == len(DNA) - 12 + 1
+    assert hll.estimate_cardinality() == len(DNA) - 12 + 1
+
+def test_consume_fasta():
+    # random-20-a.fa has 3960 distinct 20-mers.
+    filename = utils.get_test_data('random-20-a.fa')
+    hll = khmer.new_hll_counter(20)
+    n_reads, n_kmers = hll.consume_fasta(filename)
+    assert n_reads == 99, n_reads
+
+    estimate = hll.estimate_cardinality()
+    assert abs(estimate - 3960) < 3960 * 0.03, estimate
+
+def test_consume_fasta_threads():
+    filename = utils.get_test_data('random-20-a.fa')
+    hll = khmer.new_hll_counter(20)
+    hll.consume_fasta(filename)
+
+    hll2 = khmer.new_hll_counter(20)
+    n_reads, n_kmers = hll2.consume_fasta(filename, n_threads=4)
+    assert n_reads == 99
+
+    assert hll2.estimate_cardinality() == hll.estimate_cardinality()
+
+def test_consume_fasta_max_reads():
+    filename = utils.get_test_data('random-20-a.fa')
+    hll = khmer.new_hll_counter(20)
+    n_reads, n_kmers = hll.consume_fasta(filename, max_reads=10)
+    assert n_reads == 10, n_reads
+
+    all = khmer.new_hll_counter(20)
+    all.consume_fasta(filename)
+    assert hll.estimate_cardinality() < all.estimate_cardinality()
+
+def test_merge():
+    filename = utils.get_test_data('random-20-a.fa')
+    hll = khmer.new_hll_counter(20)
+    hll.consume_fasta(filename)
+
+    a = khmer.new_hll_counter(20)
+    a.consume_fasta(filename, max_reads=50)
+    b = khmer.new_hll_counter(20)
+    b.consume_fasta(filename)
+    a.merge(b)
+
+    assert a.estimate_cardinality() == hll.estimate_cardinality()
+
+def test_merge_fail():
+    a = khmer.new_hll_counter(20)
+    b = khmer.new_hll_counter(20, 12)
+    assert_raises(ValueError, a.merge, b)
+
+    c = khmer.new_hll_counter(21)
+    assert_raises(ValueError, a.merge, c)
+
+def test_bad_precision():
+    assert_raises(ValueError, khmer.new_hll_counter, 20, 3)
+    assert_raises(ValueError, khmer.new_hll_counter, 20, 19)
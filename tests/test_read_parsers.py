@@ -0,0 +1,58 @@
+import gzip
+
+import khmer
+import khmer_tst_utils as utils
+
+def teardown():
+    utils.cleanup()
+
+def _write(filename, data):
+    if filename.endswith('.gz'):
+        fp = gzip.open(filename, 'wb')
+    else:
+        fp = open(filename, 'w')
+    fp.write(data)
+    fp.close()
+
+LONG_SEQ = 'ACGTTGCAAGGTC' * 200             # 2600 bp; longer than old buffers
+
+def test_long_read_gz():
+    # the old gz parser truncated lines at 1000 bytes
+    filename = utils.get_temp_filename('long.fa.gz')
+    _write(filename, '>a\n%s\n>b\nACGTACGTACGTAC\n' % LONG_SEQ)
+
+    ht = khmer.new_counting_hash(12, 1e6, 2)
+    total_reads, n_consumed = ht.consume_fasta(filename)
+
+    assert total_reads == 2, total_reads
+    assert n_consumed == (len(LONG_SEQ) - 12 + 1) + 3, n_consumed
+
+def test_multiline_fasta():
+    filename = utils.get_temp_filename('multiline.fa')
+    _write(filename, '>a\nACGTTG\r\nCAAGGT\nC\n\n>b\nACGTTGCAAGGTC')
+
+    ht = khmer.new_counting_hash(12, 1e6, 2)
+    total_reads, n_consumed = ht.consume_fasta(filename)
+
+    assert total_reads == 2, total_reads
+    assert n_consumed == 4, n_consumed
+    assert ht.get('ACGTTGCAAGGT') == 2
+
+def test_fastq_detected_by_content():
+    filename = utils.get_temp_filename('reads.txt.gz')
+    _write(filename, '@a\n%s\n+\n%s\n@b\nACGTNACGTACGTAC\n+\n%s' %
+           (LONG_SEQ, 'I' * len(LONG_SEQ), 'I' * 15))
+
+    ht = khmer.new_counting_hash(12, 1e6, 2)
+    total_reads, n_consumed = ht.consume_fasta(filename)
+
+    # reads with N's are skipped, as before
+    assert total_reads == 1, total_reads
+    assert n_consumed == len(LONG_SEQ) - 12 + 1, n_consumed
+
+def test_empty_file():
+    filename = utils.get_temp_filename('empty.fa')
+    _write(filename, '')
+
+    ht = khmer.new_counting_hash(12, 1e6, 2)
+    assert ht.consume_fasta(filename) == (0, 0)
@@ -97,6 +97,55 @@ def test_load_into_counting():
     assert status == 0
     assert os.path.exists(outfile)
 
+def test_load_into_counting_threads():
+    script = scriptpath('load-into-counting.py')
+    args = ['-x', '1e7', '-N', '2', '-k', '18', '-T', '4']
+    
+    outfile = utils.get_temp_filename('out.kh')
+    infile = utils.get_test_data('test-abund-read-2.fa')
+
+    args.extend([outfile, infile])
+
+    (status, out, err) = runscript(script, args)
+    assert status == 0
+    assert os.path.exists(outfile)
+
+    kh = khmer.load_counting_hash(outfile)
+    assert kh.get('GGTTGACGGGGCTCAGGG') == 1001
+
+def test_load_into_counting_max_memory():
+    script = scriptpath('load-into-counting.py')
+    args = ['-M', '1e6', '-k', '20']
+
+    outfile = utils.get_temp_filename('out.kh')
+    infile = utils.get_test_data('random-20-a.fa')
+
+    args.extend([outfile, infile])
+
+    (status, out, err) = runscript(script, args)
+    assert status == 0
+    assert 'distinct k-mers' in err, err
+
+    kh = khmer.load_counting_hash(outfile)
+    assert len(kh.hashsizes()) * kh.hashsizes()[0] < 1e6
+    assert khmer.calc_expected_collisions(kh) < 0.02
+
+def test_load_into_counting_max_memory_blocked():
+    script = scriptpath('load-into-counting.py')
+    args = ['-M', '1e6', '-k', '20', '--blocked']
+
+    outfile = utils.get_temp_filename('out.kh')
+    infile = utils.get_test_data('random-20-a.fa')
+
+    args.extend([outfile, infile])
+
+    (status, out, err) = runscript(script, args)
+    assert status == 0
+
+    kh = khmer.load_counting_hash(outfile)
+    assert kh.is_blocked()
+    assert khmer.calc_expected_collisions(kh) < 0.02
+
 def test_load_into_counting_fail():
     script = scriptpath('load-into-counting.py')
     args = ['-x', '1e2', '-N', '2', '-k', '20'] # use small HT
@@ -112,6 +161,68 @@ def test_load_into_counting_fail():
     assert status == -1
     assert "ERROR:" in err
 
+def test_merge_counting():
+    script = scriptpath('load-into-counting.py')
+    infile = utils.get_test_data('test-abund-read-2.fa')
+    outfile = utils.get_temp_filename('out.kh')
+    args = ['-x', '1e7', '-N', '2', '-k', '18', outfile, infile]
+    (status, out, err) = runscript(script, args)
+    assert status == 0
+
+    script = scriptpath('merge-counting.py')
+    mergefile = utils.get_temp_filename('merged.kh')
+    args = ['-T', '2', mergefile, outfile, outfile, outfile]
+    (status, out, err) = runscript(script, args)
+    assert status == 0
+
+    kh = khmer.load_counting_hash(mergefile)
+    assert kh.get('GGTTGACGGGGCTCAGGG') == 3003
+
+def test_merge_counting_fail():
+    infile = utils.get_test_data('test-abund-read-2.fa')
+    outfile1 = utils.get_temp_filename('out1.kh')
+    outfile2 = utils.get_temp_filename('out2.kh')
+    script = scriptpath('load-into-counting.py')
+    (status, out, err) = runscript(script, ['-x', '1e7', '-N', '2', '-k', '18',
+                                            outfile1, infile])
+    assert status == 0
+    (status, out, err) = runscript(script, ['-x', '1e7', '-N', '3', '-k', '18',
+                                            outfile2, infile])
+    assert status == 0
+
+    script = scriptpath('merge-counting.py')
+    mergefile = utils.get_temp_filename('merged.kh')
+    (status, out, err) = runscript(script, [mergefile, outfile1, outfile2])
+    assert status == -1
+    assert "ERROR:" in err
+
+def test_merge_presence():
+    ht1 = khmer.new_hashbits(20, 1e5, 4)
+    ht2 = khmer.new_hashbits(20, 1e5, 4)
+    ht1.consume('ATGGCTGGATGGCTGGATGG')
+    ht2.consume('ATGGCTGGATGGCTGGATGG')
+    ht2.consume('CCCCCTGGATGGCTGGATGG')
+    infile1 = utils.get_temp_filename('in1.ht')
+    infile2 = utils.get_temp_filename('in2.ht')
+    ht1.save(infile1)
+    ht2.save(infile2)
+
+    script = scriptpath('merge-presence.py')
+    outfile = utils.get_temp_filename('union.ht')
+    (status, out, err) = runscript(script, [outfile, infile1, infile2])
+    assert status == 0
+    ht = khmer.load_hashbits(outfile)
+    assert ht.get('ATGGCTGGATGGCTGGATGG')
+    assert ht.get('CCCCCTGGATGGCTGGATGG')
+
+    outfile = utils.get_temp_filename('intersection.ht')
+    (status, out, err) = runscript(script, ['--intersect', outfile,
+                                            infile1, infile2])
+    assert status == 0
+    ht = khmer.load_hashbits(outfile)
+    assert ht.get('ATGGCTGGATGGCTGGATGG')
+    assert not ht.get('CCCCCTGGATGGCTGGATGG')
+
 def _make_counting(infilename, SIZE=1e7, N=2, K=20):
     script = scriptpath('load-into-counting.py')
     args = ['-x', str(SIZE), '-N', str(N), '-k', str(K)]
@@ -190,6 +301,25 @@ def test_filter_abund_3():
     assert len(seqs) == 2, seqs
     assert '##################' in seqs
 
+def test_filter_abund_threads():
+    infile = utils.get_temp_filename('test.fq')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-2.fq'), infile)
+    counting_ht = _make_counting(infile, K=17)
+
+    script = scriptpath('filter-abund.py')
+    args = ['-T', '4', counting_ht, infile]
+    (status, out, err) = runscript(script, args, in_dir)
+    assert status == 0
+
+    outfile = infile + '.abundfilt'
+    records = list(screed.open(outfile))
+    assert len(records) == 1001, len(records)
+    assert records[0].name == '895:1:37:17593:9954/1', records[0].name
+    assert records[0].sequence == 'GGTTGACGGGGCTCAGGG'
+    assert records[0].accuracy == '#' * 18
+
 def test_filter_stoptags():
     infile = utils.get_temp_filename('test.fa')
     in_dir = os.path.dirname(infile)
@@ -699,3 +829,99 @@ def test_abundance_dist():
     assert line == '1 96 96 0.98', line
     line = fp.next().strip()
     assert line == '1001 2 98 1.0', line
+
+def _abundance_dist_total(htfile, infile):
+    # the number of distinct k-mers abundance-dist.py finds in infile.
+    outfile = utils.get_temp_filename('test.dist')
+    in_dir = os.path.dirname(outfile)
+
+    script = scriptpath('abundance-dist.py')
+    args = ['-z', '-s', htfile, infile, outfile]
+    (status, out, err) = runscript(script, args, in_dir)
+    assert status == 0, err
+
+    lines = open(outfile).readlines()
+    return int(lines[-1].split()[2])
+
+def _make_random_reads(filename, n_reads, length=100):
+    import random
+    rng = random.Random(1)
+
+    fp = open(filename, 'w')
+    for i in range(n_reads):
+        seq = ''.join(rng.choice('ACGT') for j in range(length))
+        fp.write('>%d\n%s\n' % (i, seq))
+    fp.close()
+
+def test_abundance_dist_fast_hash():
+    # fast_hash tables are all one size; the distribution must still
+    # count every distinct k-mer.
+    infile = utils.get_temp_filename('random.fa')
+    _make_random_reads(infile, 3000)
+
+    totals = []
+    for fast_hash in (False, True):
+        htfile = utils.get_temp_filename('fast_hash_%s.kh' % fast_hash)
+        ht = khmer.new_counting_hash(20, 4e5, 4, fast_hash=fast_hash)
+        ht.consume_fasta(infile)
+        ht.save(htfile)
+
+        totals.append(_abundance_dist_total(htfile, infile))
+
+    classic, fast = totals
+    assert classic > 240000, classic
+    assert abs(fast - classic) < classic * 0.01, (fast, classic)
+
+def test_abundance_dist_blocked():
+    # blocked tables report one size for all their tables, too.
+    infile = utils.get_temp_filename('random.fa')
+    _make_random_reads(infile, 3000)
+
+    totals = []
+    for blocked in (False, True):
+        htfile = utils.get_temp_filename('blocked_%s.kh' % blocked)
+        ht = khmer.new_counting_hash(20, 4e5, 4, blocked=blocked)
+        ht.consume_fasta(infile)
+        ht.save(htfile)
+
+        totals.append(_abundance_dist_total(htfile, infile))
+
+    classic, blocked = totals
+    assert classic > 240000, classic
+    assert abs(blocked - classic) < classic * 0.01, (blocked, classic)
+
+def test_abundance_dist_approximate():
+    # with --approximate, only the table is read.
+    infile = utils.get_temp_filename('test.fa')
+    outfile = utils.get_temp_filename('test.dist')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-2.fa'), infile)
+
+    htfile = _make_counting(infile, K=17)
+
+    script = scriptpath('abundance-dist.py')
+    args = ['-z', '--approximate', htfile, outfile]
+    (status, out, err) = runscript(script, args, in_dir)
+    assert status == 0
+
+    fp = iter(open(outfile))
+    line = fp.next().strip()
+    assert line.startswith('1 '), line
+
+    # not for conservative-update tables.
+    kh = khmer.new_counting_hash(17, 1e5, 2, conservative=True)
+    kh.consume_fasta(infile)
+    conservative_file = utils.get_temp_filename('conservative.kh')
+    kh.save(conservative_file)
+
+    args = ['-z', '-s', '--approximate', conservative_file, outfile]
+    (status, out, err) = runscript(script, args, in_dir)
+    assert status != 0
+    assert 'conservative' in err, err
+
+    # without it, the data file is needed.
+    args = ['-z', '-s', htfile, outfile]
+    (status, out, err) = runscript(script, args, in_dir)
+    assert status != 0
+    assert 'datafile is required' in err, err
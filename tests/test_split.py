@@ -1,8 +1,15 @@
 import khmer
-from khmer.split import SplitHashtable
+import screed
+from khmer.split import SplitHashtable, ShardedCountingHash, \
+     get_shard_bounds, load_sharded_counting_hash
+from khmer import forward_hash, reverse_hash
+import khmer_tst_utils as utils
 
 DNA = "AGCTTTTCATTCTGACTGCAACGGGCAATATGTCTCTGTGTGGATTAAAAAAAGAGTGTCTGATAGCAGC"
 
+def teardown():
+    utils.cleanup()
+
 def test_2_split():
     total = SplitHashtable(4, 4**4, 0, 1)
 
@@ -72,3 +79,79 @@ def test_n3_split():
 
     assert t_min == sub_min
     assert t_max == sub_max
+
+def test_shard_bounds():
+    bounds = get_shard_bounds(4, 3)
+    assert bounds[0] == 0 and bounds[-1] == 4**4
+    assert bounds == sorted(bounds)
+
+    # the shards should hold about the same number of k-mers.
+    n = [ 0 ] * 3
+    for i in range(4**4):
+        h = forward_hash(reverse_hash(i, 4), 4)
+        for j in range(3):
+            if bounds[j] <= h < bounds[j + 1]:
+                n[j] += 1
+    assert sum(n) == 4**4
+    assert max(n) - min(n) < 4**4 / 10, n
+
+    assert get_shard_bounds(32, 2)[-1] == 2**64 - 1
+
+def test_sharded_counting():
+    inpath = utils.get_test_data('random-20-a.fa')
+    seqs = [ r['sequence'] for r in screed.open(inpath) ]
+
+    total = khmer.new_counting_hash(12, 1e5, 2)
+    total.consume_fasta(inpath)
+
+    ht = ShardedCountingHash(12, 1e5, 2, 3)
+    try:
+        n_reads, n_kmers = ht.consume_fasta(inpath)
+        assert n_reads == len(seqs)
+        assert n_kmers == sum([ len(seq) - 12 + 1 for seq in seqs ])
+        assert ht.consume(seqs[0]) == len(seqs[0]) - 12 + 1
+        total.consume(seqs[0])
+
+        for i in range(len(DNA) - 12 + 1):
+            assert ht.get(DNA[i:i + 12]) == total.get(DNA[i:i + 12])
+
+        for seq in seqs[:20]:
+            assert ht.get_kmer_counts(seq) == total.get_kmer_counts(seq)
+
+        medians = ht.get_median_counts(seqs[:20])
+        for seq, (median, average, stddev) in zip(seqs, medians):
+            t_median, t_average, t_stddev = total.get_median_count(seq)
+            assert median == t_median
+            assert abs(average - t_average) < 1e-4
+            assert abs(stddev - t_stddev) < 1e-4
+
+        basename = utils.get_temp_filename('sharded')
+        ht.save(basename)
+    finally:
+        ht.close()
+
+    # the shards are saved so the workers can map them.
+    for i in range(3):
+        shard = khmer._new_counting_hash(1, [1])
+        assert shard.load_mmap('%s.shard.%d' % (basename, i))
+        assert shard.ksize() == 12
+
+    ht = load_sharded_counting_hash(basename, 3)
+    try:
+        assert ht.n_shards() == 3 and ht.ksize() == 12
+        for seq in seqs[:20]:
+            assert ht.get_kmer_counts(seq) == total.get_kmer_counts(seq)
+    finally:
+        ht.close()
+
+def test_sharded_counting_error():
+    ht = ShardedCountingHash(12, 1e4, 2, 2)
+    try:
+        try:
+            ht.consume('ACGT')
+            assert 0, "should fail"
+        except ValueError:
+            pass
+        assert ht.get('ACGTACGTACGT') == 0
+    finally:
+        ht.close()
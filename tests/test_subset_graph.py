@@ -371,3 +371,43 @@ def test_small_real_partitions():
     assert set(parts) != set(['0'])
 
 test_small_real_partitions.runme = True
+
+def test_divide_tags_into_subsets_sorted():
+    filename = utils.get_test_data('random-20-a.fa')
+
+    ht = khmer.new_hashbits(20, 1e6, 4)
+    ht.consume_fasta_and_tag(filename)
+
+    # the tagset itself is unordered, but subsets are cut in tag order.
+    tags = sorted([ khmer.forward_hash_no_rc(t, 20)
+                    for t in ht.get_tagset() ])
+    divvy = ht.divide_tags_into_subsets(10)
+    assert divvy == tags[::10], (divvy, tags)
+
+    # ...and partitioning subset by subset covers every tag once.
+    divvy.append(0)
+    for i in range(len(divvy) - 1):
+        x = ht.do_subset_partition(divvy[i], divvy[i + 1])
+        ht.merge_subset(x)
+
+    outfile = utils.get_temp_filename('out')
+    n_partitions = ht.output_partitions(filename, outfile)
+    assert n_partitions == 1, n_partitions
+
+def test_partition_all():
+    filename = utils.get_test_data('random-20-a.fa')
+
+    ht = khmer.new_hashbits(20, 1e6, 4)
+    ht.consume_fasta_and_tag(filename)
+
+    basename = utils.get_temp_filename('graph')
+    n_subsets = ht.partition_all(basename, n_threads=3, subset_size=10)
+    assert n_subsets == len(ht.divide_tags_into_subsets(10)), n_subsets
+
+    # one pmap per subset, which merge back into the one partition.
+    for n in range(n_subsets):
+        ht.merge_subset_from_disk(basename + '.subset.%d.pmap' % (n,))
+
+    outfile = utils.get_temp_filename('out')
+    n_partitions = ht.output_partitions(filename, outfile)
+    assert n_partitions == 1, n_partitions